@@ -1,22 +1,163 @@
 import os 
 from dotenv import load_dotenv
-from fastapi.testclient import TestClient
 import zoneinfo
-# from app.main import app
 import logging
+from app.utils.log_pipeline import configure_logging, parse_rules
 
 load_dotenv()
 
 class Settings:
     DATABASE_URL =os.getenv("DATABASE_URL")
     DISTANCE_MATRIX_API_KEY=os.getenv("DISTANCE_MATRIX_API_KEY")
-    # client = TestClient(app)
+    DISTANCE_MATRIX_URL=os.getenv("DISTANCE_MATRIX_URL", "https://api.distancematrix.ai/maps/api/distancematrix/json")
+
+    # Distance provider chain (see app/utils/distance_providers.py)
+    DISTANCE_PROVIDER = os.getenv("DISTANCE_PROVIDER", "matrix")  # matrix | local | fake
+    DISTANCE_FALLBACK_PROVIDER = os.getenv("DISTANCE_FALLBACK_PROVIDER", "local")  # matrix | local | fake | none
+    DISTANCE_TIMEOUT_SECONDS = float(os.getenv("DISTANCE_TIMEOUT_SECONDS", "2.0"))
+    DISTANCE_HEDGE_DELAY_SECONDS = os.getenv("DISTANCE_HEDGE_DELAY_SECONDS", "auto")  # auto (observed p95) | off | seconds
+    CIRCUIT_BREAKER_FAILURE_THRESHOLD = int(os.getenv("CIRCUIT_BREAKER_FAILURE_THRESHOLD", "5"))
+    CIRCUIT_BREAKER_RESET_SECONDS = float(os.getenv("CIRCUIT_BREAKER_RESET_SECONDS", "30"))
+    LOCAL_ESTIMATOR_SPEED_KMH = float(os.getenv("LOCAL_ESTIMATOR_SPEED_KMH", "30"))
+    LOCAL_ESTIMATOR_ROAD_FACTOR = float(os.getenv("LOCAL_ESTIMATOR_ROAD_FACTOR", "1.3"))
+    DISTANCE_MATRIX_MAX_DESTINATIONS = int(os.getenv("DISTANCE_MATRIX_MAX_DESTINATIONS", "25"))  # API limit per call
+
+    # Precomputed ETA grids around each service origin (see app/utils/eta_grid.py)
+    ETA_GRID_ENABLED = os.getenv("ETA_GRID_ENABLED", "false").lower() == "true"
+    ETA_GRID_DIR = os.getenv("ETA_GRID_DIR", "eta_grids")
+    ETA_GRID_RADIUS_KM = float(os.getenv("ETA_GRID_RADIUS_KM", "15"))
+    ETA_GRID_STEP_KM = float(os.getenv("ETA_GRID_STEP_KM", "0.5"))
+    ETA_GRID_BUILD_CONCURRENCY = int(os.getenv("ETA_GRID_BUILD_CONCURRENCY", "4"))  # matrix calls in flight
+    ETA_GRID_AUTO_BUILD = os.getenv("ETA_GRID_AUTO_BUILD", "true").lower() == "true"
+    ETA_GRID_MAX_AGE_HOURS = float(os.getenv("ETA_GRID_MAX_AGE_HOURS", "24"))
+    ETA_GRID_CHECK_SECONDS = float(os.getenv("ETA_GRID_CHECK_SECONDS", "60"))
     SECRET_KEY=os.getenv("SECRET_KEY")
     ALGORITHM=os.getenv("ALGORITHM")
     ACCESS_TOKEN_EXPIRE_MINUTES = 30
     UTC=zoneinfo.ZoneInfo("UTC")
-    logging.basicConfig(level=logging.INFO) 
     logger= logging.getLogger(__name__)
-    FIXED_COORDINATES = (24.8523464, 67.0078039)  # Fixed coordinates for both services
+    FIXED_COORDINATES = (24.8523464, 67.0078039)  # Default location for services without any registered sites
+
+    # Background ETA enrichment: issue tokens first, compute distance later (see app/utils/eta_worker.py)
+    ASYNC_ETA_ENABLED = os.getenv("ASYNC_ETA_ENABLED", "false").lower() == "true"
+    ETA_WORKER_CONCURRENCY = int(os.getenv("ETA_WORKER_CONCURRENCY", "4"))
+    ETA_QUEUE_SIZE = int(os.getenv("ETA_QUEUE_SIZE", "1000"))
+    ETA_MAX_RETRIES = int(os.getenv("ETA_MAX_RETRIES", "3"))
+    ETA_RETRY_BACKOFF_SECONDS = float(os.getenv("ETA_RETRY_BACKOFF_SECONDS", "0.5"))
+    TOKEN_EVENTS_TIMEOUT_SECONDS = float(os.getenv("TOKEN_EVENTS_TIMEOUT_SECONDS", "300"))
+
+    # Periodic bulk ETA refresh for all waiting tokens (see app/utils/eta_refresher.py)
+    ETA_REFRESH_ENABLED = os.getenv("ETA_REFRESH_ENABLED", "false").lower() == "true"
+    ETA_REFRESH_INTERVAL_SECONDS = float(os.getenv("ETA_REFRESH_INTERVAL_SECONDS", "60"))
+    ETA_REFRESH_CONCURRENCY = int(os.getenv("ETA_REFRESH_CONCURRENCY", "4"))
+    ETA_REFRESH_MAX_AGE_HOURS = float(os.getenv("ETA_REFRESH_MAX_AGE_HOURS", "12"))  # older tokens are left alone
+
+    # Per-user token-bucket limits and global admission control (see app/utils/rate_limit.py)
+    RATE_LIMIT_ENABLED = os.getenv("RATE_LIMIT_ENABLED", "false").lower() == "true"
+    RATE_LIMIT_BACKEND = os.getenv("RATE_LIMIT_BACKEND", "memory")  # memory | redis
+    REDIS_URL = os.getenv("REDIS_URL", "redis://localhost:6379/0")
+    RATE_LIMIT_TOKEN_PER_MINUTE = float(os.getenv("RATE_LIMIT_TOKEN_PER_MINUTE", "6"))
+    RATE_LIMIT_TOKEN_BURST = float(os.getenv("RATE_LIMIT_TOKEN_BURST", "3"))
+    RATE_LIMIT_LOCATION_PER_MINUTE = float(os.getenv("RATE_LIMIT_LOCATION_PER_MINUTE", "12"))
+    RATE_LIMIT_LOCATION_BURST = float(os.getenv("RATE_LIMIT_LOCATION_BURST", "4"))
+    ADMISSION_MAX_CONCURRENCY = int(os.getenv("ADMISSION_MAX_CONCURRENCY", "200"))  # 0 disables
+    ADMISSION_QUEUE_HIGH_WATERMARK = float(os.getenv("ADMISSION_QUEUE_HIGH_WATERMARK", "0.9"))
+
+    # Append-only token event log with snapshots (see app/utils/token_log.py)
+    TOKEN_LOG_ENABLED = os.getenv("TOKEN_LOG_ENABLED", "false").lower() == "true"
+    TOKEN_LOG_PATH = os.getenv("TOKEN_LOG_PATH", "token_events.log")
+    TOKEN_LOG_SNAPSHOT_EVERY = int(os.getenv("TOKEN_LOG_SNAPSHOT_EVERY", "10000"))
+
+    # Idempotency-Key support on POST /users/token (see app/utils/idempotency.py)
+    IDEMPOTENCY_TTL_SECONDS = float(os.getenv("IDEMPOTENCY_TTL_SECONDS", "3600"))
+    IDEMPOTENCY_MAX_KEYS = int(os.getenv("IDEMPOTENCY_MAX_KEYS", "10000"))
+
+    # Cache-Control max-age for ETag'd catalog endpoints (services, counters, sites)
+    CATALOG_CACHE_MAX_AGE_SECONDS = int(os.getenv("CATALOG_CACHE_MAX_AGE_SECONDS", "5"))
+
+    # Streaming wait/service time percentiles (see app/utils/sketches.py). Set
+    # ANALYTICS_SKETCH_DIR to a directory shared by all workers to merge their sketches
+    ANALYTICS_WINDOW_SECONDS = float(os.getenv("ANALYTICS_WINDOW_SECONDS", "300"))
+    ANALYTICS_RETENTION_WINDOWS = int(os.getenv("ANALYTICS_RETENTION_WINDOWS", "288"))
+    ANALYTICS_SKETCH_DIR = os.getenv("ANALYTICS_SKETCH_DIR")
+    ANALYTICS_FLUSH_SECONDS = float(os.getenv("ANALYTICS_FLUSH_SECONDS", "10"))
+
+    # Erlang-C counter staffing recommendations (see app/utils/staffing.py)
+    STAFFING_TARGET_WAIT_SECONDS = float(os.getenv("STAFFING_TARGET_WAIT_SECONDS", "300"))
+    STAFFING_TARGET_PERCENTILE = float(os.getenv("STAFFING_TARGET_PERCENTILE", "0.8"))  # share served within target
+    STAFFING_DEFAULT_SERVICE_SECONDS = float(os.getenv("STAFFING_DEFAULT_SERVICE_SECONDS", "300"))
+    STAFFING_REFRESH_SECONDS = float(os.getenv("STAFFING_REFRESH_SECONDS", "60"))
+    STAFFING_TIMEZONE = os.getenv("STAFFING_TIMEZONE", "UTC")  # hour-of-week slots are in this zone
+    STAFFING_PLAN_CACHE_SIZE = int(os.getenv("STAFFING_PLAN_CACHE_SIZE", "256"))  # (service, targets) plans kept
+    # Refreshes re-read this far behind their watermarks to catch rows that committed late
+    STAFFING_OVERLAP_IDS = int(os.getenv("STAFFING_OVERLAP_IDS", "1000"))
+    STAFFING_OVERLAP_SECONDS = float(os.getenv("STAFFING_OVERLAP_SECONDS", "300"))
+
+    # Pre-bookable appointment slots (see app/utils/appointments.py)
+    APPOINTMENTS_ENABLED = os.getenv("APPOINTMENTS_ENABLED", "false").lower() == "true"  # booking routes + merger
+    SERVICE_TIMEZONE = os.getenv("SERVICE_TIMEZONE", "UTC")  # zone of service_entry_time / service_end_time
+    APPOINTMENT_SLOT_MINUTES = int(os.getenv("APPOINTMENT_SLOT_MINUTES", "15"))
+    APPOINTMENT_BOOKINGS_PER_COUNTER = int(os.getenv("APPOINTMENT_BOOKINGS_PER_COUNTER", "1"))  # per slot
+    APPOINTMENT_DAYS_AHEAD = int(os.getenv("APPOINTMENT_DAYS_AHEAD", "14"))
+    APPOINTMENT_MERGE_INTERVAL_SECONDS = float(os.getenv("APPOINTMENT_MERGE_INTERVAL_SECONDS", "30"))
+
+    # Bulk CSV/NDJSON import (see app/utils/bulk_import.py)
+    IMPORT_BATCH_SIZE = int(os.getenv("IMPORT_BATCH_SIZE", "1000"))  # rows per INSERT and commit
+    IMPORT_HASH_WORKERS = int(os.getenv("IMPORT_HASH_WORKERS", "0"))  # bcrypt processes, 0 = one per CPU
+    IMPORT_MAX_ERRORS = int(os.getenv("IMPORT_MAX_ERRORS", "1000"))  # rejected rows listed in the report
+
+    # No-show sweeper (see app/utils/no_show.py): defers tokens near the head of a
+    # counter's queue whose owner will not make it in time, skips them if they stay silent
+    NO_SHOW_ENABLED = os.getenv("NO_SHOW_ENABLED", "false").lower() == "true"
+    NO_SHOW_INTERVAL_SECONDS = float(os.getenv("NO_SHOW_INTERVAL_SECONDS", "30"))
+    NO_SHOW_RULES = os.getenv("NO_SHOW_RULES", "eta,ping")  # eta: travel time beyond call time; ping: no location ping
+    NO_SHOW_HEAD_WINDOW = int(os.getenv("NO_SHOW_HEAD_WINDOW", "3"))  # waiting tokens checked per counter
+    NO_SHOW_ETA_GRACE_MINUTES = float(os.getenv("NO_SHOW_ETA_GRACE_MINUTES", "5"))
+    NO_SHOW_PING_MINUTES = float(os.getenv("NO_SHOW_PING_MINUTES", "10"))
+    NO_SHOW_SKIP_MINUTES = float(os.getenv("NO_SHOW_SKIP_MINUTES", "30"))  # silent deferred tokens are skipped; 0 never skips
+
+    # Read replicas for read-only endpoints (see app/db/replicas.py)
+    DATABASE_REPLICA_URLS = os.getenv("DATABASE_REPLICA_URLS", "")  # comma-separated
+    REPLICA_HEALTH_CHECK_SECONDS = float(os.getenv("REPLICA_HEALTH_CHECK_SECONDS", "10"))
+    READ_YOUR_WRITES_SECONDS = float(os.getenv("READ_YOUR_WRITES_SECONDS", "5"))
+
+    # Token number / queue position counters shared across workers (see app/utils/shared_state.py)
+    SHARED_STATE_BACKEND = os.getenv("SHARED_STATE_BACKEND", "none")  # none | mmap | redis
+    SHARED_STATE_PATH = os.getenv("SHARED_STATE_PATH")  # mmap file, defaults to /dev/shm/spotqueue-counters
+    SHARED_STATE_SLOTS = int(os.getenv("SHARED_STATE_SLOTS", "4096"))
+
+    # Startup schema handling (see app/db/database.py): auto compares a stored
+    # metadata fingerprint and only runs create_all on change; always | never force it
+    SCHEMA_SYNC = os.getenv("SCHEMA_SYNC", "auto")
+
+    # Logging pipeline (see app/utils/log_pipeline.py). Rules are "logger=value,..." and
+    # match child loggers too; rate limits are records per second
+    LOG_LEVEL = os.getenv("LOG_LEVEL", "INFO")
+    LOG_FORMAT = os.getenv("LOG_FORMAT", "json")  # json | text
+    LOG_BUFFER_SIZE = int(os.getenv("LOG_BUFFER_SIZE", "10000"))
+    LOG_SAMPLE_RATES = os.getenv("LOG_SAMPLE_RATES", "")
+    LOG_RATE_LIMITS = os.getenv("LOG_RATE_LIMITS", "sqlalchemy.engine=100")
+    SQL_ECHO = os.getenv("SQL_ECHO", "false").lower() == "true"
+
+    # Span tracing (see app/utils/tracing.py). Traces are exported when sampled or
+    # slower than TRACE_SLOW_MS (0 disables the slow-trace rule)
+    TRACING_ENABLED = os.getenv("TRACING_ENABLED", "false").lower() == "true"
+    TRACE_SAMPLE_RATE = float(os.getenv("TRACE_SAMPLE_RATE", "0.01"))
+    TRACE_SLOW_MS = float(os.getenv("TRACE_SLOW_MS", "500"))
+    TRACE_EXPORTER = os.getenv("TRACE_EXPORTER", "jsonl")  # jsonl | otlp
+    TRACE_FILE = os.getenv("TRACE_FILE", "traces.jsonl")
+    TRACE_OTLP_ENDPOINT = os.getenv("TRACE_OTLP_ENDPOINT", "http://localhost:4318/v1/traces")
+    TRACE_SERVICE_NAME = os.getenv("TRACE_SERVICE_NAME", "spotqueue")
+
+    # Opt-in per-request SQL profiler (see app/utils/sql_profiler.py)
+    SQL_PROFILER_ENABLED = os.getenv("SQL_PROFILER_ENABLED", "false").lower() == "true"
+    SQL_PROFILER_STRICT = os.getenv("SQL_PROFILER_STRICT", "false").lower() == "true"
+    SQL_QUERY_BUDGET = int(os.getenv("SQL_QUERY_BUDGET", "10"))
+    SQL_REPEAT_THRESHOLD = int(os.getenv("SQL_REPEAT_THRESHOLD", "3"))
+
+settings=Settings()
 
-settings=Settings()    
\ No newline at end of file
+configure_logging(
+    settings.LOG_LEVEL, settings.LOG_FORMAT, settings.LOG_BUFFER_SIZE,
+    parse_rules(settings.LOG_SAMPLE_RATES), parse_rules(settings.LOG_RATE_LIMITS),
+)    
\ No newline at end of file
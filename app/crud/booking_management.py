@@ -0,0 +1,226 @@
+from datetime import datetime, timedelta, timezone
+from sqlalchemy.orm import Session
+from sqlalchemy import func, insert, literal, select, update
+from sqlalchemy.exc import SQLAlchemyError
+from fastapi import HTTPException
+from app.models.booking_models import Booking
+from app.models.service_models import Service
+from app.schemas.booking_schemas import BookingRequest
+from app.schemas.token_schemas import TokenCreate
+from app.crud.counter_management import get_counter_by_service_id
+from app.crud.services_management import get_service_by_name
+from app.crud.site_management import get_nearest_site
+from app.crud.token_management import create_token_record, record_token_issued
+from app.crud.user_management import get_user_by_email
+from app.utils.appointments import slot_inventory
+from app.utils.sketches import as_utc
+from app.utils.shared_state import get_shared_counters
+from app.core.config import settings
+from app.utils.tracing import trace_functions
+
+MERGE_BATCH = 500
+
+# 1. Book an appointment slot
+def create_booking(db: Session, service_name: str, request: BookingRequest):
+    """
+        Reserve a place in an appointment slot for a user.
+
+        - **db**: The database session used to execute queries.
+        - **service_name**: The name of the service to book.
+        - **request**: A `BookingRequest` with the user's email, the slot start and their coordinates.
+
+        Logic:
+        - Loads the slot's service day into the in-memory inventory if needed and
+          takes a place atomically there before inserting, so concurrent bookings
+          can never overfill a slot.
+        - Without a shared-state backend each worker only sees its own places, so
+          the insert is also conditional on the slot's live bookings in the
+          database (`_insert_within_capacity`).
+
+        Error Handling:
+        - Raises a 400 error for unknown users, past or too distant dates and times that are not a slot start.
+        - Raises a 409 error if the slot is fully booked.
+        - Raises a 500 error for any SQLAlchemy-related issues (the place is released again).
+    """
+    user = get_user_by_email(db, request.email)
+    if not user:
+        raise HTTPException(status_code=400, detail="User not found")
+    service = get_service_by_name(db, service_name)
+
+    slot_start = as_utc(request.slot_start)
+    now = datetime.now(timezone.utc)
+    if slot_start <= now:
+        raise HTTPException(status_code=400, detail="Slot has already started")
+    if slot_start > now + timedelta(days=settings.APPOINTMENT_DAYS_AHEAD):
+        raise HTTPException(status_code=400, detail=f"Slots can be booked at most {settings.APPOINTMENT_DAYS_AHEAD} days ahead")
+
+    slot_inventory.load_day(db, service, slot_inventory.local_day(slot_start))
+    if slot_inventory.capacity(service["id"], slot_start) is None:
+        raise HTTPException(status_code=400, detail="Not a bookable slot for this service")
+    if not slot_inventory.reserve(service["id"], slot_start):
+        raise HTTPException(status_code=409, detail="Slot is fully booked")
+    values = {
+        "service_id": service["id"],
+        "user_id": user.id,
+        "slot_start": slot_start,
+        "latitude": request.latitude,
+        "longitude": request.longitude,
+    }
+    try:
+        if get_shared_counters() is None:
+            booking_id = _insert_within_capacity(db, values, slot_inventory.capacity(service["id"], slot_start))
+        else:
+            booking = Booking(**values)
+            db.add(booking)
+            db.flush()
+            booking_id = booking.id
+        db.commit()
+    except SQLAlchemyError as e:
+        db.rollback()
+        slot_inventory.release(service["id"], slot_start)
+        raise HTTPException(status_code=500, detail=f"Error while creating booking: {e}")
+    if booking_id is None:
+        slot_inventory.release(service["id"], slot_start)
+        raise HTTPException(status_code=409, detail="Slot is fully booked")
+    return db.get(Booking, booking_id)
+
+def _insert_within_capacity(db: Session, values: dict, capacity: int) -> int | None:
+    """
+        Insert a booking only if its slot has fewer than `capacity` live bookings.
+
+        The service row is locked first (`SELECT ... FOR UPDATE`), so bookings of
+        a service are serialized across workers on databases with row locks; the
+        `INSERT ... SELECT ... WHERE count < capacity` keeps the check and the
+        insert in one statement where they are not (SQLite).
+        Returns the new booking's id, or None when the slot is full.
+    """
+    db.execute(select(Service.id).where(Service.id == values["service_id"]).with_for_update())
+    live = select(func.count(Booking.id)).where(
+        Booking.service_id == values["service_id"],
+        Booking.slot_start == values["slot_start"],
+        Booking.status != "cancelled",
+    ).scalar_subquery()
+    row = dict(values, status="booked", created_at=datetime.now(timezone.utc))
+    columns = Booking.__table__.c
+    source = select(*(literal(value, columns[name].type) for name, value in row.items())).where(live < capacity)
+    return db.execute(insert(Booking).from_select(list(row), source).returning(Booking.id)).scalar()
+
+# 2. Cancel a booking that has not been merged into the queue yet
+def cancel_booking(db: Session, service_name: str, booking_id: int):
+    service = get_service_by_name(db, service_name)
+    try:
+        cancelled = db.execute(
+            update(Booking)
+            .where(Booking.id == booking_id, Booking.service_id == service["id"], Booking.status == "booked")
+            .values(status="cancelled")
+        ).rowcount
+        db.commit()
+        booking = db.get(Booking, booking_id)
+    except SQLAlchemyError as e:
+        db.rollback()
+        raise HTTPException(status_code=500, detail=f"Error while cancelling booking: {e}")
+    if booking is None or booking.service_id != service["id"]:
+        raise HTTPException(status_code=404, detail="Booking not found")
+    if not cancelled:
+        raise HTTPException(status_code=409, detail=f"Booking is already {booking.status}")
+    if as_utc(booking.slot_start) > datetime.now(timezone.utc):  # started slots are no longer in the inventory
+        slot_inventory.load_day(db, service, slot_inventory.local_day(booking.slot_start))
+        slot_inventory.release(service["id"], booking.slot_start)
+    return booking
+
+# 3. Availability of every slot of a service day
+def get_slot_availability(db: Session, service_name: str, day):
+    """
+        Capacity and remaining places of every slot of a service on `day`.
+
+        Error Handling:
+        - Raises a 400 error for days before today or more than `APPOINTMENT_DAYS_AHEAD` days ahead.
+    """
+    today = slot_inventory.today()
+    if not today <= day <= today + timedelta(days=settings.APPOINTMENT_DAYS_AHEAD):
+        raise HTTPException(status_code=400, detail=f"Slots are listed from today up to {settings.APPOINTMENT_DAYS_AHEAD} days ahead")
+    service = get_service_by_name(db, service_name)
+    return [
+        {
+            "slot_start": slot_start,
+            "capacity": slot_inventory.capacity(service["id"], slot_start) or 0,
+            "available": slot_inventory.available(service["id"], slot_start),
+        }
+        for slot_start in slot_inventory.load_day(db, service, day)
+    ]
+
+def count_bookings_by_slot(db: Session, service_id: int, first_slot: datetime, last_slot: datetime):
+    """
+        `(slot_start, bookings)` rows for live bookings of a service between two slot starts.
+    """
+    try:
+        return db.execute(
+            select(Booking.slot_start, func.count(Booking.id))
+            .where(
+                Booking.service_id == service_id,
+                Booking.slot_start.between(first_slot, last_slot),
+                Booking.status != "cancelled",
+            )
+            .group_by(Booking.slot_start)
+        ).all()
+    except SQLAlchemyError as e:
+        raise HTTPException(status_code=500, detail=f"Error while counting bookings: {e}")
+
+def merge_due_bookings(db: Session, now: datetime):
+    """
+        Issue live queue tokens for bookings whose slot has started.
+
+        Each booking is claimed (`booked` -> `queued`) with a conditional update,
+        and the claim, the token and the booking's `token_id` are committed
+        together, so concurrent mergers never issue it twice and a failed token
+        leaves the booking `booked` for the next run.
+
+        Returns:
+            list[tuple[Token, float, float, tuple[float, float]]]: Each token with the
+            booking's coordinates and the site coordinates it was routed to.
+    """
+    try:
+        due = db.execute(
+            select(Booking)
+            .where(Booking.status == "booked", Booking.slot_start <= now)
+            .order_by(Booking.slot_start, Booking.id)
+            .limit(MERGE_BATCH)
+        ).scalars().all()
+    except SQLAlchemyError as e:
+        raise HTTPException(status_code=500, detail=f"Error while fetching due bookings: {e}")
+
+    merged = []
+    for booking in due:
+        booking_id, latitude, longitude = booking.id, booking.latitude, booking.longitude
+        counter_id = get_counter_by_service_id(db, booking.service_id)
+        if counter_id is None:
+            settings.logger.warning(f"Booking {booking_id} stays pending: service {booking.service_id} has no counter")
+            continue
+        try:
+            claimed = db.execute(
+                update(Booking).where(Booking.id == booking_id, Booking.status == "booked").values(status="queued")
+            ).rowcount
+            if not claimed:
+                db.rollback()
+                continue  # another worker merged or the user cancelled it
+            site = get_nearest_site(db, booking.service_id, latitude, longitude)
+            coordinates = site.coordinates if site else settings.FIXED_COORDINATES
+            token = create_token_record(db, TokenCreate(
+                user_id=booking.user_id,
+                service_id=booking.service_id,
+                counter_id=counter_id,
+                site_id=site.id if site else None,
+                latitude=latitude,
+                longitude=longitude,
+            ), None, None, coordinates, commit=False)
+            db.execute(update(Booking).where(Booking.id == booking_id).values(token_id=token.id))
+            db.commit()
+        except (SQLAlchemyError, HTTPException) as e:
+            db.rollback()
+            settings.logger.error(f"Booking {booking_id} stays pending: {getattr(e, 'detail', e)}")
+            continue
+        record_token_issued(token)
+        merged.append((token, latitude, longitude, coordinates))
+    return merged
+
+trace_functions(globals())
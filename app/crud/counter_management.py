@@ -4,7 +4,10 @@ from app.models.counter_models import Counter
 from app.schemas.counter_schemas import CounterCreate
 from fastapi import HTTPException
 from sqlalchemy.exc import SQLAlchemyError
+from sqlalchemy import func
 from app.models.service_models import Service
+from app.utils.table_versions import table_versions
+from app.utils.tracing import trace_functions
 
 # 1. Create a new counter
 def create_counter(db: Session, counter: CounterCreate):
@@ -31,6 +34,7 @@ def create_counter(db: Session, counter: CounterCreate):
         counters_count = db.query(Counter).filter(Counter.service_id == service.id).count()
         service.number_of_counters = counters_count
         db.commit()
+        table_versions.bump("counters")
         return new_counter
     except SQLAlchemyError as e:
         db.rollback()
@@ -59,3 +63,12 @@ def get_counter_by_id(db: Session, counter_id: int):
 def get_counter_by_service_id(db: Session, service_id: int):
     counter = db.query(Counter).filter(Counter.service_id == service_id).first()
     return counter.id if counter else None  # Return counter id or None if not found
+
+def count_counters_by_service(db: Session, service_id: int) -> int:
+    try:
+        return db.query(func.count(Counter.id)).filter(Counter.service_id == service_id).scalar()
+    except SQLAlchemyError as e:
+        raise HTTPException(status_code=500, detail=f"Error while counting counters: {e}")
+
+
+trace_functions(globals())
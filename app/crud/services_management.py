@@ -4,6 +4,8 @@ from app.models.service_models import Service
 from app.schemas.service_schemas import ServiceCreate
 from fastapi import HTTPException
 from sqlalchemy.exc import SQLAlchemyError
+from app.utils.table_versions import table_versions
+from app.utils.tracing import trace_functions
 
 # 1. Create a new service
 def create_services(db:Session,service:ServiceCreate):
@@ -50,6 +52,7 @@ def create_services(db:Session,service:ServiceCreate):
         })
 
         db.commit()
+        table_versions.bump("services")
 
         created_service = result.fetchone()
 
@@ -132,3 +135,6 @@ def get_service_by_name(db:Session,service_name:str):
         }
     except SQLAlchemyError as e:
         raise HTTPException(status_code=500, detail=f"Error while fetching the service: {e}")
+
+
+trace_functions(globals())
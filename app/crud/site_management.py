@@ -0,0 +1,107 @@
+from sqlalchemy.orm import Session
+from sqlalchemy.exc import SQLAlchemyError
+from fastapi import HTTPException
+from app.models.site_models import ServiceSite
+from app.schemas.site_schemas import SiteCreate
+from app.crud.services_management import get_service_by_name
+from app.utils.spatial_index import site_index
+from app.utils.table_versions import table_versions
+from app.utils.tracing import trace_functions
+
+# 1. Create a new site for a service
+def create_site(db: Session, service_name: str, site: SiteCreate):
+    """
+        Register a new branch (site) for an existing service.
+
+        - **db**: The database session used to execute queries.
+        - **service_name**: The name of the service the branch belongs to.
+        - **site**: A `SiteCreate` object with the branch name, coordinates and open flag.
+
+        Logic:
+        - Resolves the service by name; `get_service_by_name` raises a 400 if it does not exist.
+        - Inserts the site and invalidates the in-memory spatial index so the next
+          token issuance sees the new branch.
+
+        Returns:
+        - The created `ServiceSite` row.
+
+        Error Handling:
+        - Raises a 500 error for any SQLAlchemy-related issues during the transaction.
+    """
+    service = get_service_by_name(db, service_name)
+    try:
+        new_site = ServiceSite(
+            service_id=service["id"],
+            site_name=site.site_name,
+            latitude=site.latitude,
+            longitude=site.longitude,
+            is_open=site.is_open,
+        )
+        db.add(new_site)
+        db.commit()
+        db.refresh(new_site)
+        table_versions.bump("service_sites")  # every worker's site_index rebuilds on its next lookup
+        return new_site
+    except SQLAlchemyError as e:
+        db.rollback()
+        raise HTTPException(status_code=500, detail=f"Error while creating site: {e}")
+
+# 2. Retrieve all sites of a service
+def get_sites_by_service(db: Session, service_name: str):
+    """
+        Fetch every branch registered for a service.
+
+        - **db**: The database session used to execute queries.
+        - **service_name**: The name of the service.
+
+        Returns:
+        - A list of `ServiceSite` rows, possibly empty.
+
+        Error Handling:
+        - Raises a 400 error if the service does not exist.
+        - Raises a 500 error for any SQLAlchemy-related issues during the query.
+    """
+    service = get_service_by_name(db, service_name)
+    try:
+        return db.query(ServiceSite).filter(ServiceSite.service_id == service["id"]).all()
+    except SQLAlchemyError as e:
+        raise HTTPException(status_code=500, detail=f"Error while fetching sites: {e}")
+
+# 3. Route a user to the nearest open site of a service
+def get_nearest_site(db: Session, service_id: int, latitude: float, longitude: float):
+    """
+        Pick the closest open branch of a service for the given user location.
+
+        The lookup is served by the in-memory KD-tree in `app.utils.spatial_index`,
+        so it costs no database round-trip once the index is loaded.
+
+        - **db**: The database session, only used to (re)load the index.
+        - **service_id**: The service to route to.
+        - **latitude** / **longitude**: The user's current position.
+
+        Returns:
+        - A `SiteLocation`, or None when the service has no open sites
+          (callers then fall back to `settings.FIXED_COORDINATES`).
+    """
+    try:
+        site, _ = site_index.nearest(db, service_id, latitude, longitude)
+        return site
+    except SQLAlchemyError as e:
+        raise HTTPException(status_code=500, detail=f"Error while loading sites: {e}")
+
+# 4. Coordinates of every registered site
+def get_site_coordinates(db: Session):
+    """
+        Distinct coordinates of all sites, open or not, used to precompute ETA grids.
+
+        Returns:
+        - A list of `(latitude, longitude)` tuples.
+    """
+    try:
+        rows = db.query(ServiceSite.latitude, ServiceSite.longitude).distinct().all()
+        return [(row.latitude, row.longitude) for row in rows]
+    except SQLAlchemyError as e:
+        raise HTTPException(status_code=500, detail=f"Error while loading sites: {e}")
+
+
+trace_functions(globals())
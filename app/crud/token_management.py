@@ -1,46 +1,77 @@
 from app.crud.counter_management import get_counter_by_service_id
 from app.crud.services_management import get_service_by_name
+from app.crud.site_management import get_nearest_site
 from app.crud.user_management import get_user_by_email
+from app.models.counter_models import Counter
 from app.models.token_models import Token
+from app.models.site_models import ServiceSite
 from app.schemas.token_schemas import TokenCreate, TokenRequest
+from datetime import datetime, timezone
 from sqlalchemy.orm import Session
-from sqlalchemy import func,select
+from sqlalchemy import and_,func,or_,select,update
 from sqlalchemy.exc import SQLAlchemyError
 from fastapi import HTTPException
 from app.utils.get_distance import get_distance
+from app.utils.eta_worker import EtaJob, eta_worker
+from app.utils.shared_state import get_shared_counters, next_value
+from app.utils.token_log import record_event
+from app.utils.notifier import notifier
+from app.utils.sketches import latency_sketches, seconds_between
 from app.core.config import settings
+from app.utils.tracing import trace_functions
 
-def create_token_record(db: Session, token_data: TokenCreate, duration_text: str, distance_text: str):
-    try:
-        # Generate a unique token number based on the maximum existing token_number
-        token_number = db.query(func.max(Token.token_number)).scalar() or 0
-        max_token_number = int(token_number) if token_number is not None else 0
-        new_token_number = max_token_number + 1
+def allocate_token_slot(db: Session, service_id: int, counter_id: int) -> tuple[int, int]:
+    """
+        Returns the next token number and the queue position at the given counter.
 
+        With a shared-state backend both come from atomic cross-worker counters,
+        seeded once per process from the database. Otherwise they are derived from
+        MAX(token_number) and the number of tokens already issued at the counter.
+    """
+    def max_token_number():
+        return db.query(func.max(Token.token_number)).scalar() or 0
 
-        existing_token_count = db.query(Token).filter(
-            Token.service_id == token_data.service_id,
-            Token.counter_id == token_data.counter_id,
+    def counter_token_count():
+        return db.query(Token).filter(
+            Token.service_id == service_id,
+            Token.counter_id == counter_id,
         ).count()
 
-        queue_position = existing_token_count+1
+    if get_shared_counters() is None:
+        return int(max_token_number()) + 1, counter_token_count() + 1
+    return (
+        next_value("token_number", max_token_number),
+        next_value(f"queue:{service_id}:{counter_id}", counter_token_count),
+    )
+
+def create_token_record(db: Session, token_data: TokenCreate, duration_text: str, distance_text: str, service_coordinates: tuple[float, float] | None = None, commit: bool = True):
+    """
+        Insert a new token. With `commit=False` the token is only flushed, so the
+        caller can commit it together with its own changes and then call
+        `record_token_issued`.
+    """
+    try:
+        new_token_number, queue_position = allocate_token_slot(db, token_data.service_id, token_data.counter_id)
 
-        # Check if the user's coordinates match the fixed service coordinates
-        service_latitude, service_longitude = settings.FIXED_COORDINATES[0], settings.FIXED_COORDINATES[1]
+        # Check if the user's coordinates match the coordinates of the branch they were routed to
+        service_latitude, service_longitude = service_coordinates or settings.FIXED_COORDINATES
         exact_location_match = (float(token_data.latitude) == service_latitude) and (float(token_data.longitude) == service_longitude)
         
         if exact_location_match:
             reach_out = True
+        elif distance_text is None or duration_text is None:
+            reach_out = False  # ETA pending, filled in by the background ETA worker
         else:
             reach_out = float(distance_text) < 2 or int(duration_text) < 2  # Adjust as needed for your unit
        
-        print(f"Reach Out Condition: {reach_out}")
+        settings.logger.debug("Reach out condition for token %s: %s", new_token_number, reach_out)
 
         new_token = Token(
             token_number=new_token_number,  # Increment the max token number
             user_id=token_data.user_id,
             service_id=token_data.service_id,
             counter_id=token_data.counter_id,
+            site_id=token_data.site_id,
             latitude=token_data.latitude,
             longitude=token_data.longitude,
             queue_position=queue_position,
@@ -49,8 +80,12 @@ def create_token_record(db: Session, token_data: TokenCreate, duration_text: str
             reach_out=reach_out
         )
         db.add(new_token)
+        if not commit:
+            db.flush()
+            return new_token
         db.commit()
         db.refresh(new_token)
+        record_token_issued(new_token)
         return new_token
     except SQLAlchemyError as e:
         db.rollback() 
@@ -60,6 +95,11 @@ def create_token_record(db: Session, token_data: TokenCreate, duration_text: str
     
 
 
+def record_token_issued(token: Token):
+    record_event("issued", token.token_number, token.service_id, token.counter_id, token.distance, token.duration)
+    if token.reach_out:
+        record_event("arrived", token.token_number)
+
 async def generate_token(request: TokenRequest, db: Session):
     try:
         # Get user by email
@@ -80,18 +120,34 @@ async def generate_token(request: TokenRequest, db: Session):
         if counter_id is None:
             raise HTTPException(status_code=400, detail="No counter available for this service")
 
-        duration_text, distance_text = await get_distance(request.latitude, request.longitude)
+        # Route to the nearest open branch before paying for a remote distance call
+        site = get_nearest_site(db, service_id, request.latitude, request.longitude)
+        service_coordinates = site.coordinates if site else settings.FIXED_COORDINATES
+
+        if settings.ASYNC_ETA_ENABLED:
+            # Insert first; the ETA worker fills in distance, duration and reach_out
+            duration_text, distance_text = None, None
+        else:
+            duration_text, distance_text = await get_distance(request.latitude, request.longitude, service_coordinates)
 
         # Generate the token and store it in the database
         token_data = TokenCreate(
             user_id=user.id,
             service_id=service_id,
             counter_id=counter_id,  
+            site_id=site.id if site else None,
             latitude=request.latitude,
             longitude=request.longitude
         )
 
-        token = create_token_record(db, token_data,duration_text, distance_text)
+        token = create_token_record(db, token_data,duration_text, distance_text, service_coordinates)
+
+        if settings.ASYNC_ETA_ENABLED:
+            job = EtaJob(token.id, token.token_number, request.latitude, request.longitude, service_coordinates)
+            if not eta_worker.enqueue(job):
+                # Queue is full: enrich inline rather than leave the token pending
+                await eta_worker.process(job)
+                db.refresh(token)
 
         return token
     
@@ -101,6 +157,230 @@ async def generate_token(request: TokenRequest, db: Session):
         raise HTTPException(status_code=500, detail=f"An unexpected error occurred while generating token: {e}")
 
 
+def fill_token_eta(db: Session, token_id: int, duration_value: int, distance_value: float, service_coordinates: tuple[float, float] | None = None):
+    """
+        Store a freshly computed ETA on a token that was issued with a pending ETA.
+
+        Applies the same reach-out rule as `create_token_record` and returns the
+        updated token, or None if it no longer exists.
+    """
+    try:
+        token = db.get(Token, token_id)
+        if token is None:
+            return None
+        service_latitude, service_longitude = service_coordinates or settings.FIXED_COORDINATES
+        exact_location_match = (token.latitude == service_latitude) and (token.longitude == service_longitude)
+        token.distance = distance_value
+        token.duration = duration_value
+        token.reach_out = exact_location_match or float(distance_value) < 2 or int(duration_value) < 2
+        db.commit()
+        db.refresh(token)
+        return token
+    except SQLAlchemyError as e:
+        db.rollback()
+        raise HTTPException(status_code=500,detail=f"Database error occurred: {e}")
+
+def get_active_tokens_for_refresh(db: Session, issued_after: datetime):
+    """
+        Tokens whose ETA should be refreshed: issued after `issued_after`, still
+        waiting (or deferred) and not yet arrived. The time bound keeps tokens
+        abandoned on earlier days out of every refresh.
+
+        Returns lightweight rows `(id, token_number, latitude, longitude, site_latitude,
+        site_longitude)` via one outer join instead of loading ORM objects and
+        lazily fetching each token's site.
+    """
+    try:
+        return db.execute(
+            select(
+                Token.id, Token.token_number, Token.latitude, Token.longitude,
+                ServiceSite.latitude.label("site_latitude"), ServiceSite.longitude.label("site_longitude"),
+            )
+            .outerjoin(ServiceSite, Token.site_id == ServiceSite.id)
+            .where(
+                Token.state.in_(("waiting", "deferred")),
+                Token.issue_time > issued_after,
+                Token.reach_out.is_(False),
+            )
+        ).all()
+    except SQLAlchemyError as e:
+        raise HTTPException(status_code=500, detail=f"Database error occurred: {e}")
+
+def bulk_update_token_etas(db: Session, updates: list[dict]):
+    """
+        Write many ETAs at once with a single executemany `UPDATE ... WHERE id = ?`.
+
+        - **updates**: dicts with `id`, `distance`, `duration` and `reach_out`.
+    """
+    if not updates:
+        return 0
+    try:
+        db.bulk_update_mappings(Token, updates)
+        db.commit()
+        return len(updates)
+    except SQLAlchemyError as e:
+        db.rollback()
+        raise HTTPException(status_code=500, detail=f"Database error occurred: {e}")
+
+def get_arrivals_after(db: Session, last_id: int, limit: int = 50_000):
+    """
+        Lightweight `(id, service_id, issue_time)` rows for tokens with `id > last_id`, in id order.
+    """
+    try:
+        return db.execute(
+            select(Token.id, Token.service_id, Token.issue_time)
+            .where(Token.id > last_id)
+            .order_by(Token.id)
+            .limit(limit)
+        ).all()
+    except SQLAlchemyError as e:
+        raise HTTPException(status_code=500, detail=f"Database error occurred: {e}")
+
+def get_service_times_after(db: Session, served_after: datetime | None, after_id: int = 0, limit: int = 50_000):
+    """
+        `(id, service_id, called_at, served_at)` rows for served tokens, in `(served_at, id)`
+        order, starting after the `(served_after, after_id)` position.
+    """
+    stmt = select(Token.id, Token.service_id, Token.called_at, Token.served_at).where(
+        Token.served_at.is_not(None), Token.called_at.is_not(None)
+    )
+    if served_after is not None:
+        stmt = stmt.where(or_(
+            Token.served_at > served_after, and_(Token.served_at == served_after, Token.id > after_id),
+        ))
+    try:
+        return db.execute(stmt.order_by(Token.served_at, Token.id).limit(limit)).all()
+    except SQLAlchemyError as e:
+        raise HTTPException(status_code=500, detail=f"Database error occurred: {e}")
+
+def call_next_token(db: Session, counter_id: int):
+    """
+        Finish the token being served at a counter and call the next waiting one.
+
+        Sets `served_at` on the finished token and `called_at` on the called one,
+        records both events, pushes both state changes to the tokens' event
+        subscribers and feeds the waiting and service times into the
+        latency sketches behind `/analytics/percentiles`.
+
+        The counter row is locked first (`SELECT ... FOR UPDATE`), so concurrent
+        calls at one counter run one after the other, and the serving token is
+        finished with a conditional `UPDATE`, so it is only ever served once.
+
+        Returns:
+            tuple[Row | None, Token | None]: `(token_number, service_id, called_at)`
+            of the token just served, and the token now being served.
+    """
+    now = datetime.now(timezone.utc)
+    try:
+        db.execute(select(Counter.id).where(Counter.id == counter_id).with_for_update())
+        served = db.execute(
+            update(Token)
+            .where(Token.counter_id == counter_id, Token.state == "serving")
+            .values(state="served", served_at=now)
+            .returning(Token.token_number, Token.service_id, Token.called_at)
+        ).first()
+        called = (
+            db.query(Token)
+            .filter(Token.counter_id == counter_id, Token.state == "waiting")
+            .order_by(Token.token_number)
+            .with_for_update(skip_locked=True)
+            .first()
+        )
+        if called is not None:
+            called.state = "serving"
+            called.called_at = now
+        db.commit()
+    except SQLAlchemyError as e:
+        db.rollback()
+        raise HTTPException(status_code=500, detail=f"Database error occurred: {e}")
+    if served is not None:
+        record_event("served", served.token_number, served.service_id, counter_id)
+        notifier.publish(served.token_number, {"token_number": served.token_number, "state": "served"})
+        service_time = seconds_between(served.called_at, now)
+        if service_time is not None:
+            latency_sketches.record("service", served.service_id, counter_id, service_time)
+    if called is not None:
+        record_event("called", called.token_number, called.service_id, counter_id)
+        notifier.publish(called.token_number, {"token_number": called.token_number, "state": "serving"})
+        wait_time = seconds_between(called.issue_time, now)
+        if wait_time is not None:
+            latency_sketches.record("wait", called.service_id, counter_id, wait_time)
+    return served, called
+
+def get_no_show_candidates(db: Session):
+    """
+        Lightweight rows for every waiting, deferred or serving token, ordered by
+        counter and queue order, for the no-show sweeper.
+    """
+    try:
+        return db.execute(
+            select(
+                Token.id, Token.token_number, Token.service_id, Token.counter_id, Token.state,
+                Token.duration, Token.reach_out, Token.last_location_at,
+            )
+            .where(Token.state.in_(("waiting", "deferred", "serving")))
+            .order_by(Token.counter_id, Token.token_number)
+        ).all()
+    except SQLAlchemyError as e:
+        raise HTTPException(status_code=500, detail=f"Database error occurred: {e}")
+
+def apply_no_show_transitions(db: Session, defer_ids: list[int], resume_ids: list[int], silent_since: datetime | None):
+    """
+        Move tokens between queue states in at most three conditional bulk `UPDATE`s:
+        waiting -> deferred for `defer_ids`, deferred -> waiting for `resume_ids`,
+        and deferred -> skipped for every deferred token without a location ping
+        since `silent_since` (None skips nothing).
+
+        Each `UPDATE` only matches rows still in the expected state, so several
+        workers can sweep concurrently; only the rows this call moved are returned.
+
+        Returns:
+            dict[str, list]: `(id, token_number, service_id, counter_id)` rows per new state.
+    """
+    columns = (Token.id, Token.token_number, Token.service_id, Token.counter_id)
+    moves = {}
+    try:
+        if defer_ids:
+            moves["deferred"] = db.execute(
+                update(Token).where(Token.id.in_(defer_ids), Token.state == "waiting")
+                .values(state="deferred").returning(*columns).execution_options(synchronize_session=False)
+            ).all()
+        if resume_ids:
+            moves["waiting"] = db.execute(
+                update(Token).where(Token.id.in_(resume_ids), Token.state == "deferred")
+                .values(state="waiting").returning(*columns).execution_options(synchronize_session=False)
+            ).all()
+        if silent_since is not None:
+            moves["skipped"] = db.execute(
+                update(Token).where(Token.state == "deferred", Token.last_location_at < silent_since)
+                .values(state="skipped").returning(*columns).execution_options(synchronize_session=False)
+            ).all()
+        db.commit()
+        return moves
+    except SQLAlchemyError as e:
+        db.rollback()
+        raise HTTPException(status_code=500, detail=f"Database error occurred: {e}")
+
+def get_counter_queue(db: Session, counter_id: int):
+    """
+        Active (waiting, deferred or serving) tokens at a counter in issue order.
+    """
+    try:
+        return (
+            db.query(Token)
+            .filter(Token.counter_id == counter_id, Token.state.in_(("waiting", "deferred", "serving")))
+            .order_by(Token.token_number)
+            .all()
+        )
+    except SQLAlchemyError as e:
+        raise HTTPException(status_code=500, detail=f"Database error occurred: {e}")
+
+def get_token_by_number(db:Session,token_number:int):
+    try:
+        return db.query(Token).filter(Token.token_number==token_number).first()
+    except SQLAlchemyError as e:
+        raise HTTPException(status_code=500,detail=f"Database Error: {e}")
+
 def get_token_by_counter_id(counter_id:int,db:Session):
     try:
         result= db.execute(select(Token).filter(Token.counter_id == counter_id)).scalars().all()
@@ -124,6 +404,7 @@ def update_token_distance_duration(db:Session,token:Token,latitude:float,longitu
     try:
         token.latitude=latitude
         token.longitude = longitude
+        token.last_location_at = datetime.now(timezone.utc)
         token.duration = duration_value
         token.distance= distance_value
 
@@ -136,7 +417,16 @@ def update_token_distance_duration(db:Session,token:Token,latitude:float,longitu
     except Exception as e:
         raise HTTPException(status_code=500,detail=f"An unexpected error occurred {e}")
     
-def check_reach_out(latitude: float, longitude: float, distance: int, duration: int) -> bool:
+def get_token_service_coordinates(token: Token) -> tuple[float, float]:
+    """
+        Coordinates of the branch a token was routed to, or the fixed default
+        location for tokens issued before multi-site routing existed.
+    """
+    if token.site is not None:
+        return (token.site.latitude, token.site.longitude)
+    return settings.FIXED_COORDINATES
+
+def check_reach_out(latitude: float, longitude: float, distance: int, duration: int, service_coordinates: tuple[float, float] | None = None) -> bool:
     try:
         # Validate latitude and longitude (example: check if they are within valid GPS ranges)
         if not (-90 <= latitude <= 90) or not (-180 <= longitude <= 180):
@@ -146,10 +436,13 @@ def check_reach_out(latitude: float, longitude: float, distance: int, duration:
         if distance < 0 or duration < 0:
             raise HTTPException(status_code=400, detail="Distance and duration must be non-negative.")
         
-        service_coordinate = (settings.FIXED_COORDINATES[0], settings.FIXED_COORDINATES[1])
+        service_coordinate = tuple(service_coordinates or settings.FIXED_COORDINATES)
         user_at_service_location = (latitude, longitude) == service_coordinate
         return user_at_service_location and (distance < 2) and (duration < 2)
     except HTTPException as e:
         raise e
     except Exception as e:
         raise HTTPException(status_code=500,detail=f"Unexpected error occurred: {e}")
+
+
+trace_functions(globals())
@@ -2,6 +2,7 @@ from sqlalchemy import text
 from sqlalchemy.orm import Session
 from app.models.user_models import User 
 from fastapi import HTTPException
+from app.utils.tracing import trace_functions
 
 def create_user(db:Session,name:str,email:str,hashed_password:str):
     """
@@ -110,4 +111,7 @@ def get_user_by_username(db:Session,name:str):
             raise HTTPException(status_code=400,detail="User not found or exist")
         return user
     except Exception as e:
-        raise HTTPException(status_code=500,detail=f"Error on get_user_by_username: {e}")
\ No newline at end of file
+        raise HTTPException(status_code=500,detail=f"Error on get_user_by_username: {e}")
+
+
+trace_functions(globals())
@@ -1,26 +1,140 @@
-from sqlalchemy import create_engine
+import hashlib
+import logging
+from datetime import datetime
+from sqlalchemy import Column, DateTime, Integer, MetaData, String, Table, create_engine, inspect, literal, select, text
+from sqlalchemy.schema import CreateColumn
 from sqlalchemy.orm import sessionmaker, declarative_base
 from sqlalchemy.exc import SQLAlchemyError
 from app.core.config import settings
 
 
 # Create SQLAlchemy engine and sessionmaker 
-engine = create_engine(settings.DATABASE_URL, echo=True) 
+engine = create_engine(settings.DATABASE_URL)
+if settings.SQL_ECHO:
+    # Rather than echo=True, which attaches its own synchronous stream handler,
+    # let statements flow through the queued logging pipeline and its rate limits
+    logging.getLogger("sqlalchemy.engine").setLevel(logging.INFO)
 SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
 
 # Base class for models
 Base = declarative_base()
 
+# Single-row bookkeeping table, kept out of Base.metadata so it never affects the fingerprint
+_schema_metadata = MetaData()
+schema_version = Table(
+    "schema_version", _schema_metadata,
+    Column("id", Integer, primary_key=True),
+    Column("fingerprint", String(64), nullable=False),
+    Column("updated_at", DateTime, nullable=False),
+)
+
+def schema_fingerprint(metadata=Base.metadata) -> str:
+    """
+        Hashes the declared tables, columns, keys and indexes into a stable hex digest.
+
+        The digest changes whenever a model changes, so comparing it with the value
+        stored in `schema_version` tells us whether `create_all` has anything to do.
+    """
+    parts = []
+    for table in sorted(metadata.tables.values(), key=lambda t: t.name):
+        parts.append(f"table {table.name}")
+        for column in table.columns:
+            foreign_keys = ",".join(sorted(fk.target_fullname for fk in column.foreign_keys))
+            parts.append(f"  {column.name} {column.type!r} null={column.nullable} pk={column.primary_key} fk={foreign_keys}")
+        for index in sorted(table.indexes, key=lambda i: i.name or ""):
+            parts.append(f"  index {index.name} {[c.name for c in index.columns]} unique={index.unique}")
+    return hashlib.sha256("\n".join(parts).encode()).hexdigest()
+
+def _stored_fingerprint() -> str | None:
+    try:
+        with engine.connect() as conn:
+            return conn.execute(select(schema_version.c.fingerprint).where(schema_version.c.id == 1)).scalar()
+    except SQLAlchemyError:
+        # Table missing on a fresh database
+        return None
+
+def add_missing_columns(conn) -> list[str]:
+    """
+        Brings existing tables up to the models: `create_all` only creates missing
+        tables, so columns and indexes added to a model later are added here with
+        `ALTER TABLE ... ADD COLUMN` and `CREATE INDEX`.
+
+        Existing rows get the column's scalar default (e.g. `tokens.state`), or NULL.
+        A NOT NULL column without a scalar default cannot be added to a table
+        with rows and raises RuntimeError, so startup stops on a schema it cannot upgrade.
+
+        Returns the `table.column` names that were added.
+    """
+    inspector = inspect(conn)
+    tables = set(inspector.get_table_names())
+    preparer = conn.dialect.identifier_preparer
+    added = []
+    for table in Base.metadata.sorted_tables:
+        if table.name not in tables:
+            continue
+        present = {column["name"] for column in inspector.get_columns(table.name)}
+        for column in table.columns:
+            if column.name in present:
+                continue
+            ddl = str(CreateColumn(column).compile(dialect=conn.dialect))
+            default = column.default
+            if default is not None and default.is_scalar:
+                value = literal(default.arg, column.type).compile(dialect=conn.dialect, compile_kwargs={"literal_binds": True})
+                ddl += f" DEFAULT {value}"
+            elif not column.nullable and conn.execute(select(literal(1)).select_from(table).limit(1)).first():
+                raise RuntimeError(f"Cannot add NOT NULL column {table.name}.{column.name} without a default to existing rows")
+            conn.execute(text(f"ALTER TABLE {preparer.format_table(table)} ADD COLUMN {ddl}"))
+            added.append(f"{table.name}.{column.name}")
+        indexes = {index["name"] for index in inspector.get_indexes(table.name)}
+        for index in table.indexes:
+            if index.name not in indexes:
+                index.create(conn)
+    return added
+
 # Function to initialize the database with error handling
 def init_db():
+    """
+        Makes sure the schema exists without reflecting every table on each start.
+
+        With `SCHEMA_SYNC=auto` one primary-key lookup compares the stored schema
+        fingerprint with the models; `create_all` and `add_missing_columns` only
+        run when they differ.
+    """
     try:
-        Base.metadata.create_all(bind=engine)
+        if settings.SCHEMA_SYNC == "never":
+            return
+        fingerprint = schema_fingerprint()
+        if settings.SCHEMA_SYNC == "auto" and _stored_fingerprint() == fingerprint:
+            settings.logger.info("Database schema up to date, skipping create_all.")
+            return
+        with engine.begin() as conn:
+            Base.metadata.create_all(bind=conn)
+            added = add_missing_columns(conn)
+            _schema_metadata.create_all(bind=conn)
+            conn.execute(schema_version.delete())
+            conn.execute(schema_version.insert().values(id=1, fingerprint=fingerprint, updated_at=datetime.utcnow()))
+        if added:
+            settings.logger.info(f"Added columns: {', '.join(added)}")
         settings.logger.info("Database initialized successfully.")
     except SQLAlchemyError as e:
         settings.logger.error(f"Error initializing the database: {e}")
+    except RuntimeError:
+        raise
     except Exception as ex:
         settings.logger.error(f"Unexpected error during database initialization: {ex}")
 
+def with_session(func, *args):
+    """
+        Call `func(db, *args)` with a fresh session and close it afterwards.
+
+        For background tasks, which run it in a thread with `asyncio.to_thread`.
+    """
+    db = SessionLocal()
+    try:
+        return func(db, *args)
+    finally:
+        db.close()
+
 def get_db():
     db = SessionLocal()
     try:
@@ -33,4 +147,4 @@ def get_db():
         raise
     finally:
         db.close()
-        settings.logger.info("Database session closed.")
+        settings.logger.debug("Database session closed.")
@@ -0,0 +1,143 @@
+import threading
+import time
+from fastapi import Request
+from sqlalchemy import create_engine, text
+from sqlalchemy.exc import DBAPIError, SQLAlchemyError
+from app.core.config import settings
+from app.db.database import SessionLocal, engine as primary_engine
+
+# Set on successful writes; reads carrying a recent value go to the primary
+LAST_WRITE_COOKIE = "spotqueue_last_write"
+
+
+class ReplicaRouter:
+    """
+        Picks the engine that serves a read-only request.
+
+        Healthy replicas are used round-robin. A replica that fails a connection is
+        taken out of rotation until the next health check, which runs at most every
+        `health_check_interval` seconds. With no healthy replica, or inside the
+        caller's read-your-writes window, reads go to the primary.
+
+        Only one caller runs a due health check; concurrent callers keep using
+        the last known state instead of each waiting out a dead replica's
+        connect timeout.
+    """
+
+    def __init__(self, primary, replicas: list | None = None, health_check_interval: float = 10.0, clock=time.monotonic):
+        self.primary = primary
+        self.replicas = list(replicas or [])
+        self.health_check_interval = health_check_interval
+        self.clock = clock
+        self._healthy = {id(replica): True for replica in self.replicas}
+        self._next = 0
+        self._last_check = clock()
+        self._lock = threading.Lock()
+        self._probe_lock = threading.Lock()
+
+    def healthy_replicas(self) -> list:
+        return [replica for replica in self.replicas if self._healthy[id(replica)]]
+
+    def check_health(self):
+        for replica in self.replicas:
+            try:
+                with replica.connect() as conn:
+                    conn.execute(text("SELECT 1"))
+                healthy = True
+            except SQLAlchemyError as e:
+                settings.logger.warning(f"Read replica {replica.url!r} failed health check: {e}")
+                healthy = False
+            self._healthy[id(replica)] = healthy
+        self._last_check = self.clock()
+
+    def _health_check_due(self) -> bool:
+        return self.clock() - self._last_check >= self.health_check_interval
+
+    def mark_unhealthy(self, replica):
+        if id(replica) in self._healthy:
+            self._healthy[id(replica)] = False
+
+    def engine_for_read(self, recent_write: bool = False):
+        if recent_write or not self.replicas:
+            return self.primary
+        if self._health_check_due() and self._probe_lock.acquire(blocking=False):
+            try:
+                if self._health_check_due():  # another caller may have just finished one
+                    self.check_health()
+            finally:
+                self._probe_lock.release()
+        healthy = self.healthy_replicas()
+        if not healthy:
+            return self.primary
+        with self._lock:
+            replica = healthy[self._next % len(healthy)]
+            self._next += 1
+        return replica
+
+
+def build_replica_engines() -> list:
+    urls = [url.strip() for url in (settings.DATABASE_REPLICA_URLS or "").split(",") if url.strip()]
+    return [create_engine(url, echo=primary_engine.echo, pool_pre_ping=True) for url in urls]
+
+
+replica_router = ReplicaRouter(primary_engine, build_replica_engines(), settings.REPLICA_HEALTH_CHECK_SECONDS)
+
+
+def wrote_recently(request: Request, now: float | None = None) -> bool:
+    try:
+        last_write = float(request.cookies.get(LAST_WRITE_COOKIE, 0))
+    except ValueError:
+        return False
+    return (now or time.time()) - last_write < settings.READ_YOUR_WRITES_SECONDS
+
+
+def get_read_db(request: Request):
+    """
+        Session dependency for read-only handlers.
+
+        Same contract as `get_db`, but bound to a replica picked by
+        `replica_router`, or to the primary when the caller wrote recently.
+    """
+    bind = replica_router.engine_for_read(recent_write=wrote_recently(request))
+    db = SessionLocal(bind=bind)
+    try:
+        yield db
+    except DBAPIError as e:
+        if e.connection_invalidated and bind is not replica_router.primary:
+            replica_router.mark_unhealthy(bind)
+        settings.logger.error(f"Database session error: {e}")
+        raise
+    except SQLAlchemyError as e:
+        settings.logger.error(f"Database session error: {e}")
+        raise
+    except Exception as ex:
+        settings.logger.error(f"Unexpected error during database session: {ex}")
+        raise
+    finally:
+        db.close()
+
+
+class ReadYourWritesMiddleware:
+    """
+        Pure ASGI middleware that stamps successful writes with `LAST_WRITE_COOKIE`.
+
+        `get_read_db` sends that client's reads to the primary for
+        `settings.READ_YOUR_WRITES_SECONDS` afterwards, so replica lag never hides
+        a user's own token or registration.
+    """
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or scope["method"] in ("GET", "HEAD", "OPTIONS"):
+            await self.app(scope, receive, send)
+            return
+
+        async def send_wrapper(message):
+            if message["type"] == "http.response.start" and message["status"] < 400:
+                cookie = f"{LAST_WRITE_COOKIE}={time.time():.3f}; Max-Age={int(settings.READ_YOUR_WRITES_SECONDS) + 1}; Path=/; HttpOnly"
+                message["headers"] = [*message.get("headers", []), (b"set-cookie", cookie.encode())]
+            await send(message)
+
+        await self.app(scope, receive, send_wrapper)
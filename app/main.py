@@ -1,15 +1,101 @@
+import time
+_IMPORT_STARTED = time.perf_counter()
+
 from fastapi import FastAPI
 from app.routing.service_router import router as service_router
 from app.routing.user_router import router as user_router
-from app.db.database import init_db
+from app.db.database import engine, init_db
+from app.db.replicas import ReadYourWritesMiddleware, replica_router
 from app.routing.counter_routes import router as counter_router
+from app.routing.metrics_router import router as metrics_router
+from app.routing.analytics_router import router as analytics_router
+from app.routing.booking_router import router as booking_router
+from app.routing.import_router import router as import_router
+from app.utils.metrics import MetricsMiddleware, instrument_engine
+from app.utils.sql_profiler import SQLProfilerMiddleware, install_profiler
+from app.utils.tracing import TracingMiddleware, install_tracing
+from app.core.config import settings
+from app.utils.eta_worker import eta_worker
+from app.utils.eta_refresher import eta_refresher
+from app.utils.rate_limit import AdmissionController
+from app.utils.startup import startup_timer
+from app.utils.serialization import default_response_class
+from app.utils.token_log import token_log
+from app.utils.sketches import latency_sketches
+from app.utils.appointments import appointment_merger
+from app.utils.eta_grid import eta_grid_refresher
+from app.utils.bulk_import import shutdown_hash_pool
+from app.utils.distance_providers import close_distance_provider
+from app.utils.no_show import no_show_sweeper
+from app.utils.notifier import notifier
+
+startup_timer.record("imports", time.perf_counter() - _IMPORT_STARTED)
+_SETUP_STARTED = time.perf_counter()
 
 async def lifespan(app:FastAPI):
-    init_db() 
+    with startup_timer.phase("init_db"):
+        init_db()
+    if settings.TOKEN_LOG_ENABLED:
+        with startup_timer.phase("token_log_recovery"):
+            replayed = token_log.recover()
+        settings.logger.info(f"Token log recovered {len(token_log.state.tokens)} active tokens, replayed {replayed} events")
+    with startup_timer.phase("background_tasks"):
+        await notifier.start()
+        if settings.ASYNC_ETA_ENABLED:
+            await eta_worker.start()
+        if settings.ETA_REFRESH_ENABLED:
+            await eta_refresher.start()
+        await latency_sketches.start(settings.ANALYTICS_FLUSH_SECONDS)
+        if settings.APPOINTMENTS_ENABLED:
+            await appointment_merger.start()
+        if settings.ETA_GRID_ENABLED:
+            await eta_grid_refresher.start()
+        if settings.NO_SHOW_ENABLED:
+            await no_show_sweeper.start()
+    startup_timer.report()
     yield
+    await no_show_sweeper.stop()
+    await eta_grid_refresher.stop()
+    await appointment_merger.stop()
+    await latency_sketches.stop()
+    await eta_refresher.stop()
+    await eta_worker.stop()
+    await notifier.stop()
+    await close_distance_provider()
+    shutdown_hash_pool()
+
+instrument_engine(engine)
+for replica in replica_router.replicas:
+    instrument_engine(replica, pool_metrics=False)
+
+app:FastAPI = FastAPI(lifespan=lifespan, default_response_class=default_response_class)
+app.add_middleware(MetricsMiddleware)
 
-app:FastAPI = FastAPI(lifespan=lifespan)
+if replica_router.replicas:
+    app.add_middleware(ReadYourWritesMiddleware)
+
+if settings.SQL_PROFILER_ENABLED:
+    install_profiler(engine)
+    for replica in replica_router.replicas:
+        install_profiler(replica)
+    app.add_middleware(SQLProfilerMiddleware)
+
+if settings.TRACING_ENABLED:
+    install_tracing(engine)
+    for replica in replica_router.replicas:
+        install_tracing(replica)
+    app.add_middleware(TracingMiddleware)
+
+# Added last so it runs first and rejects overload before any other work
+app.add_middleware(AdmissionController, pool=engine.pool, eta_pool=eta_worker)
 
 app.include_router(user_router, prefix="/users", tags=["Users"])
 app.include_router(service_router, prefix="/services", tags=["Services"])
-app.include_router(counter_router,prefix="/counter",tags=["counters"])
\ No newline at end of file
+if settings.APPOINTMENTS_ENABLED:
+    app.include_router(booking_router, prefix="/services", tags=["Appointments"])
+app.include_router(counter_router,prefix="/counter",tags=["counters"])
+app.include_router(metrics_router)
+app.include_router(analytics_router, prefix="/analytics", tags=["Analytics"])
+app.include_router(import_router, prefix="/import", tags=["Import"])
+
+startup_timer.record("app_setup", time.perf_counter() - _SETUP_STARTED)
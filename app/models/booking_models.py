@@ -0,0 +1,33 @@
+from sqlalchemy import Column, DateTime, Float, ForeignKey, Index, Integer, String
+from sqlalchemy.orm import relationship
+from datetime import datetime, timezone
+from app.db.database import Base
+
+
+class Booking(Base):
+    """
+        A pre-booked appointment slot for a service.
+
+        Lifecycle: `booked` until the slot starts, then `queued` once the
+        appointment merger has issued a token for it (`token_id`), or `cancelled`.
+    """
+    __tablename__ = "bookings"
+
+    id = Column(Integer, primary_key=True, index=True)
+    service_id = Column(Integer, ForeignKey("services.id"), nullable=False)
+    user_id = Column(Integer, ForeignKey("users.id"), nullable=False, index=True)
+    slot_start = Column(DateTime, nullable=False)  # UTC
+    latitude = Column(Float, nullable=False)  # Where the user expects to travel from
+    longitude = Column(Float, nullable=False)
+    status = Column(String, default="booked", nullable=False)
+    token_id = Column(Integer, ForeignKey("tokens.id"), nullable=True)
+    created_at = Column(DateTime, default=lambda: datetime.now(timezone.utc))
+
+    service = relationship("Service")
+    user = relationship("User")
+    token = relationship("Token")
+
+    __table_args__ = (
+        Index("ix_bookings_service_slot", "service_id", "slot_start"),
+        Index("ix_bookings_status_slot", "status", "slot_start"),  # merger scans due bookings
+    )
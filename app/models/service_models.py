@@ -12,4 +12,5 @@ class Service(Base):
     service_end_time = Column(Time,nullable=False)
 
     counters = relationship("Counter", back_populates="service")
-    tokens = relationship("Token", back_populates="service")
\ No newline at end of file
+    tokens = relationship("Token", back_populates="service")
+    sites = relationship("ServiceSite", back_populates="service")
\ No newline at end of file
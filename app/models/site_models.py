@@ -0,0 +1,23 @@
+from sqlalchemy import Boolean, Column, Float, ForeignKey, Integer, String
+from sqlalchemy.orm import relationship
+from app.db.database import Base
+
+
+class ServiceSite(Base):
+    """
+        A physical branch where a service is offered.
+
+        A service can run at several sites; each site carries its own coordinates
+        and an `is_open` flag so closed branches are skipped when routing tokens.
+    """
+    __tablename__ = "service_sites"
+
+    id = Column(Integer, primary_key=True, index=True)
+    service_id = Column(Integer, ForeignKey("services.id"), nullable=False, index=True)
+    site_name = Column(String, nullable=False)
+    latitude = Column(Float, nullable=False)
+    longitude = Column(Float, nullable=False)
+    is_open = Column(Boolean, default=True, nullable=False)
+
+    service = relationship("Service", back_populates="sites")
+    tokens = relationship("Token", back_populates="site")
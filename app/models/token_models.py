@@ -1,4 +1,4 @@
-from sqlalchemy import Boolean, Column, Float, Integer, String, ForeignKey, DateTime
+from sqlalchemy import Boolean, Column, Float, Index, Integer, String, ForeignKey, DateTime
 from sqlalchemy.orm import relationship
 from datetime import datetime, timezone
 from app.db.database import Base 
@@ -9,23 +9,35 @@ class Token(Base):
     id = Column(Integer, primary_key=True, index=True)
     token_number = Column(Integer, unique=True, index=True)  # Unique token number
     queue_position = Column(Integer)  # Position of the token in the queue
-    issue_time = Column(DateTime, default=datetime.now(timezone.utc))  # Timestamp of token issuance
+    issue_time = Column(DateTime, default=lambda: datetime.now(timezone.utc))  # Timestamp of token issuance
+    called_at = Column(DateTime, nullable=True)  # When a counter called the token
+    served_at = Column(DateTime, nullable=True)  # When service at the counter finished
 
 
     latitude = Column(Float, nullable=False)  # Latitude of the user
     longitude = Column(Float, nullable=False)  # Longitude of the user
+    last_location_at = Column(DateTime, default=lambda: datetime.now(timezone.utc))  # Issue time or latest location ping
     
     distance = Column(Float,nullable=True)
     duration = Column(Integer,nullable=True)
 
     reach_out = Column(Boolean, default=False)  # Default to False
+    state = Column(String, default="waiting", nullable=False, index=True)  # Lifecycle: waiting, deferred, serving, served, skipped
 
     # Foreign keys
     user_id = Column(Integer, ForeignKey("users.id"), nullable=True)  # Link to the User table
     service_id = Column(Integer, ForeignKey("services.id"), nullable=False)  # Link to the Service table
     counter_id = Column(Integer, ForeignKey("counters.id"), nullable=False)  # Link to the Counter table
+    site_id = Column(Integer, ForeignKey("service_sites.id"), nullable=True)  # Branch the token was routed to
 
     # Relationships
     user = relationship("User", back_populates="tokens")  # Establish relationship with User
     service = relationship("Service", back_populates="tokens")  # Establish relationship with Service
-    counter = relationship("Counter", back_populates="tokens")  # Establish relationship with Counter
\ No newline at end of file
+    counter = relationship("Counter", back_populates="tokens")  # Establish relationship with Counter
+    site = relationship("ServiceSite", back_populates="tokens")  # Establish relationship with ServiceSite
+
+    __table_args__ = (
+        Index("ix_tokens_state_last_location", "state", "last_location_at"),  # no-show sweeper scans
+        Index("ix_tokens_state_issue_time", "state", "issue_time"),  # ETA refresher scans recent tokens
+        Index("ix_tokens_served_at", "served_at"),  # staffing planner scans recently served tokens
+    )
@@ -0,0 +1,24 @@
+from fastapi import APIRouter, HTTPException, Query
+from app.utils.sketches import latency_sketches, summarize
+
+router = APIRouter()
+
+@router.get("/percentiles")
+def get_percentiles(
+    window_minutes: float = Query(60, gt=0),
+    quantiles: str = Query("0.5,0.9,0.99"),
+):
+    """
+        Waiting and service time percentiles (seconds) per counter and per service.
+
+        Answered entirely from in-memory latency sketches, merged across time
+        windows and across workers' flushed sketch files; no database queries.
+    """
+    try:
+        wanted = tuple(float(q) for q in quantiles.split(","))
+    except ValueError:
+        raise HTTPException(status_code=422, detail="quantiles must be comma-separated numbers")
+    if not all(0 <= q <= 1 for q in wanted):
+        raise HTTPException(status_code=422, detail="quantiles must be between 0 and 1")
+    merged = latency_sketches.collect(window_minutes * 60)
+    return {"window_minutes": window_minutes, **summarize(merged, wanted)}
@@ -0,0 +1,44 @@
+from datetime import date
+from fastapi import APIRouter,Depends,Query
+from sqlalchemy.orm import Session
+from app.crud.booking_management import cancel_booking,create_booking,get_slot_availability
+from app.schemas.booking_schemas import BookingRequest,BookingResponse,SlotAvailability
+from app.db.database import get_db
+from app.utils.appointments import slot_inventory
+from app.utils.serialization import list_response, model_response
+
+router = APIRouter()
+
+@router.get("/{service_name}/slots",response_model=list[SlotAvailability])
+def read_slots(service_name:str,day:date|None=Query(None),db:Session=Depends(get_db)):
+    """
+        List the appointment slots of a service day with their remaining places.
+
+        - **service_name**: The name of the service.
+        - **day**: The day in `SERVICE_TIMEZONE` (defaults to today), at most
+          `APPOINTMENT_DAYS_AHEAD` days ahead.
+
+        Served from the in-memory slot inventory once the day has been loaded.
+    """
+    day = day or slot_inventory.today()
+    return list_response(SlotAvailability,get_slot_availability(db,service_name,day))
+
+@router.post("/{service_name}/bookings",response_model=BookingResponse,status_code=201)
+def book_slot(service_name:str,request:BookingRequest,db:Session=Depends(get_db)):
+    """
+        Book an appointment slot.
+
+        - **service_name**: The name of the service.
+        - **request**: The user's email, the slot start and where they will travel from.
+
+        At the slot time the booking joins the live queue as a regular token.
+        Returns 409 when the slot is fully booked.
+    """
+    return model_response(BookingResponse,create_booking(db,service_name,request),status_code=201)
+
+@router.delete("/{service_name}/bookings/{booking_id}",response_model=BookingResponse)
+def cancel_slot(service_name:str,booking_id:int,db:Session=Depends(get_db)):
+    """
+        Cancel a booking before its slot starts and give the place back.
+    """
+    return model_response(BookingResponse,cancel_booking(db,service_name,booking_id))
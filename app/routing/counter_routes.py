@@ -1,10 +1,17 @@
 
-from fastapi import APIRouter, Depends
+from fastapi import APIRouter, Depends, Request
 from sqlalchemy.orm import Session
 from app.db.database import get_db
+from app.db.replicas import get_read_db
 from app.schemas.counter_schemas import CounterCreate, CounterResponse
 from app.crud.counter_management import create_counter, get_all_counters, get_counter_by_id
+from app.crud.token_management import call_next_token, get_counter_queue
+from app.schemas.token_schemas import QueueEntry, TokenResponse
+from app.core.config import settings
+from app.utils.token_log import token_log
 from fastapi import HTTPException
+from app.utils.serialization import list_response, model_response
+from app.utils.table_versions import not_modified
 
 router = APIRouter()
 
@@ -16,15 +23,47 @@ def add_counter(counter: CounterCreate, db: Session = Depends(get_db)):
         raise HTTPException(status_code=500,detail=f"Error creating Counter {e}")
 
 @router.get("/", response_model=list[CounterResponse])
-def list_counters(db: Session = Depends(get_db)):
+def list_counters(request: Request, db: Session = Depends(get_read_db)):
+    headers, cached = not_modified(request, "counters")
+    if cached:
+        return cached
     try:
-        return get_all_counters(db)
+        return list_response(CounterResponse, get_all_counters(db), headers=headers)
     except Exception as e:
         raise HTTPException(status_code=500,detail=f"Error getting Counter {e}")
 
 @router.get("/{counter_id}", response_model=CounterResponse)
-def get_counter(counter_id: int, db: Session = Depends(get_db)):
+def get_counter(counter_id: int, request: Request, db: Session = Depends(get_read_db)):
+    headers, cached = not_modified(request, "counters")
+    if cached:
+        return cached
     try:
-        return get_counter_by_id(db, counter_id)
+        return model_response(CounterResponse, get_counter_by_id(db, counter_id), headers=headers)
     except Exception as e:
         raise HTTPException(status_code=500,detail=f"Error getting Counter by his id {e}")
+
+@router.post("/{counter_id}/next", response_model=TokenResponse)
+def serve_next(counter_id: int, db: Session = Depends(get_db)):
+    """
+        Finish the token being served at this counter and call the next one in line.
+
+        Raises 404 when nobody is waiting (the current token is still marked served).
+    """
+    _, called = call_next_token(db, counter_id)
+    if called is None:
+        raise HTTPException(status_code=404, detail="No tokens waiting at this counter")
+    response = TokenResponse.model_validate(called)
+    response.status = "Now serving"
+    return model_response(TokenResponse, response)
+
+@router.get("/{counter_id}/queue", response_model=list[QueueEntry])
+def counter_queue(counter_id: int, db: Session = Depends(get_read_db)):
+    """
+        Active tokens at this counter in issue order.
+
+        Served from the in-memory token event log when it is enabled, without
+        querying the database.
+    """
+    if settings.TOKEN_LOG_ENABLED:
+        return list_response(QueueEntry, token_log.queue(counter_id))
+    return list_response(QueueEntry, get_counter_queue(db, counter_id))
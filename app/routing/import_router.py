@@ -0,0 +1,28 @@
+from fastapi import APIRouter, Depends, File, HTTPException, Query, UploadFile
+from sqlalchemy.orm import Session
+from app.db.database import get_db
+from app.utils.bulk_import import FORMATS, KINDS, detect_format, get_hash_pool, import_file
+
+router = APIRouter()
+
+@router.post("/{kind}")
+def bulk_import(kind: str, file: UploadFile = File(...), format: str | None = Query(None),
+                db: Session = Depends(get_db)):
+    """
+        Import users, services or counters from an uploaded CSV or NDJSON file.
+
+        - **kind**: `users`, `services` or `counters`.
+        - **file**: CSV with a header row, or one JSON object per line.
+        - **format**: `csv` or `ndjson`; guessed from the file name or content type when omitted.
+
+        Rows are validated, de-duplicated and inserted in batches; invalid or
+        conflicting rows do not stop the import. Returns the number of rows read,
+        inserted and rejected, with the line number and reason of each rejection.
+    """
+    if kind not in KINDS:
+        raise HTTPException(status_code=404, detail=f"Unknown import kind: {kind}")
+    if format is not None and format not in FORMATS:
+        raise HTTPException(status_code=422, detail=f"format must be one of {', '.join(FORMATS)}")
+    fmt = format or detect_format(file.filename, file.content_type)
+    pool = get_hash_pool() if kind == "users" else None
+    return import_file(db, kind, file.file, fmt, pool)
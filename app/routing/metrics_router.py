@@ -0,0 +1,12 @@
+from fastapi import APIRouter
+from fastapi.responses import PlainTextResponse
+from app.utils.metrics import registry
+
+router = APIRouter()
+
+@router.get("/metrics",response_class=PlainTextResponse,include_in_schema=False)
+def read_metrics():
+    """
+        Expose all collected metrics in the Prometheus text exposition format.
+    """
+    return PlainTextResponse(registry.render(),media_type="text/plain; version=0.0.4; charset=utf-8")
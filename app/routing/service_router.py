@@ -1,8 +1,15 @@
-from fastapi import APIRouter,HTTPException,Depends
+from fastapi import APIRouter,HTTPException,Depends,Query,Request
 from sqlalchemy.orm import Session
 from app.crud.services_management import create_services,get_all_services,get_service_by_name
 from app.schemas.service_schemas import ServiceResponse,ServiceCreate
+from app.crud.site_management import create_site,get_sites_by_service
+from app.crud.counter_management import count_counters_by_service
+from app.schemas.site_schemas import SiteCreate,SiteResponse
 from app.db.database import get_db
+from app.db.replicas import get_read_db
+from app.utils.serialization import list_response, model_response
+from app.utils.table_versions import not_modified
+from app.utils.staffing import staffing_planner
 
 router = APIRouter()
     
@@ -23,29 +30,83 @@ def create_service(service:ServiceCreate,db:Session=Depends(get_db)):
         raise HTTPException(status_code=500,detail=f"Error creating Service {e}")
     
 @router.get("/",response_model=list[ServiceResponse])
-def read_services(db:Session=Depends(get_db)):
+def read_services(request:Request,db:Session=Depends(get_read_db)):
     """
         Retrieve a list of all available services.
 
-        - Returns a list of all services.
+        - Returns a list of all services, or 304 when `If-None-Match` is current.
     """
+    headers, cached = not_modified(request,"services")
+    if cached:
+        return cached
     try:
         services = get_all_services(db) 
-        return services
+        return list_response(ServiceResponse,services,headers=headers)
     except Exception as e:
         raise HTTPException(status_code=e.status_code,detail=e.detail)
     
 @router.get("/{service_name}",response_model=ServiceResponse)
-def read_service_by_name(service_name:str,db:Session = Depends(get_db)):
+def read_service_by_name(service_name:str,request:Request,db:Session = Depends(get_read_db)):
     """
         Retrieve a service by its name.
 
         - **service_name**: The name of the service to be fetched.
 
-        Returns the service with the specified name.
+        Returns the service with the specified name, or 304 when `If-None-Match` is current.
     """
+    headers, cached = not_modified(request,"services")
+    if cached:
+        return cached
     try:
         service = get_service_by_name(db,service_name)
-        return service
+        return model_response(ServiceResponse,service,headers=headers)
     except HTTPException as e:
-        raise HTTPException(status_code=e.status_code,detail=e.detail)   
\ No newline at end of file
+        raise HTTPException(status_code=e.status_code,detail=e.detail)
+
+@router.post("/{service_name}/sites",response_model=SiteResponse)
+def add_service_site(service_name:str,site:SiteCreate,db:Session=Depends(get_db)):
+    """
+        Register a new branch for a service.
+
+        - **service_name**: The name of the service offered at the branch.
+        - **site**: The branch name, coordinates and whether it is open.
+
+        Returns the newly created site.
+    """
+    return create_site(db,service_name,site)
+
+@router.get("/{service_name}/sites",response_model=list[SiteResponse])
+def read_service_sites(service_name:str,request:Request,db:Session=Depends(get_read_db)):
+    """
+        Retrieve every branch registered for a service.
+
+        - **service_name**: The name of the service.
+
+        Returns a list of sites, possibly empty, or 304 when `If-None-Match` is current.
+    """
+    headers, cached = not_modified(request,"services","service_sites")
+    if cached:
+        return cached
+    return list_response(SiteResponse,get_sites_by_service(db,service_name),headers=headers)
+
+@router.get("/{service_name}/staffing")
+def read_service_staffing(
+    service_name:str,
+    target_wait_seconds:float|None=Query(None,gt=0),
+    target_percentile:float|None=Query(None,gt=0,lt=1),
+    db:Session=Depends(get_read_db),
+):
+    """
+        Recommend how many counters a service needs for each hour of the week.
+
+        - **service_name**: The name of the service.
+        - **target_wait_seconds**: Wait SLA (defaults to `STAFFING_TARGET_WAIT_SECONDS`).
+        - **target_percentile**: Share of customers that must be called within the SLA.
+
+        Solves an Erlang-C (M/M/c) model per hour-of-week slot from historical
+        arrival rates and measured service times, next to the current counter count.
+    """
+    service = get_service_by_name(db,service_name)
+    plan = staffing_planner.plan(db,service["id"],target_wait_seconds,target_percentile)
+    return {"service_name":service_name,"current_counters":count_counters_by_service(db,service["id"]),**plan}
+
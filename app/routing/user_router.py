@@ -1,14 +1,23 @@
-from fastapi import APIRouter,Depends,HTTPException
+import asyncio
+import json
+from fastapi import APIRouter,Depends,Header,HTTPException
+from fastapi.responses import StreamingResponse
 from fastapi.security import OAuth2PasswordRequestForm
 from sqlalchemy.orm import Session
 from app.schemas.token_schemas import TokenRequest, TokenResponse, UpdateTokenRequest
 from app.schemas.user_schemas import UserIn,UserCreate,Token
 from app.db.database import get_db
+from app.db.replicas import get_read_db
 from app.utils.auth import get_password_hash,verify_password,create_access_token
 from app.crud.user_management import create_user,get_user_by_email,get_all_users,get_user_by_username
 from app.core.config import settings    
-from app.crud.token_management import check_reach_out, generate_token, get_token_by_user_id, update_token_distance_duration
+from app.crud.token_management import check_reach_out, generate_token, get_token_by_number, get_token_by_user_id, get_token_service_coordinates, update_token_distance_duration
 from app.utils.get_distance import get_distance
+from app.utils.notifier import notifier
+from app.utils.token_log import record_eta
+from app.utils.rate_limit import rate_limiter
+from app.utils.serialization import list_response, model_response
+from app.utils.idempotency import request_fingerprint, token_idempotency
 
 router = APIRouter()
 
@@ -50,7 +59,7 @@ def register_user(user:UserCreate,db:Session = Depends(get_db)):
             status_code=500,
             detail=f"Failed to create user, please try again later: {e}"
         )
-    return UserIn(id=new_user.id,name=new_user.name,email=new_user.email,role=new_user.role)
+    return model_response(UserIn,new_user)
 
 
 @router.post("/login",response_model=Token)
@@ -83,7 +92,7 @@ def login_for_access_token(form_data:OAuth2PasswordRequestForm = Depends(),db:Se
     return {"access_token":access_token,"token_type":"bearer"}
 
 @router.get("/",response_model=list[UserIn])
-def get_users(db:Session=Depends(get_db)):
+def get_users(db:Session=Depends(get_read_db)):
     """
         Retrieve a list of all registered users.
 
@@ -96,11 +105,11 @@ def get_users(db:Session=Depends(get_db)):
             - list[UserIn]: A list of user objects.
     """
     users = get_all_users(db)
-    return users
+    return list_response(UserIn,users)
     
 
 @router.get("/{name}",response_model=UserIn)
-def get_user_by_name(name:str,db:Session = Depends(get_db)):
+def get_user_by_name(name:str,db:Session = Depends(get_read_db)):
     """
         Retrieve a user by their username.
 
@@ -121,45 +130,61 @@ def get_user_by_name(name:str,db:Session = Depends(get_db)):
     if not user:
         settings.logger.info(f"User not found: {name}")
         raise HTTPException(status_code=400,detail="User not found")
-    return user
+    return model_response(UserIn,user)
 
 
 @router.post("/token", response_model=TokenResponse)
-async def generate_token_for_user(request: TokenRequest, db: Session = Depends(get_db)):
-    try:
-        token = await generate_token(request, db)
-        
-        # Return a TokenResponse
-        return TokenResponse(
-            token_number=token.token_number,
-            user_id=token.user_id,
-            service_id=token.service_id,
-            counter_id=token.counter_id,
-            distance = token.distance,
-            duration = token.duration,
-            status="Token generated successfully"
-        )
-    except HTTPException as e:
-        raise e
-    except Exception as e:
-        raise HTTPException(status_code=500, detail=f"Error generating token: {e}")
+async def generate_token_for_user(
+    request: TokenRequest,
+    db: Session = Depends(get_db),
+    idempotency_key: str | None = Header(None, alias="Idempotency-Key"),
+):
+    """
+        Issue a queue token for the user at the nearest branch of the service.
+
+        Clients may send an `Idempotency-Key` header: a retry with the same key and
+        body replays the original response without touching the database or the
+        distance provider, and concurrent duplicates wait for the first request.
+    """
+    async def issue():
+        rate_limiter.check("token", request.email)
+        try:
+            token = await generate_token(request, db)
+
+            # Map the token row straight onto the response schema
+            response = TokenResponse.model_validate(token)
+            response.status = "Token generated successfully" if token.duration is not None else "Token generated successfully, ETA pending"
+            return model_response(TokenResponse,response)
+        except HTTPException as e:
+            raise e
+        except Exception as e:
+            raise HTTPException(status_code=500, detail=f"Error generating token: {e}")
+
+    if not idempotency_key:
+        return await issue()
+    fingerprint = request_fingerprint(request.email, request.service_name, request.latitude, request.longitude)
+    return await token_idempotency.run(f"{request.email}:{idempotency_key}", fingerprint, issue)
     
 @router.put("/new-location",response_model=TokenResponse)
 async def update_eta(request:UpdateTokenRequest,db:Session = Depends(get_db)):
+    # Each ping costs a paid distance lookup and two commits, so throttle per user
+    rate_limiter.check("new-location", request.user_id)
     try:
         token = get_token_by_user_id(db, request.user_id)
         if not token:
             raise HTTPException(status_code=400,detail="Token Not Found")
         
-        # Get the new distance and duration
-        duration_value,distance_value=await get_distance(request.latitude,request.longitude)
+        # Get the new distance and duration from the branch this token was routed to
+        service_coordinates = get_token_service_coordinates(token)
+        duration_value,distance_value=await get_distance(request.latitude,request.longitude,service_coordinates)
 
         # Check if the user has reached the service location
         reach_out = check_reach_out(
             latitude=request.latitude,
             longitude=request.longitude,
             distance=distance_value,
-            duration=duration_value
+            duration=duration_value,
+            service_coordinates=service_coordinates
         )
         
         # Update the token with the new distance and duration
@@ -174,17 +199,68 @@ async def update_eta(request:UpdateTokenRequest,db:Session = Depends(get_db)):
         updated_token.reach_out = reach_out
         db.commit()
         db.refresh(updated_token)
+        record_eta(updated_token.token_number, updated_token.distance, updated_token.duration, updated_token.reach_out)
+        notifier.publish(updated_token.token_number, {
+            "token_number": updated_token.token_number,
+            "eta_status": "ready",
+            "distance": updated_token.distance,
+            "duration": updated_token.duration,
+            "reach_out": updated_token.reach_out,
+        })
 
-        return TokenResponse(
-            token_number = updated_token.token_number,
-            user_id = updated_token.user_id,
-            service_id = updated_token.service_id,
-            counter_id= updated_token.counter_id,
-            distance=updated_token.distance,
-            duration = updated_token.duration,
-            status ="ETA Updated Successfully"
-        )
+        response = TokenResponse.model_validate(updated_token)
+        response.status = "ETA Updated Successfully"
+        return model_response(TokenResponse,response)
     except HTTPException as e:
         raise e
     except Exception as e:
-        raise HTTPException(status_code=500,detail=f"Error Updating ETA: {e}")
\ No newline at end of file
+        raise HTTPException(status_code=500,detail=f"Error Updating ETA: {e}")
+
+@router.get("/token/{token_number}/events")
+async def token_events(token_number:int,db:Session = Depends(get_read_db)):
+    """
+        Stream ETA updates for a token as Server-Sent Events.
+
+        The first event carries the token's current ETA (`eta_status` is "pending"
+        until the background worker has filled it in) and queue `state`. Later
+        events are pushed whenever the ETA or the state changes. The stream closes after
+        `settings.TOKEN_EVENTS_TIMEOUT_SECONDS` without updates.
+
+        Updates from other workers only arrive with `SHARED_STATE_BACKEND=redis`
+        (see `TokenNotifier`).
+
+        Raises:
+            - HTTPException: If the token does not exist (status code 400).
+    """
+    # Subscribe before reading the snapshot, so no update can fall in between
+    queue = notifier.subscribe(token_number)
+    try:
+        token = get_token_by_number(db,token_number)
+        if not token:
+            raise HTTPException(status_code=400,detail="Token Not Found")
+        current = {
+            "token_number": token.token_number,
+            "eta_status": "pending" if token.duration is None else "ready",
+            "distance": token.distance,
+            "duration": token.duration,
+            "reach_out": token.reach_out,
+            "state": token.state,
+        }
+    except Exception:
+        notifier.unsubscribe(token_number,queue)
+        raise
+    db.close()
+
+    async def event_stream():
+        try:
+            yield f"data: {json.dumps(current)}\n\n"
+            while True:
+                try:
+                    event = await asyncio.wait_for(queue.get(), settings.TOKEN_EVENTS_TIMEOUT_SECONDS)
+                except asyncio.TimeoutError:
+                    return
+                yield f"data: {json.dumps(event)}\n\n"
+        finally:
+            notifier.unsubscribe(token_number,queue)
+
+    return StreamingResponse(event_stream(),media_type="text/event-stream")
@@ -0,0 +1,24 @@
+from datetime import datetime
+from pydantic import BaseModel, ConfigDict, Field
+from typing import Optional
+
+class BookingRequest(BaseModel):
+    email: str
+    slot_start: datetime  # ISO 8601; naive values are taken as UTC
+    latitude: float = Field(..., ge=-90, le=90)
+    longitude: float = Field(..., ge=-180, le=180)
+
+class BookingResponse(BaseModel):
+    id: int
+    service_id: int
+    user_id: int
+    slot_start: datetime
+    status: str
+    token_id: Optional[int] = None
+
+    model_config = ConfigDict(from_attributes=True, strict=True)
+
+class SlotAvailability(BaseModel):
+    slot_start: datetime
+    capacity: int
+    available: int
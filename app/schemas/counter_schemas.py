@@ -1,4 +1,4 @@
-from pydantic import BaseModel
+from pydantic import BaseModel, ConfigDict
 
 
 class CounterCreate(BaseModel):
@@ -10,5 +10,4 @@ class CounterResponse(BaseModel):
     counter_number: int
     service_id: int
 
-    class Config:
-        orm_mode = True
\ No newline at end of file
+    model_config = ConfigDict(from_attributes=True, strict=True)
\ No newline at end of file
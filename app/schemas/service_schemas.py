@@ -1,5 +1,5 @@
 from datetime import time
-from pydantic import BaseModel
+from pydantic import BaseModel, ConfigDict, Field
 
 # SCHEMAS FOR CREATING A SERVICES
 class ServiceCreate(BaseModel):
@@ -12,8 +12,8 @@ class ServiceCreate(BaseModel):
 class ServiceResponse(BaseModel):
     id:int
     service_name:str
-    service_entry_time:time
-    service_end_time:time
+    # Lax: raw-SQL lookups on SQLite return TIME columns as ISO strings
+    service_entry_time:time = Field(strict=False)
+    service_end_time:time = Field(strict=False)
 
-    class Config:
-        orm_mode = True
\ No newline at end of file
+    model_config = ConfigDict(from_attributes=True, strict=True)
\ No newline at end of file
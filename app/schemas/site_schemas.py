@@ -0,0 +1,20 @@
+from pydantic import BaseModel, ConfigDict, Field
+
+# SCHEMAS FOR CREATING A SERVICE SITE
+class SiteCreate(BaseModel):
+    site_name: str
+    latitude: float = Field(..., ge=-90, le=90)
+    longitude: float = Field(..., ge=-180, le=180)
+    is_open: bool = True
+
+
+# SCHEMAS FOR RETURNING A SERVICE SITE
+class SiteResponse(BaseModel):
+    id: int
+    service_id: int
+    site_name: str
+    latitude: float
+    longitude: float
+    is_open: bool
+
+    model_config = ConfigDict(from_attributes=True, strict=True)
@@ -1,4 +1,5 @@
-from pydantic import BaseModel
+from pydantic import BaseModel, ConfigDict
+from typing import Optional
 
 class TokenRequest(BaseModel):
     email: str
@@ -10,6 +11,7 @@ class TokenCreate(BaseModel):
     user_id: int
     service_id: int
     counter_id: int
+    site_id: Optional[int] = None
     latitude: float
     longitude: float
 class TokenResponse(BaseModel):
@@ -17,14 +19,22 @@ class TokenResponse(BaseModel):
     user_id: int
     service_id: int
     counter_id: int
-    distance: float  # Ensure this is set to float
-    duration: int
-    status: str
+    distance: Optional[float] = None  # None while the ETA is still pending
+    duration: Optional[int] = None
+    status: str = ""  # set by the handler, not read from the token row
 
-    class Config:
-        orm_mode = True
+    model_config = ConfigDict(from_attributes=True, strict=True)
 
 class UpdateTokenRequest(BaseModel):
     user_id:int
     latitude:float
-    longitude:float
\ No newline at end of file
+    longitude:float
+
+class QueueEntry(BaseModel):
+    token_number: int
+    state: str
+    distance: Optional[float] = None
+    duration: Optional[int] = None
+    reach_out: bool = False
+
+    model_config = ConfigDict(from_attributes=True, strict=True)
@@ -1,4 +1,4 @@
-from pydantic import BaseModel,Field,EmailStr
+from pydantic import BaseModel,ConfigDict,Field,EmailStr
 from typing import Literal
 
 class UserCreate(BaseModel):
@@ -36,14 +36,9 @@ class UserIn(BaseModel):
     email: str
     role:str
 
-    class Config:
-        """
-            Configuration options for the UserIn schema.
-        
-            Enables compatibility with ORM models, allowing Pydantic to 
-            read data from SQLAlchemy models directly.
-        """
-        orm_mode = True
+    # Read straight from SQLAlchemy models and raw rows; strict because
+    # database values already have the right types
+    model_config = ConfigDict(from_attributes=True, strict=True)
 
 class Token(BaseModel):
     """
@@ -0,0 +1,142 @@
+from datetime import date, datetime, time, timedelta, timezone
+from types import SimpleNamespace
+import pytest
+from fastapi import HTTPException
+from sqlalchemy import create_engine
+from sqlalchemy.orm import sessionmaker
+from app.crud import booking_management
+from app.db.database import Base
+from app.schemas.booking_schemas import BookingRequest
+from app.models import booking_models, counter_models, service_models, site_models, token_models, user_models  # noqa: F401
+from app.utils import shared_state
+from app.utils.appointments import SlotInventory
+from app.utils.shared_state import MmapCounters
+
+DAY = date(2030, 1, 7)
+SERVICE = {"id": 1, "service_entry_time": "09:00:00.000000", "service_end_time": time(10, 40)}
+
+
+@pytest.fixture
+def inventory(monkeypatch):
+    monkeypatch.setattr("app.crud.counter_management.count_counters_by_service", lambda db, service_id: 2)
+    monkeypatch.setattr(booking_management, "count_bookings_by_slot",
+                        lambda db, service_id, first, last: [(datetime(2030, 1, 7, 8, 15), 1)])  # naive UTC, as SQLite returns it
+    return SlotInventory(slot_minutes=15, bookings_per_counter=1, tz="Europe/Berlin")
+
+
+def test_slots_follow_service_hours_in_local_time(inventory):
+    slots = inventory.load_day(None, SERVICE, DAY)
+    assert len(slots) == 6  # 09:00 .. 10:15 local; 10:30 would end after closing
+    assert slots[0] == datetime(2030, 1, 7, 8, 0, tzinfo=timezone.utc)
+    assert inventory.capacity(1, slots[0]) == 2
+    assert inventory.capacity(1, slots[0] + timedelta(minutes=5)) is None
+
+
+def test_reservations_never_exceed_capacity(inventory):
+    slots = inventory.load_day(None, SERVICE, DAY)
+    assert inventory.available(1, slots[1]) == 1  # one existing booking was loaded
+    assert inventory.reserve(1, slots[0]) and inventory.reserve(1, slots[0])
+    assert not inventory.reserve(1, slots[0])
+    inventory.release(1, slots[0])
+    assert inventory.available(1, slots[0]) == 1
+
+
+def test_shared_backend_reserves_atomically_across_inventories(inventory, tmp_path):
+    shared_state.set_shared_counters(MmapCounters(str(tmp_path / "counters"), slots=64))
+    try:
+        other = SlotInventory(slot_minutes=15, bookings_per_counter=1, tz="Europe/Berlin")
+        slots = inventory.load_day(None, SERVICE, DAY)
+        other.load_day(None, SERVICE, DAY)
+        assert inventory.reserve(1, slots[1])  # 1 existing + 1 = capacity
+        assert not other.reserve(1, slots[1])
+        assert other.available(1, slots[1]) == 0
+    finally:
+        shared_state.set_shared_counters(None)
+
+
+def test_past_days_are_expired_with_their_shared_counters(inventory, tmp_path, monkeypatch):
+    shared_state.set_shared_counters(MmapCounters(str(tmp_path / "counters"), slots=8))
+    try:
+        monkeypatch.setattr(inventory, "today", lambda: DAY)
+        slots = inventory.load_day(None, SERVICE, DAY)
+        monkeypatch.setattr(inventory, "today", lambda: DAY + timedelta(days=1))
+        next_slots = inventory.load_day(None, SERVICE, DAY + timedelta(days=1))  # 6 more keys only fit in the freed slots
+        assert inventory.capacity(1, slots[0]) is None
+        assert all(inventory.reserve(1, slot_start) for slot_start in next_slots)
+    finally:
+        shared_state.set_shared_counters(None)
+
+
+def test_slot_listing_is_bounded_to_the_booking_window(monkeypatch):
+    monkeypatch.setattr(booking_management, "get_service_by_name", lambda db, name: SERVICE)
+    today = booking_management.slot_inventory.today()
+    for day in (today - timedelta(days=1), today + timedelta(days=booking_management.settings.APPOINTMENT_DAYS_AHEAD + 1)):
+        with pytest.raises(HTTPException) as error:
+            booking_management.get_slot_availability(None, "passport", day)
+        assert error.value.status_code == 400
+
+
+def test_database_enforces_capacity_without_shared_backend(inventory, monkeypatch):
+    engine = create_engine("sqlite://")
+    Base.metadata.create_all(engine)
+    db = sessionmaker(bind=engine)()
+    monkeypatch.setattr(booking_management, "get_user_by_email", lambda db, email: SimpleNamespace(id=1))
+    monkeypatch.setattr(booking_management, "get_service_by_name", lambda db, name: SERVICE)
+    other = SlotInventory(slot_minutes=15, bookings_per_counter=1, tz="Europe/Berlin")  # a second worker
+    slot = inventory.slot_starts(SERVICE["service_entry_time"], SERVICE["service_end_time"],
+                                 inventory.today() + timedelta(days=1))[0]
+    request = BookingRequest(email="guest@example.com", slot_start=slot, latitude=1.0, longitude=2.0)
+
+    for worker in (inventory, inventory, other):
+        monkeypatch.setattr(booking_management, "slot_inventory", worker)
+        if worker is other:
+            with pytest.raises(HTTPException) as error:
+                booking_management.create_booking(db, "passport", request)
+            assert error.value.status_code == 409
+        else:
+            assert booking_management.create_booking(db, "passport", request).status == "booked"
+    assert db.query(booking_models.Booking).count() == 2
+    assert other.available(1, slot) == 2  # the rejected place was given back
+    db.close()
+
+
+def test_due_bookings_are_merged_once(monkeypatch):
+    engine = create_engine("sqlite://")
+    Base.metadata.create_all(engine)
+    db = sessionmaker(bind=engine)()
+    slot = datetime(2030, 1, 7, 8, 0, tzinfo=timezone.utc)
+    db.add(booking_models.Booking(service_id=1, user_id=1, slot_start=slot, latitude=1.0, longitude=2.0))
+    db.add(booking_models.Booking(service_id=1, user_id=2, slot_start=slot + timedelta(hours=1), latitude=1.0, longitude=2.0))
+    db.commit()
+    monkeypatch.setattr(booking_management, "get_counter_by_service_id", lambda db, service_id: 3)
+    monkeypatch.setattr(booking_management, "get_nearest_site", lambda db, service_id, lat, lon: None)
+    monkeypatch.setattr(booking_management, "create_token_record",
+                        lambda db, data, duration, distance, coordinates, commit: SimpleNamespace(id=42, counter_id=data.counter_id))
+    monkeypatch.setattr(booking_management, "record_token_issued", lambda token: None)
+
+    merged = booking_management.merge_due_bookings(db, slot + timedelta(minutes=1))
+    assert [(token.id, token.counter_id) for token, *_ in merged] == [(42, 3)]
+    assert booking_management.merge_due_bookings(db, slot + timedelta(minutes=1)) == []
+    statuses = [(b.status, b.token_id) for b in db.query(booking_models.Booking).order_by(booking_models.Booking.id)]
+    assert statuses == [("queued", 42), ("booked", None)]
+    db.close()
+
+
+def test_failed_token_leaves_the_booking_pending(monkeypatch):
+    engine = create_engine("sqlite://")
+    Base.metadata.create_all(engine)
+    db = sessionmaker(bind=engine)()
+    slot = datetime(2030, 1, 7, 8, 0, tzinfo=timezone.utc)
+    db.add(booking_models.Booking(service_id=1, user_id=1, slot_start=slot, latitude=1.0, longitude=2.0))
+    db.commit()
+    monkeypatch.setattr(booking_management, "get_counter_by_service_id", lambda db, service_id: 3)
+    monkeypatch.setattr(booking_management, "get_nearest_site", lambda db, service_id, lat, lon: None)
+
+    def fail(*args, **kwargs):
+        raise HTTPException(status_code=500, detail="Database error occurred")
+
+    monkeypatch.setattr(booking_management, "create_token_record", fail)
+    assert booking_management.merge_due_bookings(db, slot + timedelta(minutes=1)) == []
+    booking = db.query(booking_models.Booking).one()
+    assert (booking.status, booking.token_id) == ("booked", None)
+    db.close()
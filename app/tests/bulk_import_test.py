@@ -0,0 +1,92 @@
+import io
+import pytest
+from sqlalchemy import create_engine, insert
+from sqlalchemy.orm import sessionmaker
+from app.db.database import Base
+from app.models import booking_models, counter_models, service_models, site_models, token_models, user_models  # noqa: F401
+from app.utils import bulk_import
+from app.utils.bulk_import import import_file, import_records
+
+
+@pytest.fixture
+def db(monkeypatch):
+    monkeypatch.setattr(bulk_import, "_hash_password", lambda password: f"hashed:{password}")  # bcrypt is slow
+    engine = create_engine("sqlite://")
+    Base.metadata.create_all(engine)
+    session = sessionmaker(bind=engine)()
+    yield session
+    session.close()
+
+
+def test_users_csv_reports_invalid_and_duplicate_rows(db):
+    db.execute(insert(user_models.User), [{"name": "taken", "email": "taken@example.com", "hashed_password": "x"}])
+    db.commit()
+    csv_text = (
+        "name,email,password,role\n"
+        "alice,alice@example.com,secret1,\n"
+        "bob,not-an-email,secret1,User\n"
+        "carol,taken@example.com,secret1,Client\n"
+        "alice,alice2@example.com,secret1,User\n"
+        "dave,dave@example.com,secret1,User\n"
+    )
+    report = import_records(db, "users", io.StringIO(csv_text), "csv", batch_size=2)
+
+    assert (report["rows"], report["inserted"], report["failed"]) == (5, 2, 3)
+    assert [error["line"] for error in report["errors"]] == [3, 4, 5]
+    assert "email" in report["errors"][0]["error"]
+    assert report["errors"][1]["error"] == "Email already exist"
+    assert report["errors"][2]["error"] == "Name already exist"  # duplicate of a row from an earlier batch
+    users = {user.name: user for user in db.query(user_models.User)}
+    assert users["alice"].hashed_password == "hashed:secret1" and users["alice"].role == "User"
+
+
+def test_services_and_counters_from_ndjson(db):
+    services = (
+        '{"service_name": "passport", "service_entry_time": "09:00", "service_end_time": "17:00"}\n'
+        "\n"
+        "not json\n"
+        '{"service_name": "passport", "service_entry_time": "09:00", "service_end_time": "17:00"}\n'
+    )
+    report = import_records(db, "services", io.StringIO(services), "ndjson")
+    assert (report["inserted"], report["failed"]) == (1, 2)
+    assert [error["line"] for error in report["errors"]] == [3, 4]
+
+    counters = "".join(
+        f'{{"counter_number": {number}, "service_name": "{name}"}}\n'
+        for number, name in [(1, "passport"), (2, "passport"), (1, "passport"), (1, "visa")]
+    )
+    report = import_records(db, "counters", io.StringIO(counters), "ndjson", batch_size=3)
+    assert (report["inserted"], report["failed"]) == (2, 2)
+    assert [error["error"] for error in report["errors"]] == ["Counter already exists", "Service not found"]
+    assert db.query(counter_models.Counter).count() == 2
+
+
+def test_non_utf8_upload_is_reported_instead_of_raising(db):
+    rows = "".join(f"service{number},09:00,17:00\n" for number in range(200))
+    upload = io.BytesIO(f"service_name,service_entry_time,service_end_time\n{rows}caf\xe9,09:00,17:00\n".encode("latin-1"))
+    report = import_file(db, "services", upload, "csv")
+    assert report["errors"][-1]["error"].startswith("File is not UTF-8")
+    assert report["inserted"] > 0 and report["inserted"] + report["failed"] <= 201
+    assert db.query(service_models.Service).filter_by(service_name="caf\xe9").first() is None
+
+
+def test_rows_taken_by_a_concurrent_writer_are_rejected_individually(tmp_path, monkeypatch):
+    monkeypatch.setattr(bulk_import, "_hash_password", lambda password: f"hashed:{password}")
+    engine = create_engine(f"sqlite:///{tmp_path / 'import.db'}")
+    Base.metadata.create_all(engine)
+    prepare = bulk_import._UserImporter.prepare
+
+    def racing_prepare(self, rows, report):
+        accepted = prepare(self, rows, report)
+        with engine.begin() as conn:  # lands between the duplicate check and the INSERT
+            conn.execute(insert(user_models.User), [{"name": "other", "email": "bob@example.com", "hashed_password": "x"}])
+        return accepted
+
+    monkeypatch.setattr(bulk_import._UserImporter, "prepare", racing_prepare)
+    ndjson = "".join(f'{{"name": "{name}", "email": "{name}@example.com", "password": "secret1"}}\n' for name in ("alice", "bob", "carol"))
+    db = sessionmaker(bind=engine)()
+    report = import_records(db, "users", io.StringIO(ndjson), "ndjson")
+    db.close()
+
+    assert (report["inserted"], report["failed"]) == (2, 1)
+    assert report["errors"] == [{"line": 2, "error": "Email or name already exist"}]
@@ -0,0 +1,18 @@
+import pytest
+
+
+class ManualClock:
+    """
+        Stand-in for `time.monotonic` that only moves when a test sets `now`.
+    """
+
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+
+@pytest.fixture
+def clock():
+    return ManualClock()
@@ -0,0 +1,81 @@
+import json
+import threading
+import pytest
+from fastapi import HTTPException
+from sqlalchemy import create_engine, insert
+from sqlalchemy.orm import sessionmaker
+from app.crud.token_management import call_next_token
+from app.db.database import Base
+from app.models import booking_models, counter_models, service_models, site_models, token_models, user_models  # noqa: F401
+from app.routing.counter_routes import serve_next
+from app.utils.sketches import latency_sketches
+
+
+@pytest.fixture
+def sessions(tmp_path, monkeypatch):
+    monkeypatch.setattr(latency_sketches, "record", lambda *args: None)
+    engine = create_engine(f"sqlite:///{tmp_path / 'queue.db'}", connect_args={"timeout": 30})
+    Base.metadata.create_all(engine)
+    with engine.begin() as conn:
+        conn.execute(insert(counter_models.Counter), [{"id": 1, "counter_number": 1, "service_id": 1}])
+        conn.execute(insert(token_models.Token), [
+            {"id": i, "token_number": i, "queue_position": i, "user_id": 1, "latitude": 0.0, "longitude": 0.0,
+             "service_id": 1, "counter_id": 1, "state": "waiting"}
+            for i in range(1, 21)
+        ])
+    yield sessionmaker(bind=engine)
+    engine.dispose()
+
+
+def _states(db):
+    return dict(db.query(token_models.Token.token_number, token_models.Token.state).all())
+
+
+def test_call_next_finishes_the_current_token_and_calls_the_next(sessions):
+    db = sessions()
+    served, called = call_next_token(db, 1)
+    assert served is None and called.token_number == 1
+    served, called = call_next_token(db, 1)
+    assert served.token_number == 1 and called.token_number == 2
+    states = _states(db)
+    assert (states[1], states[2], states[3]) == ("served", "serving", "waiting")
+    db.close()
+
+
+def test_concurrent_calls_never_serve_two_tokens_at_once(sessions):
+    calls = []
+
+    def worker():
+        db = sessions()
+        try:
+            for _ in range(5):
+                calls.append(call_next_token(db, 1)[1].token_number)
+        finally:
+            db.close()
+
+    workers = [threading.Thread(target=worker) for _ in range(4)]
+    for thread in workers:
+        thread.start()
+    for thread in workers:
+        thread.join()
+
+    assert sorted(calls) == list(range(1, 21))  # every token called exactly once
+    db = sessions()
+    states = _states(db)
+    assert list(states.values()).count("serving") == 1
+    assert list(states.values()).count("served") == 19
+    db.close()
+
+
+def test_serve_next_returns_the_called_token_or_404(sessions):
+    db = sessions()
+    db.query(token_models.Token).filter(token_models.Token.token_number > 1).delete()
+    db.commit()
+    response = serve_next(1, db)
+    body = json.loads(response.body)
+    assert (body["token_number"], body["status"]) == (1, "Now serving")
+    with pytest.raises(HTTPException) as error:
+        serve_next(1, db)
+    assert error.value.status_code == 404
+    assert _states(db) == {1: "served"}
+    db.close()
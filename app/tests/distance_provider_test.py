@@ -0,0 +1,132 @@
+import asyncio
+import pytest
+from app.utils.distance_providers import (
+    CircuitBreaker,
+    DistanceProviderError,
+    FakeDistanceProvider,
+    LocalEstimatorProvider,
+    MatrixApiProvider,
+    ResilientDistanceProvider,
+)
+
+ORIGIN = (24.8523464, 67.0078039)
+DESTINATION = (24.8416198, 67.164574)
+
+
+def test_primary_result_is_returned_when_healthy():
+    primary = FakeDistanceProvider(result=(12, 6.1))
+    provider = ResilientDistanceProvider(primary, FakeDistanceProvider(result=(99, 99.0)), hedge_delay="off")
+    assert asyncio.run(provider.get_distance(ORIGIN, DESTINATION)) == (12, 6.1)
+
+
+def test_timeout_falls_back_within_budget():
+    primary = FakeDistanceProvider(delay=1.0, timeout=0.05)
+    fallback = FakeDistanceProvider(result=(7, 3.0))
+    provider = ResilientDistanceProvider(primary, fallback, hedge_delay="off")
+    assert asyncio.run(provider.get_distance(ORIGIN, DESTINATION)) == (7, 3.0)
+
+
+def test_circuit_opens_and_skips_primary(clock):
+    primary = FakeDistanceProvider(fail=True)
+    fallback = FakeDistanceProvider(result=(7, 3.0))
+    provider = ResilientDistanceProvider(primary, fallback, CircuitBreaker(2, 30, clock), hedge_delay="off")
+
+    for _ in range(5):
+        assert asyncio.run(provider.get_distance(ORIGIN, DESTINATION)) == (7, 3.0)
+    assert primary.calls == 2
+    assert provider.breaker.state == "open"
+
+    # After the reset timeout a single probe is allowed; success closes the breaker
+    clock.now = 31
+    primary.fail = False
+    assert asyncio.run(provider.get_distance(ORIGIN, DESTINATION)) == primary.result
+    assert provider.breaker.state == "closed"
+
+
+def _open_breaker(primary, clock):
+    provider = ResilientDistanceProvider(primary, FakeDistanceProvider(result=(7, 3.0)), CircuitBreaker(1, 30, clock), hedge_delay="off")
+    primary.fail = True
+    asyncio.run(provider.get_distance(ORIGIN, DESTINATION))
+    primary.fail = False
+    clock.now = 31
+    assert provider.breaker.state == "half-open"
+    return provider
+
+
+def test_cancelled_probe_reopens_the_breaker(clock):
+    primary = FakeDistanceProvider(delay=1.0)
+    provider = _open_breaker(primary, clock)
+
+    async def cancel_probe():
+        probe = asyncio.ensure_future(provider.get_distance(ORIGIN, DESTINATION))
+        await asyncio.sleep(0.01)
+        probe.cancel()
+        await asyncio.gather(probe, return_exceptions=True)
+
+    asyncio.run(cancel_probe())
+    assert provider.breaker.state == "open"
+    clock.now = 62
+    primary.delay = 0
+    assert asyncio.run(provider.get_distance(ORIGIN, DESTINATION)) == primary.result  # probed again
+    assert primary.calls == 3
+
+
+def test_unexpected_probe_error_reopens_the_breaker(clock):
+    class BadPayload(FakeDistanceProvider):
+        bad = False
+
+        async def get_distance(self, origin, destination):
+            if self.bad:
+                self.bad = False
+                raise KeyError("rows")
+            return await super().get_distance(origin, destination)
+
+    primary = BadPayload()
+    provider = _open_breaker(primary, clock)
+    primary.bad = True
+    with pytest.raises(KeyError):
+        asyncio.run(provider.get_distance(ORIGIN, DESTINATION))
+    assert provider.breaker.state == "open"
+    clock.now = 62
+    assert asyncio.run(provider.get_distance(ORIGIN, DESTINATION)) == primary.result
+    assert provider.breaker.state == "closed"
+
+
+def test_matrix_client_is_closed():
+    pytest.importorskip("httpx")
+    provider = ResilientDistanceProvider(MatrixApiProvider(url="http://matrix.invalid"), None)
+
+    async def run():
+        client = provider.primary._get_client()
+        await provider.aclose()
+        return client
+
+    assert asyncio.run(run()).is_closed
+    assert provider.primary._client is None
+
+
+def test_hedged_request_wins_over_slow_first_call():
+    class SlowThenFast(FakeDistanceProvider):
+        async def get_distance(self, origin, destination):
+            self.calls += 1
+            await asyncio.sleep(1.0 if self.calls == 1 else 0.01)
+            return self.result
+
+    primary = SlowThenFast(result=(4, 1.5), timeout=0.5)
+    provider = ResilientDistanceProvider(primary, None, hedge_delay=0.02)
+    assert asyncio.run(provider.get_distance(ORIGIN, DESTINATION)) == (4, 1.5)
+    assert primary.calls == 2
+
+
+def test_no_fallback_raises():
+    provider = ResilientDistanceProvider(FakeDistanceProvider(fail=True), None, hedge_delay="off")
+    with pytest.raises(DistanceProviderError):
+        asyncio.run(provider.get_distance(ORIGIN, DESTINATION))
+
+
+def test_local_estimator_scales_with_distance():
+    estimator = LocalEstimatorProvider(speed_kmh=30, road_factor=1.0)
+    near = asyncio.run(estimator.get_distance(ORIGIN, (24.86, 67.01)))
+    far = asyncio.run(estimator.get_distance(ORIGIN, DESTINATION))
+    assert near[1] < far[1]
+    assert far[0] == pytest.approx(far[1] * 2, abs=1)
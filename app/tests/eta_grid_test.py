@@ -0,0 +1,161 @@
+import asyncio
+import os
+import time
+import pytest
+from app.utils import eta_grid
+from app.utils.distance_providers import DistanceProvider, FakeDistanceProvider, GridDistanceProvider
+from app.utils.eta_grid import EtaGridRefresher, EtaGridStore, build_grid
+
+ORIGIN = (24.8523464, 67.0078039)
+
+
+class ManhattanProvider(DistanceProvider):
+    """
+        Duration and distance grow linearly with |dlat| + |dlon|, which is linear
+        within every grid cell, so interpolation must reproduce it exactly.
+    """
+    name = "manhattan"
+
+    def __init__(self):
+        super().__init__()
+        self.batches = []
+
+    @staticmethod
+    def value(origin, destination):
+        spread = abs(destination[0] - origin[0]) + abs(destination[1] - origin[1])
+        return spread * 1000, spread * 100
+
+    async def get_distances(self, origin, destinations):
+        self.batches.append(len(destinations))
+        return [self.value(origin, destination) for destination in destinations]
+
+
+@pytest.fixture
+def store(tmp_path):
+    provider = ManhattanProvider()
+    grids = EtaGridStore(str(tmp_path))
+    resolved = asyncio.run(build_grid(provider, ORIGIN, grids.path_for(ORIGIN), radius_km=2, step_km=0.5))
+    assert resolved == 81
+    assert max(provider.batches) <= 25
+    assert grids.reload() == 1
+    return grids
+
+
+def test_lookup_interpolates_between_cells(store):
+    destination = (ORIGIN[0] + 0.0071, ORIGIN[1] - 0.0123)
+    duration, distance = ManhattanProvider.value(ORIGIN, destination)
+    assert store.lookup(ORIGIN, destination) == (int(round(duration)), round(distance, 1))
+
+
+def test_lookup_outside_coverage_or_unknown_origin_misses(store):
+    assert store.lookup(ORIGIN, (ORIGIN[0] + 0.5, ORIGIN[1])) is None
+    assert store.lookup((0.0, 0.0), ORIGIN) is None
+
+
+def test_unresolved_cells_fall_back(tmp_path):
+    class Holes(ManhattanProvider):
+        async def get_distances(self, origin, destinations):
+            results = await super().get_distances(origin, destinations)
+            return [None if destination[0] > origin[0] + 1e-9 else result for destination, result in zip(destinations, results)]
+
+    grids = EtaGridStore(str(tmp_path))
+    asyncio.run(build_grid(Holes(), ORIGIN, grids.path_for(ORIGIN), radius_km=2, step_km=0.5))
+    grids.reload()
+    assert grids.lookup(ORIGIN, (ORIGIN[0] - 0.005, ORIGIN[1])) is not None
+    assert grids.lookup(ORIGIN, (ORIGIN[0] + 0.005, ORIGIN[1])) is None
+
+
+def test_grid_provider_only_calls_remote_outside_coverage(store):
+    remote = FakeDistanceProvider(result=(99, 99.0))
+    provider = GridDistanceProvider(remote, store)
+    inside = (ORIGIN[0] + 0.003, ORIGIN[1] + 0.003)
+    outside = (ORIGIN[0] + 1.0, ORIGIN[1])
+
+    assert asyncio.run(provider.get_distance(ORIGIN, inside)) != (99, 99.0)
+    assert remote.calls == 0
+    results = asyncio.run(provider.get_distances(ORIGIN, [inside, outside, inside]))
+    assert results[1] == (99, 99.0) and results[0] == results[2] != (99, 99.0)
+    assert remote.calls == 1
+
+
+def test_refresher_rebuilds_stale_grids_and_reloads(tmp_path, monkeypatch):
+    grids = EtaGridStore(str(tmp_path))
+    refresher = EtaGridRefresher(grids, interval=60, max_age=3600, auto_build=True)
+    monkeypatch.setattr("app.utils.eta_grid.service_origins", lambda: [ORIGIN])
+    monkeypatch.setattr("app.core.config.settings.ETA_GRID_RADIUS_KM", 1.0)
+
+    assert asyncio.run(refresher.tick(ManhattanProvider())) == 1
+    assert grids.get(ORIGIN) is not None
+    assert asyncio.run(refresher.tick(ManhattanProvider())) == 0  # still fresh
+
+
+def test_failed_chunk_cancels_the_rest_and_keeps_the_old_grid(tmp_path):
+    class FailsOnce(ManhattanProvider):
+        def __init__(self):
+            super().__init__()
+            self.cancelled = 0
+
+        async def get_distances(self, origin, destinations):
+            if not self.batches:
+                self.batches.append(len(destinations))
+                raise RuntimeError("quota exceeded")
+            try:
+                await asyncio.sleep(10)
+            except asyncio.CancelledError:
+                self.cancelled += 1
+                raise
+
+    provider = FailsOnce()
+    grids = EtaGridStore(str(tmp_path))
+
+    async def run():
+        with pytest.raises(RuntimeError):
+            await build_grid(provider, ORIGIN, grids.path_for(ORIGIN), radius_km=2, step_km=0.5, concurrency=2)
+        return asyncio.all_tasks() - {asyncio.current_task()}
+
+    assert asyncio.run(run()) == set()  # no chunk keeps calling the provider
+    assert provider.cancelled >= 1
+    assert grids.reload() == 0
+
+
+def test_refresher_backs_off_after_a_failed_build(tmp_path, monkeypatch):
+    class Down(ManhattanProvider):
+        async def get_distances(self, origin, destinations):
+            self.batches.append(len(destinations))
+            raise RuntimeError("provider down")
+
+    grids = EtaGridStore(str(tmp_path))
+    refresher = EtaGridRefresher(grids, interval=60, max_age=3600, auto_build=True)
+    monkeypatch.setattr("app.utils.eta_grid.service_origins", lambda: [ORIGIN])
+    monkeypatch.setattr("app.core.config.settings.ETA_GRID_RADIUS_KM", 1.0)
+
+    provider = Down()
+    assert asyncio.run(refresher.tick(provider)) == 0
+    attempts = len(provider.batches)
+    assert attempts > 0 and refresher.backing_off(ORIGIN)
+    assert asyncio.run(refresher.tick(provider)) == 0
+    assert len(provider.batches) == attempts  # not retried yet
+    assert not refresher.backing_off(ORIGIN, now=time.time() + 121)  # 60s x 2^1
+
+    assert asyncio.run(refresher.build([ORIGIN], ManhattanProvider())) == 1
+    assert not refresher.backing_off(ORIGIN)
+
+
+def test_refresher_rechecks_staleness_once_it_holds_the_lock(tmp_path, monkeypatch):
+    grids = EtaGridStore(str(tmp_path))
+    refresher = EtaGridRefresher(grids, interval=60, max_age=3600, auto_build=True)
+    monkeypatch.setattr("app.utils.eta_grid.service_origins", lambda: [ORIGIN])
+    monkeypatch.setattr("app.core.config.settings.ETA_GRID_RADIUS_KM", 1.0)
+    built_elsewhere = str(tmp_path / "other.grid")
+    asyncio.run(build_grid(ManhattanProvider(), ORIGIN, built_elsewhere, radius_km=1.0, step_km=0.5))
+    flock = eta_grid.fcntl.flock
+
+    def lock_after_another_worker_built(file, flags):
+        # The worker that held the lock finishes the grid just before we get it
+        os.replace(built_elsewhere, grids.path_for(ORIGIN))
+        flock(file, flags)
+
+    monkeypatch.setattr(eta_grid.fcntl, "flock", lock_after_another_worker_built)
+    provider = ManhattanProvider()
+    assert asyncio.run(refresher.tick(provider)) == 0
+    assert provider.batches == []
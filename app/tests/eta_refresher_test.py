@@ -0,0 +1,70 @@
+import asyncio
+from datetime import datetime, timedelta, timezone
+import pytest
+from sqlalchemy import create_engine, insert
+from sqlalchemy.orm import sessionmaker
+from app.crud.token_management import bulk_update_token_etas, get_active_tokens_for_refresh
+from app.db.database import Base
+from app.models import booking_models, counter_models, service_models, site_models, token_models, user_models  # noqa: F401
+from app.utils.distance_providers import FakeDistanceProvider
+from app.utils.eta_refresher import EtaRefresher
+
+NOW = datetime.now(timezone.utc)
+
+
+@pytest.fixture
+def sessions(tmp_path, monkeypatch):
+    # A file database: the refresher runs its queries in worker threads
+    engine = create_engine(f"sqlite:///{tmp_path / 'tokens.db'}")
+    Base.metadata.create_all(engine)
+    with engine.begin() as conn:
+        conn.execute(insert(site_models.ServiceSite), [
+            {"id": 1, "service_id": 1, "site_name": "north", "latitude": 25.0, "longitude": 67.0, "is_open": True},
+        ])
+        conn.execute(insert(token_models.Token), [
+            {"id": i, "token_number": i, "queue_position": i, "latitude": 24.9, "longitude": 67.1, "service_id": 1,
+             "counter_id": 1, "site_id": site_id, "state": state, "reach_out": reach_out, "issue_time": NOW - age}
+            for i, state, reach_out, age, site_id in [
+                (1, "waiting", False, timedelta(minutes=5), 1),
+                (2, "deferred", False, timedelta(hours=1), None),
+                (3, "waiting", True, timedelta(minutes=5), 1),  # already arrived
+                (4, "served", False, timedelta(minutes=5), 1),
+                (5, "waiting", False, timedelta(days=2), 1),  # abandoned days ago
+            ]
+        ])
+    factory = sessionmaker(bind=engine)
+    monkeypatch.setattr("app.db.database.SessionLocal", factory)
+    yield factory
+    engine.dispose()
+
+
+def test_only_recent_active_tokens_are_refreshed(sessions):
+    db = sessions()
+    rows = get_active_tokens_for_refresh(db, NOW - timedelta(hours=12))
+    assert sorted((row.id, row.site_latitude) for row in rows) == [(1, 25.0), (2, None)]
+    db.close()
+
+
+def test_bulk_update_writes_every_eta(sessions):
+    db = sessions()
+    assert bulk_update_token_etas(db, []) == 0
+    assert bulk_update_token_etas(db, [
+        {"id": 1, "distance": 4.5, "duration": 11, "reach_out": False},
+        {"id": 2, "distance": 1.0, "duration": 3, "reach_out": True},
+    ]) == 2
+    rows = db.query(token_models.Token.id, token_models.Token.distance, token_models.Token.duration, token_models.Token.reach_out)
+    assert sorted(rows.filter(token_models.Token.id <= 2).all()) == [(1, 4.5, 11, False), (2, 1.0, 3, True)]
+    db.close()
+
+
+def test_refresher_tick_updates_recent_waiting_tokens(sessions, monkeypatch):
+    provider = FakeDistanceProvider(result=(14, 6.0))
+    monkeypatch.setattr("app.utils.eta_refresher.get_distance_provider", lambda: provider)
+    refresher = EtaRefresher(interval=60, concurrency=2, max_age=12 * 3600)
+
+    assert asyncio.run(refresher.tick()) == 2
+    assert provider.calls == 2  # one per site group: the routed site and the fixed coordinates
+    db = sessions()
+    etas = dict(db.query(token_models.Token.id, token_models.Token.duration).all())
+    assert etas == {1: 14, 2: 14, 3: None, 4: None, 5: None}
+    db.close()
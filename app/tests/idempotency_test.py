@@ -0,0 +1,91 @@
+import asyncio
+import pytest
+from fastapi import HTTPException
+from fastapi.responses import Response
+from app.utils.idempotency import IdempotencyStore
+
+
+def counting_handler(calls, delay=0.0):
+    async def handler():
+        calls.append(1)
+        await asyncio.sleep(delay)
+        return Response(content=f'{{"token_number":{len(calls)}}}'.encode(), media_type="application/json")
+    return handler
+
+
+def test_retry_replays_original_response():
+    store = IdempotencyStore(max_entries=10, ttl=60)
+    calls = []
+
+    async def scenario():
+        first = await store.run("k", "fp", counting_handler(calls))
+        retry = await store.run("k", "fp", counting_handler(calls))
+        return first, retry
+
+    first, retry = asyncio.run(scenario())
+    assert calls == [1]
+    assert retry.body == first.body == b'{"token_number":1}'
+    assert retry.headers["Idempotent-Replayed"] == "true"
+
+
+def test_concurrent_duplicates_wait_for_first_execution():
+    store = IdempotencyStore(max_entries=10, ttl=60)
+    calls = []
+
+    async def scenario():
+        return await asyncio.gather(*(store.run("k", "fp", counting_handler(calls, delay=0.01)) for _ in range(5)))
+
+    responses = asyncio.run(scenario())
+    assert calls == [1]
+    assert {response.body for response in responses} == {b'{"token_number":1}'}
+
+
+def test_duplicates_take_over_when_the_first_request_is_cancelled():
+    store = IdempotencyStore(max_entries=10, ttl=60)
+    calls = []
+
+    async def scenario():
+        first = asyncio.ensure_future(store.run("k", "fp", counting_handler(calls, delay=1.0)))
+        await asyncio.sleep(0.01)
+        duplicates = [asyncio.ensure_future(store.run("k", "fp", counting_handler(calls, delay=0.01))) for _ in range(3)]
+        await asyncio.sleep(0.01)
+        first.cancel()  # client disconnected
+        return await asyncio.gather(*duplicates)
+
+    responses = asyncio.run(scenario())
+    assert calls == [1, 1]
+    assert [response.headers.get("Idempotent-Replayed") for response in responses] == [None, "true", "true"]
+    assert {response.body for response in responses} == {b'{"token_number":2}'}
+
+
+def test_key_reuse_with_different_body_is_rejected():
+    store = IdempotencyStore(max_entries=10, ttl=60)
+
+    async def scenario():
+        await store.run("k", "fp", counting_handler([]))
+        await store.run("k", "other", counting_handler([]))
+
+    with pytest.raises(HTTPException) as excinfo:
+        asyncio.run(scenario())
+    assert excinfo.value.status_code == 422
+
+
+def test_failures_are_not_stored_and_entries_expire(clock):
+    store = IdempotencyStore(max_entries=2, ttl=60, clock=clock)
+    calls = []
+
+    async def failing():
+        raise HTTPException(status_code=500, detail="boom")
+
+    async def scenario():
+        with pytest.raises(HTTPException):
+            await store.run("k", "fp", failing)
+        await store.run("k", "fp", counting_handler(calls))
+        clock.now = 61
+        await store.run("k", "fp", counting_handler(calls))
+        await store.run("a", "fp", counting_handler(calls))
+        await store.run("b", "fp", counting_handler(calls))
+
+    asyncio.run(scenario())
+    assert len(calls) == 4
+    assert len(store) == 2
@@ -0,0 +1,70 @@
+import io
+import json
+import logging
+import queue
+from app.utils.log_pipeline import BoundedQueueHandler, JsonFormatter, SamplingFilter, configure_logging, parse_rules
+from app.utils.metrics import log_records_dropped
+
+
+def record(name="app.db.session", level=logging.INFO, msg="hello %s", args=("world",), **extra):
+    rec = logging.LogRecord(name, level, __file__, 1, msg, args, None)
+    rec.__dict__.update(extra)
+    return rec
+
+
+def test_json_formatter_emits_extras_and_tracebacks():
+    try:
+        raise ValueError("boom")
+    except ValueError:
+        import sys
+        rec = logging.LogRecord("app", logging.ERROR, __file__, 1, "failed %d", (3,), sys.exc_info())
+    rec.token_number = 7
+    prepared = BoundedQueueHandler(queue.Queue()).prepare(rec)
+    payload = json.loads(JsonFormatter().format(prepared))
+    assert (payload["message"], payload["level"], payload["token_number"]) == ("failed 3", "ERROR", 7)
+    assert "ValueError: boom" in payload["exc_info"]
+
+
+def test_rules_match_longest_prefix():
+    rules = SamplingFilter(parse_rules("app=0.5,app.db=0.0,root=1"), parse_rules("sqlalchemy.engine=2"))
+    assert rules._rule("app.db.session") == (0.0, None)
+    assert rules._rule("app.core.config") == (0.5, None)
+    assert rules._rule("sqlalchemy.engine.Engine") == (1.0, 2.0)
+
+
+def test_sampling_and_rate_limits_spare_warnings():
+    now = [0.0]
+    sampler = SamplingFilter({"app.db": 0.0}, {"sqlalchemy": 2}, clock=lambda: now[0])
+    assert not sampler.filter(record())
+    assert sampler.filter(record(level=logging.WARNING))
+
+    engine_records = [sampler.filter(record("sqlalchemy.engine")) for _ in range(5)]
+    assert engine_records == [True, True, False, False, False]
+    now[0] += 0.5
+    assert sampler.filter(record("sqlalchemy.engine"))
+    assert not sampler.filter(record("sqlalchemy.engine"))
+
+
+def test_full_buffer_drops_instead_of_blocking():
+    handler = BoundedQueueHandler(queue.Queue(1))
+    before = log_records_dropped.labels("queue_full").value
+    handler.emit(record())
+    handler.emit(record())
+    assert handler.queue.qsize() == 1
+    assert log_records_dropped.labels("queue_full").value == before + 1
+
+
+def test_pipeline_writes_json_lines_from_the_writer_thread():
+    root = logging.getLogger()
+    saved_handlers, saved_level = list(root.handlers), root.level
+    stream = io.StringIO()
+    listener = configure_logging("INFO", "json", 100, stream=stream)
+    try:
+        logging.getLogger("app.test").info("queued %s", "line", extra={"route": "/x"})
+        logging.getLogger("app.test").debug("below level")
+    finally:
+        listener.stop()
+        root.handlers[:] = saved_handlers
+        root.setLevel(saved_level)
+    lines = [json.loads(line) for line in stream.getvalue().splitlines()]
+    assert [(line["message"], line["route"]) for line in lines] == [("queued line", "/x")]
@@ -0,0 +1,57 @@
+import pytest
+from app.utils.metrics import Registry
+
+
+def test_histogram_renders_cumulative_buckets():
+    registry = Registry()
+    histogram = registry.histogram("latency_seconds", "Test latency.", ("route",), buckets=(0.1, 1.0))
+    for value in (0.05, 0.5, 0.5, 3.0):
+        histogram.labels("/users/").observe(value)
+
+    lines = registry.render().splitlines()
+    assert 'latency_seconds_bucket{route="/users/",le="0.1"} 1' in lines
+    assert 'latency_seconds_bucket{route="/users/",le="1"} 3' in lines
+    assert 'latency_seconds_bucket{route="/users/",le="+Inf"} 4' in lines
+    assert 'latency_seconds_count{route="/users/"} 4' in lines
+    assert 'latency_seconds_sum{route="/users/"} 4.05' in lines
+
+
+@pytest.mark.parametrize("callback, expected", [
+    (lambda: 3, "pool_checked_out 3"),
+    (lambda: None, None),
+])
+def test_gauge_callback_sampled_at_scrape(callback, expected):
+    registry = Registry()
+    registry.gauge("pool_checked_out", "Test gauge.", callback=callback)
+    samples = [line for line in registry.render().splitlines() if not line.startswith("#")]
+    assert samples == ([expected] if expected else [])
+
+
+def test_counter_total_suffix():
+    registry = Registry()
+    counter = registry.counter("distance_api_errors", "Test counter.", ("reason",))
+    counter.labels("timeout").inc()
+    counter.labels("timeout").inc(2)
+    assert 'distance_api_errors_total{reason="timeout"} 3' in registry.render().splitlines()
+
+
+def test_label_values_are_escaped():
+    registry = Registry()
+    counter = registry.counter("requests", "Test counter.", ("route",))
+    counter.labels('/a\\b"c\nd').inc()
+    assert 'requests_total{route="/a\\\\b\\"c\\nd"} 1' in registry.render().splitlines()
+
+
+def test_failed_statements_do_not_leak_start_times():
+    from sqlalchemy import create_engine, text
+    from sqlalchemy.exc import OperationalError
+    from app.utils.metrics import instrument_engine
+
+    engine = create_engine("sqlite://")
+    instrument_engine(engine, pool_metrics=False)
+    with engine.connect() as conn:
+        for _ in range(3):
+            with pytest.raises(OperationalError):
+                conn.execute(text("SELECT * FROM missing"))
+        conn.execute(text("SELECT 1"))
+        assert conn.info["metrics_query_start"] == []
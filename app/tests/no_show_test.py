@@ -0,0 +1,79 @@
+from datetime import datetime, timedelta
+from types import SimpleNamespace
+from sqlalchemy import create_engine, insert
+from sqlalchemy.orm import sessionmaker
+from app.crud.token_management import apply_no_show_transitions, get_no_show_candidates
+from app.db.database import Base
+from app.models import booking_models, counter_models, service_models, site_models, token_models, user_models  # noqa: F401
+from app.utils.no_show import evaluate
+from app.utils.token_log import QueueState, TokenEvent
+
+NOW = datetime(2030, 1, 7, 12, 0)
+
+
+def _row(token_id, state="waiting", duration=1, reach_out=False, silent_minutes=0, counter_id=1):
+    return SimpleNamespace(id=token_id, token_number=token_id, service_id=1, counter_id=counter_id, state=state,
+                           duration=duration, reach_out=reach_out, last_location_at=NOW - timedelta(minutes=silent_minutes))
+
+
+def _evaluate(rows, **rules):
+    return evaluate(rows, NOW, lambda service_id: 300, head_window=2, eta_grace_minutes=5, ping_minutes=10, **rules)
+
+
+def test_head_tokens_that_cannot_make_it_are_deferred():
+    rows = [
+        _row(1, "serving"),
+        _row(2, duration=30),  # called in ~5 minutes, 30 away
+        _row(3, silent_minutes=15),  # stopped pinging
+        _row(4, duration=8),  # 1 token ahead once 2 and 3 are deferred: 5 + 5 grace >= 8
+        _row(5, duration=12),  # 2 ahead: 10 + 5 >= 12
+        _row(6, duration=60),  # behind a full head window
+        _row(7, duration=60, reach_out=True, counter_id=2),  # already here
+    ]
+    decision = _evaluate(rows)
+    assert decision.defer == {2: ["eta"], 3: ["ping"]}
+    assert decision.resume == []
+
+    only_ping = _evaluate(rows, rules=("ping",))
+    assert only_ping.defer == {3: ["ping"]}
+
+
+def test_deferred_tokens_resume_once_they_fit_again():
+    rows = [
+        _row(1, "deferred", duration=3),  # now close enough to be called first
+        _row(2, "deferred", duration=30, reach_out=True),  # arrived
+        _row(3, "deferred", duration=90),  # still far away
+    ]
+    decision = _evaluate(rows)
+    assert decision.resume == [1, 2]
+    assert decision.defer == {}
+
+
+def test_transitions_are_conditional_bulk_updates():
+    engine = create_engine("sqlite://")
+    Base.metadata.create_all(engine)
+    tokens = [
+        {"id": i, "token_number": i, "queue_position": i, "latitude": 0.0, "longitude": 0.0, "service_id": 1,
+         "counter_id": 1, "state": state, "last_location_at": NOW - timedelta(minutes=silent)}
+        for i, state, silent in [(1, "waiting", 0), (2, "deferred", 0), (3, "deferred", 45), (4, "serving", 0)]
+    ]
+    with engine.begin() as conn:
+        conn.execute(insert(token_models.Token), tokens)
+    db = sessionmaker(bind=engine)()
+
+    assert [row.id for row in get_no_show_candidates(db)] == [1, 2, 3, 4]
+    moves = apply_no_show_transitions(db, [1, 4], [2], NOW - timedelta(minutes=30))
+    assert {state: [row.token_number for row in rows] for state, rows in moves.items()} == {
+        "deferred": [1], "waiting": [2], "skipped": [3],  # 4 is being served, so it is left alone
+    }
+    assert apply_no_show_transitions(db, [1], [], None) == {"deferred": []}  # a second worker moves nothing
+    states = dict(db.query(token_models.Token.id, token_models.Token.state).all())
+    assert states == {1: "deferred", 2: "waiting", 3: "skipped", 4: "serving"}
+    db.close()
+
+
+def test_queue_state_replays_no_show_events():
+    state = QueueState()
+    for event_type, number in [("issued", 1), ("issued", 2), ("deferred", 1), ("deferred", 2), ("resumed", 1), ("skipped", 2)]:
+        state.apply(TokenEvent(0.0, event_type, number, 1, 1))
+    assert [(t.token_number, t.state) for t in state.queue(1)] == [(1, "waiting")]
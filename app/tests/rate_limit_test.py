@@ -0,0 +1,111 @@
+import asyncio
+import pytest
+from fastapi import HTTPException
+from app.utils.rate_limit import AdmissionController, InMemoryRateLimitBackend, RateLimiter, RedisRateLimitBackend
+
+
+def test_bucket_allows_burst_then_refills(clock):
+    backend = InMemoryRateLimitBackend(clock=clock)
+    assert [backend.take("k", rate=1.0, capacity=2)[0] for _ in range(3)] == [True, True, False]
+    allowed, retry_after = backend.take("k", rate=1.0, capacity=2)
+    assert not allowed and retry_after == pytest.approx(1.0)
+    clock.now = 1.0
+    assert backend.take("k", rate=1.0, capacity=2)[0]
+
+
+def test_buckets_are_keyed_and_bounded(clock):
+    backend = InMemoryRateLimitBackend(max_keys=2, clock=clock)
+    backend.take("a", 1.0, 1)
+    assert backend.take("b", 1.0, 1)[0]
+    backend.take("c", 1.0, 1)
+    assert len(backend._buckets) == 2
+    assert backend.take("a", 1.0, 1)[0]  # evicted, so it starts full again
+
+
+def test_limiter_raises_429_with_retry_after(monkeypatch, clock):
+    monkeypatch.setattr("app.core.config.settings.RATE_LIMIT_ENABLED", True)
+    limiter = RateLimiter(InMemoryRateLimitBackend(clock=clock), {"new-location": (6, 1)})
+    limiter.check("new-location", 1)
+    limiter.check("new-location", 2)
+    with pytest.raises(HTTPException) as excinfo:
+        limiter.check("new-location", 1)
+    assert excinfo.value.status_code == 429
+    assert excinfo.value.headers["Retry-After"] == "10"
+
+
+def test_limiter_is_off_unless_enabled(monkeypatch, clock):
+    monkeypatch.setattr("app.core.config.settings.RATE_LIMIT_ENABLED", False)
+    limiter = RateLimiter(InMemoryRateLimitBackend(clock=clock), {"new-location": (6, 1)})
+    for _ in range(5):
+        limiter.check("new-location", 1)
+
+
+def test_redis_backend_shares_buckets():
+    fakeredis = pytest.importorskip("fakeredis")
+    pytest.importorskip("lupa")
+    client = fakeredis.FakeRedis()
+    first = RedisRateLimitBackend(client, clock=lambda: 100.0)
+    second = RedisRateLimitBackend(client, clock=lambda: 100.0)
+    assert first.take("token:a", 1.0, 1)[0]
+    assert not second.take("token:a", 1.0, 1)[0]
+
+
+def test_admission_controller_sheds_over_concurrency():
+    release = asyncio.Event()
+
+    async def app(scope, receive, send):
+        await release.wait()
+        await send({"type": "http.response.start", "status": 200, "headers": []})
+
+    controller = AdmissionController(app, max_concurrency=1)
+    sent = []
+
+    async def send(message):
+        sent.append(message)
+
+    async def scenario():
+        scope = {"type": "http", "method": "GET", "path": "/users/"}
+        first = asyncio.create_task(controller(scope, None, send))
+        await asyncio.sleep(0)
+        await controller(scope, None, send)
+        release.set()
+        await first
+
+    asyncio.run(scenario())
+    assert sent[0]["status"] == 503
+    assert (b"retry-after", b"1") in sent[0]["headers"]
+    assert sent[-1]["status"] == 200
+    assert controller.in_flight == 0
+
+
+def test_open_event_streams_do_not_block_other_routes():
+    closed = asyncio.Event()
+
+    async def app(scope, receive, send):
+        await send({"type": "http.response.start", "status": 200, "headers": []})
+        if scope["path"].endswith("/events"):
+            await send({"type": "http.response.body", "body": b"data: {}\n\n", "more_body": True})
+            await closed.wait()
+        await send({"type": "http.response.body", "body": b""})
+
+    controller = AdmissionController(app, max_concurrency=2)
+    statuses = []
+
+    async def send(message):
+        if message["type"] == "http.response.start":
+            statuses.append(message["status"])
+
+    async def scenario():
+        streams = [
+            asyncio.create_task(controller({"type": "http", "method": "GET", "path": f"/users/token/{n}/events"}, None, send))
+            for n in range(3)
+        ]
+        await asyncio.sleep(0.01)
+        assert controller.in_flight == 0
+        await controller({"type": "http", "method": "POST", "path": "/users/token"}, None, send)
+        closed.set()
+        await asyncio.gather(*streams)
+
+    asyncio.run(scenario())
+    assert statuses == [200, 200, 200, 200]
+    assert controller.in_flight == 0
@@ -0,0 +1,78 @@
+import threading
+import time
+from types import SimpleNamespace
+from sqlalchemy import create_engine, text
+from app.db.replicas import LAST_WRITE_COOKIE, ReplicaRouter, wrote_recently
+
+
+def database_file(path, name):
+    engine = create_engine(f"sqlite:///{path}")
+    with engine.begin() as conn:
+        conn.execute(text("CREATE TABLE IF NOT EXISTS origin (name TEXT)"))
+        conn.execute(text("DELETE FROM origin"))
+        conn.execute(text("INSERT INTO origin VALUES (:name)"), {"name": name})
+    return engine
+
+
+def origin(engine):
+    with engine.connect() as conn:
+        return conn.execute(text("SELECT name FROM origin")).scalar()
+
+
+def test_reads_round_robin_across_replicas(tmp_path, clock):
+    primary = database_file(tmp_path / "primary.db", "primary")
+    replicas = [database_file(tmp_path / "replica_a.db", "a"), database_file(tmp_path / "replica_b.db", "b")]
+    router = ReplicaRouter(primary, replicas, health_check_interval=60, clock=clock)
+    assert [origin(router.engine_for_read()) for _ in range(4)] == ["a", "b", "a", "b"]
+
+
+def test_recent_writer_reads_from_primary(tmp_path, clock):
+    primary = database_file(tmp_path / "primary.db", "primary")
+    router = ReplicaRouter(primary, [database_file(tmp_path / "replica.db", "replica")], clock=clock)
+    assert origin(router.engine_for_read(recent_write=True)) == "primary"
+
+    now = time.time()
+    assert wrote_recently(SimpleNamespace(cookies={LAST_WRITE_COOKIE: str(now - 1)}), now)
+    assert not wrote_recently(SimpleNamespace(cookies={LAST_WRITE_COOKIE: str(now - 3600)}), now)
+    assert not wrote_recently(SimpleNamespace(cookies={}), now)
+
+
+def test_unhealthy_replica_is_skipped_until_it_recovers(tmp_path, clock):
+    primary = database_file(tmp_path / "primary.db", "primary")
+    broken = create_engine(f"sqlite:///{tmp_path / 'missing' / 'replica.db'}")
+    healthy = database_file(tmp_path / "replica.db", "replica")
+    router = ReplicaRouter(primary, [broken, healthy], health_check_interval=10, clock=clock)
+
+    clock.now = 10
+    assert [origin(router.engine_for_read()) for _ in range(3)] == ["replica"] * 3
+
+    router.mark_unhealthy(healthy)
+    assert router.engine_for_read() is primary
+
+    (tmp_path / "missing").mkdir()
+    database_file(tmp_path / "missing" / "replica.db", "recovered")
+    clock.now = 20
+    assert {origin(router.engine_for_read()) for _ in range(2)} == {"recovered", "replica"}
+
+
+def test_only_one_caller_runs_a_due_health_check(tmp_path, clock):
+    primary = database_file(tmp_path / "primary.db", "primary")
+    replica = database_file(tmp_path / "replica.db", "replica")
+    router = ReplicaRouter(primary, [replica], health_check_interval=10, clock=clock)
+    probing, release, probes = threading.Event(), threading.Event(), []
+
+    def slow_check():  # a replica that takes its connect timeout to answer
+        probes.append(1)
+        probing.set()
+        release.wait(5)
+        router._last_check = clock()
+
+    router.check_health = slow_check
+    clock.now = 10
+    prober = threading.Thread(target=router.engine_for_read)
+    prober.start()
+    assert probing.wait(5)
+    assert [router.engine_for_read() for _ in range(3)] == [replica] * 3  # last known state, no waiting
+    release.set()
+    prober.join()
+    assert probes == [1]
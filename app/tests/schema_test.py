@@ -0,0 +1,55 @@
+import pytest
+from sqlalchemy import Column, Integer, MetaData, Table, create_engine, inspect, text
+from app.db import database
+# Register every model on Base.metadata
+import app.models.counter_models  # noqa: F401
+import app.models.service_models  # noqa: F401
+import app.models.site_models  # noqa: F401
+import app.models.token_models  # noqa: F401
+import app.models.user_models  # noqa: F401
+
+
+@pytest.fixture
+def fresh_engine(monkeypatch):
+    engine = create_engine("sqlite://")
+    monkeypatch.setattr(database, "engine", engine)
+    monkeypatch.setattr(database.settings, "SCHEMA_SYNC", "auto")
+    return engine
+
+
+def test_fingerprint_tracks_model_changes():
+    metadata = MetaData()
+    Table("t", metadata, Column("id", Integer, primary_key=True))
+    before = database.schema_fingerprint(metadata)
+    assert database.schema_fingerprint(metadata) == before
+    Table("t", metadata, Column("extra", Integer), extend_existing=True)
+    assert database.schema_fingerprint(metadata) != before
+
+
+def test_init_db_skips_create_all_when_schema_is_current(fresh_engine, monkeypatch):
+    database.init_db()
+    assert "tokens" in database.Base.metadata.tables
+    assert database._stored_fingerprint() == database.schema_fingerprint()
+
+    calls = []
+    monkeypatch.setattr(database.Base.metadata, "create_all", lambda **kwargs: calls.append(kwargs))
+    database.init_db()
+    assert calls == []
+
+
+def test_init_db_adds_columns_missing_from_existing_tables(fresh_engine):
+    with fresh_engine.begin() as conn:
+        conn.execute(text(
+            "CREATE TABLE tokens (id INTEGER PRIMARY KEY, token_number INTEGER, queue_position INTEGER, issue_time DATETIME,"
+            " latitude FLOAT NOT NULL, longitude FLOAT NOT NULL, distance FLOAT, duration INTEGER, reach_out BOOLEAN,"
+            " user_id INTEGER, service_id INTEGER NOT NULL, counter_id INTEGER NOT NULL)"
+        ))
+        conn.execute(text("INSERT INTO tokens (id, token_number, latitude, longitude, service_id, counter_id) VALUES (1, 1, 0, 0, 1, 1)"))
+
+    database.init_db()
+    inspector = inspect(fresh_engine)
+    columns = {column["name"] for column in inspector.get_columns("tokens")}
+    assert {"called_at", "served_at", "site_id", "state", "last_location_at"} <= columns
+    assert "ix_tokens_state_last_location" in {index["name"] for index in inspector.get_indexes("tokens")}
+    with fresh_engine.connect() as conn:
+        assert conn.execute(text("SELECT state, called_at FROM tokens")).one() == ("waiting", None)
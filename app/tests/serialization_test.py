@@ -0,0 +1,36 @@
+import json
+from types import SimpleNamespace
+import pytest
+from pydantic import ValidationError
+from app.schemas.token_schemas import TokenResponse
+from app.schemas.user_schemas import UserIn
+from app.utils.serialization import default_response_class, list_adapter, list_response, model_response
+
+
+def test_model_response_reads_attributes_without_extra_fields():
+    row = SimpleNamespace(id=1, name="abc", email="a@b.com", role="User", hashed_password="secret")
+    response = model_response(UserIn, row)
+    assert response.media_type == "application/json"
+    assert json.loads(response.body) == {"id": 1, "name": "abc", "email": "a@b.com", "role": "User"}
+
+
+def test_token_status_is_set_after_mapping_the_row():
+    token = SimpleNamespace(token_number=7, user_id=1, service_id=2, counter_id=3, distance=None, duration=None)
+    response = TokenResponse.model_validate(token)
+    response.status = "pending"
+    assert json.loads(model_response(TokenResponse, response).body)["status"] == "pending"
+
+
+def test_list_response_reuses_compiled_adapter():
+    users = [SimpleNamespace(id=i, name=f"user_{i}", email=f"u{i}@example.com", role="User") for i in range(3)]
+    assert [user["id"] for user in json.loads(list_response(UserIn, users).body)] == [0, 1, 2]
+    assert list_adapter(UserIn) is list_adapter(UserIn)
+
+
+def test_response_schemas_are_strict():
+    with pytest.raises(ValidationError):
+        UserIn.model_validate(SimpleNamespace(id="1", name="abc", email="a@b.com", role="User"))
+
+
+def test_default_response_class_renders_json():
+    assert json.loads(default_response_class({"access_token": "x", "token_type": "bearer"}).body) == {"access_token": "x", "token_type": "bearer"}
@@ -0,0 +1,77 @@
+import multiprocessing
+import pytest
+from app.utils import shared_state
+from app.utils.shared_state import MmapCounters, RedisCounters
+
+
+def allocate(path, count, results):
+    counters = MmapCounters(path, slots=64)
+    results.put([counters.incr("token_number") for _ in range(count)])
+
+
+def test_incr_and_compare_and_swap(tmp_path):
+    counters = MmapCounters(str(tmp_path / "counters"), slots=8)
+    assert counters.get("queue:1:1") == 0
+    assert counters.incr("queue:1:1") == 1
+    assert counters.incr("queue:1:1", 5) == 6
+    assert not counters.compare_and_swap("queue:1:1", 1, 10)
+    assert counters.compare_and_swap("queue:1:1", 6, 10)
+    assert counters.raise_to("queue:1:1", 4) == 10
+    assert counters.raise_to("queue:1:1", 12) == 12
+
+
+def test_keys_survive_reopen_and_collisions(tmp_path):
+    path = str(tmp_path / "counters")
+    counters = MmapCounters(path, slots=4)
+    for key in ("a", "b", "c", "d"):
+        counters.incr(key, ord(key))
+    reopened = MmapCounters(path, slots=4)
+    assert [reopened.get(key) for key in ("a", "b", "c", "d")] == [97, 98, 99, 100]
+    with pytest.raises(RuntimeError):
+        reopened.incr("e")
+
+
+def test_deleted_keys_free_their_slot_for_every_process(tmp_path):
+    path = str(tmp_path / "counters")
+    counters, other = MmapCounters(path, slots=2), MmapCounters(path, slots=2)
+    counters.incr("a", 5)
+    counters.incr("b", 7)
+    assert other.get("a") == 5  # caches the offset of "a"
+    counters.delete("a")
+    assert counters.incr("c") == 1  # takes the slot "a" had
+    assert other.get("b") == 7 and other.get("c") == 1
+    with pytest.raises(RuntimeError):
+        other.get("a")  # stale offset is re-probed, and the table is full
+
+
+def test_token_numbers_are_unique_across_processes(tmp_path):
+    path = str(tmp_path / "counters")
+    context = multiprocessing.get_context("fork")
+    results = context.Queue()
+    workers = [context.Process(target=allocate, args=(path, 300, results)) for _ in range(4)]
+    for worker in workers:
+        worker.start()
+    allocated = [value for _ in workers for value in results.get(timeout=30)]
+    for worker in workers:
+        worker.join()
+    assert sorted(allocated) == list(range(1, 1201))
+
+
+def test_next_value_seeds_once_from_loader(tmp_path):
+    shared_state.set_shared_counters(MmapCounters(str(tmp_path / "counters"), slots=8))
+    try:
+        loads = []
+        assert shared_state.next_value("token_number", lambda: loads.append(1) or 41) == 42
+        assert shared_state.next_value("token_number", lambda: loads.append(1) or 41) == 43
+        assert len(loads) == 1
+    finally:
+        shared_state.set_shared_counters(None)
+
+
+def test_redis_counters_compare_and_swap():
+    fakeredis = pytest.importorskip("fakeredis")
+    pytest.importorskip("lupa")
+    counters = RedisCounters(fakeredis.FakeRedis())
+    assert counters.incr("token_number") == 1
+    assert counters.compare_and_swap("token_number", 1, 5)
+    assert counters.get("token_number") == 5
@@ -0,0 +1,77 @@
+import math
+import random
+import pytest
+from sqlalchemy import create_engine
+from sqlalchemy.orm import sessionmaker
+from app.db.database import Base
+from app.models import booking_models, counter_models, service_models, site_models, token_models, user_models  # noqa: F401
+from app.utils import shared_state
+from app.utils.shared_state import MmapCounters
+from app.utils.spatial_index import KDTree, SiteIndex, SiteLocation, _to_unit_vector, chord_to_km
+from app.utils.table_versions import table_versions
+
+
+def haversine_km(lat1, lon1, lat2, lon2):
+    phi1, phi2 = math.radians(lat1), math.radians(lat2)
+    dphi = phi2 - phi1
+    dlmb = math.radians(lon2 - lon1)
+    a = math.sin(dphi / 2) ** 2 + math.cos(phi1) * math.cos(phi2) * math.sin(dlmb / 2) ** 2
+    return 2 * 6371.0088 * math.asin(math.sqrt(a))
+
+
+def build_tree(sites):
+    return KDTree([(_to_unit_vector(site.latitude, site.longitude), site) for site in sites])
+
+
+# 1. The KD-tree must agree with a brute-force great-circle search
+@pytest.mark.parametrize("seed, site_count", [(1, 1), (2, 7), (3, 250)])
+def test_nearest_site_matches_brute_force(seed, site_count):
+    rng = random.Random(seed)
+    sites = [
+        SiteLocation(id=i, service_id=1, latitude=rng.uniform(24.7, 25.1), longitude=rng.uniform(66.9, 67.3))
+        for i in range(site_count)
+    ]
+    tree = build_tree(sites)
+
+    for _ in range(50):
+        lat, lon = rng.uniform(24.6, 25.2), rng.uniform(66.8, 67.4)
+        expected = min(sites, key=lambda s: haversine_km(lat, lon, s.latitude, s.longitude))
+        found, chord = tree.nearest(_to_unit_vector(lat, lon))
+        assert found.id == expected.id
+        assert chord_to_km(chord) == pytest.approx(haversine_km(lat, lon, expected.latitude, expected.longitude), rel=1e-6)
+
+
+# 2. Routing across the antimeridian still picks the geographically closest branch
+def test_nearest_site_across_antimeridian():
+    sites = [
+        SiteLocation(id=1, service_id=1, latitude=0.0, longitude=179.9),
+        SiteLocation(id=2, service_id=1, latitude=0.0, longitude=170.0),
+    ]
+    found, _ = build_tree(sites).nearest(_to_unit_vector(0.0, -179.9))
+    assert found.id == 1
+
+
+def test_empty_tree_returns_none():
+    found, chord = KDTree([]).nearest(_to_unit_vector(24.85, 67.0))
+    assert found is None
+    assert chord == math.inf
+
+
+def test_site_index_rebuilds_when_another_worker_adds_a_site(tmp_path):
+    shared_state.set_shared_counters(MmapCounters(str(tmp_path / "counters"), slots=8))
+    engine = create_engine("sqlite://")
+    Base.metadata.create_all(engine)
+    db = sessionmaker(bind=engine)()
+    try:
+        db.add(site_models.ServiceSite(service_id=1, site_name="north", latitude=25.0, longitude=67.0, is_open=True))
+        db.commit()
+        index = SiteIndex()
+        assert index.nearest(db, 1, 24.0, 67.0)[0].latitude == 25.0
+
+        db.add(site_models.ServiceSite(service_id=1, site_name="south", latitude=24.1, longitude=67.0, is_open=True))
+        db.commit()
+        table_versions.bump("service_sites")  # as create_site does in the other worker
+        assert index.nearest(db, 1, 24.0, 67.0)[0].latitude == 24.1
+    finally:
+        db.close()
+        shared_state.set_shared_counters(None)
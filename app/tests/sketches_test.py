@@ -0,0 +1,59 @@
+import json
+import random
+from datetime import datetime, timedelta
+from app.utils.sketches import DDSketch, LatencySketches, seconds_between, summarize
+
+
+def test_quantiles_stay_within_relative_accuracy():
+    rng = random.Random(7)
+    values = sorted(rng.lognormvariate(4, 1) for _ in range(20_000))
+    sketch = DDSketch(0.01)
+    for value in values:
+        sketch.add(value)
+    for q in (0.5, 0.9, 0.99):
+        exact = values[int(q * (len(values) - 1))]
+        assert abs(sketch.quantile(q) - exact) <= 0.01 * exact + 1e-9
+
+
+def test_merge_equals_single_sketch_and_survives_serialization():
+    whole, left, right = DDSketch(), DDSketch(), DDSketch()
+    for value in range(1, 1001):
+        whole.add(value)
+        (left if value % 2 else right).add(value)
+    merged = DDSketch.from_dict(left.to_dict()).merge(DDSketch.from_dict(right.to_dict()))
+    assert merged.count == whole.count
+    assert [merged.quantile(q) for q in (0.5, 0.9, 0.99)] == [whole.quantile(q) for q in (0.5, 0.9, 0.99)]
+
+
+def test_windows_expire_and_merge_across_workers(tmp_path):
+    now = [10_000.0]
+    directory = str(tmp_path)
+    worker = LatencySketches(window_seconds=60, retention_windows=10, directory=directory, clock=lambda: now[0])
+    worker.record("wait", 1, 1, 30.0, at=now[0] - 300)
+    worker.record("wait", 1, 1, 90.0)
+    worker.record("service", 1, 2, 120.0)
+    assert worker.collect(60)[("wait", 1, 1)].count == 1
+    assert worker.collect(600)[("wait", 1, 1)].count == 2
+
+    peer = LatencySketches(window_seconds=60, retention_windows=10, clock=lambda: now[0])
+    peer.record("wait", 1, 1, 45.0)
+    (tmp_path / "sketches-0.json").write_text(json.dumps(peer.to_json()))
+    assert worker.collect(60)[("wait", 1, 1)].count == 2
+
+
+def test_summary_rolls_counters_up_to_services():
+    sketches = {}
+    for counter_id, wait in ((1, 10.0), (2, 30.0)):
+        sketch = DDSketch()
+        sketch.add(wait)
+        sketches[("wait", 5, counter_id)] = sketch
+    summary = summarize(sketches, (0.5,))
+    assert [c["counter_id"] for c in summary["counters"]] == [1, 2]
+    assert summary["services"][0]["wait"]["count"] == 2
+    assert summary["counters"][0]["wait"]["count"] == 1
+
+
+def test_seconds_between_treats_naive_as_utc():
+    start = datetime(2024, 1, 1, 12, 0)
+    assert seconds_between(start, start + timedelta(minutes=2)) == 120
+    assert seconds_between(None, start) is None
@@ -0,0 +1,50 @@
+import pytest
+from sqlalchemy import create_engine, text
+from app.utils.sql_profiler import QueryBudgetExceeded, install_profiler, normalize_statement, query_budget
+
+
+@pytest.fixture
+def engine():
+    engine = create_engine("sqlite://")
+    install_profiler(engine)
+    with engine.begin() as conn:
+        conn.execute(text("CREATE TABLE tokens (id INTEGER PRIMARY KEY, counter_id INTEGER)"))
+        conn.execute(text("INSERT INTO tokens (counter_id) VALUES (1), (1), (2)"))
+    return engine
+
+
+@pytest.mark.parametrize("first, second", [
+    ("SELECT * FROM users WHERE email = 'a@b.com'", "SELECT *  FROM users\n WHERE email = 'c@d.com'"),
+    ("SELECT * FROM tokens WHERE id IN (?, ?, ?)", "SELECT * FROM tokens WHERE id IN (?)"),
+    ("SELECT * FROM tokens WHERE counter_id = 1 LIMIT 5", "SELECT * FROM tokens WHERE counter_id = 22 LIMIT 1"),
+])
+def test_normalize_statement_groups_same_shape(first, second):
+    assert normalize_statement(first) == normalize_statement(second)
+
+
+def test_repeated_shapes_flag_n_plus_one(engine):
+    with query_budget(10) as profile:
+        with engine.connect() as conn:
+            for counter_id in (1, 2, 3):
+                conn.execute(text("SELECT id FROM tokens WHERE counter_id = :c"), {"c": counter_id})
+    assert profile.count == 3
+    assert list(profile.repeated(threshold=3).values()) == [3]
+
+
+def test_query_budget_fails_when_exceeded(engine):
+    with pytest.raises(QueryBudgetExceeded):
+        with query_budget(1, "two selects"):
+            with engine.connect() as conn:
+                conn.execute(text("SELECT 1"))
+                conn.execute(text("SELECT 2"))
+
+
+def test_failed_statements_do_not_leak_start_times(engine):
+    from sqlalchemy.exc import OperationalError
+
+    with query_budget(10):
+        with engine.connect() as conn:
+            with pytest.raises(OperationalError):
+                conn.execute(text("SELECT * FROM missing"))
+            conn.execute(text("SELECT 1"))
+            assert conn.info["profiler_query_start"] == []
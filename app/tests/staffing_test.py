@@ -0,0 +1,114 @@
+from datetime import datetime, timedelta
+import pytest
+from sqlalchemy import create_engine, insert
+from sqlalchemy.orm import sessionmaker
+from app.db.database import Base
+from app.models import counter_models, service_models, site_models, token_models, user_models  # noqa: F401
+from app.utils.staffing import StaffingPlanner, erlang_c, recommend_counters, service_level
+
+MONDAY_9AM = datetime(2024, 1, 1, 9, 0)
+
+
+def test_erlang_c_matches_textbook_value():
+    assert erlang_c(2, 3) == pytest.approx(4 / 9, abs=1e-4)
+    assert erlang_c(3, 3) == 1.0
+    assert erlang_c(0, 1) == 0.0
+
+
+def test_recommendation_is_the_smallest_count_meeting_the_sla():
+    # 60 arrivals/hour, 5 minute service -> 5 Erlangs
+    plan = recommend_counters(60, 300, target_wait=60, target_percentile=0.8)
+    assert plan["counters"] > 5
+    assert service_level(5, plan["counters"], 300, 60) >= 0.8
+    assert service_level(5, plan["counters"] - 1, 300, 60) < 0.8
+    assert recommend_counters(0, 300, 60, 0.8)["counters"] == 0
+
+
+def _token(token_id, issued, served_minutes=None):
+    called = issued + timedelta(minutes=1) if served_minutes else None
+    return {
+        "id": token_id, "token_number": token_id, "queue_position": token_id, "issue_time": issued,
+        "called_at": called, "served_at": called + timedelta(minutes=served_minutes) if called else None,
+        "latitude": 0.0, "longitude": 0.0, "state": "served" if called else "waiting", "service_id": 1, "counter_id": 1,
+    }
+
+
+def test_planner_refreshes_incrementally_and_caches():
+    engine = create_engine("sqlite://")
+    Base.metadata.create_all(engine)
+    with engine.begin() as conn:
+        conn.execute(insert(token_models.Token), [_token(i, MONDAY_9AM + timedelta(minutes=i), 4) for i in range(1, 31)])
+    db = sessionmaker(bind=engine)()
+    planner = StaffingPlanner(refresh_interval=3600)
+
+    plan = planner.plan(db, 1, target_wait=120, target_percentile=0.8)
+    monday_9 = plan["hours"][9]
+    assert (monday_9["day"], monday_9["arrivals_per_hour"]) == ("Mon", 30)
+    assert plan["mean_service_seconds"] == 240
+    assert monday_9["counters"] >= 3
+    assert plan["hours"][10]["counters"] == 0
+    assert planner.plan(db, 1, target_wait=120, target_percentile=0.8) is plan
+
+    with engine.begin() as conn:
+        conn.execute(insert(token_models.Token), [_token(100, MONDAY_9AM + timedelta(hours=1))])
+    assert planner.plan(db, 1, target_wait=120, target_percentile=0.8) is plan  # within refresh interval
+    assert planner.refresh(db, force=True)
+    refreshed = planner.plan(db, 1, target_wait=120, target_percentile=0.8)
+    assert refreshed is not plan and refreshed["hours"][10]["arrivals_per_hour"] == 1
+    db.close()
+
+
+def test_plan_cache_keeps_the_most_recently_used_plans():
+    engine = create_engine("sqlite://")
+    Base.metadata.create_all(engine)
+    db = sessionmaker(bind=engine)()
+    planner = StaffingPlanner(refresh_interval=3600, cache_size=2)
+
+    first = planner.plan(db, 1, target_wait=60)
+    planner.plan(db, 1, target_wait=120)
+    assert planner.plan(db, 1, target_wait=60) is first  # used again, so it outlives the next insert
+    planner.plan(db, 1, target_wait=180)
+    assert len(planner._cache) == 2
+    assert planner.plan(db, 1, target_wait=60) is first
+    db.close()
+
+
+def test_refresh_reads_the_database_outside_the_aggregate_lock(monkeypatch):
+    planner = StaffingPlanner(refresh_interval=3600)
+    reads = []
+
+    def arrivals_after(db, last_id, limit):
+        # A concurrent plan() or mean_service_seconds() must not wait for this query
+        reads.append(planner._lock.acquire(blocking=False))
+        planner._lock.release()
+        assert not planner.refresh(db)  # a second refresh does not read the same rows again
+        return [(1, 1, MONDAY_9AM)]
+
+    monkeypatch.setattr("app.crud.token_management.get_arrivals_after", arrivals_after)
+    monkeypatch.setattr("app.crud.token_management.get_service_times_after", lambda db, served_after, after_id, limit: [])
+    assert planner.refresh(None, force=True)
+    assert reads == [True]
+    assert planner._arrivals[1][9] == 1
+
+
+def test_refresh_picks_up_rows_that_commit_behind_the_watermarks(monkeypatch):
+    monkeypatch.setattr("app.utils.staffing._ARRIVAL_BATCH", 4)  # several batches per scan
+    engine = create_engine("sqlite://")
+    Base.metadata.create_all(engine)
+    tokens = [_token(i, MONDAY_9AM + timedelta(minutes=i), 4) for i in range(1, 21)]
+    late = tokens.pop(9)  # id 10, served before the rows already committed
+    with engine.begin() as conn:
+        conn.execute(insert(token_models.Token), tokens)
+    db = sessionmaker(bind=engine)()
+    planner = StaffingPlanner(refresh_interval=3600, overlap_ids=50, overlap_seconds=3600)
+
+    assert planner.refresh(db, force=True)
+    assert planner._arrivals[1][9] == 19
+    assert planner._service_time[1] == [19 * 240, 19]
+
+    with engine.begin() as conn:
+        conn.execute(insert(token_models.Token), [late])
+    assert planner.refresh(db, force=True)
+    assert planner._arrivals[1][9] == 20  # re-read rows are counted once
+    assert planner._service_time[1] == [20 * 240, 20]
+    db.close()
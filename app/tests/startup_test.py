@@ -0,0 +1,10 @@
+from app.utils.startup import StartupTimer
+
+
+def test_report_does_not_count_a_previous_total():
+    timer = StartupTimer()
+    timer.record("imports", 0.5)
+    timer.record("init_db", 0.25)
+    timer.report()
+    timer.report()  # second lifespan in the same process
+    assert timer.phases["total"] == 0.75
@@ -0,0 +1,71 @@
+from types import SimpleNamespace
+import pytest
+from app.utils import shared_state
+from app.utils.shared_state import MmapCounters
+from app.utils.table_versions import TableVersions, etag_matches, not_modified, table_versions
+
+
+@pytest.fixture
+def shared(tmp_path):
+    shared_state.set_shared_counters(MmapCounters(str(tmp_path / "counters"), slots=8))
+    yield
+    shared_state.set_shared_counters(None)
+
+
+def test_bump_changes_only_affected_etags():
+    versions = TableVersions()
+    services, counters = versions.etag("services"), versions.etag("counters")
+    versions.bump("counters")
+    assert versions.etag("services") == services
+    assert versions.etag("counters") != counters
+
+
+def test_if_none_match_parsing():
+    etag = 'W/"abc-3"'
+    assert etag_matches('W/"abc-3"', etag)
+    assert etag_matches('"abc-3"', etag)
+    assert etag_matches('"x", W/"abc-3"', etag)
+    assert etag_matches("*", etag)
+    assert not etag_matches('W/"abc-2"', etag)
+    assert not etag_matches(None, etag)
+
+
+def test_not_modified_short_circuits_with_cache_headers(shared, monkeypatch):
+    monkeypatch.setattr("app.core.config.settings.READ_YOUR_WRITES_SECONDS", 0)
+    headers, cached = not_modified(SimpleNamespace(headers={}), "services")
+    assert cached is None
+    assert headers["Cache-Control"].startswith("public, max-age=")
+
+    _, cached = not_modified(SimpleNamespace(headers={"if-none-match": headers["ETag"]}), "services")
+    assert cached.status_code == 304
+    assert cached.headers["etag"] == headers["ETag"]
+
+    table_versions.bump("services")
+    _, cached = not_modified(SimpleNamespace(headers={"if-none-match": headers["ETag"]}), "services")
+    assert cached is None
+
+
+def test_shared_backend_gives_identical_etags_across_workers(shared):
+    worker_a, worker_b = TableVersions(), TableVersions()
+    worker_a.bump("services")
+    assert worker_a.etag("services") == worker_b.etag("services") == 'W/"1"'
+
+
+def test_no_etags_without_a_shared_backend():
+    table_versions.bump("services")
+    headers, cached = not_modified(SimpleNamespace(headers={"if-none-match": "*"}), "services")
+    assert (headers, cached) == ({}, None)
+
+
+def test_fresh_changes_are_not_tagged_until_replicas_catch_up(shared, monkeypatch):
+    monkeypatch.setattr("app.core.config.settings.READ_YOUR_WRITES_SECONDS", 60)
+    table_versions.bump("counters")
+    current = table_versions.etag("counters")
+    assert not_modified(SimpleNamespace(headers={}), "counters") == ({}, None)
+    # a client holding the current tag got it after the replicas caught up
+    _, cached = not_modified(SimpleNamespace(headers={"if-none-match": current}), "counters")
+    assert cached.status_code == 304
+
+    monkeypatch.setattr("app.core.config.settings.READ_YOUR_WRITES_SECONDS", 0)
+    headers, cached = not_modified(SimpleNamespace(headers={}), "counters")
+    assert cached is None and headers["ETag"] == current
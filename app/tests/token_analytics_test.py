@@ -0,0 +1,67 @@
+from datetime import datetime, timedelta
+import pytest
+
+pd = pytest.importorskip("pandas")
+
+from sqlalchemy import create_engine, insert  # noqa: E402
+from app.db.database import Base  # noqa: E402
+from app.models import counter_models, service_models, site_models, token_models, user_models  # noqa: E402,F401
+from app.utils.token_analytics import analyze, export_parquet, iter_token_frames  # noqa: E402
+
+MONDAY_9AM = datetime(2024, 1, 1, 9, 0)
+
+
+@pytest.fixture
+def engine():
+    engine = create_engine("sqlite://")
+    Base.metadata.create_all(engine)
+    rows = []
+    for i in range(10):
+        issued = MONDAY_9AM + timedelta(minutes=10 * i)
+        called = issued + timedelta(minutes=20) if i < 6 else None
+        rows.append({
+            "token_number": i + 1, "queue_position": i + 1, "issue_time": issued, "called_at": called,
+            "served_at": called + timedelta(minutes=5) if called else None,
+            "latitude": 0.0, "longitude": 0.0, "distance": 3.0 if i % 2 else 30.0, "duration": 10 if i % 2 else 30,
+            "reach_out": i % 2 == 1, "state": "served" if called else "waiting",
+            "service_id": 1 if i < 8 else 2, "counter_id": 1 if i < 8 else 2,
+        })
+    with engine.begin() as conn:
+        conn.execute(insert(token_models.Token), rows)
+    return engine
+
+
+def test_frames_are_bounded_by_chunk_size(engine):
+    sizes = [len(frame) for frame in iter_token_frames(engine, chunk_size=4)]
+    assert sizes == [4, 4, 2]
+
+
+def test_report_is_independent_of_chunking(engine):
+    assert analyze(engine, chunk_size=3) == analyze(engine, chunk_size=1000)
+
+
+def test_report_contents(engine):
+    report = analyze(engine, chunk_size=3)
+    assert report["rows"] == 10
+    assert sum(map(sum, report["arrival_heatmap"]["1"])) == 8
+    assert report["arrival_heatmap"]["1"][0][9] == 6  # Monday, 09:00-09:59
+    assert sum(row["tokens"] for row in report["served"]) == 6
+    assert report["reach_out_rate"]["1"] == 0.5
+    assert report["distance_histogram_km"]["counts"] == [0, 0, 5, 0, 0, 5, 0, 0]
+    eta = report["eta_accuracy"]["per_service"]["1"]
+    assert eta["tokens"] == 6 and eta["late_rate"] == 0.5  # 20 min wait vs 30 min trips are late
+
+
+def test_since_filters_rows(engine):
+    assert analyze(engine, since=MONDAY_9AM + timedelta(minutes=50))["rows"] == 5
+
+
+def test_overlapping_exports_replace_their_days(engine, tmp_path):
+    pytest.importorskip("pyarrow")
+    directory = str(tmp_path / "tokens")
+    assert export_parquet(engine, directory, chunk_size=3) == 10
+    # Widened to the whole day, so the partition is rewritten rather than appended to
+    assert export_parquet(engine, directory, since=MONDAY_9AM + timedelta(minutes=30), chunk_size=3) == 10
+    exported = pd.read_parquet(directory)
+    assert len(exported) == 10
+    assert sorted(exported["token_number"]) == list(range(1, 11))
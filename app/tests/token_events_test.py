@@ -0,0 +1,187 @@
+import asyncio
+import json
+import threading
+import pytest
+from fastapi import HTTPException
+from sqlalchemy import create_engine, insert
+from sqlalchemy.orm import sessionmaker
+from app.crud.token_management import call_next_token, fill_token_eta
+from app.db.database import Base
+from app.models import booking_models, counter_models, service_models, site_models, token_models, user_models  # noqa: F401
+from app.routing import user_router
+from app.utils.eta_worker import EtaJob, EtaWorkerPool
+from app.utils.notifier import TokenNotifier, notifier
+
+SITE = (24.85, 67.0)
+
+
+@pytest.fixture
+def db():
+    engine = create_engine("sqlite://")
+    Base.metadata.create_all(engine)
+    with engine.begin() as conn:
+        conn.execute(insert(token_models.Token), [
+            {"id": 1, "token_number": 101, "queue_position": 1, "latitude": 25.0, "longitude": 67.2, "service_id": 1, "counter_id": 1},
+            {"id": 2, "token_number": 102, "queue_position": 2, "latitude": SITE[0], "longitude": SITE[1], "service_id": 1, "counter_id": 1},
+        ])
+    session = sessionmaker(bind=engine)()
+    yield session
+    session.close()
+
+
+def test_fill_token_eta_applies_the_reach_out_rule(db):
+    far = fill_token_eta(db, 1, 30, 12.5, SITE)
+    assert (far.duration, far.distance, far.reach_out) == (30, 12.5, False)
+    assert fill_token_eta(db, 2, 30, 12.5, SITE).reach_out  # standing at the site
+    assert fill_token_eta(db, 1, 1, 12.5, SITE).reach_out  # about to arrive
+    assert fill_token_eta(db, 99, 30, 12.5, SITE) is None
+
+
+class FlakyDistance:
+    def __init__(self, failures):
+        self.failures = failures
+        self.calls = 0
+
+    async def __call__(self, latitude, longitude, coordinates=None):
+        self.calls += 1
+        if self.calls <= self.failures:
+            raise HTTPException(status_code=500, detail="Error fetching distance data")
+        return 12, 3.5
+
+
+def _run_job(monkeypatch, failures, max_retries=2):
+    distance = FlakyDistance(failures)
+    monkeypatch.setattr("app.utils.get_distance.get_distance", distance)
+    monkeypatch.setattr(EtaWorkerPool, "_store", staticmethod(lambda job, duration, distance: {"reach_out": False}))
+    pool = EtaWorkerPool(concurrency=1, queue_size=4, max_retries=max_retries, backoff=0)
+
+    async def run():
+        queue = notifier.subscribe(7)
+        try:
+            assert not pool.enqueue(EtaJob(1, 7, 25.0, 67.2))  # not started
+            await pool.start()
+            assert pool.enqueue(EtaJob(1, 7, 25.0, 67.2))
+            await pool._queue.join()
+            await pool.stop()
+            return queue.get_nowait()
+        finally:
+            notifier.unsubscribe(7, queue)
+
+    return asyncio.run(run()), distance.calls
+
+
+def test_eta_worker_retries_and_publishes_the_result(monkeypatch):
+    event, calls = _run_job(monkeypatch, failures=2)
+    assert calls == 3
+    assert event == {"token_number": 7, "eta_status": "ready", "distance": 3.5, "duration": 12, "reach_out": False}
+
+
+def test_eta_worker_gives_up_after_max_retries(monkeypatch):
+    event, calls = _run_job(monkeypatch, failures=5)
+    assert calls == 3
+    assert event == {"token_number": 7, "eta_status": "failed"}
+
+
+def _read_events(response, count):
+    async def read():
+        events = []
+        async for chunk in response.body_iterator:
+            events.append(json.loads(chunk.removeprefix("data: ")))
+            if len(events) == count:
+                break
+        await response.body_iterator.aclose()
+        return events
+    return read()
+
+
+def test_token_events_stream_snapshot_then_updates(db, monkeypatch):
+    real_lookup = user_router.get_token_by_number
+
+    def lookup_racing_an_update(session, token_number):
+        token = real_lookup(session, token_number)
+        notifier.publish(token_number, {"token_number": token_number, "eta_status": "ready", "duration": 9})
+        return token
+
+    monkeypatch.setattr(user_router, "get_token_by_number", lookup_racing_an_update)
+
+    async def run():
+        response = await user_router.token_events(101, db)
+        events = await _read_events(response, 2)
+        assert notifier._subscribers.get(101) is None  # closed streams unsubscribe
+        return events
+
+    snapshot, update = asyncio.run(run())
+    assert (snapshot["token_number"], snapshot["eta_status"], snapshot["state"]) == (101, "pending", "waiting")
+    assert update["duration"] == 9  # published while the snapshot was read, still delivered
+
+
+def test_token_events_unknown_token(db):
+    with pytest.raises(HTTPException) as error:
+        asyncio.run(user_router.token_events(999, db))
+    assert error.value.status_code == 400
+    assert notifier._subscribers.get(999) is None
+
+
+def test_calling_the_next_token_notifies_both_tokens(db):
+    async def run():
+        await notifier.start()
+        first, second = notifier.subscribe(101), notifier.subscribe(102)
+        try:
+            call_next_token(db, 1)
+            call_next_token(db, 1)
+            # sync route handlers call it from a worker thread
+            await asyncio.to_thread(notifier.publish, 102, {"token_number": 102, "state": "deferred"})
+            events = [await asyncio.wait_for(queue.get(), 5) for queue in (first, first, second, second)]
+        finally:
+            notifier.unsubscribe(101, first)
+            notifier.unsubscribe(102, second)
+            await notifier.stop()
+        return events
+
+    assert asyncio.run(run()) == [
+        {"token_number": 101, "state": "serving"},
+        {"token_number": 101, "state": "served"},
+        {"token_number": 102, "state": "serving"},
+        {"token_number": 102, "state": "deferred"},
+    ]
+
+
+class LocalChannel:
+    """
+        In-memory stand-in for Redis pub/sub shared by several notifiers.
+    """
+
+    def __init__(self):
+        self.handlers = []
+        self.lock = threading.Lock()
+
+    def publish(self, message):
+        with self.lock:
+            for handler in self.handlers:
+                handler(message)
+
+    def listen(self, handler, stop):
+        with self.lock:
+            self.handlers.append(handler)
+        stop.wait()
+        with self.lock:
+            self.handlers.remove(handler)
+
+
+def test_events_reach_subscribers_of_other_workers():
+    channel = LocalChannel()
+    publisher, subscriber = TokenNotifier(channel=channel), TokenNotifier(channel=channel)
+
+    async def run():
+        await publisher.start()
+        await subscriber.start()
+        while len(channel.handlers) < 2:
+            await asyncio.sleep(0.01)
+        queue = subscriber.subscribe(5)
+        publisher.publish(5, {"token_number": 5, "state": "deferred"})
+        event = await asyncio.wait_for(queue.get(), 5)
+        await publisher.stop()
+        await subscriber.stop()
+        return event
+
+    assert asyncio.run(run()) == {"token_number": 5, "state": "deferred"}
@@ -0,0 +1,64 @@
+import pytest
+from app.utils.token_log import RECORD, TokenEvent, TokenEventLog
+
+
+def issue(log, token_number, counter_id=1):
+    log.append(TokenEvent(1000.0 + token_number, "issued", token_number, service_id=1, counter_id=counter_id))
+
+
+def test_event_roundtrip_keeps_unknown_eta():
+    event = TokenEvent(1.5, "eta_updated", 7, 1, 2, distance=3.25, duration=None)
+    assert TokenEvent.unpack(event.pack()) == event
+    assert len(event.pack()) == RECORD.size
+
+
+def test_queue_follows_lifecycle(tmp_path):
+    log = TokenEventLog(str(tmp_path / "events.log"))
+    for token_number in (1, 2, 3):
+        issue(log, token_number)
+    issue(log, 4, counter_id=2)
+    log.append(TokenEvent(1.0, "eta_updated", 2, distance=1.5, duration=4))
+    log.append(TokenEvent(1.0, "arrived", 2))
+    log.append(TokenEvent(1.0, "called", 1))
+    log.append(TokenEvent(1.0, "served", 1))
+    log.append(TokenEvent(1.0, "called", 2))
+
+    queue = log.queue(1)
+    assert [(t.token_number, t.state) for t in queue] == [(2, "serving"), (3, "waiting")]
+    assert (queue[0].duration, queue[0].reach_out) == (4, True)
+    assert [t.token_number for t in log.queue(2)] == [4]
+
+
+def test_recovery_replays_only_the_tail_after_a_snapshot(tmp_path):
+    path = str(tmp_path / "events.log")
+    writer = TokenEventLog(path, snapshot_every=5)
+    for token_number in range(1, 6):
+        issue(writer, token_number)
+    writer._snapshotter.join()  # written off the request path
+    for token_number in range(6, 8):
+        issue(writer, token_number)
+    writer.append(TokenEvent(1.0, "served", 1))
+
+    reader = TokenEventLog(path, snapshot_every=5)
+    assert reader.recover() == 3  # 5 events are covered by the snapshot
+    assert [t.token_number for t in reader.queue(1)] == [2, 3, 4, 5, 6, 7]
+
+
+def test_partial_trailing_record_is_ignored_until_complete(tmp_path):
+    path = tmp_path / "events.log"
+    log = TokenEventLog(str(path))
+    issue(log, 1)
+    record = TokenEvent(1.0, "issued", 2, 1, 1).pack()
+    with open(path, "ab") as raw:
+        raw.write(record[:10])
+    assert [t.token_number for t in log.queue(1)] == [1]
+    with open(path, "ab") as raw:
+        raw.write(record[10:])
+    assert [t.token_number for t in log.queue(1)] == [1, 2]
+
+
+def test_rejects_foreign_files(tmp_path):
+    path = tmp_path / "events.log"
+    path.write_bytes(b"not a log")
+    with pytest.raises(ValueError):
+        TokenEventLog(str(path)).recover()
@@ -0,0 +1,104 @@
+import asyncio
+import json
+from sqlalchemy import create_engine, text
+from app.utils import tracing
+from app.utils.tracing import JsonlExporter, OtlpHttpExporter, Tracer, install_tracing, parse_traceparent, traced
+
+
+class Collect:
+    def __init__(self):
+        self.traces = []
+
+    def submit(self, spans):
+        self.traces.append(spans)
+
+
+def use_tracer(monkeypatch, **kwargs):
+    exporter = Collect()
+    monkeypatch.setattr(tracing, "tracer", Tracer(exporter, **kwargs))
+    return exporter
+
+
+def test_spans_nest_across_await_and_decorators(monkeypatch):
+    exporter = use_tracer(monkeypatch)
+
+    @traced("lookup")
+    def lookup():
+        return 1
+
+    @traced()
+    async def handler():
+        await asyncio.gather(asyncio.sleep(0), asyncio.to_thread(lookup))
+        return lookup()
+
+    async def request():
+        with tracing.tracer.trace("POST /users/token"):
+            return await handler()
+
+    assert asyncio.run(request()) == 1
+    root, handler_span, *lookups = exporter.traces[0]
+    assert handler_span.parent_id == root.span_id and handler_span.name.endswith("handler")
+    assert [span.parent_id for span in lookups] == [handler_span.span_id] * 2
+    assert traced()(lambda: 2)() == 2  # no-op outside a trace
+
+
+def test_sampling_keeps_slow_traces(monkeypatch):
+    exporter = use_tracer(monkeypatch, sample_rate=0.0, slow_ms=50)
+    with tracing.tracer.trace("fast"):
+        pass
+    with tracing.tracer.trace("slow") as root:
+        root.start_ns -= 100_000_000
+    with tracing.tracer.trace("forced", sampled=True):
+        pass
+    assert [spans[0].name for spans in exporter.traces] == ["slow", "forced"]
+
+
+def test_errors_mark_spans(monkeypatch):
+    exporter = use_tracer(monkeypatch)
+    try:
+        with tracing.tracer.trace("root"), tracing.tracer.span("child"):
+            raise KeyError("x")
+    except KeyError:
+        pass
+    assert [(s.status, s.attributes["error.type"]) for s in exporter.traces[0]] == [("error", "KeyError")] * 2
+
+
+def test_db_statements_become_client_spans(monkeypatch):
+    exporter = use_tracer(monkeypatch)
+    engine = create_engine("sqlite://")
+    install_tracing(engine)
+    with engine.connect() as conn:
+        conn.execute(text("SELECT 1"))  # outside a trace: ignored
+        with tracing.tracer.trace("root"):
+            conn.execute(text("SELECT 2"))
+    _, query = exporter.traces[0]
+    assert (query.name, query.kind, query.attributes["db.statement"]) == ("db.query", "client", "SELECT 2")
+    assert query.end_ns is not None
+
+
+def test_exporters_write_waterfalls_and_otlp(tmp_path, monkeypatch):
+    exporter = use_tracer(monkeypatch)
+    with tracing.tracer.trace("GET /services/", **{"http.status_code": 200}):
+        with tracing.tracer.span("services_management.get_all_services"):
+            pass
+    spans = exporter.traces[0]
+
+    jsonl = JsonlExporter(str(tmp_path / "traces.jsonl"))
+    jsonl.submit(spans)
+    jsonl.flush()
+    line = json.loads((tmp_path / "traces.jsonl").read_text())
+    assert line["name"] == "GET /services/"
+    assert [span["name"] for span in line["spans"]] == ["GET /services/", "services_management.get_all_services"]
+    assert line["spans"][1]["offset_ms"] >= 0
+
+    otlp = OtlpHttpExporter("http://collector/v1/traces").payload(spans)["resourceSpans"][0]["scopeSpans"][0]["spans"]
+    assert otlp[0]["kind"] == 2 and "parentSpanId" not in otlp[0]
+    assert otlp[1]["parentSpanId"] == otlp[0]["spanId"]
+    assert otlp[0]["attributes"] == [{"key": "http.status_code", "value": {"intValue": "200"}}]
+
+
+def test_traceparent_parsing():
+    header = "00-4bf92f3577b34da6a3ce929d0e0e4736-00f067aa0ba902b7-01"
+    assert parse_traceparent(header) == ("4bf92f3577b34da6a3ce929d0e0e4736", "00f067aa0ba902b7", True)
+    assert parse_traceparent("garbage") is None
+    assert parse_traceparent(None) is None
@@ -0,0 +1,231 @@
+import asyncio
+import threading
+from datetime import date, datetime, time, timedelta, timezone
+from zoneinfo import ZoneInfo
+from sqlalchemy.orm import Session
+from app.core.config import settings
+from app.utils.shared_state import get_shared_counters
+from app.utils.sketches import as_utc
+from app.utils.table_versions import table_versions
+
+
+def _as_time(value) -> time:
+    # Raw SQL on SQLite hands TIME columns back as strings
+    return time.fromisoformat(value) if isinstance(value, str) else value
+
+
+class SlotInventory:
+    """
+        Capacity and booking counters for every appointment slot.
+
+        Slots are `slot_minutes` long, run from a service's entry to end time in
+        `SERVICE_TIMEZONE` and each holds `bookings_per_counter` x counters
+        bookings. A service day is loaded from the database once per process (and
+        its capacities recomputed whenever the services or counters catalog
+        changes); after that availability and reservation are a dict lookup and a
+        counter increment per slot. With a shared-state backend the booked counts
+        live there, so reservations are atomic across workers. Days before today
+        are dropped (shared counters included) as new days are loaded, so the
+        inventory only ever holds the bookable window.
+    """
+
+    def __init__(self, slot_minutes: int = 15, bookings_per_counter: int = 1, tz: str = "UTC"):
+        self.slot_minutes = slot_minutes
+        self.bookings_per_counter = bookings_per_counter
+        self.tz = ZoneInfo(tz)
+        self._capacity: dict[tuple[int, int], int] = {}
+        self._booked: dict[tuple[int, int], int] = {}
+        self._days: dict[tuple[int, date], tuple[int, int]] = {}  # -> catalog versions it was built from
+        self._day_slots: dict[tuple[int, date], list[datetime]] = {}
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def _key(service_id: int, slot_start: datetime) -> tuple[int, int]:
+        return service_id, int(as_utc(slot_start).timestamp()) // 60
+
+    @staticmethod
+    def _counter_name(key: tuple[int, int]) -> str:
+        return f"slot:{key[0]}:{key[1]}"
+
+    def local_day(self, slot_start: datetime) -> date:
+        return as_utc(slot_start).astimezone(self.tz).date()
+
+    def today(self) -> date:
+        return datetime.now(self.tz).date()
+
+    def slot_starts(self, entry_time, end_time, day: date) -> list[datetime]:
+        """
+            UTC start of every full slot between the service's opening and closing time on `day`.
+        """
+        start = datetime.combine(day, _as_time(entry_time), self.tz)
+        end = datetime.combine(day, _as_time(end_time), self.tz)
+        step = timedelta(minutes=self.slot_minutes)
+        slots = []
+        while start + step <= end:
+            slots.append(start.astimezone(timezone.utc))
+            start += step
+        return slots
+
+    def load_day(self, db: Session, service: dict, day: date) -> list[datetime]:
+        """
+            Make sure every slot of `service` on `day` is in the inventory and return their starts.
+        """
+        from app.crud.booking_management import count_bookings_by_slot
+        from app.crud.counter_management import count_counters_by_service
+
+        slots = self.slot_starts(service["service_entry_time"], service["service_end_time"], day)
+        version = (table_versions.get("services"), table_versions.get("counters"))
+        day_key = (service["id"], day)
+        with self._lock:
+            loaded = self._days.get(day_key)
+        if loaded == version or not slots:
+            return slots
+        if loaded is None:
+            self.expire(self.today())
+
+        capacity = count_counters_by_service(db, service["id"]) * self.bookings_per_counter
+        existing = {} if loaded is not None else {
+            self._key(service["id"], slot_start)[1]: count
+            for slot_start, count in count_bookings_by_slot(db, service["id"], slots[0], slots[-1])
+        }
+        counters = get_shared_counters()
+        with self._lock:
+            for slot_start in slots:
+                key = self._key(service["id"], slot_start)
+                self._capacity[key] = capacity
+                if loaded is None:
+                    booked = existing.get(key[1], 0)
+                    if counters is not None:
+                        counters.raise_to(self._counter_name(key), booked)
+                    else:
+                        self._booked[key] = max(self._booked.get(key, 0), booked)
+            self._days[day_key] = version
+            self._day_slots[day_key] = slots
+        return slots
+
+    def expire(self, before: date) -> int:
+        """
+            Forget every loaded day before `before` and delete its shared counters.
+            Returns the number of days dropped.
+        """
+        with self._lock:
+            expired = [day_key for day_key in self._days if day_key[1] < before]
+            keys = []
+            for day_key in expired:
+                del self._days[day_key]
+                keys.extend(self._key(day_key[0], slot_start) for slot_start in self._day_slots.pop(day_key, []))
+            for key in keys:
+                self._capacity.pop(key, None)
+                self._booked.pop(key, None)
+        counters = get_shared_counters()
+        if counters is not None:
+            for key in keys:
+                counters.delete(self._counter_name(key))
+        return len(expired)
+
+    def capacity(self, service_id: int, slot_start: datetime) -> int | None:
+        """
+            Capacity of a loaded slot, or None if `slot_start` is not a slot of this service.
+        """
+        return self._capacity.get(self._key(service_id, slot_start))
+
+    def booked(self, service_id: int, slot_start: datetime) -> int:
+        key = self._key(service_id, slot_start)
+        counters = get_shared_counters()
+        if counters is not None:
+            return counters.get(self._counter_name(key))
+        return self._booked.get(key, 0)
+
+    def available(self, service_id: int, slot_start: datetime) -> int:
+        return max(0, (self.capacity(service_id, slot_start) or 0) - self.booked(service_id, slot_start))
+
+    def reserve(self, service_id: int, slot_start: datetime) -> bool:
+        """
+            Atomically take one place in a slot; False when it is full or unknown.
+        """
+        key = self._key(service_id, slot_start)
+        capacity = self._capacity.get(key)
+        if capacity is None:
+            return False
+        counters = get_shared_counters()
+        if counters is not None:
+            name = self._counter_name(key)
+            if counters.incr(name) <= capacity:
+                return True
+            counters.incr(name, -1)
+            return False
+        with self._lock:
+            booked = self._booked.get(key, 0)
+            if booked >= capacity:
+                return False
+            self._booked[key] = booked + 1
+            return True
+
+    def release(self, service_id: int, slot_start: datetime):
+        key = self._key(service_id, slot_start)
+        counters = get_shared_counters()
+        if counters is not None:
+            counters.incr(self._counter_name(key), -1)
+            return
+        with self._lock:
+            self._booked[key] = max(0, self._booked.get(key, 0) - 1)
+
+
+slot_inventory = SlotInventory(
+    settings.APPOINTMENT_SLOT_MINUTES, settings.APPOINTMENT_BOOKINGS_PER_COUNTER, settings.SERVICE_TIMEZONE,
+)
+
+
+class AppointmentMerger:
+    """
+        Periodically turns bookings whose slot has started into live queue tokens.
+
+        Each due booking is claimed with a conditional `UPDATE`, so several
+        workers can run the merger without issuing a token twice. The token joins
+        the queue like a walk-in arriving at the slot time, with its ETA pending
+        (resolved by the ETA worker or refresher).
+    """
+
+    def __init__(self, interval: float | None = None):
+        self.interval = interval or settings.APPOINTMENT_MERGE_INTERVAL_SECONDS
+        self._task: asyncio.Task | None = None
+
+    async def start(self):
+        if self._task is None:
+            self._task = asyncio.create_task(self._run())
+            settings.logger.info(f"Appointment merger started, every {self.interval}s")
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            await asyncio.gather(self._task, return_exceptions=True)
+            self._task = None
+
+    async def _run(self):
+        while True:
+            await asyncio.sleep(self.interval)
+            try:
+                await self.tick()
+            except Exception as e:
+                settings.logger.error(f"Appointment merge failed: {e}")
+
+    async def tick(self) -> int:
+        """
+            Merge every due booking. Returns the number of tokens issued.
+        """
+        from app.crud.booking_management import merge_due_bookings
+        from app.db.database import with_session
+        from app.utils.eta_worker import EtaJob, eta_worker
+
+        merged = await asyncio.to_thread(with_session, merge_due_bookings, datetime.now(timezone.utc))
+        if settings.ASYNC_ETA_ENABLED:
+            for token, latitude, longitude, coordinates in merged:
+                job = EtaJob(token.id, token.token_number, latitude, longitude, coordinates)
+                if not eta_worker.enqueue(job):
+                    await eta_worker.process(job)
+        if merged:
+            settings.logger.info(f"Merged {len(merged)} appointments into the live queue")
+        return len(merged)
+
+
+appointment_merger = AppointmentMerger()
@@ -1,12 +1,18 @@
-from passlib.context import CryptContext
-from jose import jwt
 from datetime import datetime,timedelta
-from app.core.config import settings
+from functools import lru_cache
 from fastapi import HTTPException
 from app.core.config import settings
+from app.utils.metrics import bcrypt_inflight
+
+# passlib and jose are imported on first use so they stay off the worker startup path
 
-# Password encryption context using bcrypt algorithm
-pwd_context= CryptContext(schemes=["bcrypt"],deprecated="auto")
+@lru_cache(maxsize=None)
+def get_pwd_context():
+    """
+        Returns the password encryption context (bcrypt), created on first use.
+    """
+    from passlib.context import CryptContext
+    return CryptContext(schemes=["bcrypt"],deprecated="auto")
 
 def get_password_hash(password:str):
     """
@@ -21,11 +27,14 @@ def get_password_hash(password:str):
         Raises:
             HTTPException: Raises an internal server error (500) if password hashing fails.
     """
+    bcrypt_inflight.inc()
     try:
-        return pwd_context.hash(password)
+        return get_pwd_context().hash(password)
     except Exception as e:
         settings.logger.error("Error hashing password: %s",e)
         raise HTTPException(status_code=500,detail=f"Internal Server Error: Error hashing password. {e}")
+    finally:
+        bcrypt_inflight.dec()
 
 def verify_password(plain_password,hashed_password):
     """
@@ -41,11 +50,14 @@ def verify_password(plain_password,hashed_password):
         Raises:
             HTTPException: Raises an internal server error (500) if password verification fails.
     """
+    bcrypt_inflight.inc()
     try:
-        return pwd_context.verify(plain_password,hashed_password)
+        return get_pwd_context().verify(plain_password,hashed_password)
     except Exception as e:
         settings.logger.error("Error verifying password: %s", e)
         raise HTTPException(status_code=500,detail=f"Internal Server Error: Error verifying password. {e}")
+    finally:
+        bcrypt_inflight.dec()
 
 def create_access_token(data:dict,expires_delta:timedelta|None =None):
     """
@@ -63,6 +75,7 @@ def create_access_token(data:dict,expires_delta:timedelta|None =None):
             HTTPException: Raises an internal server error (500) if access token creation fails.
     """
     try:
+        from jose import jwt
         to_encode = data.copy()
         if expires_delta:
             expire = datetime.now(settings.UTC)+expires_delta
@@ -0,0 +1,419 @@
+"""
+Bulk import of users, services and counters from CSV or NDJSON.
+
+The input is streamed and handled in batches: every row of a batch is
+validated against the same schema as the single-row endpoints, duplicates are
+found with one query per batch instead of one per row, user passwords are
+hashed in parallel in a pool of worker processes and the surviving rows are
+inserted with a single executemany `INSERT` and committed together. Rows that
+fail are reported with their line number and the import carries on:
+
+    python -m app.utils.bulk_import users users.csv
+    python -m app.utils.bulk_import services services.ndjson
+    python -m app.utils.bulk_import counters counters.csv --errors rejected.ndjson
+
+CSV files need a header row with the field names of the matching create
+endpoint (users: name, email, password, role; services: service_name,
+service_entry_time, service_end_time; counters: counter_number, service_name).
+"""
+import argparse
+import codecs
+import csv
+import json
+import multiprocessing
+import os
+import sys
+import threading
+import time
+from concurrent.futures import ProcessPoolExecutor
+from typing import IO, Iterator
+from pydantic import BaseModel, ValidationError
+from sqlalchemy import insert, select, tuple_
+from sqlalchemy.exc import IntegrityError, SQLAlchemyError
+from sqlalchemy.orm import Session
+from app.core.config import settings
+from app.schemas.counter_schemas import CounterCreate
+from app.schemas.service_schemas import ServiceCreate
+from app.schemas.user_schemas import UserCreate
+from app.utils.auth import get_pwd_context
+from app.utils.table_versions import table_versions
+
+KINDS = ("users", "services", "counters")
+FORMATS = ("csv", "ndjson")
+
+
+def _hash_password(password: str) -> str:
+    # Runs in the worker processes
+    return get_pwd_context().hash(password)
+
+
+_hash_pool: ProcessPoolExecutor | None = None
+_hash_pool_lock = threading.Lock()
+
+
+def get_hash_pool() -> ProcessPoolExecutor:
+    """
+        Process pool for bcrypt, created on first use.
+
+        Workers are spawned rather than forked, since the parent runs threads
+        (log writer, background tasks) whose locks a forked child could inherit held.
+    """
+    global _hash_pool
+    with _hash_pool_lock:
+        if _hash_pool is None:
+            _hash_pool = ProcessPoolExecutor(settings.IMPORT_HASH_WORKERS or os.cpu_count(),
+                                             mp_context=multiprocessing.get_context("spawn"))
+        return _hash_pool
+
+
+def shutdown_hash_pool():
+    global _hash_pool
+    with _hash_pool_lock:
+        if _hash_pool is not None:
+            _hash_pool.shutdown(cancel_futures=True)
+            _hash_pool = None
+
+
+def detect_format(filename: str | None, content_type: str | None = None) -> str:
+    if content_type and ("ndjson" in content_type or "jsonl" in content_type):
+        return "ndjson"
+    if filename and filename.lower().endswith((".ndjson", ".jsonl")):
+        return "ndjson"
+    return "csv"
+
+
+def iter_records(stream: IO[str], fmt: str) -> Iterator[tuple[int, dict | None, str | None]]:
+    """
+        Yield `(line, record, error)` for every data row of a text stream.
+
+        Text that cannot be decoded ends the stream with one error row; the
+        decoder reads ahead, so rows shortly before it may be dropped with it.
+    """
+    line = 0
+    try:
+        if fmt == "ndjson":
+            for line, text in enumerate(stream, 1):
+                if not text.strip():
+                    continue
+                try:
+                    record = json.loads(text)
+                except ValueError as e:
+                    yield line, None, f"Invalid JSON: {e}"
+                    continue
+                if isinstance(record, dict):
+                    yield line, record, None
+                else:
+                    yield line, None, "Expected a JSON object"
+            return
+        reader = csv.DictReader(stream)
+        for record in reader:
+            line = reader.line_num
+            # Empty cells mean "use the default", as if the field were left out of a JSON body
+            yield line, {key: value for key, value in record.items() if key and value not in ("", None)}, None
+    except UnicodeDecodeError as e:
+        yield line + 1, None, f"File is not UTF-8 ({e.reason}); the rest of the file was not imported"
+
+
+def _batches(records, size: int):
+    batch = []
+    for record in records:
+        batch.append(record)
+        if len(batch) >= size:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
+
+
+def _format_validation_error(error: ValidationError) -> str:
+    return "; ".join(f"{'.'.join(map(str, item['loc'])) or 'row'}: {item['msg']}" for item in error.errors())
+
+
+class ImportReport:
+    """
+        Running totals of one import plus the first `max_errors` rejected rows.
+    """
+
+    def __init__(self, kind: str, max_errors: int = 1000):
+        self.kind = kind
+        self.max_errors = max_errors
+        self.rows = 0
+        self.inserted = 0
+        self.failed = 0
+        self.errors: list[dict] = []
+        self.started = time.perf_counter()
+
+    def reject(self, line: int, message: str):
+        self.failed += 1
+        if len(self.errors) < self.max_errors:
+            self.errors.append({"line": line, "error": message})
+
+    def to_dict(self) -> dict:
+        return {
+            "kind": self.kind,
+            "rows": self.rows,
+            "inserted": self.inserted,
+            "failed": self.failed,
+            "errors": self.errors,
+            "errors_truncated": self.failed > len(self.errors),
+            "seconds": round(time.perf_counter() - self.started, 3),
+        }
+
+
+class _Importer:
+    """
+        Per-kind batch logic: `prepare` turns validated rows into insert parameters,
+        rejecting duplicates, and `table` is where they go.
+    """
+    schema: type[BaseModel]
+
+    def __init__(self, db: Session):
+        self.db = db
+
+    def prepare(self, rows: list[tuple[int, BaseModel]], report: ImportReport) -> list[tuple[int, dict]]:
+        raise NotImplementedError
+
+    def conflict_message(self, params: dict) -> str:
+        return "Conflicts with an existing row"
+
+
+class _UserImporter(_Importer):
+    schema = UserCreate
+
+    def __init__(self, db: Session, pool: ProcessPoolExecutor | None):
+        super().__init__(db)
+        from app.models.user_models import User
+
+        self.table = User.__table__
+        self.pool = pool
+        self.seen_emails: set[str] = set()
+        self.seen_names: set[str] = set()
+
+    def prepare(self, rows, report):
+        emails = [user.email for _, user in rows]
+        names = [user.name for _, user in rows]
+        existing = self.db.execute(
+            select(self.table.c.email, self.table.c.name)
+            .where(self.table.c.email.in_(emails) | self.table.c.name.in_(names))
+        ).all()
+        taken_emails = {row.email for row in existing} | self.seen_emails
+        taken_names = {row.name for row in existing} | self.seen_names
+
+        accepted = []
+        for line, user in rows:
+            if user.email in taken_emails:
+                report.reject(line, "Email already exist")
+            elif user.name in taken_names:
+                report.reject(line, "Name already exist")
+            else:
+                taken_emails.add(user.email)
+                taken_names.add(user.name)
+                accepted.append((line, user))
+        self.seen_emails.update(user.email for _, user in accepted)
+        self.seen_names.update(user.name for _, user in accepted)
+
+        passwords = [user.password for _, user in accepted]
+        if self.pool is None:
+            hashes = [_hash_password(password) for password in passwords]
+        else:
+            hashes = list(self.pool.map(_hash_password, passwords))
+        return [
+            (line, {"name": user.name, "email": user.email, "hashed_password": hashed, "role": user.role})
+            for (line, user), hashed in zip(accepted, hashes)
+        ]
+
+    def conflict_message(self, params):
+        return "Email or name already exist"
+
+
+class _ServiceImporter(_Importer):
+    schema = ServiceCreate
+
+    def __init__(self, db: Session):
+        super().__init__(db)
+        from app.models.service_models import Service
+
+        self.table = Service.__table__
+        self.seen: set[str] = set()
+
+    def prepare(self, rows, report):
+        names = [service.service_name for _, service in rows]
+        taken = set(self.db.execute(
+            select(self.table.c.service_name).where(self.table.c.service_name.in_(names))
+        ).scalars()) | self.seen
+        accepted = []
+        for line, service in rows:
+            if service.service_name in taken:
+                report.reject(line, "Service already exists")
+                continue
+            taken.add(service.service_name)
+            self.seen.add(service.service_name)
+            accepted.append((line, service.model_dump()))
+        return accepted
+
+
+class _CounterImporter(_Importer):
+    schema = CounterCreate
+
+    def __init__(self, db: Session):
+        super().__init__(db)
+        from app.models.counter_models import Counter
+        from app.models.service_models import Service
+
+        self.table = Counter.__table__
+        self.services = Service.__table__
+        self.service_ids: dict[str, int] = {}
+        self.seen: set[tuple[int, int]] = set()
+
+    def prepare(self, rows, report):
+        unknown = {counter.service_name for _, counter in rows} - self.service_ids.keys()
+        if unknown:
+            self.service_ids.update(self.db.execute(
+                select(self.services.c.service_name, self.services.c.id).where(self.services.c.service_name.in_(unknown))
+            ).tuples().all())
+        keys = {
+            (self.service_ids[counter.service_name], counter.counter_number)
+            for _, counter in rows if counter.service_name in self.service_ids
+        }
+        taken = set(self.db.execute(
+            select(self.table.c.service_id, self.table.c.counter_number)
+            .where(tuple_(self.table.c.service_id, self.table.c.counter_number).in_(keys))
+        ).tuples()) if keys else set()
+        taken |= self.seen
+
+        accepted = []
+        for line, counter in rows:
+            service_id = self.service_ids.get(counter.service_name)
+            if service_id is None:
+                report.reject(line, "Service not found")
+                continue
+            key = (service_id, counter.counter_number)
+            if key in taken:
+                report.reject(line, "Counter already exists")
+                continue
+            taken.add(key)
+            self.seen.add(key)
+            accepted.append((line, {"service_id": service_id, "counter_number": counter.counter_number}))
+        return accepted
+
+
+def _insert(db: Session, importer: _Importer, prepared: list[tuple[int, dict]], report: ImportReport):
+    """
+        One executemany `INSERT` and commit for the batch. If a concurrent writer
+        slipped in a conflicting row, redo the batch row by row in savepoints so
+        only the offending rows are rejected.
+    """
+    try:
+        db.execute(insert(importer.table), [params for _, params in prepared])
+        db.commit()
+        report.inserted += len(prepared)
+        return
+    except IntegrityError:
+        db.rollback()
+    for line, params in prepared:
+        try:
+            with db.begin_nested():
+                db.execute(insert(importer.table), params)
+            report.inserted += 1
+        except IntegrityError:
+            report.reject(line, importer.conflict_message(params))
+    db.commit()
+
+
+def import_records(db: Session, kind: str, stream: IO[str], fmt: str = "csv", batch_size: int | None = None,
+                   pool: ProcessPoolExecutor | None = None, max_errors: int | None = None) -> dict:
+    """
+        Validate and insert every row of `stream`; returns the import report.
+
+        Rows are committed batch by batch, so a failure part-way leaves the
+        batches before it in place.
+
+        Raises:
+            HTTPException: For any database error other than a row conflict (status code 500).
+    """
+    from fastapi import HTTPException
+
+    batch_size = batch_size or settings.IMPORT_BATCH_SIZE
+    report = ImportReport(kind, settings.IMPORT_MAX_ERRORS if max_errors is None else max_errors)
+    if kind == "users":
+        importer = _UserImporter(db, pool)
+    elif kind == "services":
+        importer = _ServiceImporter(db)
+    elif kind == "counters":
+        importer = _CounterImporter(db)
+    else:
+        raise ValueError(f"Unknown import kind: {kind}")
+
+    try:
+        for batch in _batches(iter_records(stream, fmt), batch_size):
+            report.rows += len(batch)
+            valid = []
+            for line, record, error in batch:
+                if error is not None:
+                    report.reject(line, error)
+                    continue
+                try:
+                    valid.append((line, importer.schema.model_validate(record)))
+                except ValidationError as e:
+                    report.reject(line, _format_validation_error(e))
+            prepared = importer.prepare(valid, report) if valid else []
+            if prepared:
+                _insert(db, importer, prepared, report)
+    except SQLAlchemyError as e:
+        db.rollback()
+        raise HTTPException(status_code=500, detail=f"Error while importing {kind}: {e}")
+    finally:
+        if report.inserted and kind != "users":
+            table_versions.bump(kind)
+    settings.logger.info(f"Imported {report.inserted}/{report.rows} {kind} ({report.failed} rejected)")
+    return report.to_dict()
+
+
+def import_file(db: Session, kind: str, binary: IO[bytes], fmt: str, pool: ProcessPoolExecutor | None = None) -> dict:
+    """
+        `import_records` over a binary file object, decoded as UTF-8 (a BOM is ignored).
+
+        Invalid UTF-8 is reported as a rejected row and stops the import; the
+        batches before it stay committed.
+    """
+    stream = codecs.getreader("utf-8-sig")(binary)
+    return import_records(db, kind, stream, fmt, pool=pool)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("kind", choices=KINDS)
+    parser.add_argument("path", help="CSV or NDJSON file, - for stdin")
+    parser.add_argument("--format", choices=FORMATS, help="defaults to ndjson for .ndjson/.jsonl files, csv otherwise")
+    parser.add_argument("--batch-size", type=int, default=settings.IMPORT_BATCH_SIZE, help="rows per INSERT and commit")
+    parser.add_argument("--workers", type=int, default=settings.IMPORT_HASH_WORKERS or os.cpu_count(),
+                        help="password hashing processes")
+    parser.add_argument("--errors", help="write every rejected row to this NDJSON file")
+    args = parser.parse_args()
+
+    from app.db.database import SessionLocal
+
+    fmt = args.format or detect_format(args.path)
+    stream = sys.stdin if args.path == "-" else open(args.path, newline="", encoding="utf-8-sig")
+    pool = ProcessPoolExecutor(args.workers, mp_context=multiprocessing.get_context("spawn")) if args.kind == "users" else None
+    db = SessionLocal()
+    try:
+        report = import_records(db, args.kind, stream, fmt, args.batch_size, pool,
+                                max_errors=sys.maxsize if args.errors else None)
+    finally:
+        db.close()
+        if pool is not None:
+            pool.shutdown()
+        if stream is not sys.stdin:
+            stream.close()
+    if args.errors:
+        with open(args.errors, "w") as f:
+            for error in report["errors"]:
+                f.write(json.dumps(error) + "\n")
+        report["errors"] = report["errors"][:settings.IMPORT_MAX_ERRORS]
+        report["errors_truncated"] = report["failed"] > len(report["errors"])
+    print(json.dumps(report, indent=2, default=str))
+
+
+if __name__ == "__main__":
+    main()
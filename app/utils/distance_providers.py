@@ -0,0 +1,507 @@
+import asyncio
+import math
+import re
+import time
+from collections import deque
+from fastapi import HTTPException
+from app.core.config import settings
+from app.utils.metrics import distance_cache_hits, distance_errors, distance_request_duration
+from app.utils.tracing import tracer
+
+EARTH_RADIUS_KM = 6371.0088
+
+
+class DistanceProviderError(Exception):
+    """
+        Raised by a provider when it cannot produce a distance/duration pair.
+    """
+
+
+def parse_distance_response(data: dict, element: int = 0):
+    """
+        Extract `(duration_minutes, distance_km)` from a Distance Matrix API payload.
+
+        The API returns human-readable text such as "1 hour 5 mins" and "12.3 km";
+        durations are converted to whole minutes.
+
+        Raises:
+            HTTPException: If the duration text cannot be parsed (status code 500).
+    """
+    distance_text = data["rows"][0]["elements"][element]["distance"]["text"]
+    duration_text = data["rows"][0]["elements"][element]["duration"]["text"]
+
+    distance_value =  float(re.search(r"[\d.]+", distance_text).group()) if re.search(r"[\d.]+", distance_text) else 0.0
+    duration_match = re.search(r'(?:(\d+)\s*hour[s]?)?\s*(?:(\d+)\s*min[s]?)?', duration_text) if re.search(r"\d+", duration_text) else 0
+    if duration_match:
+        hours = int(duration_match.group(1)) if duration_match.group(1) else 0
+        minutes = int(duration_match.group(2)) if duration_match.group(2) else 0
+        duration_value = (hours * 60) + minutes  # Convert total duration to minutes
+    else:
+        raise HTTPException(status_code=500, detail="Error processing duration data.")
+
+    return duration_value, distance_value
+
+
+def haversine_km(origin: tuple[float, float], destination: tuple[float, float]) -> float:
+    lat1, lon1 = map(math.radians, origin)
+    lat2, lon2 = map(math.radians, destination)
+    a = math.sin((lat2 - lat1) / 2) ** 2 + math.cos(lat1) * math.cos(lat2) * math.sin((lon2 - lon1) / 2) ** 2
+    return 2 * EARTH_RADIUS_KM * math.asin(math.sqrt(a))
+
+
+class DistanceProvider:
+    """
+        Interface for anything that can estimate travel from a service site to a user.
+
+        Attributes:
+            name (str): Label used in metrics and logs.
+            timeout (float): Latency budget in seconds for a single lookup.
+    """
+    name = "base"
+
+    def __init__(self, timeout: float | None = None):
+        self.timeout = timeout if timeout is not None else settings.DISTANCE_TIMEOUT_SECONDS
+
+    async def get_distance(self, origin: tuple[float, float], destination: tuple[float, float]) -> tuple[int, float]:
+        """
+            Returns:
+                tuple[int, float]: `(duration_minutes, distance_km)`.
+
+            Raises:
+                DistanceProviderError: If the lookup fails.
+        """
+        raise NotImplementedError
+
+    async def get_distances(self, origin: tuple[float, float], destinations: list[tuple[float, float]]) -> list:
+        """
+            Look up many destinations from one origin.
+
+            Returns:
+                list[tuple[int, float] | None]: One `(duration_minutes, distance_km)` per
+                destination, in order, with None where that destination could not be resolved.
+
+            Raises:
+                DistanceProviderError: If the whole batch fails.
+        """
+        results = []
+        for destination in destinations:
+            try:
+                results.append(await self.get_distance(origin, destination))
+            except DistanceProviderError:
+                results.append(None)
+        return results
+
+    async def aclose(self):
+        """
+            Release connections held by the provider. Safe to call more than once.
+        """
+
+
+class MatrixApiProvider(DistanceProvider):
+    """
+        The remote distancematrix.ai API.
+
+        A single `httpx.AsyncClient` is kept per event loop so connections and
+        TLS sessions are reused across lookups instead of reopened per request.
+    """
+    name = "distancematrix"
+
+    def __init__(self, url: str | None = None, api_key: str | None = None, timeout: float | None = None):
+        super().__init__(timeout)
+        self.url = url or settings.DISTANCE_MATRIX_URL
+        self.api_key = api_key if api_key is not None else settings.DISTANCE_MATRIX_API_KEY
+        self._client = None
+        self._client_loop = None
+
+    def _get_client(self):
+        import httpx
+
+        loop = asyncio.get_running_loop()
+        if self._client is None or self._client_loop is not loop:
+            self._client = httpx.AsyncClient(timeout=self.timeout)
+            self._client_loop = loop
+        return self._client
+
+    async def aclose(self):
+        client, self._client, self._client_loop = self._client, None, None
+        if client is not None and not client.is_closed:
+            await client.aclose()
+
+    async def _fetch(self, origin: tuple[float, float], destinations: list[tuple[float, float]]) -> dict:
+        import httpx
+
+        params = {
+            "origins": f"{origin[0]},{origin[1]}",
+            "destinations": "|".join(f"{lat},{lon}" for lat, lon in destinations),
+            "key": self.api_key,
+        }
+        with tracer.span(f"GET {self.name}", "client", **{"http.url": self.url, "destinations": len(destinations)}) as span:
+            try:
+                response = await self._get_client().get(self.url, params=params)
+            except httpx.RequestError as e:
+                distance_errors.labels(self.name, "connection").inc()
+                raise DistanceProviderError(f"Error connecting to the distance matrix service: {e}") from e
+            if span is not None:
+                span.attributes["http.status_code"] = response.status_code
+        if response.status_code >= 400:
+            distance_errors.labels(self.name, "http").inc()
+            raise DistanceProviderError(f"Error fetching distance data: HTTP {response.status_code}")
+        try:
+            data = response.json()
+        except ValueError as e:
+            distance_errors.labels(self.name, "parse").inc()
+            raise DistanceProviderError(f"Error processing distance data: {e}") from e
+        if data.get("status") != "OK":
+            distance_errors.labels(self.name, "status").inc()
+            raise DistanceProviderError("Error fetching distance data.")
+        return data
+
+    async def get_distance(self, origin, destination):
+        data = await self._fetch(origin, [destination])
+        try:
+            return parse_distance_response(data)
+        except (HTTPException, KeyError, IndexError, ValueError, AttributeError) as e:
+            distance_errors.labels(self.name, "parse").inc()
+            raise DistanceProviderError(f"Error processing distance data: {e}") from e
+
+    async def get_distances(self, origin, destinations):
+        """
+            One matrix call per chunk of `settings.DISTANCE_MATRIX_MAX_DESTINATIONS`
+            destinations instead of one call per destination.
+        """
+        chunk_size = settings.DISTANCE_MATRIX_MAX_DESTINATIONS
+        results = []
+        for start in range(0, len(destinations), chunk_size):
+            chunk = destinations[start:start + chunk_size]
+            data = await self._fetch(origin, chunk)
+            for index in range(len(chunk)):
+                try:
+                    element = data["rows"][0]["elements"][index]
+                    results.append(parse_distance_response(data, index) if element.get("status", "OK") == "OK" else None)
+                except (HTTPException, KeyError, IndexError, ValueError, AttributeError):
+                    distance_errors.labels(self.name, "parse").inc()
+                    results.append(None)
+        return results
+
+
+class LocalEstimatorProvider(DistanceProvider):
+    """
+        Offline estimate: great-circle distance stretched by a road factor and
+        converted to minutes at a fixed average speed. Never fails and costs
+        nothing, which makes it the default fallback.
+    """
+    name = "local"
+
+    def __init__(self, speed_kmh: float | None = None, road_factor: float | None = None, timeout: float | None = None):
+        super().__init__(timeout)
+        self.speed_kmh = speed_kmh or settings.LOCAL_ESTIMATOR_SPEED_KMH
+        self.road_factor = road_factor or settings.LOCAL_ESTIMATOR_ROAD_FACTOR
+
+    async def get_distance(self, origin, destination):
+        distance_km = round(haversine_km(origin, destination) * self.road_factor, 1)
+        return int(round(distance_km / self.speed_kmh * 60)), distance_km
+
+
+class FakeDistanceProvider(DistanceProvider):
+    """
+        Scriptable provider for tests.
+
+        Attributes:
+            result (tuple[int, float]): Value returned by every successful call.
+            delay (float): Seconds to sleep before answering.
+            fail (bool): When True every call raises `DistanceProviderError`.
+            calls (int): Number of lookups received.
+    """
+    name = "fake"
+
+    def __init__(self, result=(5, 2.5), delay: float = 0.0, fail: bool = False, timeout: float | None = None):
+        super().__init__(timeout)
+        self.result = result
+        self.delay = delay
+        self.fail = fail
+        self.calls = 0
+
+    async def get_distance(self, origin, destination):
+        self.calls += 1
+        if self.delay:
+            await asyncio.sleep(self.delay)
+        if self.fail:
+            raise DistanceProviderError("Fake provider failure")
+        return self.result
+
+
+class CircuitBreaker:
+    """
+        Classic closed / open / half-open breaker.
+
+        After `failure_threshold` consecutive failures the breaker opens and every
+        call is short-circuited for `reset_timeout` seconds. The first call after
+        that is let through as a probe; its outcome closes or re-opens the breaker.
+    """
+
+    def __init__(self, failure_threshold: int | None = None, reset_timeout: float | None = None, clock=time.monotonic):
+        self.failure_threshold = failure_threshold or settings.CIRCUIT_BREAKER_FAILURE_THRESHOLD
+        self.reset_timeout = reset_timeout if reset_timeout is not None else settings.CIRCUIT_BREAKER_RESET_SECONDS
+        self.clock = clock
+        self.failures = 0
+        self.opened_at: float | None = None
+        self._probing = False
+
+    @property
+    def state(self) -> str:
+        if self.opened_at is None:
+            return "closed"
+        if self.clock() - self.opened_at >= self.reset_timeout:
+            return "half-open"
+        return "open"
+
+    def allow(self) -> bool:
+        state = self.state
+        if state == "closed":
+            return True
+        if state == "half-open" and not self._probing:
+            self._probing = True
+            return True
+        return False
+
+    def record_success(self):
+        self.failures = 0
+        self.opened_at = None
+        self._probing = False
+
+    def record_failure(self):
+        self.failures += 1
+        if self._probing or self.failures >= self.failure_threshold:
+            self.opened_at = self.clock()
+        self._probing = False
+
+
+class LatencyTracker:
+    """
+        Rolling window of recent successful latencies, used to derive the hedge delay.
+    """
+
+    def __init__(self, size: int = 200, min_samples: int = 20):
+        self.samples: deque = deque(maxlen=size)
+        self.min_samples = min_samples
+
+    def observe(self, seconds: float):
+        self.samples.append(seconds)
+
+    def quantile(self, fraction: float) -> float | None:
+        if len(self.samples) < self.min_samples:
+            return None
+        ordered = sorted(self.samples)
+        return ordered[min(len(ordered) - 1, int(fraction * len(ordered)))]
+
+
+class ResilientDistanceProvider(DistanceProvider):
+    """
+        Wraps a primary provider with a latency budget, a circuit breaker,
+        request hedging and a fallback provider.
+
+        - Each lookup is bounded by the primary's `timeout`; overruns count as failures.
+        - While the breaker is open, lookups go straight to the fallback.
+        - If the primary has not answered after `hedge_delay` seconds (default: the
+          observed p95), a second identical request is raised and the first answer wins.
+    """
+
+    def __init__(self, primary: DistanceProvider, fallback: DistanceProvider | None = None,
+                 breaker: CircuitBreaker | None = None, hedge_delay: float | str | None = None):
+        super().__init__(primary.timeout)
+        self.primary = primary
+        self.fallback = fallback
+        self.breaker = breaker or CircuitBreaker()
+        self.hedge_delay = settings.DISTANCE_HEDGE_DELAY_SECONDS if hedge_delay is None else hedge_delay
+        self.latency = LatencyTracker()
+        self.name = primary.name
+
+    def _current_hedge_delay(self) -> float | None:
+        if self.hedge_delay == "off":
+            return None
+        if self.hedge_delay == "auto":
+            return self.latency.quantile(0.95)
+        return float(self.hedge_delay)
+
+    async def _timed(self, provider: DistanceProvider, origin, destination):
+        started = time.perf_counter()
+        result = await provider.get_distance(origin, destination)
+        elapsed = time.perf_counter() - started
+        distance_request_duration.labels(provider.name).observe(elapsed)
+        if provider is self.primary:
+            self.latency.observe(elapsed)
+        return result
+
+    async def _hedged(self, origin, destination):
+        delay = self._current_hedge_delay()
+        first = asyncio.ensure_future(self._timed(self.primary, origin, destination))
+        pending = {first}
+        try:
+            if delay is None:
+                return await first
+            done, pending = await asyncio.wait(pending, timeout=delay)
+            if done:
+                return first.result()
+
+            pending.add(asyncio.ensure_future(self._timed(self.primary, origin, destination)))
+            error = None
+            while pending:
+                done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+                for task in done:
+                    if task.exception() is None:
+                        return task.result()
+                    error = task.exception()
+            raise error
+        finally:
+            for task in pending:
+                task.cancel()
+
+    async def _use_fallback(self, origin, destination, reason: str):
+        if self.fallback is None:
+            raise DistanceProviderError(f"Distance provider unavailable ({reason}) and no fallback configured")
+        try:
+            return await asyncio.wait_for(self._timed(self.fallback, origin, destination), self.fallback.timeout)
+        except asyncio.TimeoutError as e:
+            distance_errors.labels(self.fallback.name, "timeout").inc()
+            raise DistanceProviderError("Fallback distance provider timed out") from e
+
+    async def get_distance(self, origin, destination):
+        if not self.breaker.allow():
+            return await self._use_fallback(origin, destination, "circuit open")
+        try:
+            result = await asyncio.wait_for(self._hedged(origin, destination), self.primary.timeout)
+        except asyncio.TimeoutError:
+            distance_errors.labels(self.primary.name, "timeout").inc()
+            self.breaker.record_failure()
+            return await self._use_fallback(origin, destination, "timeout")
+        except DistanceProviderError as e:
+            self.breaker.record_failure()
+            settings.logger.warning(f"Distance provider {self.primary.name} failed: {e}")
+            return await self._use_fallback(origin, destination, "error")
+        except BaseException:
+            # Cancelled or unexpected errors end the attempt too; a half-open probe must not stay claimed
+            self.breaker.record_failure()
+            raise
+        self.breaker.record_success()
+        return result
+
+    async def get_distances(self, origin, destinations):
+        """
+            Batch lookup with the same breaker and fallback policy as `get_distance`.
+            The budget scales with the number of matrix calls the batch needs; batches
+            are not hedged since they are issued off the request path.
+        """
+        calls = max(1, -(-len(destinations) // settings.DISTANCE_MATRIX_MAX_DESTINATIONS))
+        if self.breaker.allow():
+            started = time.perf_counter()
+            try:
+                results = await asyncio.wait_for(self.primary.get_distances(origin, destinations), self.primary.timeout * calls)
+                distance_request_duration.labels(self.primary.name).observe(time.perf_counter() - started)
+                self.breaker.record_success()
+                return results
+            except asyncio.TimeoutError:
+                distance_errors.labels(self.primary.name, "timeout").inc()
+                self.breaker.record_failure()
+            except DistanceProviderError as e:
+                settings.logger.warning(f"Distance provider {self.primary.name} batch failed: {e}")
+                self.breaker.record_failure()
+            except BaseException:
+                self.breaker.record_failure()
+                raise
+        if self.fallback is None:
+            raise DistanceProviderError("Distance provider unavailable and no fallback configured")
+        return await self.fallback.get_distances(origin, destinations)
+
+    async def aclose(self):
+        await self.primary.aclose()
+        if self.fallback is not None:
+            await self.fallback.aclose()
+
+
+class GridDistanceProvider(DistanceProvider):
+    """
+        Answers from the precomputed ETA grids (see `app.utils.eta_grid`) and only
+        asks `remote` for destinations outside grid coverage. Grid answers are
+        counted in `distance_cache_hits_total{source="grid"}`.
+    """
+
+    def __init__(self, remote: DistanceProvider, grids):
+        super().__init__(remote.timeout)
+        self.remote = remote
+        self.grids = grids
+        self.name = remote.name
+
+    async def get_distance(self, origin, destination):
+        result = self.grids.lookup(origin, destination)
+        if result is not None:
+            distance_cache_hits.labels("grid").inc()
+            return result
+        return await self.remote.get_distance(origin, destination)
+
+    async def get_distances(self, origin, destinations):
+        results = [self.grids.lookup(origin, destination) for destination in destinations]
+        missing = [index for index, result in enumerate(results) if result is None]
+        if len(missing) < len(destinations):
+            distance_cache_hits.labels("grid").inc(len(destinations) - len(missing))
+        if missing:
+            remote = await self.remote.get_distances(origin, [destinations[index] for index in missing])
+            for index, result in zip(missing, remote):
+                results[index] = result
+        return results
+
+    async def aclose(self):
+        await self.remote.aclose()
+
+
+PROVIDERS = {
+    "matrix": MatrixApiProvider,
+    "local": LocalEstimatorProvider,
+    "fake": FakeDistanceProvider,
+}
+
+_provider: DistanceProvider | None = None
+
+
+def build_provider(name: str | None = None, fallback: str | None = None) -> DistanceProvider:
+    """
+        Build the provider chain described by `settings.DISTANCE_PROVIDER` and
+        `settings.DISTANCE_FALLBACK_PROVIDER` (use "none" to disable the fallback).
+    """
+    name = name or settings.DISTANCE_PROVIDER
+    fallback = fallback or settings.DISTANCE_FALLBACK_PROVIDER
+    if name not in PROVIDERS:
+        raise ValueError(f"Unknown distance provider: {name}")
+    fallback_provider = None
+    if fallback != "none":
+        if fallback not in PROVIDERS:
+            raise ValueError(f"Unknown fallback distance provider: {fallback}")
+        fallback_provider = PROVIDERS[fallback]()
+    provider = ResilientDistanceProvider(PROVIDERS[name](), fallback_provider)
+    if settings.ETA_GRID_ENABLED:
+        from app.utils.eta_grid import eta_grids
+
+        provider = GridDistanceProvider(provider, eta_grids)
+    return provider
+
+
+def get_distance_provider() -> DistanceProvider:
+    global _provider
+    if _provider is None:
+        _provider = build_provider()
+    return _provider
+
+
+def set_distance_provider(provider: DistanceProvider | None):
+    """
+        Replace the process-wide provider, e.g. with a `FakeDistanceProvider` in tests.
+    """
+    global _provider
+    _provider = provider
+
+
+async def close_distance_provider():
+    """
+        Close the process-wide provider's connections, if it was ever built.
+    """
+    if _provider is not None:
+        await _provider.aclose()
@@ -0,0 +1,388 @@
+"""
+Precomputed travel-time grids around each service location.
+
+For every service origin (`FIXED_COORDINATES` and each registered site) the
+distance provider is asked, in batched matrix calls, for the travel duration
+and distance to every point of a regular grid covering `ETA_GRID_RADIUS_KM`.
+The results are stored as a compact float32 array file that every worker
+memory-maps; a lookup bilinearly interpolates the four surrounding cells and
+takes a few microseconds. Destinations outside the grid, or next to a cell the
+provider could not resolve, fall back to the remote API.
+
+    python -m app.utils.eta_grid build            # every origin
+    python -m app.utils.eta_grid build --stale    # only missing or outdated grids
+
+While `ETA_GRID_ENABLED` is set the app reloads rebuilt grids and, unless
+`ETA_GRID_AUTO_BUILD` is false, rebuilds grids older than `ETA_GRID_MAX_AGE_HOURS`.
+"""
+import argparse
+import asyncio
+import contextlib
+import math
+import mmap
+import os
+import struct
+import sys
+import tempfile
+import threading
+import time
+from app.core.config import settings
+
+try:
+    import fcntl
+except ImportError:  # not available on Windows
+    fcntl = None
+
+KM_PER_DEGREE_LATITUDE = 110.574
+KM_PER_DEGREE_LONGITUDE = 111.320  # at the equator
+
+
+def _origin_key(origin: tuple[float, float]) -> tuple[float, float]:
+    return round(float(origin[0]), 5), round(float(origin[1]), 5)
+
+
+class EtaGrid:
+    """
+        One memory-mapped grid of `(duration_minutes, distance_km)` cells.
+
+        File layout: a fixed header (origin, south-west corner, cell size in
+        degrees, rows, columns, build time) followed by `rows x cols` pairs of
+        little-endian float32, row-major from the south-west corner. Cells the
+        provider could not resolve hold NaN.
+    """
+
+    MAGIC = b"ETAGRID1"
+    HEADER = struct.Struct("<8s6d2Id")
+    CELL = struct.Struct("<2f")
+    PAIR = struct.Struct("<4f")  # two horizontally adjacent cells
+
+    def __init__(self, path: str):
+        self.path = path
+        with open(path, "rb") as f:
+            self._mm = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        (magic, origin_lat, origin_lon, self.lat_min, self.lon_min, self.lat_step, self.lon_step,
+         self.rows, self.cols, self.built_at) = self.HEADER.unpack_from(self._mm, 0)
+        if magic != self.MAGIC or len(self._mm) < self.HEADER.size + self.rows * self.cols * self.CELL.size:
+            raise ValueError(f"{path} is not a valid ETA grid")
+        self.origin = (origin_lat, origin_lon)
+
+    @staticmethod
+    def layout(origin: tuple[float, float], radius_km: float, step_km: float) -> tuple[float, float, float, float, int]:
+        """
+            `(lat_min, lon_min, lat_step, lon_step, size)` of a square grid centred on `origin`.
+        """
+        half = max(1, math.ceil(radius_km / step_km))
+        lat_step = step_km / KM_PER_DEGREE_LATITUDE
+        lon_step = step_km / (KM_PER_DEGREE_LONGITUDE * math.cos(math.radians(origin[0])))
+        return origin[0] - half * lat_step, origin[1] - half * lon_step, lat_step, lon_step, 2 * half + 1
+
+    @classmethod
+    def write(cls, path: str, origin: tuple[float, float], lat_min: float, lon_min: float,
+              lat_step: float, lon_step: float, rows: int, cols: int, cells: list):
+        """
+            Atomically replace `path` with a grid; `cells` is row-major, None for unresolved points.
+        """
+        nan = float("nan")
+        values = []
+        for cell in cells:
+            values.extend(cell if cell is not None else (nan, nan))
+        header = cls.HEADER.pack(cls.MAGIC, origin[0], origin[1], lat_min, lon_min, lat_step, lon_step,
+                                 rows, cols, time.time())
+        directory = os.path.dirname(path) or "."
+        fd, tmp_path = tempfile.mkstemp(dir=directory, suffix=".tmp")
+        try:
+            with os.fdopen(fd, "wb") as f:
+                f.write(header)
+                f.write(struct.pack(f"<{len(values)}f", *values))
+            # Readers keep their mapping of the old file until they reload
+            os.replace(tmp_path, path)
+        except BaseException:
+            os.unlink(tmp_path)
+            raise
+
+    def lookup(self, latitude: float, longitude: float) -> tuple[int, float] | None:
+        """
+            Bilinear interpolation of the four cells around a point; None outside coverage.
+        """
+        y = (latitude - self.lat_min) / self.lat_step
+        x = (longitude - self.lon_min) / self.lon_step
+        if not (0.0 <= y <= self.rows - 1 and 0.0 <= x <= self.cols - 1):
+            return None
+        row = min(int(y), self.rows - 2)
+        col = min(int(x), self.cols - 2)
+        fy, fx = y - row, x - col
+        offset = self.HEADER.size + (row * self.cols + col) * self.CELL.size
+        d00, k00, d01, k01 = self.PAIR.unpack_from(self._mm, offset)
+        d10, k10, d11, k11 = self.PAIR.unpack_from(self._mm, offset + self.cols * self.CELL.size)
+        duration = (d00 * (1 - fx) + d01 * fx) * (1 - fy) + (d10 * (1 - fx) + d11 * fx) * fy
+        distance = (k00 * (1 - fx) + k01 * fx) * (1 - fy) + (k10 * (1 - fx) + k11 * fx) * fy
+        if math.isnan(duration) or math.isnan(distance):  # a neighbouring cell is unresolved
+            return None
+        return int(round(duration)), round(distance, 1)
+
+
+class EtaGridStore:
+    """
+        Every grid file in `directory`, keyed by origin.
+
+        `reload` maps new or rebuilt files and drops deleted ones; lookups read
+        the current mapping without locking.
+    """
+
+    SUFFIX = ".grid"
+
+    def __init__(self, directory: str):
+        self.directory = directory
+        self._grids: dict[tuple[float, float], EtaGrid] = {}
+        self._files: dict[str, tuple[int, int]] = {}  # path -> (inode, mtime_ns)
+        self._lock = threading.Lock()
+
+    def path_for(self, origin: tuple[float, float]) -> str:
+        latitude, longitude = _origin_key(origin)
+        return os.path.join(self.directory, f"{latitude:.5f}_{longitude:.5f}{self.SUFFIX}")
+
+    def reload(self) -> int:
+        """
+            Pick up grids written since the last reload. Returns the number of grids loaded.
+        """
+        with self._lock:
+            try:
+                names = [name for name in os.listdir(self.directory) if name.endswith(self.SUFFIX)]
+            except FileNotFoundError:
+                names = []
+            grids, files = {}, {}
+            for name in names:
+                path = os.path.join(self.directory, name)
+                try:
+                    stat = os.stat(path)
+                    identity = (stat.st_ino, stat.st_mtime_ns)
+                    grid = next((g for g in self._grids.values() if g.path == path), None)
+                    if grid is None or self._files.get(path) != identity:
+                        grid = EtaGrid(path)
+                except (OSError, ValueError) as e:
+                    settings.logger.warning(f"Skipping ETA grid {path}: {e}")
+                    continue
+                grids[_origin_key(grid.origin)] = grid
+                files[path] = identity
+            self._grids, self._files = grids, files
+            return len(grids)
+
+    def get(self, origin: tuple[float, float]) -> EtaGrid | None:
+        return self._grids.get(_origin_key(origin))
+
+    def lookup(self, origin: tuple[float, float], destination: tuple[float, float]) -> tuple[int, float] | None:
+        grid = self._grids.get(_origin_key(origin))
+        if grid is None:
+            return None
+        return grid.lookup(destination[0], destination[1])
+
+    def age(self, origin: tuple[float, float]) -> float | None:
+        """
+            Seconds since the grid of `origin` was built, or None if there is none.
+        """
+        grid = self.get(origin)
+        return None if grid is None else time.time() - grid.built_at
+
+
+async def build_grid(provider, origin: tuple[float, float], path: str, radius_km: float, step_km: float,
+                     concurrency: int = 4) -> int:
+    """
+        Resolve every grid point around `origin` with `provider` and write the grid to `path`.
+
+        Points are sent in chunks of `DISTANCE_MATRIX_MAX_DESTINATIONS` (one matrix
+        call each), at most `concurrency` chunks at a time. A failed chunk cancels
+        the chunks still in flight and aborts the build, so the previous grid
+        stays in place. Returns the number of resolved cells.
+    """
+    origin = (float(origin[0]), float(origin[1]))
+    lat_min, lon_min, lat_step, lon_step, size = EtaGrid.layout(origin, radius_km, step_km)
+    points = [(lat_min + row * lat_step, lon_min + col * lon_step) for row in range(size) for col in range(size)]
+    chunk_size = settings.DISTANCE_MATRIX_MAX_DESTINATIONS
+    semaphore = asyncio.Semaphore(concurrency)
+
+    async def resolve(chunk):
+        async with semaphore:
+            return await provider.get_distances(origin, chunk)
+
+    tasks = [asyncio.create_task(resolve(points[start:start + chunk_size])) for start in range(0, len(points), chunk_size)]
+    try:
+        chunks = await asyncio.gather(*tasks)
+    except BaseException:
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+        raise
+    cells = [cell for chunk in chunks for cell in chunk]
+    await asyncio.to_thread(EtaGrid.write, path, origin, lat_min, lon_min, lat_step, lon_step, size, size, cells)
+    return sum(cell is not None for cell in cells)
+
+
+def service_origins() -> list[tuple[float, float]]:
+    """
+        `FIXED_COORDINATES` plus the coordinates of every registered site.
+    """
+    from app.crud.site_management import get_site_coordinates
+    from app.db.database import SessionLocal
+
+    db = SessionLocal()
+    try:
+        coordinates = get_site_coordinates(db)
+    finally:
+        db.close()
+    origins = {_origin_key(settings.FIXED_COORDINATES): tuple(settings.FIXED_COORDINATES)}
+    for origin in coordinates:
+        origins.setdefault(_origin_key(origin), tuple(origin))
+    return list(origins.values())
+
+
+class EtaGridRefresher:
+    """
+        Keeps the grids of every service origin loaded and fresh.
+
+        Each tick reloads grids rebuilt by other workers or the CLI and, when
+        `auto_build` is on, rebuilds missing grids and grids older than `max_age`
+        seconds with the primary distance provider. An exclusive lock file in
+        the grid directory makes sure only one worker builds at a time, and the
+        stale grids are re-checked once it is held. A failed build leaves a
+        `<grid>.failed` file counting the failures; the origin is not retried for
+        `interval` x 2^failures seconds (at most `max_age`), by any worker.
+    """
+
+    def __init__(self, store: EtaGridStore, interval: float | None = None, max_age: float | None = None,
+                 auto_build: bool | None = None):
+        self.store = store
+        self.interval = interval or settings.ETA_GRID_CHECK_SECONDS
+        self.max_age = max_age if max_age is not None else settings.ETA_GRID_MAX_AGE_HOURS * 3600
+        self.auto_build = settings.ETA_GRID_AUTO_BUILD if auto_build is None else auto_build
+        self._task: asyncio.Task | None = None
+
+    async def start(self):
+        if self._task is None:
+            loaded = await asyncio.to_thread(self.store.reload)
+            self._task = asyncio.create_task(self._run())
+            settings.logger.info(f"ETA grid refresher started with {loaded} grids, every {self.interval}s")
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            await asyncio.gather(self._task, return_exceptions=True)
+            self._task = None
+
+    async def _run(self):
+        while True:
+            try:
+                await self.tick()
+            except Exception as e:
+                settings.logger.error(f"ETA grid refresh failed: {e}")
+            await asyncio.sleep(self.interval)
+
+    def _failure_path(self, origin: tuple[float, float]) -> str:
+        return self.store.path_for(origin) + ".failed"
+
+    def backing_off(self, origin: tuple[float, float], now: float | None = None) -> bool:
+        """
+            True while `origin` is waiting out the retry delay after a failed build.
+        """
+        path = self._failure_path(origin)
+        try:
+            failed_at = os.stat(path).st_mtime
+            with open(path) as file:
+                failures = int(file.read() or 1)
+        except (OSError, ValueError):
+            return False
+        delay = min(self.interval * 2 ** failures, self.max_age)
+        return (now or time.time()) < failed_at + delay
+
+    def _record_failure(self, origin: tuple[float, float]):
+        path = self._failure_path(origin)
+        try:
+            with open(path) as file:
+                failures = int(file.read() or 0)
+        except (OSError, ValueError):
+            failures = 0
+        with open(path, "w") as file:
+            file.write(str(failures + 1))
+
+    def stale_origins(self, origins: list[tuple[float, float]]) -> list[tuple[float, float]]:
+        stale = []
+        for origin in origins:
+            age = self.store.age(origin)
+            if age is None or age > self.max_age:
+                stale.append(origin)
+        return stale
+
+    async def tick(self, provider=None) -> int:
+        """
+            Reload, then rebuild stale grids if this worker wins the build lock.
+            Returns the number of grids built.
+        """
+        await asyncio.to_thread(self.store.reload)
+        if not self.auto_build:
+            return 0
+        stale = [origin for origin in self.stale_origins(await asyncio.to_thread(service_origins))
+                 if not self.backing_off(origin)]
+        if not stale:
+            return 0
+        os.makedirs(self.store.directory, exist_ok=True)
+        lock = open(os.path.join(self.store.directory, ".build.lock"), "w")
+        try:
+            if fcntl is not None:
+                try:
+                    fcntl.flock(lock, fcntl.LOCK_EX | fcntl.LOCK_NB)
+                except BlockingIOError:
+                    return 0  # another worker is building; its grids are picked up on a later tick
+            # The previous holder may have just built some of them
+            await asyncio.to_thread(self.store.reload)
+            stale = [origin for origin in self.stale_origins(stale) if not self.backing_off(origin)]
+            return await self.build(stale, provider) if stale else 0
+        finally:
+            lock.close()
+
+    async def build(self, origins: list[tuple[float, float]], provider=None) -> int:
+        """
+            Build the grids of `origins` one after the other. A failed origin is
+            logged and recorded for backoff; the others are still built.
+        """
+        from app.utils.distance_providers import PROVIDERS
+
+        provider = provider or PROVIDERS[settings.DISTANCE_PROVIDER]()
+        built = 0
+        for origin in origins:
+            started = time.perf_counter()
+            try:
+                resolved = await build_grid(provider, origin, self.store.path_for(origin), settings.ETA_GRID_RADIUS_KM,
+                                            settings.ETA_GRID_STEP_KM, settings.ETA_GRID_BUILD_CONCURRENCY)
+            except Exception as e:
+                settings.logger.error(f"Building the ETA grid for {origin} failed: {e}")
+                self._record_failure(origin)
+                continue
+            with contextlib.suppress(FileNotFoundError):
+                os.remove(self._failure_path(origin))
+            settings.logger.info(
+                f"Built ETA grid for {origin}: {resolved} cells resolved in {time.perf_counter() - started:.1f}s")
+            built += 1
+        await asyncio.to_thread(self.store.reload)
+        return built
+
+
+eta_grids = EtaGridStore(settings.ETA_GRID_DIR)
+eta_grid_refresher = EtaGridRefresher(eta_grids)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("command", choices=("build",))
+    parser.add_argument("--stale", action="store_true", help="only build missing or outdated grids")
+    args = parser.parse_args()
+
+    eta_grids.reload()
+    origins = service_origins()
+    if args.stale:
+        origins = eta_grid_refresher.stale_origins(origins)
+    os.makedirs(eta_grids.directory, exist_ok=True)
+    built = asyncio.run(eta_grid_refresher.build(origins))
+    print(f"built {built} ETA grids in {eta_grids.directory}", file=sys.stderr)
+
+
+if __name__ == "__main__":
+    main()
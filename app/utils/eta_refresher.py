@@ -0,0 +1,118 @@
+import asyncio
+from collections import defaultdict
+from datetime import datetime, timedelta, timezone
+from app.core.config import settings
+from app.utils.distance_providers import DistanceProviderError, get_distance_provider
+from app.utils.notifier import notifier
+from app.utils.token_log import record_eta
+
+
+def _reach_out(origin: tuple[float, float], latitude: float, longitude: float, duration: int, distance: float) -> bool:
+    return (latitude, longitude) == tuple(origin) or float(distance) < 2 or int(duration) < 2
+
+
+class EtaRefresher:
+    """
+        Periodically refreshes the ETA of every waiting token.
+
+        Each tick loads all waiting, not-yet-arrived tokens issued within the
+        last `max_age` seconds in one query, groups them by the site they were
+        routed to, resolves each group with as few multi-destination matrix calls
+        as the API limit allows and writes the results back in one executemany
+        `UPDATE`.
+    """
+
+    def __init__(self, interval: float | None = None, concurrency: int | None = None, max_age: float | None = None):
+        self.interval = interval or settings.ETA_REFRESH_INTERVAL_SECONDS
+        self.concurrency = concurrency or settings.ETA_REFRESH_CONCURRENCY
+        self.max_age = max_age or settings.ETA_REFRESH_MAX_AGE_HOURS * 3600
+        self._task: asyncio.Task | None = None
+
+    async def start(self):
+        if self._task is None:
+            self._task = asyncio.create_task(self._run())
+            settings.logger.info(f"ETA refresher started, every {self.interval}s")
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            await asyncio.gather(self._task, return_exceptions=True)
+            self._task = None
+
+    async def _run(self):
+        while True:
+            await asyncio.sleep(self.interval)
+            try:
+                await self.tick()
+            except Exception as e:
+                settings.logger.error(f"ETA refresh failed: {e}")
+
+    async def tick(self) -> int:
+        """
+            Run one refresh cycle. Returns the number of tokens updated.
+        """
+        from app.crud.token_management import get_active_tokens_for_refresh
+        from app.db.database import with_session
+
+        issued_after = datetime.now(timezone.utc) - timedelta(seconds=self.max_age)
+        rows = await asyncio.to_thread(with_session, get_active_tokens_for_refresh, issued_after)
+        if not rows:
+            return 0
+
+        groups: dict[tuple[float, float], list] = defaultdict(list)
+        for row in rows:
+            origin = (row.site_latitude, row.site_longitude) if row.site_latitude is not None else tuple(settings.FIXED_COORDINATES)
+            groups[origin].append(row)
+
+        provider = get_distance_provider()
+        semaphore = asyncio.Semaphore(self.concurrency)
+        chunk_size = settings.DISTANCE_MATRIX_MAX_DESTINATIONS
+
+        async def resolve(origin, chunk):
+            async with semaphore:
+                try:
+                    results = await provider.get_distances(origin, [(row.latitude, row.longitude) for row in chunk])
+                except DistanceProviderError as e:
+                    settings.logger.warning(f"Skipping {len(chunk)} tokens in ETA refresh: {e}")
+                    return []
+            return [
+                {
+                    "id": row.id,
+                    "token_number": row.token_number,
+                    "duration": result[0],
+                    "distance": result[1],
+                    "reach_out": _reach_out(origin, row.latitude, row.longitude, result[0], result[1]),
+                }
+                for row, result in zip(chunk, results) if result is not None
+            ]
+
+        batches = await asyncio.gather(*(
+            resolve(origin, tokens[start:start + chunk_size])
+            for origin, tokens in groups.items()
+            for start in range(0, len(tokens), chunk_size)
+        ))
+        updates = [update for batch in batches for update in batch]
+        updated = await asyncio.to_thread(with_session, self._write, updates)
+
+        for update in updates:
+            record_eta(update["token_number"], update["distance"], update["duration"], update["reach_out"])
+            notifier.publish(update["token_number"], {
+                "token_number": update["token_number"],
+                "eta_status": "ready",
+                "distance": update["distance"],
+                "duration": update["duration"],
+                "reach_out": update["reach_out"],
+            })
+        settings.logger.info(f"ETA refresh updated {updated} of {len(rows)} waiting tokens")
+        return updated
+
+    @staticmethod
+    def _write(db, updates):
+        from app.crud.token_management import bulk_update_token_etas
+
+        return bulk_update_token_etas(db, [
+            {key: update[key] for key in ("id", "distance", "duration", "reach_out")} for update in updates
+        ])
+
+
+eta_refresher = EtaRefresher()
@@ -0,0 +1,129 @@
+import asyncio
+from dataclasses import dataclass
+from app.core.config import settings
+from app.utils.metrics import registry
+from app.utils.notifier import notifier
+from app.utils.token_log import record_eta
+
+
+@dataclass
+class EtaJob:
+    """
+        A token waiting for its distance, duration and reach-out flag.
+    """
+    token_id: int
+    token_number: int
+    latitude: float
+    longitude: float
+    service_coordinates: tuple[float, float] | None = None
+    attempt: int = 0
+
+
+class EtaWorkerPool:
+    """
+        Bounded asyncio task queue that computes ETAs off the request path.
+
+        `concurrency` worker tasks pull jobs from a queue of at most `queue_size`
+        entries. A failed lookup is retried with exponential backoff up to
+        `max_retries` times. Every result is written to the token and published
+        to subscribers of that token through `app.utils.notifier`.
+    """
+
+    def __init__(self, concurrency: int | None = None, queue_size: int | None = None,
+                 max_retries: int | None = None, backoff: float | None = None):
+        self.concurrency = concurrency or settings.ETA_WORKER_CONCURRENCY
+        self.queue_size = queue_size or settings.ETA_QUEUE_SIZE
+        self.max_retries = max_retries if max_retries is not None else settings.ETA_MAX_RETRIES
+        self.backoff = backoff if backoff is not None else settings.ETA_RETRY_BACKOFF_SECONDS
+        self._queue: asyncio.Queue | None = None
+        self._tasks: list[asyncio.Task] = []
+
+    @property
+    def running(self) -> bool:
+        return bool(self._tasks)
+
+    def qsize(self) -> int:
+        return self._queue.qsize() if self._queue is not None else 0
+
+    async def start(self):
+        if self.running:
+            return
+        self._queue = asyncio.Queue(maxsize=self.queue_size)
+        self._tasks = [asyncio.create_task(self._run()) for _ in range(self.concurrency)]
+        settings.logger.info(f"ETA worker pool started with {self.concurrency} workers")
+
+    async def stop(self):
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks = []
+        self._queue = None
+
+    def enqueue(self, job: EtaJob) -> bool:
+        """
+            Queue a job without waiting. Returns False when the pool is not running
+            or the queue is full, so the caller can fall back to inline processing.
+        """
+        if self._queue is None:
+            return False
+        try:
+            self._queue.put_nowait(job)
+            return True
+        except asyncio.QueueFull:
+            return False
+
+    async def _run(self):
+        while True:
+            job = await self._queue.get()
+            try:
+                await self.process(job)
+            except Exception as e:
+                settings.logger.error(f"ETA worker failed on token {job.token_number}: {e}")
+            finally:
+                self._queue.task_done()
+
+    async def process(self, job: EtaJob):
+        """
+            Compute and store the ETA for one job, retrying transient failures.
+        """
+        from fastapi import HTTPException
+        from app.utils.get_distance import get_distance
+
+        while True:
+            try:
+                duration_value, distance_value = await get_distance(job.latitude, job.longitude, job.service_coordinates)
+                break
+            except HTTPException as e:
+                job.attempt += 1
+                if job.attempt > self.max_retries:
+                    settings.logger.error(f"Giving up on ETA for token {job.token_number}: {e.detail}")
+                    notifier.publish(job.token_number, {"token_number": job.token_number, "eta_status": "failed"})
+                    return
+                await asyncio.sleep(self.backoff * (2 ** (job.attempt - 1)))
+
+        token = await asyncio.to_thread(self._store, job, duration_value, distance_value)
+        if token is not None:
+            record_eta(job.token_number, distance_value, duration_value, token["reach_out"])
+            notifier.publish(job.token_number, {
+                "token_number": job.token_number,
+                "eta_status": "ready",
+                "distance": distance_value,
+                "duration": duration_value,
+                "reach_out": token["reach_out"],
+            })
+
+    @staticmethod
+    def _store(job: EtaJob, duration_value: int, distance_value: float):
+        from app.crud.token_management import fill_token_eta
+        from app.db.database import SessionLocal
+
+        db = SessionLocal()
+        try:
+            token = fill_token_eta(db, job.token_id, duration_value, distance_value, job.service_coordinates)
+            return {"reach_out": token.reach_out} if token is not None else None
+        finally:
+            db.close()
+
+
+eta_worker = EtaWorkerPool()
+registry.gauge("eta_queue_depth", "ETA jobs waiting for a background worker.", callback=eta_worker.qsize)
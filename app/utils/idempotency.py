@@ -0,0 +1,108 @@
+import asyncio
+import hashlib
+import time
+from collections import OrderedDict
+from dataclasses import dataclass
+from fastapi import HTTPException
+from fastapi.responses import Response
+from app.core.config import settings
+
+
+@dataclass
+class StoredResponse:
+    status_code: int
+    body: bytes
+    media_type: str = "application/json"
+
+    def to_response(self, replayed: bool) -> Response:
+        headers = {"Idempotent-Replayed": "true"} if replayed else None
+        return Response(content=self.body, status_code=self.status_code, headers=headers, media_type=self.media_type)
+
+
+@dataclass
+class _Entry:
+    fingerprint: str
+    expires_at: float
+    future: asyncio.Future
+
+
+def request_fingerprint(*parts) -> str:
+    return hashlib.sha256("\x1f".join(str(part) for part in parts).encode()).hexdigest()
+
+
+class IdempotencyStore:
+    """
+        Bounded, TTL-evicting map from idempotency keys to responses.
+
+        The first request for a key runs the handler; its response is kept for
+        `ttl` seconds and replayed to retries without running the handler again.
+        Duplicates arriving while the first is still running await the same
+        future; if the first is cancelled (its client went away), one of them
+        runs the handler instead. Failures are not stored, so the client can
+        retry them. At most `max_entries` keys are kept, oldest first out.
+
+        The store is per process: with several workers, a retry that lands on
+        another worker runs the handler again and issues a second token.
+        Clients or load balancers that need exactly-once issuance across
+        workers must route a key's retries to the same worker.
+    """
+
+    def __init__(self, max_entries: int | None = None, ttl: float | None = None, clock=time.monotonic):
+        self.max_entries = max_entries or settings.IDEMPOTENCY_MAX_KEYS
+        self.ttl = ttl if ttl is not None else settings.IDEMPOTENCY_TTL_SECONDS
+        self.clock = clock
+        self._entries: OrderedDict[str, _Entry] = OrderedDict()
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def _evict(self, now: float):
+        while self._entries:
+            key, entry = next(iter(self._entries.items()))
+            if entry.expires_at > now and len(self._entries) <= self.max_entries:
+                break
+            del self._entries[key]
+
+    async def run(self, key: str, fingerprint: str, handler) -> Response:
+        """
+            Return the response for `key`, running `handler()` only for the first request.
+
+            Raises:
+                HTTPException: 422 if the key was already used with a different request.
+        """
+        while True:
+            now = self.clock()
+            self._evict(now)
+            entry = self._entries.get(key)
+            if entry is None:
+                break
+            if entry.fingerprint != fingerprint:
+                raise HTTPException(status_code=422, detail="Idempotency-Key was already used with a different request")
+            try:
+                stored = await asyncio.shield(entry.future)
+            except asyncio.CancelledError:
+                if entry.future.cancelled():
+                    continue  # the first request was cancelled, not this one: take over
+                raise
+            return stored.to_response(replayed=True)
+
+        future = asyncio.get_running_loop().create_future()
+        self._entries[key] = _Entry(fingerprint, now + self.ttl, future)
+        self._evict(now)
+        try:
+            response = await handler()
+        except asyncio.CancelledError:
+            self._entries.pop(key, None)
+            future.cancel()
+            raise
+        except Exception as e:
+            self._entries.pop(key, None)
+            future.set_exception(e)
+            future.exception()  # mark retrieved when no duplicate is waiting
+            raise
+        stored = StoredResponse(response.status_code, bytes(response.body), response.media_type or "application/json")
+        future.set_result(stored)
+        return stored.to_response(replayed=False)
+
+
+token_idempotency = IdempotencyStore()
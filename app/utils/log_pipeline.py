@@ -0,0 +1,163 @@
+import atexit
+import copy
+import json
+import logging
+import logging.handlers
+import queue
+import random
+import sys
+import threading
+import time
+from datetime import datetime, timezone
+from app.utils.metrics import log_records_dropped
+
+# Attributes every LogRecord has; anything else was passed via `extra=` and is emitted as a field
+_RECORD_ATTRIBUTES = set(vars(logging.makeLogRecord({}))) | {"message", "asctime", "taskName"}
+
+
+class JsonFormatter(logging.Formatter):
+    """
+        One JSON object per line: timestamp, level, logger, message, `extra=` fields
+        and the formatted traceback, if any. Runs on the writer thread.
+    """
+
+    def format(self, record: logging.LogRecord) -> str:
+        payload = {
+            "ts": datetime.fromtimestamp(record.created, timezone.utc).isoformat(timespec="milliseconds"),
+            "level": record.levelname,
+            "logger": record.name,
+            "message": record.getMessage(),
+        }
+        for key, value in record.__dict__.items():
+            if key not in _RECORD_ATTRIBUTES:
+                payload[key] = value
+        if record.exc_text:
+            payload["exc_info"] = record.exc_text
+        return json.dumps(payload, default=str)
+
+
+class SamplingFilter(logging.Filter):
+    """
+        Per-logger sampling and rate limiting for high-frequency records.
+
+        Rules are keyed by logger name and match that logger and its children,
+        the longest matching prefix winning. `sample_rates` keeps a random fraction
+        of records; `rate_limits` caps records per second with a token bucket per
+        logger. WARNING and above always pass. Dropped records are counted in
+        `log_records_dropped_total`.
+    """
+
+    def __init__(self, sample_rates: dict[str, float] | None = None, rate_limits: dict[str, float] | None = None,
+                 clock=time.monotonic, rng=random.random):
+        super().__init__()
+        self.sample_rates = sample_rates or {}
+        self.rate_limits = rate_limits or {}
+        self.clock = clock
+        self.rng = rng
+        self._rules: dict[str, tuple[float, float | None]] = {}
+        self._buckets: dict[str, list[float]] = {}  # logger -> [tokens, last refill]
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def _match(rules: dict[str, float], name: str):
+        while True:
+            if name in rules:
+                return rules[name]
+            if "." not in name:
+                return rules.get("")
+            name = name.rsplit(".", 1)[0]
+
+    def _rule(self, name: str) -> tuple[float, float | None]:
+        rule = self._rules.get(name)
+        if rule is None:
+            sample_rate = self._match(self.sample_rates, name)
+            rule = self._rules[name] = (1.0 if sample_rate is None else sample_rate, self._match(self.rate_limits, name))
+        return rule
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        if record.levelno >= logging.WARNING:
+            return True
+        sample_rate, rate_limit = self._rule(record.name)
+        if sample_rate < 1.0 and self.rng() >= sample_rate:
+            log_records_dropped.labels("sampled").inc()
+            return False
+        if rate_limit is not None:
+            now = self.clock()
+            with self._lock:
+                bucket = self._buckets.setdefault(record.name, [rate_limit, now])
+                bucket[0] = min(rate_limit, bucket[0] + (now - bucket[1]) * rate_limit)
+                bucket[1] = now
+                if bucket[0] < 1.0:
+                    log_records_dropped.labels("rate_limited").inc()
+                    return False
+                bucket[0] -= 1.0
+        return True
+
+
+class BoundedQueueHandler(logging.handlers.QueueHandler):
+    """
+        Hands records to the writer thread without ever blocking the caller.
+
+        The message is interpolated and any traceback formatted here, since
+        arguments and frames may change once the caller moves on; everything
+        else, including JSON encoding and the write itself, happens on the
+        writer thread. When the buffer is full the record is dropped and counted.
+    """
+
+    def prepare(self, record: logging.LogRecord) -> logging.LogRecord:
+        record = copy.copy(record)
+        record.msg = record.getMessage()
+        record.args = None
+        if record.exc_info:
+            record.exc_text = logging.Formatter().formatException(record.exc_info)
+            record.exc_info = None
+        return record
+
+    def enqueue(self, record: logging.LogRecord):
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            log_records_dropped.labels("queue_full").inc()
+
+
+class _Listener(logging.handlers.QueueListener):
+    def stop(self):
+        if self._thread is not None:  # stopping twice (tests, atexit) is harmless
+            super().stop()
+
+
+def parse_rules(text: str) -> dict[str, float]:
+    """
+        Parse `"logger=value,other.logger=value"` into a dict; `root` stands for every logger.
+    """
+    rules = {}
+    for item in filter(None, (part.strip() for part in text.split(","))):
+        name, _, value = item.partition("=")
+        rules["" if name.strip() == "root" else name.strip()] = float(value)
+    return rules
+
+
+def configure_logging(level: str = "INFO", fmt: str = "json", buffer_size: int = 10_000,
+                      sample_rates: dict[str, float] | None = None, rate_limits: dict[str, float] | None = None,
+                      stream=None) -> logging.handlers.QueueListener:
+    """
+        Route every log record through a bounded queue to a background writer thread.
+
+        Replaces the root logger's handlers and returns the running listener,
+        which is stopped (flushing what is buffered) at interpreter exit.
+    """
+    output = logging.StreamHandler(stream or sys.stderr)
+    output.setFormatter(JsonFormatter() if fmt == "json" else logging.Formatter("%(levelname)s:%(name)s:%(message)s"))
+    handler = BoundedQueueHandler(queue.Queue(buffer_size))
+    handler.addFilter(SamplingFilter(sample_rates, rate_limits))
+
+    root = logging.getLogger()
+    for existing in list(root.handlers):
+        root.removeHandler(existing)
+    root.addHandler(handler)
+    root.setLevel(level)
+
+    listener = _Listener(handler.queue, output, respect_handler_level=True)
+    listener.start()
+    atexit.register(listener.stop)
+    return listener
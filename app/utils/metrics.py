@@ -0,0 +1,328 @@
+import time
+from bisect import bisect_left
+from contextvars import ContextVar
+
+# Default latency buckets in seconds, from sub-millisecond DB calls up to slow remote APIs.
+DEFAULT_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+
+def _format_value(value: float) -> str:
+    if value == float("inf"):
+        return "+Inf"
+    if isinstance(value, float) and value.is_integer():
+        return str(int(value))
+    return repr(value)
+
+
+def _escape_label(value) -> str:
+    # Prometheus text format: backslash, double quote and newline are escaped in label values
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def _format_labels(names: tuple, values: tuple, extra: str = "") -> str:
+    pairs = [f'{name}="{_escape_label(value)}"' for name, value in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+
+class _Metric:
+    """
+        Base class for a labelled metric family.
+
+        Children are created once per label combination and cached in a plain dict,
+        so the hot path is a dict lookup plus an in-place update. No locks are taken:
+        under the GIL a lost increment is possible but vanishingly rare, which is an
+        acceptable trade for sub-microsecond recording.
+    """
+    kind = ""
+
+    def __init__(self, name: str, documentation: str, labelnames: tuple = ()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._children: dict[tuple, object] = {}
+        if not self.labelnames:
+            self._children[()] = self._new_child()
+
+    def _new_child(self):
+        raise NotImplementedError
+
+    def labels(self, *values):
+        child = self._children.get(values)
+        if child is None:
+            child = self._children.setdefault(values, self._new_child())
+        return child
+
+    def _samples(self):
+        raise NotImplementedError
+
+    def render(self) -> list[str]:
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} {self.kind}"]
+        lines.extend(self._samples())
+        return lines
+
+
+class _CounterChild:
+    __slots__ = ("value",)
+
+    def __init__(self):
+        self.value = 0.0
+
+    def inc(self, amount: float = 1.0):
+        self.value += amount
+
+
+class Counter(_Metric):
+    kind = "counter"
+
+    def _new_child(self):
+        return _CounterChild()
+
+    def inc(self, amount: float = 1.0):
+        self._children[()].value += amount
+
+    def _samples(self):
+        return [
+            f"{self.name}_total{_format_labels(self.labelnames, values)} {_format_value(child.value)}"
+            for values, child in list(self._children.items())
+        ]
+
+
+class _GaugeChild:
+    __slots__ = ("value",)
+
+    def __init__(self):
+        self.value = 0.0
+
+    def set(self, value: float):
+        self.value = value
+
+    def inc(self, amount: float = 1.0):
+        self.value += amount
+
+    def dec(self, amount: float = 1.0):
+        self.value -= amount
+
+
+class Gauge(_Metric):
+    """
+        A value that goes up and down. Pass `callback` to sample the value lazily
+        at scrape time instead of maintaining it on the hot path.
+    """
+    kind = "gauge"
+
+    def __init__(self, name: str, documentation: str, labelnames: tuple = (), callback=None):
+        super().__init__(name, documentation, labelnames)
+        self.callback = callback
+
+    def _new_child(self):
+        return _GaugeChild()
+
+    def set(self, value: float):
+        self._children[()].value = value
+
+    def inc(self, amount: float = 1.0):
+        self._children[()].value += amount
+
+    def dec(self, amount: float = 1.0):
+        self._children[()].value -= amount
+
+    def _samples(self):
+        if self.callback is not None:
+            try:
+                value = self.callback()
+            except Exception:
+                return []
+            if value is None:
+                return []
+            return [f"{self.name} {_format_value(float(value))}"]
+        return [
+            f"{self.name}{_format_labels(self.labelnames, values)} {_format_value(child.value)}"
+            for values, child in list(self._children.items())
+        ]
+
+
+class _HistogramChild:
+    __slots__ = ("bounds", "counts", "sum")
+
+    def __init__(self, bounds: tuple):
+        self.bounds = bounds
+        # One slot per finite bucket plus the +Inf bucket; cumulated only at scrape time.
+        self.counts = [0] * (len(bounds) + 1)
+        self.sum = 0.0
+
+    def observe(self, value: float):
+        self.counts[bisect_left(self.bounds, value)] += 1
+        self.sum += value
+
+
+class Histogram(_Metric):
+    kind = "histogram"
+
+    def __init__(self, name: str, documentation: str, labelnames: tuple = (), buckets: tuple = DEFAULT_BUCKETS):
+        self.buckets = tuple(sorted(buckets))
+        super().__init__(name, documentation, labelnames)
+
+    def _new_child(self):
+        return _HistogramChild(self.buckets)
+
+    def observe(self, value: float):
+        self._children[()].observe(value)
+
+    def _samples(self):
+        lines = []
+        for values, child in list(self._children.items()):
+            counts = list(child.counts)
+            cumulative = 0
+            for bound, count in zip(self.buckets + (float("inf"),), counts):
+                cumulative += count
+                labels = _format_labels(self.labelnames, values, f'le="{_format_value(bound)}"')
+                lines.append(f"{self.name}_bucket{labels} {cumulative}")
+            labels = _format_labels(self.labelnames, values)
+            lines.append(f"{self.name}_sum{labels} {_format_value(child.sum)}")
+            lines.append(f"{self.name}_count{labels} {cumulative}")
+        return lines
+
+
+class Registry:
+    def __init__(self):
+        self._metrics: dict[str, _Metric] = {}
+
+    def register(self, metric: _Metric) -> _Metric:
+        self._metrics[metric.name] = metric
+        return metric
+
+    def counter(self, name: str, documentation: str, labelnames: tuple = ()) -> Counter:
+        return self.register(Counter(name, documentation, labelnames))
+
+    def gauge(self, name: str, documentation: str, labelnames: tuple = (), callback=None) -> Gauge:
+        return self.register(Gauge(name, documentation, labelnames, callback))
+
+    def histogram(self, name: str, documentation: str, labelnames: tuple = (), buckets: tuple = DEFAULT_BUCKETS) -> Histogram:
+        return self.register(Histogram(name, documentation, labelnames, buckets))
+
+    def render(self) -> str:
+        lines = []
+        for metric in list(self._metrics.values()):
+            lines.extend(metric.render())
+        return "\n".join(lines) + "\n"
+
+
+registry = Registry()
+
+# HTTP
+http_request_duration = registry.histogram(
+    "http_request_duration_seconds", "Latency of HTTP requests by route template.", ("method", "route", "status"))
+
+# Database
+db_queries_per_request = registry.histogram(
+    "db_queries_per_request", "Number of SQL statements executed per request.", ("route",),
+    buckets=(0, 1, 2, 3, 4, 5, 8, 10, 15, 20, 30, 50, 100))
+db_query_time_per_request = registry.histogram(
+    "db_query_time_per_request_seconds", "Total time spent in SQL statements per request.", ("route",))
+
+# Distance provider
+distance_request_duration = registry.histogram(
+    "distance_api_request_duration_seconds", "Latency of outbound distance lookups.", ("provider",))
+distance_errors = registry.counter(
+    "distance_api_errors", "Failed distance lookups by provider and reason.", ("provider", "reason"))
+distance_cache_hits = registry.counter(
+    "distance_cache_hits", "Distance lookups answered without a remote call.", ("source",))
+
+# No-show sweeper
+no_show_transitions = registry.counter(
+    "no_show_transitions", "Tokens moved by the no-show sweeper, by new state.", ("state",))
+
+# Startup
+startup_phase_seconds = registry.gauge(
+    "app_startup_phase_seconds", "Duration of each worker start-up phase.", ("phase",))
+
+# Password hashing
+bcrypt_inflight = registry.gauge(
+    "bcrypt_inflight", "bcrypt hash/verify calls currently running in a worker thread.")
+
+# Logging pipeline
+log_records_dropped = registry.counter(
+    "log_records_dropped", "Log records discarded before being written.", ("reason",))
+
+# Per-request SQL accumulator: [statement_count, total_seconds], set by the middleware.
+_request_queries: ContextVar[list | None] = ContextVar("request_queries", default=None)
+
+
+def instrument_engine(engine, pool_metrics: bool = True):
+    """
+        Attach statement timing hooks and pool gauges to a SQLAlchemy engine.
+
+        Pass `pool_metrics=False` for secondary engines (read replicas), whose
+        queries should count towards the request totals without redefining the
+        primary's pool gauges.
+    """
+    from sqlalchemy import event
+
+    @event.listens_for(engine, "before_cursor_execute")
+    def _before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+        conn.info.setdefault("metrics_query_start", []).append(time.perf_counter())
+
+    @event.listens_for(engine, "after_cursor_execute")
+    def _after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+        started = conn.info["metrics_query_start"].pop()
+        stats = _request_queries.get()
+        if stats is not None:
+            stats[0] += 1
+            stats[1] += time.perf_counter() - started
+
+    @event.listens_for(engine, "handle_error")
+    def _handle_error(exception_context):
+        # A failed statement never reaches after_cursor_execute; drop its start time
+        starts = exception_context.connection.info.get("metrics_query_start") if exception_context.connection else None
+        if starts:
+            starts.pop()
+
+    if not pool_metrics:
+        return
+    pool = engine.pool
+    registry.gauge("db_pool_checked_out", "Connections currently checked out of the pool.",
+                   callback=getattr(pool, "checkedout", None))
+    registry.gauge("db_pool_size", "Configured size of the connection pool.",
+                   callback=getattr(pool, "size", None))
+    registry.gauge("db_pool_overflow", "Connections opened beyond the pool size.",
+                   callback=getattr(pool, "overflow", None))
+
+
+class MetricsMiddleware:
+    """
+        Pure ASGI middleware recording request latency and per-request SQL usage.
+
+        The route label is the matched path template (e.g. `/users/{name}`) rather
+        than the raw URL, which keeps label cardinality bounded.
+    """
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        status_holder = [500]
+
+        async def send_wrapper(message):
+            if message["type"] == "http.response.start":
+                status_holder[0] = message["status"]
+            await send(message)
+
+        stats = [0, 0.0]
+        token = _request_queries.set(stats)
+        started = time.perf_counter()
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            elapsed = time.perf_counter() - started
+            _request_queries.reset(token)
+            route = scope.get("route")
+            route_path = getattr(route, "path", "unmatched")
+            http_request_duration.labels(scope["method"], route_path, str(status_holder[0])).observe(elapsed)
+            db_queries_per_request.labels(route_path).observe(stats[0])
+            db_query_time_per_request.labels(route_path).observe(stats[1])
@@ -0,0 +1,160 @@
+import asyncio
+from dataclasses import dataclass, field
+from datetime import datetime, timedelta, timezone
+from app.core.config import settings
+from app.utils.metrics import no_show_transitions
+from app.utils.notifier import notifier
+from app.utils.sketches import as_utc
+from app.utils.staffing import staffing_planner
+from app.utils.token_log import record_event
+
+RULES = ("eta", "ping")
+# token log event recorded when a token enters each state
+_EVENTS = {"deferred": "deferred", "waiting": "resumed", "skipped": "skipped"}
+
+
+@dataclass
+class NoShowDecision:
+    """
+        Tokens the sweeper wants to move, with the rules each deferred token broke.
+    """
+    defer: dict[int, list[str]] = field(default_factory=dict)  # token id -> rules
+    resume: list[int] = field(default_factory=list)
+
+
+def evaluate(rows, now: datetime, service_seconds, rules=RULES, head_window: int = 3,
+             eta_grace_minutes: float = 5, ping_minutes: float = 10) -> NoShowDecision:
+    """
+        Apply the no-show rules to the active tokens of every counter.
+
+        `rows` are `get_no_show_candidates` rows, ordered by counter and queue
+        order; `service_seconds(service_id)` is the expected time per token.
+        Walking each counter's queue in order, a token's call time is estimated as
+        the number of tokens still ahead of it (the one being served included)
+        times the service time. A waiting token among the first `head_window`
+        tokens still in line (deferred ones do not take a place) that has not
+        arrived is deferred when
+
+        - `eta`: its travel time exceeds its estimated call time by more than
+          `eta_grace_minutes`, or
+        - `ping`: it has sent no location ping for `ping_minutes`.
+
+        Deferred tokens are re-checked at the position they would take if
+        reinstated, and resumed once no rule applies or their owner has arrived.
+        Deferred tokens do not count as ahead of anyone, so the estimates of the
+        tokens behind them shrink accordingly.
+    """
+    decision = NoShowDecision()
+    silent_before = as_utc(now) - timedelta(minutes=ping_minutes)
+    counter_id, ahead, position = None, 0, 0
+    for row in rows:
+        if row.counter_id != counter_id:
+            counter_id, ahead, position = row.counter_id, 0, 0
+        if row.state == "serving":
+            ahead += 1
+            continue
+        broken = []
+        if not row.reach_out and (row.state == "deferred" or position < head_window):
+            call_in_minutes = ahead * service_seconds(row.service_id) / 60
+            if "eta" in rules and row.duration is not None and row.duration > call_in_minutes + eta_grace_minutes:
+                broken.append("eta")
+            if "ping" in rules and row.last_location_at is not None and as_utc(row.last_location_at) < silent_before:
+                broken.append("ping")
+        if broken:
+            if row.state == "waiting":
+                decision.defer[row.id] = broken
+            continue
+        if row.state == "deferred":
+            decision.resume.append(row.id)
+        ahead += 1
+        position += 1
+    return decision
+
+
+class NoShowSweeper:
+    """
+        Periodically defers tokens whose owners are not going to make it to the
+        counter in time, so counters call the next token instead of waiting.
+
+        Each tick reads the active tokens in one query, decides with `evaluate`
+        and applies all moves with conditional bulk `UPDATE`s:
+
+        - waiting -> deferred: a no-show rule applies. Deferred tokens are never
+          called but keep their place in line.
+        - deferred -> waiting: no rule applies any more (the owner got closer,
+          pinged or arrived); the token is called at its original place.
+        - deferred -> skipped: no location ping for `skip_minutes`; the token is dropped.
+
+        Every move is recorded in the token log, counted in
+        `no_show_transitions_total` and pushed to the token's event subscribers.
+    """
+
+    def __init__(self, interval: float | None = None, rules: tuple[str, ...] | None = None,
+                 head_window: int | None = None, eta_grace_minutes: float | None = None,
+                 ping_minutes: float | None = None, skip_minutes: float | None = None):
+        self.interval = interval or settings.NO_SHOW_INTERVAL_SECONDS
+        self.rules = rules if rules is not None else tuple(
+            rule.strip() for rule in settings.NO_SHOW_RULES.split(",") if rule.strip())
+        unknown = set(self.rules) - set(RULES)
+        if unknown:
+            raise ValueError(f"Unknown no-show rules: {', '.join(sorted(unknown))}")
+        self.head_window = settings.NO_SHOW_HEAD_WINDOW if head_window is None else head_window
+        self.eta_grace_minutes = settings.NO_SHOW_ETA_GRACE_MINUTES if eta_grace_minutes is None else eta_grace_minutes
+        self.ping_minutes = settings.NO_SHOW_PING_MINUTES if ping_minutes is None else ping_minutes
+        self.skip_minutes = settings.NO_SHOW_SKIP_MINUTES if skip_minutes is None else skip_minutes
+        self._task: asyncio.Task | None = None
+
+    async def start(self):
+        if self._task is None:
+            self._task = asyncio.create_task(self._run())
+            settings.logger.info(f"No-show sweeper started, every {self.interval}s, rules: {', '.join(self.rules)}")
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            await asyncio.gather(self._task, return_exceptions=True)
+            self._task = None
+
+    async def _run(self):
+        while True:
+            await asyncio.sleep(self.interval)
+            try:
+                await self.tick()
+            except Exception as e:
+                settings.logger.error(f"No-show sweep failed: {e}")
+
+    async def tick(self, now: datetime | None = None) -> dict[str, int]:
+        """
+            Run one sweep. Returns the number of tokens moved into each state.
+        """
+        from app.db.database import with_session
+
+        now = now or datetime.now(timezone.utc)
+        decision, moves = await asyncio.to_thread(with_session, self._sweep, now)
+        for state, rows in moves.items():
+            if rows:
+                no_show_transitions.labels(state).inc(len(rows))
+            for token_id, token_number, service_id, counter_id in rows:
+                record_event(_EVENTS[state], token_number, service_id, counter_id)
+                event = {"token_number": token_number, "state": state}
+                if state == "deferred":
+                    event["reasons"] = decision.defer.get(token_id, [])
+                notifier.publish(token_number, event)
+        counts = {state: len(rows) for state, rows in moves.items()}
+        if any(counts.values()):
+            settings.logger.info(f"No-show sweep: {counts}")
+        return counts
+
+    def _sweep(self, db, now: datetime):
+        from app.crud.token_management import apply_no_show_transitions, get_no_show_candidates
+
+        staffing_planner.refresh(db)
+        decision = evaluate(
+            get_no_show_candidates(db), now, staffing_planner.mean_service_seconds, self.rules,
+            self.head_window, self.eta_grace_minutes, self.ping_minutes,
+        )
+        silent_since = now - timedelta(minutes=self.skip_minutes) if self.skip_minutes > 0 else None
+        return decision, apply_no_show_transitions(db, list(decision.defer), decision.resume, silent_since)
+
+
+no_show_sweeper = NoShowSweeper()
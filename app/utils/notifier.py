@@ -0,0 +1,147 @@
+import asyncio
+import json
+import threading
+from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor
+from app.core.config import settings
+
+
+class RedisEventChannel:
+    """
+        Token events over Redis pub/sub, so subscribers on every worker see events
+        published by any worker. Any redis-py compatible client works.
+    """
+
+    def __init__(self, client, name: str = "spotqueue:token-events"):
+        self.client = client
+        self.name = name
+
+    def publish(self, message: str):
+        self.client.publish(self.name, message)
+
+    def listen(self, handler, stop: threading.Event):
+        """
+            Call `handler(message)` for every message until `stop` is set. Blocks.
+        """
+        pubsub = self.client.pubsub(ignore_subscribe_messages=True)
+        pubsub.subscribe(self.name)
+        try:
+            while not stop.is_set():
+                message = pubsub.get_message(timeout=1.0)
+                if message is not None:
+                    handler(message["data"])
+        finally:
+            pubsub.close()
+
+
+def build_event_channel():
+    if settings.SHARED_STATE_BACKEND != "redis":
+        return None
+    try:
+        import redis
+    except ImportError as e:
+        raise RuntimeError("SHARED_STATE_BACKEND=redis requires the `redis` package") from e
+    return RedisEventChannel(redis.Redis.from_url(settings.REDIS_URL))
+
+
+class TokenNotifier:
+    """
+        Publish/subscribe channel for token updates.
+
+        Each subscriber gets its own bounded `asyncio.Queue`; a slow subscriber
+        drops its oldest pending event rather than blocking the publisher.
+
+        Without a channel, events only reach subscribers in the publishing
+        process, so with several workers a client streaming from one worker
+        misses updates made by another. With `SHARED_STATE_BACKEND=redis`,
+        `start` connects a `RedisEventChannel`: `publish` sends every event there
+        (from a single background thread, which keeps them in order) and a
+        listener thread hands each received event to this process's subscribers.
+    """
+
+    def __init__(self, queue_size: int = 16, channel=None):
+        self.queue_size = queue_size
+        self.channel = channel
+        self._subscribers: dict[int, set[asyncio.Queue]] = defaultdict(set)
+        self._loop: asyncio.AbstractEventLoop | None = None
+        self._stop: threading.Event | None = None
+        self._listener: threading.Thread | None = None
+        self._sender: ThreadPoolExecutor | None = None
+
+    async def start(self):
+        if self._loop is not None:
+            return
+        self._loop = asyncio.get_running_loop()
+        self.channel = self.channel or build_event_channel()
+        if self.channel is None:
+            return
+        self._stop = threading.Event()
+        self._sender = ThreadPoolExecutor(1, thread_name_prefix="token-events")
+        self._listener = threading.Thread(
+            target=self.channel.listen, args=(self._receive, self._stop), name="token-events-listener", daemon=True,
+        )
+        self._listener.start()
+        settings.logger.info(f"Token events shared through {type(self.channel).__name__}")
+
+    async def stop(self):
+        if self._listener is not None:
+            self._stop.set()
+            await asyncio.to_thread(self._listener.join)
+            self._sender.shutdown(wait=True)
+            self._listener = self._sender = None
+        self._loop = None
+
+    def subscribe(self, token_number: int) -> asyncio.Queue:
+        queue: asyncio.Queue = asyncio.Queue(maxsize=self.queue_size)
+        self._subscribers[token_number].add(queue)
+        return queue
+
+    def unsubscribe(self, token_number: int, queue: asyncio.Queue):
+        subscribers = self._subscribers.get(token_number)
+        if subscribers is not None:
+            subscribers.discard(queue)
+            if not subscribers:
+                del self._subscribers[token_number]
+
+    def publish(self, token_number: int, event: dict):
+        """
+            Push `event` to the token's subscribers.
+
+            Once started, it may also be called from worker threads (sync route
+            handlers); the event is then handed over to the event loop.
+        """
+        loop = self._loop
+        if loop is not None and not _running_on(loop):
+            loop.call_soon_threadsafe(self.publish, token_number, event)
+            return
+        if self._listener is None:
+            self._deliver(token_number, event)
+            return
+        self._sender.submit(self._send, json.dumps({"token_number": token_number, "event": event}))
+
+    def _send(self, message: str):
+        try:
+            self.channel.publish(message)
+        except Exception as e:
+            settings.logger.error(f"Publishing token event failed: {e}")
+
+    def _receive(self, message):
+        # Listener thread: hop onto the event loop that owns the subscriber queues
+        data = json.loads(message)
+        self._loop.call_soon_threadsafe(self._deliver, data["token_number"], data["event"])
+
+    def _deliver(self, token_number: int, event: dict):
+        for queue in list(self._subscribers.get(token_number, ())):
+            if queue.full():
+                queue.get_nowait()
+            queue.put_nowait(event)
+
+
+def _running_on(loop: asyncio.AbstractEventLoop) -> bool:
+    try:
+        return asyncio.get_running_loop() is loop
+    except RuntimeError:
+        return False
+
+
+notifier = TokenNotifier()
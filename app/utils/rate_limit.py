@@ -0,0 +1,212 @@
+import math
+import threading
+import time
+from collections import OrderedDict
+from fastapi import HTTPException
+from app.core.config import settings
+
+
+class InMemoryRateLimitBackend:
+    """
+        Token buckets held in process memory.
+
+        Buckets live in an LRU-ordered dict capped at `max_keys`, so a flood of
+        distinct identities cannot grow memory without bound. Correct for a single
+        worker; use a shared backend when running several.
+    """
+
+    def __init__(self, max_keys: int = 100_000, clock=time.monotonic):
+        self.max_keys = max_keys
+        self.clock = clock
+        self._buckets: OrderedDict[str, list[float]] = OrderedDict()
+        self._lock = threading.Lock()
+
+    def take(self, key: str, rate: float, capacity: float, cost: float = 1.0) -> tuple[bool, float]:
+        """
+            Try to remove `cost` tokens from the bucket at `key`.
+
+            Returns:
+                tuple[bool, float]: Whether the request is allowed and, if not, how
+                many seconds until enough tokens have refilled.
+        """
+        now = self.clock()
+        with self._lock:
+            bucket = self._buckets.get(key)
+            if bucket is None:
+                bucket = [capacity, now]
+                self._buckets[key] = bucket
+                if len(self._buckets) > self.max_keys:
+                    self._buckets.popitem(last=False)
+            else:
+                self._buckets.move_to_end(key)
+                bucket[0] = min(capacity, bucket[0] + (now - bucket[1]) * rate)
+                bucket[1] = now
+            if bucket[0] >= cost:
+                bucket[0] -= cost
+                return True, 0.0
+            return False, (cost - bucket[0]) / rate
+
+
+class RedisRateLimitBackend:
+    """
+        Token buckets shared by every worker through Redis.
+
+        The refill-and-take step runs as one Lua script, so it is atomic on the
+        server without client-side locks. Any client exposing redis-py's
+        `eval(script, numkeys, *keys_and_args)` works.
+    """
+
+    SCRIPT = """
+    local bucket = redis.call('HMGET', KEYS[1], 'tokens', 'ts')
+    local rate = tonumber(ARGV[1])
+    local capacity = tonumber(ARGV[2])
+    local cost = tonumber(ARGV[3])
+    local now = tonumber(ARGV[4])
+    local tokens = tonumber(bucket[1]) or capacity
+    local ts = tonumber(bucket[2]) or now
+    tokens = math.min(capacity, tokens + (now - ts) * rate)
+    local allowed = 0
+    if tokens >= cost then
+        tokens = tokens - cost
+        allowed = 1
+    end
+    redis.call('HSET', KEYS[1], 'tokens', tokens, 'ts', now)
+    redis.call('EXPIRE', KEYS[1], math.ceil(capacity / rate) + 1)
+    return {allowed, tostring(tokens)}
+    """
+
+    def __init__(self, client, prefix: str = "ratelimit:", clock=time.time):
+        self.client = client
+        self.prefix = prefix
+        self.clock = clock
+
+    def take(self, key: str, rate: float, capacity: float, cost: float = 1.0) -> tuple[bool, float]:
+        allowed, tokens = self.client.eval(self.SCRIPT, 1, self.prefix + key, rate, capacity, cost, self.clock())
+        if int(allowed):
+            return True, 0.0
+        return False, (cost - float(tokens)) / rate
+
+
+def build_rate_limit_backend():
+    if settings.RATE_LIMIT_BACKEND == "redis":
+        try:
+            import redis
+        except ImportError as e:
+            raise RuntimeError("RATE_LIMIT_BACKEND=redis requires the `redis` package") from e
+        return RedisRateLimitBackend(redis.Redis.from_url(settings.REDIS_URL))
+    return InMemoryRateLimitBackend()
+
+
+class RateLimiter:
+    """
+        Per-identity, per-endpoint token-bucket limits.
+
+        `limits` maps an endpoint name to `(requests_per_minute, burst)`.
+    """
+
+    def __init__(self, backend=None, limits: dict[str, tuple[float, float]] | None = None):
+        self.backend = backend
+        self.limits = limits if limits is not None else {
+            "token": (settings.RATE_LIMIT_TOKEN_PER_MINUTE, settings.RATE_LIMIT_TOKEN_BURST),
+            "new-location": (settings.RATE_LIMIT_LOCATION_PER_MINUTE, settings.RATE_LIMIT_LOCATION_BURST),
+        }
+
+    def check(self, endpoint: str, identity):
+        """
+            Consume one request for `identity` on `endpoint`.
+
+            Raises:
+                HTTPException: 429 with a `Retry-After` header when the bucket is empty.
+        """
+        if not settings.RATE_LIMIT_ENABLED or endpoint not in self.limits:
+            return
+        if self.backend is None:
+            self.backend = build_rate_limit_backend()
+        per_minute, burst = self.limits[endpoint]
+        allowed, retry_after = self.backend.take(f"{endpoint}:{identity}", per_minute / 60.0, burst)
+        if not allowed:
+            raise HTTPException(
+                status_code=429,
+                detail="Too many requests, please retry later",
+                headers={"Retry-After": str(max(1, math.ceil(retry_after)))},
+            )
+
+
+rate_limiter = RateLimiter()
+
+
+class AdmissionController:
+    """
+        Pure ASGI middleware that sheds load before tail latency collapses.
+
+        Requests are rejected with 503 and `Retry-After` when more than
+        `max_concurrency` are already in flight, when the DB pool has no free
+        connection left, or when the ETA worker queue is nearly full. Rejection
+        costs no database or provider work. `exempt_paths` (e.g. `/metrics`) are
+        always admitted.
+
+        A request stops counting as in flight once its response starts, so
+        long-lived streams such as the token event SSE endpoint do not hold a
+        slot while they idle.
+    """
+
+    def __init__(self, app, max_concurrency: int | None = None, pool=None, eta_pool=None,
+                 exempt_paths: tuple = ("/metrics",), retry_after: int = 1):
+        self.app = app
+        self.max_concurrency = max_concurrency if max_concurrency is not None else settings.ADMISSION_MAX_CONCURRENCY
+        self.pool = pool
+        self.eta_pool = eta_pool
+        self.exempt_paths = exempt_paths
+        self.retry_after = retry_after
+        self.in_flight = 0
+
+    def _overloaded(self) -> str | None:
+        if self.max_concurrency and self.in_flight >= self.max_concurrency:
+            return "concurrency limit reached"
+        pool = self.pool
+        # Pools without a fixed ceiling (overflow of -1, or no QueuePool API) never saturate
+        overflow = getattr(pool, "_max_overflow", -1)
+        if pool is not None and overflow >= 0 and hasattr(pool, "checkedout"):
+            if pool.checkedout() >= pool.size() + overflow:
+                return "database pool saturated"
+        eta_pool = self.eta_pool
+        if eta_pool is not None and eta_pool.running and eta_pool.qsize() >= eta_pool.queue_size * settings.ADMISSION_QUEUE_HIGH_WATERMARK:
+            return "ETA queue saturated"
+        return None
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or scope["path"] in self.exempt_paths:
+            await self.app(scope, receive, send)
+            return
+
+        reason = self._overloaded()
+        if reason is not None:
+            settings.logger.warning(f"Shedding {scope['method']} {scope['path']}: {reason}")
+            body = f'{{"detail":"Service overloaded: {reason}"}}'.encode()
+            await send({
+                "type": "http.response.start",
+                "status": 503,
+                "headers": [
+                    (b"content-type", b"application/json"),
+                    (b"content-length", str(len(body)).encode()),
+                    (b"retry-after", str(self.retry_after).encode()),
+                ],
+            })
+            await send({"type": "http.response.body", "body": body})
+            return
+
+        self.in_flight += 1
+        admitted = True
+
+        async def release_on_start(message):
+            nonlocal admitted
+            if admitted and message["type"] == "http.response.start":
+                admitted = False
+                self.in_flight -= 1
+            await send(message)
+
+        try:
+            await self.app(scope, receive, release_on_start)
+        finally:
+            if admitted:
+                self.in_flight -= 1
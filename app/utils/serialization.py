@@ -0,0 +1,44 @@
+from functools import lru_cache
+from fastapi.responses import JSONResponse, ORJSONResponse, Response
+from pydantic import BaseModel, TypeAdapter
+
+try:
+    import orjson
+except ImportError:  # optional speed-up, fall back to the stdlib encoder
+    orjson = None
+
+# The application's default response class, so plain dict results (login, errors
+# raised through handlers) skip the stdlib encoder. FastAPI's ORJSONResponse
+# requires orjson, hence the fallback.
+default_response_class = ORJSONResponse if orjson is not None else JSONResponse
+
+
+@lru_cache(maxsize=None)
+def list_adapter(schema: type[BaseModel]) -> TypeAdapter:
+    """
+        Returns the compiled `list[schema]` validator/serializer, built once per schema.
+    """
+    return TypeAdapter(list[schema])
+
+
+def model_response(schema: type[BaseModel], obj, status_code: int = 200, headers: dict | None = None) -> Response:
+    """
+        Serializes one ORM object, raw SQL row or schema instance straight to JSON bytes.
+
+        The object is validated with `from_attributes`, so no intermediate dict is
+        built, and the returned `Response` bypasses FastAPI's second validation
+        and `jsonable_encoder` pass for `response_model`.
+    """
+    if not isinstance(obj, schema):
+        obj = schema.model_validate(obj, from_attributes=True)
+    body = schema.__pydantic_serializer__.to_json(obj)
+    return Response(content=body, status_code=status_code, headers=headers, media_type="application/json")
+
+
+def list_response(schema: type[BaseModel], items, status_code: int = 200, headers: dict | None = None) -> Response:
+    """
+        Serializes a sequence of ORM objects or rows as a JSON array of `schema`.
+    """
+    adapter = list_adapter(schema)
+    body = adapter.dump_json(adapter.validate_python(items, from_attributes=True))
+    return Response(content=body, status_code=status_code, headers=headers, media_type="application/json")
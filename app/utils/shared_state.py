@@ -0,0 +1,272 @@
+import mmap
+import os
+import struct
+import tempfile
+import threading
+import zlib
+from contextlib import contextmanager
+from app.core.config import settings
+
+try:
+    import fcntl
+except ImportError:  # not available on Windows
+    fcntl = None
+
+
+class SharedCounters:
+    """
+        Named integer counters shared by every worker process.
+
+        Backends provide `get`, an atomic `incr` returning the new value,
+        `compare_and_swap` and `delete`. Counters start at 0.
+    """
+
+    def get(self, key: str) -> int:
+        raise NotImplementedError
+
+    def incr(self, key: str, amount: int = 1) -> int:
+        raise NotImplementedError
+
+    def compare_and_swap(self, key: str, expected: int, new: int) -> bool:
+        raise NotImplementedError
+
+    def delete(self, key: str):
+        """
+            Drop a counter that is no longer needed; using it again starts from 0.
+        """
+        raise NotImplementedError
+
+    def raise_to(self, key: str, value: int) -> int:
+        """
+            Atomically lift the counter to at least `value` and return its current value.
+
+            Used to seed a counter from the database; concurrent seeders and
+            incrementers can never move it backwards.
+        """
+        while True:
+            current = self.get(key)
+            if current >= value:
+                return current
+            if self.compare_and_swap(key, current, value):
+                return value
+
+
+class MmapCounters(SharedCounters):
+    """
+        Array of counters in a memory-mapped file, for several workers on one host.
+
+        Each slot holds a fixed-width key and a signed 64-bit value. Keys are placed
+        by open addressing from a CRC32 of the key, so every process finds the same
+        slot. Updates hold a `fcntl` byte-range lock on the slot (plus a thread lock,
+        since `fcntl` locks are per process), which makes `incr` and
+        `compare_and_swap` atomic across processes without serializing unrelated keys.
+        Deleted keys leave a tombstone, so probe chains stay intact and the slot
+        is reused by the next new key; every access re-checks the slot's key, so
+        offsets cached by other processes never outlive a delete.
+    """
+
+    RECORD = struct.Struct("<48sq")
+    TOMBSTONE = b"\xff".ljust(48, b"\0")
+
+    def __init__(self, path: str, slots: int = 4096):
+        if fcntl is None:
+            raise RuntimeError("MmapCounters requires fcntl (POSIX)")
+        self.path = path
+        self.slots = slots
+        size = slots * self.RECORD.size
+        self._fd = os.open(path, os.O_RDWR | os.O_CREAT, 0o600)
+        if os.fstat(self._fd).st_size < size:
+            os.ftruncate(self._fd, size)
+        self._mm = mmap.mmap(self._fd, size)
+        self._thread_lock = threading.Lock()
+        self._offsets: dict[str, int] = {}
+
+    @contextmanager
+    def _locked(self, offset: int):
+        with self._thread_lock:
+            fcntl.lockf(self._fd, fcntl.LOCK_EX, self.RECORD.size, offset, os.SEEK_SET)
+            try:
+                yield
+            finally:
+                fcntl.lockf(self._fd, fcntl.LOCK_UN, self.RECORD.size, offset, os.SEEK_SET)
+
+    @staticmethod
+    def _encode(key: str) -> bytes:
+        encoded = key.encode()
+        if len(encoded) > 48:
+            raise ValueError(f"Shared counter key too long: {key!r}")
+        return encoded.ljust(48, b"\0")
+
+    def _offset(self, key: str) -> int:
+        offset = self._offsets.get(key)
+        if offset is not None:
+            return offset
+        wanted = self._encode(key)
+        start = zlib.crc32(key.encode()) % self.slots
+        while True:
+            reusable = None
+            for probe in range(self.slots):
+                offset = ((start + probe) % self.slots) * self.RECORD.size
+                with self._locked(offset):
+                    stored, _ = self.RECORD.unpack_from(self._mm, offset)
+                    if stored == wanted:
+                        break
+                    if stored == self.TOMBSTONE:
+                        if reusable is None:
+                            reusable = offset
+                        continue
+                    if not stored.strip(b"\0"):
+                        if reusable is None:
+                            self.RECORD.pack_into(self._mm, offset, wanted, 0)
+                            break
+                        offset = None
+                        break
+            else:
+                offset = None
+            if offset is None and reusable is not None:
+                # the key is not in the table: take the first tombstone unless someone else did
+                with self._locked(reusable):
+                    stored, _ = self.RECORD.unpack_from(self._mm, reusable)
+                    if stored == self.TOMBSTONE:
+                        self.RECORD.pack_into(self._mm, reusable, wanted, 0)
+                    if stored in (self.TOMBSTONE, wanted):
+                        offset = reusable
+                if offset is None:
+                    continue  # the tombstone went to another key, probe again
+            if offset is None:
+                raise RuntimeError(f"Shared counter file {self.path} is full ({self.slots} slots)")
+            self._offsets[key] = offset
+            return offset
+
+    @contextmanager
+    def _slot(self, key: str):
+        """
+            Lock the slot holding `key` and yield its offset.
+        """
+        wanted = self._encode(key)
+        while True:
+            offset = self._offset(key)
+            with self._locked(offset):
+                if self.RECORD.unpack_from(self._mm, offset)[0] == wanted:
+                    yield offset
+                    return
+            self._offsets.pop(key, None)  # deleted by another process since it was cached
+
+    def get(self, key: str) -> int:
+        with self._slot(key) as offset:
+            return self.RECORD.unpack_from(self._mm, offset)[1]
+
+    def incr(self, key: str, amount: int = 1) -> int:
+        with self._slot(key) as offset:
+            stored, value = self.RECORD.unpack_from(self._mm, offset)
+            value += amount
+            self.RECORD.pack_into(self._mm, offset, stored, value)
+            return value
+
+    def compare_and_swap(self, key: str, expected: int, new: int) -> bool:
+        with self._slot(key) as offset:
+            stored, value = self.RECORD.unpack_from(self._mm, offset)
+            if value != expected:
+                return False
+            self.RECORD.pack_into(self._mm, offset, stored, new)
+            return True
+
+    def delete(self, key: str):
+        with self._slot(key) as offset:
+            self.RECORD.pack_into(self._mm, offset, self.TOMBSTONE, 0)
+        self._offsets.pop(key, None)
+
+    def close(self):
+        self._mm.close()
+        os.close(self._fd)
+
+
+class RedisCounters(SharedCounters):
+    """
+        Counters in a Redis-protocol key-value store, for workers on several hosts.
+
+        `incr` maps to INCRBY and `compare_and_swap` to a small Lua script, so both
+        are atomic on the server. Any redis-py compatible client works.
+    """
+
+    CAS_SCRIPT = """
+    local current = redis.call('GET', KEYS[1]) or '0'
+    if current == ARGV[1] then
+        redis.call('SET', KEYS[1], ARGV[2])
+        return 1
+    end
+    return 0
+    """
+
+    def __init__(self, client, prefix: str = "spotqueue:"):
+        self.client = client
+        self.prefix = prefix
+
+    def get(self, key: str) -> int:
+        return int(self.client.get(self.prefix + key) or 0)
+
+    def incr(self, key: str, amount: int = 1) -> int:
+        return int(self.client.incrby(self.prefix + key, amount))
+
+    def compare_and_swap(self, key: str, expected: int, new: int) -> bool:
+        return bool(int(self.client.eval(self.CAS_SCRIPT, 1, self.prefix + key, str(expected), str(new))))
+
+    def delete(self, key: str):
+        self.client.delete(self.prefix + key)
+
+
+def default_state_path() -> str:
+    # /dev/shm keeps the pages in RAM on Linux; fall back to the temp dir elsewhere
+    directory = "/dev/shm" if os.path.isdir("/dev/shm") else tempfile.gettempdir()
+    return os.path.join(directory, "spotqueue-counters")
+
+
+def build_shared_counters() -> SharedCounters | None:
+    backend = settings.SHARED_STATE_BACKEND
+    if backend == "mmap":
+        return MmapCounters(settings.SHARED_STATE_PATH or default_state_path(), settings.SHARED_STATE_SLOTS)
+    if backend == "redis":
+        try:
+            import redis
+        except ImportError as e:
+            raise RuntimeError("SHARED_STATE_BACKEND=redis requires the `redis` package") from e
+        return RedisCounters(redis.Redis.from_url(settings.REDIS_URL))
+    return None
+
+
+_shared_counters: SharedCounters | None = None
+_shared_counters_built = False
+_seeded: set[str] = set()
+
+
+def get_shared_counters() -> SharedCounters | None:
+    """
+        Returns the process-wide counters, or None when `SHARED_STATE_BACKEND=none`.
+    """
+    global _shared_counters, _shared_counters_built
+    if not _shared_counters_built:
+        _shared_counters = build_shared_counters()
+        _shared_counters_built = True
+    return _shared_counters
+
+
+def set_shared_counters(counters: SharedCounters | None):
+    global _shared_counters, _shared_counters_built
+    _shared_counters = counters
+    _shared_counters_built = True
+    _seeded.clear()
+
+
+def next_value(key: str, seed_loader) -> int:
+    """
+        Atomically allocate the next value of `key` from the shared counters.
+
+        The first use of a key in this process lifts the counter to the value
+        returned by `seed_loader()` (typically a database MAX/COUNT), so shared
+        counters pick up where existing rows left off.
+    """
+    counters = get_shared_counters()
+    if key not in _seeded:
+        counters.raise_to(key, int(seed_loader() or 0))
+        _seeded.add(key)
+    return counters.incr(key)
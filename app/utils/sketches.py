@@ -0,0 +1,265 @@
+import asyncio
+import json
+import math
+import os
+import threading
+import time
+from collections import defaultdict
+from datetime import datetime, timezone
+from app.core.config import settings
+
+
+class DDSketch:
+    """
+        Quantile sketch with a relative-error guarantee (DDSketch).
+
+        Values are counted in logarithmic buckets of ratio `gamma`, so any
+        quantile is returned within `relative_accuracy` of the true value. Two
+        sketches with the same accuracy merge exactly by adding bucket counts,
+        which is what makes per-worker and per-window sketches combinable.
+        Non-positive values (clock skew) are counted in a zero bucket.
+    """
+
+    MIN_VALUE = 1e-9
+
+    def __init__(self, relative_accuracy: float = 0.01):
+        self.relative_accuracy = relative_accuracy
+        self.gamma = (1 + relative_accuracy) / (1 - relative_accuracy)
+        self._log_gamma = math.log(self.gamma)
+        self.bins: dict[int, int] = defaultdict(int)
+        self.zero_count = 0
+        self.count = 0
+        self.sum = 0.0
+        self.min = math.inf
+        self.max = -math.inf
+
+    def add(self, value: float):
+        if value <= self.MIN_VALUE:
+            self.zero_count += 1
+            value = 0.0
+        else:
+            self.bins[math.ceil(math.log(value) / self._log_gamma)] += 1
+        self.count += 1
+        self.sum += value
+        self.min = min(self.min, value)
+        self.max = max(self.max, value)
+
+    def merge(self, other: "DDSketch"):
+        if other.relative_accuracy != self.relative_accuracy:
+            raise ValueError("Cannot merge sketches with different relative accuracy")
+        for index, count in other.bins.items():
+            self.bins[index] += count
+        self.zero_count += other.zero_count
+        self.count += other.count
+        self.sum += other.sum
+        self.min = min(self.min, other.min)
+        self.max = max(self.max, other.max)
+        return self
+
+    def quantile(self, q: float) -> float | None:
+        if self.count == 0:
+            return None
+        rank = q * (self.count - 1)
+        seen = self.zero_count
+        if rank < seen:
+            return 0.0
+        for index in sorted(self.bins):
+            seen += self.bins[index]
+            if seen > rank:
+                value = 2 * self.gamma ** index / (self.gamma + 1)
+                return min(max(value, self.min), self.max)
+        return self.max
+
+    def to_dict(self) -> dict:
+        return {
+            "a": self.relative_accuracy, "z": self.zero_count, "n": self.count, "s": self.sum,
+            "lo": self.min if self.count else None, "hi": self.max if self.count else None,
+            "b": {str(index): count for index, count in self.bins.items()},
+        }
+
+    @classmethod
+    def from_dict(cls, data: dict) -> "DDSketch":
+        sketch = cls(data["a"])
+        sketch.zero_count, sketch.count, sketch.sum = data["z"], data["n"], data["s"]
+        if sketch.count:
+            sketch.min, sketch.max = data["lo"], data["hi"]
+        for index, count in data["b"].items():
+            sketch.bins[int(index)] = count
+        return sketch
+
+
+class LatencySketches:
+    """
+        Per-window DDSketches keyed by `(metric, service_id, counter_id)`.
+
+        Each `window_seconds` bucket keeps its own sketches and only the last
+        `retention_windows` are kept, so any time range is answered by merging a
+        handful of windows. Workers share results by periodically writing their
+        sketches to `directory` and merging the other workers' files on read, which
+        keeps the analytics endpoint free of database queries.
+    """
+
+    def __init__(self, window_seconds: float = 300, retention_windows: int = 288,
+                 relative_accuracy: float = 0.01, directory: str | None = None, clock=time.time):
+        self.window_seconds = window_seconds
+        self.retention_windows = retention_windows
+        self.relative_accuracy = relative_accuracy
+        self.directory = directory
+        self.clock = clock
+        self._windows: dict[int, dict[tuple, DDSketch]] = {}
+        self._lock = threading.Lock()
+        self._task: asyncio.Task | None = None
+
+    async def start(self, interval: float):
+        if self._task is None and self.directory:
+            self._task = asyncio.create_task(self._run(interval))
+            settings.logger.info(f"Latency sketches flushed to {self.directory} every {interval}s")
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            await asyncio.gather(self._task, return_exceptions=True)
+            self._task = None
+            await asyncio.to_thread(self.flush, self.directory)
+
+    async def _run(self, interval: float):
+        while True:
+            await asyncio.sleep(interval)
+            try:
+                await asyncio.to_thread(self.flush, self.directory)
+            except OSError as e:
+                settings.logger.error(f"Could not flush latency sketches: {e}")
+
+    def _window(self, at: float) -> int:
+        return int(at // self.window_seconds)
+
+    def record(self, metric: str, service_id: int, counter_id: int, seconds: float, at: float | None = None):
+        window = self._window(self.clock() if at is None else at)
+        with self._lock:
+            sketches = self._windows.setdefault(window, {})
+            key = (metric, service_id, counter_id)
+            sketch = sketches.get(key)
+            if sketch is None:
+                sketch = sketches[key] = DDSketch(self.relative_accuracy)
+            sketch.add(seconds)
+            oldest = window - self.retention_windows
+            for stale in [w for w in self._windows if w <= oldest]:
+                del self._windows[stale]
+
+    def _merge_windows(self, windows: dict, since_window: int, into: dict):
+        for window, sketches in windows.items():
+            if window < since_window:
+                continue
+            for key, sketch in sketches.items():
+                if key in into:
+                    into[key].merge(sketch)
+                else:
+                    into[key] = DDSketch(sketch.relative_accuracy).merge(sketch)
+
+    def collect(self, seconds: float) -> dict[tuple, DDSketch]:
+        """
+            Merge every sketch from the last `seconds`, including other workers' flushed files.
+        """
+        since_window = self._window(self.clock() - seconds)
+        merged: dict[tuple, DDSketch] = {}
+        with self._lock:
+            self._merge_windows(self._windows, since_window, merged)
+        if self.directory:
+            for windows in self._load_peers(self.directory):
+                self._merge_windows(windows, since_window, merged)
+        return merged
+
+    def to_json(self) -> dict:
+        with self._lock:
+            return {
+                str(window): [[*key, sketch.to_dict()] for key, sketch in sketches.items()]
+                for window, sketches in self._windows.items()
+            }
+
+    @staticmethod
+    def windows_from_json(data: dict) -> dict[int, dict[tuple, DDSketch]]:
+        return {
+            int(window): {(metric, service_id, counter_id): DDSketch.from_dict(sketch)
+                          for metric, service_id, counter_id, sketch in entries}
+            for window, entries in data.items()
+        }
+
+    def flush(self, directory: str):
+        os.makedirs(directory, exist_ok=True)
+        path = os.path.join(directory, f"sketches-{os.getpid()}.json")
+        with open(f"{path}.tmp", "w") as output:
+            json.dump(self.to_json(), output, separators=(",", ":"))
+        os.replace(f"{path}.tmp", path)
+
+    def _load_peers(self, directory: str):
+        own = f"sketches-{os.getpid()}.json"
+        max_age = self.window_seconds * self.retention_windows
+        try:
+            names = os.listdir(directory)
+        except FileNotFoundError:
+            return
+        for name in names:
+            if name == own or not (name.startswith("sketches-") and name.endswith(".json")):
+                continue
+            path = os.path.join(directory, name)
+            try:
+                if self.clock() - os.path.getmtime(path) > max_age:
+                    continue  # a worker that exited long ago
+                with open(path) as peer:
+                    yield self.windows_from_json(json.load(peer))
+            except (OSError, ValueError) as e:
+                settings.logger.warning(f"Skipping unreadable sketch file {path}: {e}")
+
+
+def as_utc(value: datetime) -> datetime:
+    """
+        `value` as an aware UTC datetime, treating naive values as UTC
+        (SQLite returns stored UTC datetimes without tzinfo).
+    """
+    return value.replace(tzinfo=timezone.utc) if value.tzinfo is None else value.astimezone(timezone.utc)
+
+
+def seconds_between(start: datetime | None, end: datetime | None) -> float | None:
+    """
+        Elapsed seconds between two timestamps, treating naive values as UTC.
+    """
+    if start is None or end is None:
+        return None
+    return (as_utc(end) - as_utc(start)).total_seconds()
+
+
+latency_sketches = LatencySketches(
+    settings.ANALYTICS_WINDOW_SECONDS, settings.ANALYTICS_RETENTION_WINDOWS, directory=settings.ANALYTICS_SKETCH_DIR,
+)
+
+
+def summarize(sketches: dict[tuple, DDSketch], quantiles: tuple[float, ...]) -> dict:
+    """
+        Roll merged sketches up per counter and per service into quantile summaries.
+    """
+    per_counter: dict[tuple, dict[str, DDSketch]] = {}
+    per_service: dict[int, dict[str, DDSketch]] = {}
+    for (metric, service_id, counter_id), sketch in sketches.items():
+        per_counter.setdefault((service_id, counter_id), {})[metric] = sketch
+        service = per_service.setdefault(service_id, {})
+        if metric in service:
+            service[metric].merge(sketch)
+        else:
+            service[metric] = DDSketch(sketch.relative_accuracy).merge(sketch)
+
+    def describe(metrics: dict[str, DDSketch]) -> dict:
+        return {
+            metric: {
+                "count": sketch.count,
+                "mean": sketch.sum / sketch.count,
+                **{f"p{round(q * 100, 1):g}": sketch.quantile(q) for q in quantiles},
+            }
+            for metric, sketch in metrics.items()
+        }
+
+    return {
+        "counters": [{"service_id": service_id, "counter_id": counter_id, **describe(metrics)}
+                     for (service_id, counter_id), metrics in sorted(per_counter.items())],
+        "services": [{"service_id": service_id, **describe(metrics)}
+                     for service_id, metrics in sorted(per_service.items())],
+    }
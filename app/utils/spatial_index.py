@@ -0,0 +1,164 @@
+import math
+import threading
+from dataclasses import dataclass
+from sqlalchemy.orm import Session
+from app.utils.table_versions import table_versions
+
+EARTH_RADIUS_KM = 6371.0088
+
+
+@dataclass(frozen=True)
+class SiteLocation:
+    """
+        A single open branch of a service as held by the spatial index.
+
+        Attributes:
+            id (int): The primary key of the `service_sites` row.
+            service_id (int): The service this branch belongs to.
+            latitude (float): Latitude of the branch.
+            longitude (float): Longitude of the branch.
+    """
+    id: int
+    service_id: int
+    latitude: float
+    longitude: float
+
+    @property
+    def coordinates(self) -> tuple[float, float]:
+        return (self.latitude, self.longitude)
+
+
+def _to_unit_vector(latitude: float, longitude: float) -> tuple[float, float, float]:
+    """
+        Project a latitude/longitude pair onto the unit sphere.
+
+        The straight-line (chord) distance between two such vectors grows
+        monotonically with the great-circle distance, so a plain Euclidean
+        KD-tree over them returns exact nearest neighbours on the globe.
+    """
+    lat = math.radians(latitude)
+    lon = math.radians(longitude)
+    cos_lat = math.cos(lat)
+    return (cos_lat * math.cos(lon), cos_lat * math.sin(lon), math.sin(lat))
+
+
+def chord_to_km(chord: float) -> float:
+    """
+        Convert a chord length on the unit sphere to a great-circle distance in kilometres.
+    """
+    return 2 * EARTH_RADIUS_KM * math.asin(min(1.0, chord / 2))
+
+
+class KDTree:
+    """
+        Static 3-d tree over unit vectors, built once and queried many times.
+
+        Nodes are stored as flat tuples `(point, item, axis, left, right)` so the
+        query loop avoids attribute lookups. Building is O(n log n) and a
+        nearest-neighbour query is O(log n) on average.
+    """
+
+    def __init__(self, items: list[tuple[tuple[float, float, float], object]]):
+        self._root = self._build(list(items), 0)
+        self.size = len(items)
+
+    def _build(self, items, depth):
+        if not items:
+            return None
+        axis = depth % 3
+        items.sort(key=lambda entry: entry[0][axis])
+        median = len(items) // 2
+        point, item = items[median]
+        return (
+            point,
+            item,
+            axis,
+            self._build(items[:median], depth + 1),
+            self._build(items[median + 1:], depth + 1),
+        )
+
+    def nearest(self, query: tuple[float, float, float]):
+        """
+            Return `(item, chord_distance)` for the point closest to `query`,
+            or `(None, inf)` if the tree is empty.
+        """
+        best_item = None
+        best_sq = math.inf
+        stack = [self._root]
+        while stack:
+            node = stack.pop()
+            if node is None:
+                continue
+            point, item, axis, left, right = node
+            dx = point[0] - query[0]
+            dy = point[1] - query[1]
+            dz = point[2] - query[2]
+            dist_sq = dx * dx + dy * dy + dz * dz
+            if dist_sq < best_sq:
+                best_sq = dist_sq
+                best_item = item
+            diff = query[axis] - point[axis]
+            near, far = (left, right) if diff < 0 else (right, left)
+            # Only descend into the far side if the splitting plane is closer than the best match.
+            if diff * diff < best_sq:
+                stack.append(far)
+            stack.append(near)
+        return best_item, math.sqrt(best_sq)
+
+
+class SiteIndex:
+    """
+        In-memory nearest-branch lookup, one KD-tree per service.
+
+        The index is loaded lazily from the `service_sites` table on first use and
+        rebuilt whenever the `service_sites` table version moves, so with a
+        shared-state backend a site added through any worker reaches every
+        worker's index. Readers never take a lock: a rebuild constructs new
+        trees and swaps them in with one assignment.
+    """
+
+    def __init__(self):
+        self._state: tuple[int, dict[int, KDTree]] | None = None  # table version, trees
+        self._lock = threading.Lock()
+
+    def invalidate(self):
+        self._state = None
+
+    def rebuild(self, db: Session, version: int | None = None):
+        from app.models.site_models import ServiceSite
+
+        version = table_versions.get("service_sites") if version is None else version
+        rows = db.query(ServiceSite).filter(ServiceSite.is_open.is_(True)).all()
+        grouped: dict[int, list] = {}
+        for row in rows:
+            site = SiteLocation(id=row.id, service_id=row.service_id, latitude=row.latitude, longitude=row.longitude)
+            grouped.setdefault(row.service_id, []).append((_to_unit_vector(row.latitude, row.longitude), site))
+        self._state = version, {service_id: KDTree(items) for service_id, items in grouped.items()}
+
+    def _ensure_loaded(self, db: Session) -> dict[int, KDTree]:
+        version = table_versions.get("service_sites")
+        state = self._state
+        if state is None or state[0] != version:
+            with self._lock:
+                state = self._state
+                if state is None or state[0] != version:
+                    self.rebuild(db, version)
+                    state = self._state
+        return state[1]
+
+    def nearest(self, db: Session, service_id: int, latitude: float, longitude: float):
+        """
+            Find the closest open branch of a service.
+
+            Returns:
+                tuple[SiteLocation | None, float]: The nearest site and its great-circle
+                distance in kilometres, or `(None, inf)` if the service has no open sites.
+        """
+        tree = self._ensure_loaded(db).get(service_id)
+        if tree is None:
+            return None, math.inf
+        site, chord = tree.nearest(_to_unit_vector(latitude, longitude))
+        return site, chord_to_km(chord)
+
+
+site_index = SiteIndex()
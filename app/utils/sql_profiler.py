@@ -0,0 +1,166 @@
+import re
+import time
+from collections import Counter
+from contextlib import contextmanager
+from contextvars import ContextVar
+from app.core.config import settings
+
+_STRING_LITERAL = re.compile(r"'(?:[^']|'')*'")
+_NUMBER_LITERAL = re.compile(r"\b\d+(?:\.\d+)?\b")
+_BIND_LIST = re.compile(r"\(\s*(?:\?|%\(\w+\)s|:\w+)(?:\s*,\s*(?:\?|%\(\w+\)s|:\w+))*\s*\)")
+_WHITESPACE = re.compile(r"\s+")
+
+# Per-route overrides of `settings.SQL_QUERY_BUDGET`, keyed by route template.
+route_budgets: dict[str, int] = {}
+
+
+class QueryBudgetExceeded(AssertionError):
+    """
+        Raised in strict mode when a request runs more statements than its budget.
+
+        Subclasses `AssertionError` so it fails a pytest test like a plain `assert`.
+    """
+
+
+def normalize_statement(statement: str) -> str:
+    """
+        Reduce a SQL statement to its shape so repeated lookups compare equal.
+
+        Literals become `?` and bind lists such as `IN (?, ?, ?)` collapse to `(?)`,
+        so `SELECT ... WHERE id = 1` and `... WHERE id = 2` share one shape.
+    """
+    shape = _STRING_LITERAL.sub("?", statement)
+    shape = _NUMBER_LITERAL.sub("?", shape)
+    shape = _BIND_LIST.sub("(?)", shape)
+    return _WHITESPACE.sub(" ", shape).strip()
+
+
+class RequestProfile:
+    """
+        Statements executed while handling a single request (or a `query_budget` block).
+    """
+
+    def __init__(self):
+        self.shapes: Counter = Counter()
+        self.count = 0
+        self.total_seconds = 0.0
+
+    def record(self, statement: str, seconds: float):
+        self.shapes[normalize_statement(statement)] += 1
+        self.count += 1
+        self.total_seconds += seconds
+
+    def repeated(self, threshold: int | None = None) -> dict[str, int]:
+        """
+            Statement shapes executed at least `threshold` times, the usual N+1 signature.
+        """
+        threshold = threshold or settings.SQL_REPEAT_THRESHOLD
+        return {shape: count for shape, count in self.shapes.items() if count >= threshold}
+
+    def summary(self) -> str:
+        return f"{self.count} queries in {self.total_seconds * 1000:.2f} ms"
+
+
+_current_profile: ContextVar[RequestProfile | None] = ContextVar("sql_profile", default=None)
+
+
+def install_profiler(engine):
+    """
+        Hook statement timing into an engine. The hooks are cheap no-ops for any
+        code path that is not running inside a profiled request.
+    """
+    from sqlalchemy import event
+
+    @event.listens_for(engine, "before_cursor_execute")
+    def _before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+        if _current_profile.get() is not None:
+            conn.info.setdefault("profiler_query_start", []).append(time.perf_counter())
+
+    @event.listens_for(engine, "after_cursor_execute")
+    def _after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+        profile = _current_profile.get()
+        if profile is not None:
+            started = conn.info["profiler_query_start"].pop()
+            profile.record(statement, time.perf_counter() - started)
+
+    @event.listens_for(engine, "handle_error")
+    def _handle_error(exception_context):
+        # A failed statement never reaches after_cursor_execute; drop its start time
+        starts = exception_context.connection.info.get("profiler_query_start") if exception_context.connection else None
+        if starts and _current_profile.get() is not None:
+            starts.pop()
+
+
+def check_budget(profile: RequestProfile, budget: int, label: str):
+    if profile.count > budget:
+        raise QueryBudgetExceeded(
+            f"{label} ran {profile.count} SQL statements, budget is {budget}; repeated shapes: {profile.repeated()}"
+        )
+
+
+@contextmanager
+def query_budget(max_queries: int, label: str = "block"):
+    """
+        Fail when the enclosed code runs more than `max_queries` statements.
+
+        Intended for tests:
+
+            with query_budget(3, "GET /services/"):
+                client.get("/services/")
+    """
+    profile = RequestProfile()
+    token = _current_profile.set(profile)
+    try:
+        yield profile
+    finally:
+        _current_profile.reset(token)
+    check_budget(profile, max_queries, label)
+
+
+class SQLProfilerMiddleware:
+    """
+        Pure ASGI middleware that profiles the SQL issued by each request.
+
+        Adds `X-SQL-Queries`, `X-SQL-Time-ms` and, when N+1 patterns are found,
+        `X-SQL-Repeated` response headers, and logs a one-line summary. With
+        `settings.SQL_PROFILER_STRICT` enabled, a request over its budget raises
+        `QueryBudgetExceeded`, which `TestClient` surfaces as a failing test.
+    """
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        profile = RequestProfile()
+        token = _current_profile.set(profile)
+
+        async def send_wrapper(message):
+            if message["type"] == "http.response.start":
+                headers = list(message.get("headers", []))
+                headers.append((b"x-sql-queries", str(profile.count).encode()))
+                headers.append((b"x-sql-time-ms", f"{profile.total_seconds * 1000:.2f}".encode()))
+                repeated = profile.repeated()
+                if repeated:
+                    headers.append((b"x-sql-repeated", str(max(repeated.values())).encode()))
+                message = {**message, "headers": headers}
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            _current_profile.reset(token)
+
+        route_path = getattr(scope.get("route"), "path", scope["path"])
+        label = f"{scope['method']} {route_path}"
+        repeated = profile.repeated()
+        if repeated:
+            settings.logger.warning(f"SQL profile {label}: {profile.summary()}, possible N+1: {repeated}")
+        else:
+            settings.logger.info(f"SQL profile {label}: {profile.summary()}")
+
+        if settings.SQL_PROFILER_STRICT:
+            check_budget(profile, route_budgets.get(route_path, settings.SQL_QUERY_BUDGET), label)
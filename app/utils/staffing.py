@@ -0,0 +1,227 @@
+import math
+import threading
+import time
+from collections import OrderedDict
+from datetime import datetime, timedelta
+from zoneinfo import ZoneInfo
+from sqlalchemy.orm import Session
+from app.core.config import settings
+from app.utils.sketches import as_utc
+
+HOURS_PER_WEEK = 168
+WEEKDAYS = ("Mon", "Tue", "Wed", "Thu", "Fri", "Sat", "Sun")
+_ARRIVAL_BATCH = 50_000
+
+
+def erlang_c(offered_load: float, servers: int) -> float:
+    """
+        Probability that an arrival has to wait in an M/M/c queue.
+
+        `offered_load` is arrival rate x mean service time (in Erlangs). Uses the
+        Erlang B recursion, which stays numerically stable for large `servers`.
+    """
+    if offered_load <= 0:
+        return 0.0
+    if servers <= offered_load:
+        return 1.0
+    blocking = 1.0
+    for k in range(1, servers + 1):
+        blocking = offered_load * blocking / (k + offered_load * blocking)
+    return servers * blocking / (servers - offered_load * (1 - blocking))
+
+
+def service_level(offered_load: float, servers: int, service_seconds: float, target_wait: float) -> float:
+    """
+        Share of arrivals that start service within `target_wait` seconds.
+    """
+    if offered_load <= 0:
+        return 1.0
+    if servers <= offered_load:
+        return 0.0
+    return 1 - erlang_c(offered_load, servers) * math.exp(-(servers - offered_load) * target_wait / service_seconds)
+
+
+def recommend_counters(arrivals_per_hour: float, service_seconds: float, target_wait: float,
+                       target_percentile: float, max_counters: int = 500) -> dict:
+    """
+        Smallest number of counters that serves `target_percentile` of arrivals within `target_wait`.
+    """
+    offered_load = arrivals_per_hour * service_seconds / 3600
+    if offered_load <= 0:
+        return {"counters": 0, "offered_load": 0.0, "probability_of_wait": 0.0,
+                "expected_wait_seconds": 0.0, "service_level": 1.0}
+    counters = math.floor(offered_load) + 1
+    while (service_level(offered_load, counters, service_seconds, target_wait) < target_percentile
+           and counters < max_counters):
+        counters += 1
+    waiting = erlang_c(offered_load, counters)
+    return {
+        "counters": counters,
+        "offered_load": offered_load,
+        "probability_of_wait": waiting,
+        "expected_wait_seconds": waiting * service_seconds / (counters - offered_load),
+        "service_level": service_level(offered_load, counters, service_seconds, target_wait),
+    }
+
+
+class StaffingPlanner:
+    """
+        Counter recommendations per service and hour of week from historical load.
+
+        Arrival counts per hour-of-week slot (in `STAFFING_TIMEZONE`) and service
+        time totals are kept as running aggregates. `refresh` only reads tokens
+        issued or served since the previous refresh, at most every
+        `refresh_interval` seconds, by one thread at a time. Ids and `served_at`
+        values can commit out of order across workers, so each refresh re-reads
+        `overlap_ids` ids and `overlap_seconds` behind its watermarks and skips
+        the rows it has already counted. Both scans run in batches and
+        outside the aggregate lock, so plans and `mean_service_seconds` are never
+        held up by the database. The `cache_size` most recently used plans are
+        cached per service and targets, and recomputed only when that service's
+        aggregates have changed.
+    """
+
+    def __init__(self, refresh_interval: float = 60, tz: str = "UTC", clock=time.monotonic, cache_size: int = 256,
+                 overlap_ids: int = 1000, overlap_seconds: float = 300):
+        self.refresh_interval = refresh_interval
+        self.tz = ZoneInfo(tz)
+        self.clock = clock
+        self.cache_size = cache_size
+        self.overlap_ids = overlap_ids
+        self.overlap = timedelta(seconds=overlap_seconds)
+        self._arrivals: dict[int, list[int]] = {}
+        self._span: dict[int, list[datetime]] = {}  # service_id -> [first, last] issue time
+        self._service_time: dict[int, list[float]] = {}  # service_id -> [total seconds, samples]
+        self._versions: dict[int, int] = {}
+        self._last_id = 0
+        self._last_served_at: datetime | None = None
+        self._seen_arrivals: set[int] = set()  # ids counted within overlap_ids of _last_id
+        self._seen_served: dict[int, datetime] = {}  # id -> served_at, within overlap of _last_served_at
+        self._refreshed_at = -math.inf
+        self._cache: OrderedDict[tuple, tuple[int, dict]] = OrderedDict()
+        self._lock = threading.Lock()  # aggregates and cache
+        self._refresh_lock = threading.Lock()  # one refresh at a time
+
+    def _changed(self, service_id: int):
+        self._versions[service_id] = self._versions.get(service_id, 0) + 1
+
+    def refresh(self, db: Session, force: bool = False) -> bool:
+        """
+            Fold tokens issued or served since the last refresh into the aggregates.
+        """
+        from app.crud.token_management import get_arrivals_after, get_service_times_after
+
+        if not force and self.clock() - self._refreshed_at < self.refresh_interval:
+            return False
+        # Another thread already refreshing has the same rows to read
+        if not self._refresh_lock.acquire(blocking=force):
+            return False
+        try:
+            if not force and self.clock() - self._refreshed_at < self.refresh_interval:
+                return False
+            self._refreshed_at = self.clock()
+            # Only the refresh lock holder moves the watermarks and the seen ids
+            after_id = max(0, self._last_id - self.overlap_ids)
+            while True:
+                rows = get_arrivals_after(db, after_id, _ARRIVAL_BATCH)
+                with self._lock:
+                    for token_id, service_id, issue_time in rows:
+                        if token_id in self._seen_arrivals:
+                            continue
+                        self._seen_arrivals.add(token_id)
+                        issued = as_utc(issue_time)
+                        local = issued.astimezone(self.tz)
+                        counts = self._arrivals.setdefault(service_id, [0] * HOURS_PER_WEEK)
+                        counts[local.weekday() * 24 + local.hour] += 1
+                        span = self._span.setdefault(service_id, [issued, issued])
+                        span[0], span[1] = min(span[0], issued), max(span[1], issued)
+                        self._changed(service_id)
+                        self._last_id = max(self._last_id, token_id)
+                if len(rows) < _ARRIVAL_BATCH:
+                    break
+                after_id = rows[-1][0]
+            self._seen_arrivals = {token_id for token_id in self._seen_arrivals if token_id > self._last_id - self.overlap_ids}
+
+            served_after = self._last_served_at - self.overlap if self._last_served_at is not None else None
+            after_id = 0
+            while True:
+                rows = get_service_times_after(db, served_after, after_id, _ARRIVAL_BATCH)
+                with self._lock:
+                    for token_id, service_id, called_at, served_at in rows:
+                        if token_id in self._seen_served:
+                            continue
+                        self._seen_served[token_id] = served_at
+                        totals = self._service_time.setdefault(service_id, [0.0, 0])
+                        totals[0] += max(0.0, (as_utc(served_at) - as_utc(called_at)).total_seconds())
+                        totals[1] += 1
+                        self._changed(service_id)
+                        if self._last_served_at is None or served_at > self._last_served_at:
+                            self._last_served_at = served_at
+                if len(rows) < _ARRIVAL_BATCH:
+                    break
+                after_id, served_after = rows[-1][0], rows[-1][3]
+            if self._last_served_at is not None:
+                horizon = self._last_served_at - self.overlap
+                self._seen_served = {token_id: at for token_id, at in self._seen_served.items() if at >= horizon}
+            return True
+        finally:
+            self._refresh_lock.release()
+
+    def mean_service_seconds(self, service_id: int) -> float:
+        """
+            Observed mean service time of a service, or `STAFFING_DEFAULT_SERVICE_SECONDS` before any sample.
+        """
+        with self._lock:
+            total, samples = self._service_time.get(service_id, (0.0, 0))
+        return total / samples if samples else settings.STAFFING_DEFAULT_SERVICE_SECONDS
+
+    def plan(self, db: Session, service_id: int, target_wait: float | None = None,
+             target_percentile: float | None = None) -> dict:
+        target_wait = settings.STAFFING_TARGET_WAIT_SECONDS if target_wait is None else target_wait
+        target_percentile = settings.STAFFING_TARGET_PERCENTILE if target_percentile is None else target_percentile
+        self.refresh(db)
+        key = (service_id, target_wait, target_percentile)
+        with self._lock:
+            version = self._versions.get(service_id, 0)
+            cached = self._cache.get(key)
+            if cached is not None and cached[0] == version:
+                self._cache.move_to_end(key)
+                return cached[1]
+            counts = list(self._arrivals.get(service_id, [0] * HOURS_PER_WEEK))
+            span = self._span.get(service_id)
+            total, samples = self._service_time.get(service_id, (0.0, 0))
+
+        # Each slot occurs once a week; anything shorter than a week counts as one occurrence
+        weeks = max(1.0, (span[1] - span[0]).total_seconds() / (7 * 86400)) if span else 1.0
+        service_seconds = total / samples if samples else settings.STAFFING_DEFAULT_SERVICE_SECONDS
+        hours = []
+        for slot, arrivals in enumerate(counts):
+            arrivals_per_hour = arrivals / weeks
+            hours.append({
+                "day": WEEKDAYS[slot // 24],
+                "hour": slot % 24,
+                "arrivals_per_hour": arrivals_per_hour,
+                **recommend_counters(arrivals_per_hour, service_seconds, target_wait, target_percentile),
+            })
+        result = {
+            "service_id": service_id,
+            "target_wait_seconds": target_wait,
+            "target_percentile": target_percentile,
+            "mean_service_seconds": service_seconds,
+            "service_time_samples": samples,
+            "weeks_observed": weeks,
+            "peak_counters": max(hour["counters"] for hour in hours),
+            "hours": hours,
+        }
+        with self._lock:
+            self._cache[key] = (version, result)
+            self._cache.move_to_end(key)
+            while len(self._cache) > self.cache_size:
+                self._cache.popitem(last=False)
+        return result
+
+
+staffing_planner = StaffingPlanner(settings.STAFFING_REFRESH_SECONDS, settings.STAFFING_TIMEZONE,
+                                   cache_size=settings.STAFFING_PLAN_CACHE_SIZE,
+                                   overlap_ids=settings.STAFFING_OVERLAP_IDS,
+                                   overlap_seconds=settings.STAFFING_OVERLAP_SECONDS)
@@ -0,0 +1,38 @@
+import time
+from contextlib import contextmanager
+from app.core.config import settings
+from app.utils.metrics import startup_phase_seconds
+
+
+class StartupTimer:
+    """
+        Records how long each worker start-up phase takes.
+
+        Phases are exported as `app_startup_phase_seconds{phase=...}` and logged
+        once the worker is ready, so slow cold starts show up per phase.
+    """
+
+    def __init__(self):
+        self.phases: dict[str, float] = {}
+
+    def record(self, name: str, seconds: float):
+        self.phases[name] = seconds
+        startup_phase_seconds.labels(name).set(seconds)
+
+    @contextmanager
+    def phase(self, name: str):
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.record(name, time.perf_counter() - started)
+
+    def report(self):
+        # "total" from an earlier lifespan (tests, reload) is not a phase of this one
+        total = sum(seconds for name, seconds in self.phases.items() if name != "total")
+        self.record("total", total)
+        details = ", ".join(f"{name}={seconds * 1000:.1f}ms" for name, seconds in self.phases.items() if name != "total")
+        settings.logger.info(f"Worker ready in {total * 1000:.1f}ms ({details})")
+
+
+startup_timer = StartupTimer()
@@ -0,0 +1,99 @@
+import time
+from fastapi import Request
+from fastapi.responses import Response
+from app.core.config import settings
+from app.utils.shared_state import get_shared_counters
+
+
+class TableVersions:
+    """
+        Cheap per-table change counters used to build catalog ETags.
+
+        Write paths call `bump(table)` after committing. With a shared-state
+        backend the counters live there, so every worker hands out the same ETag
+        for the same data. Without one they are per process: still good enough
+        for in-process caches such as the site index, but a worker cannot see
+        another worker's writes, so `not_modified` hands out no ETags at all.
+
+        Catalog handlers read from replicas, which may lag the tag. A bump also
+        records when the table changed, and `settled` reports whether that was
+        longer ago than `settings.READ_YOUR_WRITES_SECONDS`, the lag the replica
+        router already tolerates; until then `not_modified` does not tag full
+        responses, so rows from a lagging replica are never cached under the
+        current version.
+    """
+
+    def __init__(self):
+        self._local: dict[str, int] = {}
+
+    def bump(self, table: str):
+        counters = get_shared_counters()
+        if counters is not None:
+            counters.incr(f"version:{table}")
+            counters.raise_to(f"changed:{table}", int(time.time() * 1000))
+        else:
+            self._local[table] = self._local.get(table, 0) + 1
+
+    def get(self, table: str) -> int:
+        counters = get_shared_counters()
+        if counters is not None:
+            return counters.get(f"version:{table}")
+        return self._local.get(table, 0)
+
+    def settled(self, *tables: str) -> bool:
+        """
+            True when none of `tables` changed within the replica lag allowance.
+        """
+        counters = get_shared_counters()
+        if counters is None:
+            return True
+        since = int((time.time() - settings.READ_YOUR_WRITES_SECONDS) * 1000)
+        return all(counters.get(f"changed:{table}") <= since for table in tables)
+
+    def etag(self, *tables: str) -> str:
+        return 'W/"' + "-".join(str(self.get(table)) for table in tables) + '"'
+
+
+table_versions = TableVersions()
+
+
+def etag_matches(if_none_match: str | None, etag: str) -> bool:
+    if not if_none_match:
+        return False
+    if if_none_match.strip() == "*":
+        return True
+    wanted = etag.removeprefix("W/")
+    return any(candidate.strip().removeprefix("W/") == wanted for candidate in if_none_match.split(","))
+
+
+def cache_headers(etag: str) -> dict:
+    return {
+        "ETag": etag,
+        "Cache-Control": f"public, max-age={settings.CATALOG_CACHE_MAX_AGE_SECONDS}, must-revalidate",
+    }
+
+
+def not_modified(request: Request, *tables: str) -> tuple[dict, Response | None]:
+    """
+        Compute the catalog ETag for `tables` and check the request against it.
+
+        Returns the cache headers to put on a full response and, when the client's
+        `If-None-Match` already matches, a ready 304 response. Call it before any
+        query so unchanged polls cost neither database work nor serialization.
+
+        Without a shared-state backend the versions are per process, so a tag
+        from one worker could hide another worker's writes; no headers are
+        returned and every request gets a full response.
+
+        Right after a change the full response is left untagged (replicas may
+        not have it yet), but a client already holding the current tag still
+        gets its 304: that tag was only handed out once the replicas caught up.
+    """
+    if get_shared_counters() is None:
+        return {}, None
+    headers = cache_headers(table_versions.etag(*tables))
+    if etag_matches(request.headers.get("if-none-match"), headers["ETag"]):
+        return headers, Response(status_code=304, headers=headers)
+    if not table_versions.settled(*tables):
+        return {}, None
+    return headers, None
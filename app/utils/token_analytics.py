@@ -0,0 +1,238 @@
+"""
+Historical token analytics and Parquet export.
+
+Tokens are streamed out of the database in fixed-size chunks, each chunk is
+turned into a pandas DataFrame and folded into running aggregates, so memory
+stays bounded by the chunk size no matter how much history is scanned:
+
+    python -m app.utils.token_analytics report --since 2024-01-01 --output report.json
+    python -m app.utils.token_analytics export --since 2024-01-01 --parquet-dir tokens/
+
+The report contains an arrival heatmap (day of week x hour, UTC) per service,
+daily issued/served throughput per service and counter, reach-out rates,
+a distance histogram and ETA accuracy: how many minutes of slack a token had
+between its predicted travel time (`duration`) and actually being called.
+`export` writes the raw rows as Parquet partitioned by service and issue date.
+numpy, pandas and (for export) pyarrow are optional dependencies.
+"""
+import argparse
+import json
+import os
+import shutil
+import sys
+from datetime import datetime, timedelta, timezone
+from pathlib import Path
+from sqlalchemy import select
+from app.models.token_models import Token
+
+COLUMNS = (
+    "id", "token_number", "service_id", "counter_id", "site_id", "issue_time", "called_at", "served_at",
+    "distance", "duration", "reach_out", "state",
+)
+DISTANCE_BINS_KM = (0, 1, 2, 5, 10, 20, 50, 100, float("inf"))
+SLACK_BINS_MINUTES = (-float("inf"), -30, -15, -5, 0, 5, 15, 30, 60, float("inf"))
+
+
+def _require_pandas():
+    try:
+        import numpy as np
+        import pandas as pd
+    except ImportError as e:
+        raise RuntimeError("Token analytics require `numpy` and `pandas`") from e
+    return np, pd
+
+
+def iter_token_frames(engine, since: datetime | None = None, until: datetime | None = None,
+                      chunk_size: int = 100_000):
+    """
+        Yield DataFrames of at most `chunk_size` tokens issued in `[since, until)`.
+
+        Uses a streaming cursor (server-side on PostgreSQL), so only one chunk of
+        rows is ever held in memory. Timestamps come back as UTC-aware columns.
+    """
+    np, pd = _require_pandas()
+    tokens = Token.__table__  # Core columns: no need to configure the ORM mappers for a scan
+    stmt = select(*(tokens.c[column] for column in COLUMNS))
+    if since is not None:
+        stmt = stmt.where(tokens.c.issue_time >= since)
+    if until is not None:
+        stmt = stmt.where(tokens.c.issue_time < until)
+    with engine.connect() as conn:
+        result = conn.execution_options(stream_results=True, yield_per=chunk_size).execute(stmt)
+        for rows in result.partitions(chunk_size):
+            frame = pd.DataFrame.from_records(rows, columns=COLUMNS)
+            for column in ("issue_time", "called_at", "served_at"):
+                frame[column] = pd.to_datetime(frame[column], utc=True)
+            frame["distance"] = frame["distance"].astype("float64")
+            frame["duration"] = frame["duration"].astype("float64")
+            frame["reach_out"] = frame["reach_out"].fillna(False).astype(bool)
+            yield frame
+
+
+class TokenHistory:
+    """
+        Running aggregates over token chunks.
+
+        Every statistic is a sum or a count over fixed bins, so chunks can be
+        folded in any order and the result equals a single pass over all rows.
+    """
+
+    def __init__(self):
+        np, pd = _require_pandas()
+        self._np, self._pd = np, pd
+        self.rows = 0
+        self.heatmaps: dict[int, "np.ndarray"] = {}  # service_id -> 7 x 24 arrival counts
+        self.issued = pd.Series(dtype="int64")  # (service_id, counter_id, day) -> tokens issued
+        self.served = pd.Series(dtype="int64")  # (service_id, counter_id, day) -> tokens served
+        self.reach_out = pd.DataFrame(columns=["tokens", "reached"], dtype="int64")  # per service
+        self.distance_histogram = np.zeros(len(DISTANCE_BINS_KM) - 1, dtype=np.int64)
+        self.slack = pd.DataFrame(columns=["count", "sum", "late"], dtype="float64")  # per service
+        self.slack_histogram = np.zeros(len(SLACK_BINS_MINUTES) - 1, dtype=np.int64)
+
+    def _add(self, total, part):
+        return part if total.empty else total.add(part, fill_value=0)
+
+    def update(self, frame):
+        np, pd = self._np, self._pd
+        if frame.empty:
+            return
+        self.rows += len(frame)
+        issued = frame["issue_time"]
+
+        cells = issued.dt.dayofweek.to_numpy() * 24 + issued.dt.hour.to_numpy()
+        service_ids = frame["service_id"].to_numpy()
+        for service_id in np.unique(service_ids):
+            counts = np.bincount(cells[service_ids == service_id], minlength=168).reshape(7, 24)
+            heatmap = self.heatmaps.get(int(service_id))
+            self.heatmaps[int(service_id)] = counts if heatmap is None else heatmap + counts
+
+        keys = [frame["service_id"], frame["counter_id"]]
+        self.issued = self._add(self.issued, frame.groupby([*keys, issued.dt.date]).size())
+        served = frame[frame["served_at"].notna()]
+        if not served.empty:
+            self.served = self._add(self.served, served.groupby(
+                [served["service_id"], served["counter_id"], served["served_at"].dt.date]).size())
+
+        reach = frame.groupby("service_id")["reach_out"].agg(tokens="size", reached="sum")
+        self.reach_out = self._add(self.reach_out, reach)
+
+        distances = frame["distance"].to_numpy()
+        self.distance_histogram += np.histogram(distances[~np.isnan(distances)], bins=DISTANCE_BINS_KM)[0]
+
+        called = frame[frame["called_at"].notna() & frame["duration"].notna()]
+        if not called.empty:
+            waited = (called["called_at"] - called["issue_time"]).dt.total_seconds() / 60
+            slack = waited - called["duration"]
+            per_service = pd.DataFrame({"count": 1.0, "sum": slack, "late": (slack < 0).astype(float)})
+            self.slack = self._add(self.slack, per_service.groupby(called["service_id"]).sum())
+            self.slack_histogram += np.histogram(slack.to_numpy(), bins=SLACK_BINS_MINUTES)[0]
+
+    def report(self) -> dict:
+        def throughput(series):
+            return [
+                {"service_id": int(service_id), "counter_id": int(counter_id), "day": day.isoformat(), "tokens": int(count)}
+                for (service_id, counter_id, day), count in series.sort_index().items()
+            ]
+
+        return {
+            "rows": self.rows,
+            "arrival_heatmap": {str(service_id): heatmap.tolist() for service_id, heatmap in sorted(self.heatmaps.items())},
+            "issued": throughput(self.issued),
+            "served": throughput(self.served),
+            "reach_out_rate": {
+                str(int(service_id)): float(row["reached"] / row["tokens"])
+                for service_id, row in self.reach_out.iterrows() if row["tokens"]
+            },
+            "distance_histogram_km": {
+                "bins": list(DISTANCE_BINS_KM[:-1]), "counts": self.distance_histogram.tolist(),
+            },
+            "eta_accuracy": {
+                "per_service": {
+                    str(int(service_id)): {
+                        "tokens": int(row["count"]),
+                        "mean_slack_minutes": float(row["sum"] / row["count"]),
+                        "late_rate": float(row["late"] / row["count"]),
+                    }
+                    for service_id, row in self.slack.iterrows() if row["count"]
+                },
+                "slack_histogram_minutes": {
+                    "bins": list(SLACK_BINS_MINUTES[1:-1]), "counts": self.slack_histogram.tolist(),
+                },
+            },
+        }
+
+
+def analyze(engine, since: datetime | None = None, until: datetime | None = None, chunk_size: int = 100_000) -> dict:
+    history = TokenHistory()
+    for frame in iter_token_frames(engine, since, until, chunk_size):
+        history.update(frame)
+    return history.report()
+
+
+def export_parquet(engine, directory: str, since: datetime | None = None, until: datetime | None = None,
+                   chunk_size: int = 100_000) -> int:
+    """
+        Write tokens to `directory` as Parquet partitioned by `service_id` and `issue_date`.
+
+        `since` and `until` are widened to whole UTC days, and every partition
+        the export writes to is emptied the first time it is touched, so
+        re-exporting an overlapping range replaces those days instead of
+        duplicating their rows. Partitions outside the range are left alone, so
+        an export can be extended with a later `since`. Returns rows written.
+    """
+    try:
+        import pyarrow  # noqa: F401
+    except ImportError as e:
+        raise RuntimeError("Parquet export requires `pyarrow`") from e
+    since = _day_start(since) if since is not None else None
+    if until is not None and until != _day_start(until):
+        until = _day_start(until) + timedelta(days=1)
+    cleared = set()
+    written = 0
+    for frame in iter_token_frames(engine, since, until, chunk_size):
+        frame["issue_date"] = frame["issue_time"].dt.strftime("%Y-%m-%d")
+        for service_id, issue_date in frame[["service_id", "issue_date"]].drop_duplicates().itertuples(index=False):
+            partition = os.path.join(directory, f"service_id={service_id}", f"issue_date={issue_date}")
+            if partition not in cleared:
+                shutil.rmtree(partition, ignore_errors=True)
+                cleared.add(partition)
+        frame.to_parquet(directory, engine="pyarrow", partition_cols=["service_id", "issue_date"], index=False)
+        written += len(frame)
+    return written
+
+
+def _day_start(value: datetime) -> datetime:
+    value = value.astimezone(timezone.utc) if value.tzinfo else value.replace(tzinfo=timezone.utc)
+    return value.replace(hour=0, minute=0, second=0, microsecond=0)
+
+
+def _parse_time(value: str) -> datetime:
+    parsed = datetime.fromisoformat(value)
+    return parsed if parsed.tzinfo else parsed.replace(tzinfo=timezone.utc)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("command", choices=("report", "export"))
+    parser.add_argument("--since", type=_parse_time, help="ISO date/time, inclusive (UTC if no offset)")
+    parser.add_argument("--until", type=_parse_time, help="ISO date/time, exclusive")
+    parser.add_argument("--chunk-size", type=int, default=100_000, help="rows per chunk held in memory")
+    parser.add_argument("--parquet-dir", default="token_export", help="export target directory")
+    parser.add_argument("--output", help="write the JSON report to this file instead of stdout")
+    args = parser.parse_args()
+
+    from app.db.database import engine
+
+    if args.command == "export":
+        rows = export_parquet(engine, args.parquet_dir, args.since, args.until, args.chunk_size)
+        print(f"exported {rows} tokens to {args.parquet_dir}", file=sys.stderr)
+        return
+    output = json.dumps(analyze(engine, args.since, args.until, args.chunk_size), indent=2)
+    if args.output:
+        Path(args.output).write_text(output + "\n")
+    else:
+        print(output)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,247 @@
+import json
+import math
+import os
+import struct
+import threading
+import time
+from dataclasses import dataclass
+from app.core.config import settings
+
+HEADER = b"SPQLOG01"
+# timestamp, event type, token_number, service_id, counter_id, distance (NaN = unknown), duration (-1 = unknown)
+RECORD = struct.Struct("<dBqiidi")
+
+# On-disk code of each type; codes are never reused (5 was "cancelled", which nothing emitted)
+_TYPE_CODES = {"issued": 0, "eta_updated": 1, "arrived": 2, "called": 3, "served": 4, "deferred": 6, "resumed": 7, "skipped": 8}
+EVENT_TYPES = tuple(_TYPE_CODES)
+_CODE_TYPES = {code: name for name, code in _TYPE_CODES.items()}
+
+
+@dataclass(frozen=True)
+class TokenEvent:
+    timestamp: float
+    type: str
+    token_number: int
+    service_id: int = 0
+    counter_id: int = 0
+    distance: float | None = None
+    duration: int | None = None
+
+    def pack(self) -> bytes:
+        return RECORD.pack(
+            self.timestamp, _TYPE_CODES[self.type], self.token_number, self.service_id, self.counter_id,
+            math.nan if self.distance is None else self.distance,
+            -1 if self.duration is None else self.duration,
+        )
+
+    @classmethod
+    def unpack(cls, buffer, offset: int = 0) -> "TokenEvent":
+        timestamp, code, token_number, service_id, counter_id, distance, duration = RECORD.unpack_from(buffer, offset)
+        return cls(timestamp, _CODE_TYPES[code], token_number, service_id, counter_id,
+                   None if math.isnan(distance) else distance, None if duration < 0 else duration)
+
+
+@dataclass
+class TokenView:
+    token_number: int
+    service_id: int
+    counter_id: int
+    issued_at: float
+    state: str = "waiting"
+    distance: float | None = None
+    duration: int | None = None
+    reach_out: bool = False
+
+
+class QueueState:
+    """
+        Active tokens per counter, rebuilt purely from token events.
+
+        Served and skipped tokens are dropped, so memory (and snapshot size)
+        tracks the live queue rather than the full history.
+    """
+
+    def __init__(self):
+        self.tokens: dict[int, TokenView] = {}
+
+    def apply(self, event: TokenEvent):
+        if event.type == "issued":
+            self.tokens[event.token_number] = TokenView(
+                event.token_number, event.service_id, event.counter_id, event.timestamp,
+                distance=event.distance, duration=event.duration,
+            )
+            return
+        token = self.tokens.get(event.token_number)
+        if token is None:
+            return
+        if event.type == "eta_updated":
+            token.distance, token.duration = event.distance, event.duration
+        elif event.type == "arrived":
+            token.reach_out = True
+        elif event.type == "called":
+            token.state = "serving"
+        elif event.type == "deferred":
+            token.state = "deferred"
+        elif event.type == "resumed":
+            token.state = "waiting"
+        elif event.type in ("served", "skipped"):
+            del self.tokens[event.token_number]
+
+    def queue(self, counter_id: int) -> list[TokenView]:
+        """
+            Active tokens at `counter_id` in issue order (token numbers increase monotonically).
+        """
+        return sorted((t for t in self.tokens.values() if t.counter_id == counter_id), key=lambda t: t.token_number)
+
+    def to_json(self) -> list:
+        return [[t.token_number, t.service_id, t.counter_id, t.issued_at, t.state, t.distance, t.duration, t.reach_out]
+                for t in self.tokens.values()]
+
+    @classmethod
+    def from_json(cls, rows: list) -> "QueueState":
+        state = cls()
+        for row in rows:
+            state.tokens[row[0]] = TokenView(*row)
+        return state
+
+
+class TokenEventLog:
+    """
+        Append-only binary log of token lifecycle events with periodic snapshots.
+
+        Records are fixed-size, so any offset can be resumed from. Every worker
+        appends with `O_APPEND`, which keeps small writes from different processes
+        whole, and reads the log to build its `QueueState`. After
+        `snapshot_every` new events a background thread writes the state, with
+        the log offset it covers, to `snapshot_path` (atomically via rename), so
+        no request waits for it. Recovery loads that snapshot and replays only
+        the tail, so start-up cost depends on the live queue, not the history.
+
+        The log doubles as a best-effort audit stream: events are appended after
+        the database commit they describe, so a crash between the two loses the
+        event. The database stays the source of truth.
+    """
+
+    def __init__(self, path: str, snapshot_path: str | None = None, snapshot_every: int = 10_000):
+        self.path = path
+        self.snapshot_path = snapshot_path or f"{path}.snapshot"
+        self.snapshot_every = snapshot_every
+        self.state = QueueState()
+        self._offset = len(HEADER)
+        self._since_snapshot = 0
+        self._fd = None
+        self._lock = threading.Lock()
+        self._snapshotter: threading.Thread | None = None
+
+    def _open(self):
+        if self._fd is None:
+            self._fd = os.open(self.path, os.O_RDWR | os.O_CREAT | os.O_APPEND, 0o644)
+            if os.fstat(self._fd).st_size == 0:
+                os.write(self._fd, HEADER)
+        return self._fd
+
+    def append(self, event: TokenEvent):
+        os.write(self._open(), event.pack())
+        with self._lock:
+            self._since_snapshot += 1
+            due = self._since_snapshot >= self.snapshot_every
+            if due and (self._snapshotter is None or not self._snapshotter.is_alive()):
+                self._snapshotter = threading.Thread(target=self._snapshot_in_background, name="token-log-snapshot", daemon=True)
+                self._snapshotter.start()
+
+    def _snapshot_in_background(self):
+        try:
+            self.catch_up()
+            self.snapshot()
+        except (OSError, ValueError) as e:
+            settings.logger.error(f"Token log snapshot failed: {e}")
+
+    def read(self, offset: int | None = None):
+        """
+            Yield `(offset_after, event)` for every complete record from `offset` on.
+        """
+        offset = len(HEADER) if offset is None else offset
+        if not os.path.exists(self.path):
+            return
+        with open(self.path, "rb") as log:
+            if log.read(len(HEADER)) != HEADER:
+                raise ValueError(f"{self.path} is not a token event log")
+            log.seek(offset)
+            while True:
+                chunk = log.read(RECORD.size * 4096)
+                usable = len(chunk) - len(chunk) % RECORD.size
+                for position in range(0, usable, RECORD.size):
+                    offset += RECORD.size
+                    yield offset, TokenEvent.unpack(chunk, position)
+                if len(chunk) < RECORD.size * 4096:
+                    return  # a trailing partial record is an in-flight append; pick it up next time
+
+    def catch_up(self) -> int:
+        """
+            Apply events appended since the last call (by any process) to `state`.
+        """
+        applied = 0
+        with self._lock:
+            for offset, event in self.read(self._offset):
+                self.state.apply(event)
+                self._offset = offset
+                applied += 1
+        return applied
+
+    def snapshot(self):
+        with self._lock:
+            payload = {"version": 1, "offset": self._offset, "tokens": self.state.to_json()}
+            self._since_snapshot = 0
+        temporary = f"{self.snapshot_path}.{os.getpid()}.tmp"
+        with open(temporary, "w") as snapshot:
+            json.dump(payload, snapshot, separators=(",", ":"))
+        os.replace(temporary, self.snapshot_path)
+
+    def recover(self) -> int:
+        """
+            Load the latest snapshot, replay the log tail and return the events replayed.
+        """
+        with self._lock:
+            try:
+                with open(self.snapshot_path) as snapshot:
+                    payload = json.load(snapshot)
+                self.state = QueueState.from_json(payload["tokens"])
+                self._offset = payload["offset"]
+            except FileNotFoundError:
+                self.state = QueueState()
+                self._offset = len(HEADER)
+        replayed = self.catch_up()
+        with self._lock:
+            self._since_snapshot = replayed
+        return replayed
+
+    def queue(self, counter_id: int) -> list[TokenView]:
+        self.catch_up()
+        with self._lock:
+            return self.state.queue(counter_id)
+
+
+token_log = TokenEventLog(settings.TOKEN_LOG_PATH, snapshot_every=settings.TOKEN_LOG_SNAPSHOT_EVERY)
+
+
+def record_event(event_type: str, token_number: int, service_id: int = 0, counter_id: int = 0,
+                 distance: float | None = None, duration: int | None = None):
+    """
+        Append one event to the token log; a no-op unless `TOKEN_LOG_ENABLED`.
+
+        Called after the change it records is committed; logging must never
+        fail the request that triggered it, so I/O errors are logged and
+        swallowed.
+    """
+    if not settings.TOKEN_LOG_ENABLED:
+        return
+    try:
+        token_log.append(TokenEvent(time.time(), event_type, token_number, service_id, counter_id, distance, duration))
+    except OSError as e:
+        settings.logger.error(f"Could not append {event_type} event for token {token_number}: {e}")
+
+
+def record_eta(token_number: int, distance: float | None, duration: int | None, reach_out: bool):
+    record_event("eta_updated", token_number, distance=distance, duration=duration)
+    if reach_out:
+        record_event("arrived", token_number)
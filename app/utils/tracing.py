@@ -0,0 +1,413 @@
+import functools
+import inspect
+import json
+import os
+import queue
+import random
+import threading
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+from app.core.config import settings
+
+MAX_STATEMENT_LENGTH = 1000
+# OTLP SpanKind values
+_OTLP_KINDS = {"internal": 1, "server": 2, "client": 3}
+
+
+class Span:
+    __slots__ = ("trace_id", "span_id", "parent_id", "name", "kind", "start_ns", "end_ns", "attributes", "status")
+
+    def __init__(self, trace_id: str, parent_id: str | None, name: str, kind: str = "internal", attributes: dict | None = None):
+        self.trace_id = trace_id
+        self.span_id = os.urandom(8).hex()
+        self.parent_id = parent_id
+        self.name = name
+        self.kind = kind
+        self.start_ns = time.time_ns()
+        self.end_ns: int | None = None
+        self.attributes = attributes or {}
+        self.status = "ok"
+
+    def end(self, error: BaseException | None = None):
+        if error is not None:
+            self.status = "error"
+            self.attributes["error.type"] = type(error).__name__
+        self.end_ns = time.time_ns()
+
+    @property
+    def duration_ms(self) -> float:
+        return ((self.end_ns or time.time_ns()) - self.start_ns) / 1e6
+
+
+class Trace:
+    __slots__ = ("trace_id", "sampled", "spans")
+
+    def __init__(self, trace_id: str, sampled: bool):
+        self.trace_id = trace_id
+        self.sampled = sampled
+        self.spans: list[Span] = []
+
+
+_current_trace: ContextVar[Trace | None] = ContextVar("current_trace", default=None)
+_current_span: ContextVar[Span | None] = ContextVar("current_span", default=None)
+
+
+class Tracer:
+    """
+        In-process tracer with context-propagated spans.
+
+        `trace` opens a root span (one per request) and `span` nests children
+        under whatever span is current in the context, so spans follow the code
+        across `await`, `asyncio.gather` and `asyncio.to_thread`. Outside a trace
+        both are no-ops. Every trace is recorded; when it ends it is exported if it
+        was sampled (`sample_rate`, or the caller's `traceparent` flag) or took
+        at least `slow_ms`, so slow outliers are never lost to sampling.
+    """
+
+    def __init__(self, exporter=None, sample_rate: float = 1.0, slow_ms: float = 0, max_spans: int = 1000,
+                 rng=random.random):
+        self.exporter = exporter
+        self.sample_rate = sample_rate
+        self.slow_ms = slow_ms
+        self.max_spans = max_spans
+        self.rng = rng
+
+    @property
+    def enabled(self) -> bool:
+        return self.exporter is not None
+
+    @contextmanager
+    def trace(self, name: str, kind: str = "server", trace_id: str | None = None, parent_id: str | None = None,
+              sampled: bool | None = None, **attributes):
+        if self.exporter is None:
+            yield None
+            return
+        trace = Trace(trace_id or os.urandom(16).hex(), self.rng() < self.sample_rate if sampled is None else sampled)
+        root = Span(trace.trace_id, parent_id, name, kind, attributes)
+        trace.spans.append(root)
+        trace_token, span_token = _current_trace.set(trace), _current_span.set(root)
+        error = None
+        try:
+            yield root
+        except BaseException as e:
+            error = e
+            raise
+        finally:
+            root.end(error)
+            _current_span.reset(span_token)
+            _current_trace.reset(trace_token)
+            if trace.sampled or (self.slow_ms and root.duration_ms >= self.slow_ms):
+                self.exporter.submit(trace.spans)
+
+    def start_span(self, name: str, kind: str = "internal", **attributes) -> Span | None:
+        """
+            Open a child of the current span without making it current; the caller ends it.
+        """
+        trace = _current_trace.get()
+        if trace is None:
+            return None
+        parent = _current_span.get()
+        span = Span(trace.trace_id, parent.span_id if parent else None, name, kind, attributes)
+        if len(trace.spans) < self.max_spans:
+            trace.spans.append(span)
+        return span
+
+    @contextmanager
+    def span(self, name: str, kind: str = "internal", **attributes):
+        span = self.start_span(name, kind, **attributes)
+        if span is None:
+            yield None
+            return
+        token = _current_span.set(span)
+        error = None
+        try:
+            yield span
+        except BaseException as e:
+            error = e
+            raise
+        finally:
+            span.end(error)
+            _current_span.reset(token)
+
+
+def current_trace_id() -> str | None:
+    trace = _current_trace.get()
+    return trace.trace_id if trace else None
+
+
+def traced(name: str | None = None, kind: str = "internal"):
+    """
+        Decorator wrapping a sync or async function in a span named after it.
+    """
+    def decorate(func):
+        span_name = name or f"{func.__module__.rsplit('.', 1)[-1]}.{func.__qualname__}"
+        if inspect.iscoroutinefunction(func):
+            @functools.wraps(func)
+            async def async_wrapper(*args, **kwargs):
+                if _current_trace.get() is None:
+                    return await func(*args, **kwargs)
+                with tracer.span(span_name, kind):
+                    return await func(*args, **kwargs)
+            return async_wrapper
+
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            if _current_trace.get() is None:
+                return func(*args, **kwargs)
+            with tracer.span(span_name, kind):
+                return func(*args, **kwargs)
+        return wrapper
+    return decorate
+
+
+def trace_functions(namespace: dict):
+    """
+        Wrap every public function defined in a module in a span; call as
+        `trace_functions(globals())` at the bottom of the module. Does nothing
+        unless `TRACING_ENABLED`, so untraced deployments keep plain functions.
+    """
+    if not settings.TRACING_ENABLED:
+        return
+    module = namespace["__name__"]
+    for key, value in list(namespace.items()):
+        if (inspect.isfunction(value) and value.__module__ == module and not key.startswith("_")
+                and not inspect.isgeneratorfunction(value)):
+            namespace[key] = traced()(value)
+
+
+def install_tracing(engine):
+    """
+        Record a client span per SQL statement executed inside a trace.
+    """
+    from sqlalchemy import event
+
+    @event.listens_for(engine, "before_cursor_execute")
+    def _before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+        span = tracer.start_span("db.query", "client", **{
+            "db.system": engine.dialect.name,
+            "db.statement": statement[:MAX_STATEMENT_LENGTH],
+        })
+        if span is not None:
+            if executemany:
+                span.attributes["db.executemany"] = True
+            conn.info.setdefault("trace_spans", []).append(span)
+
+    @event.listens_for(engine, "after_cursor_execute")
+    def _after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+        spans = conn.info.get("trace_spans")
+        if spans and _current_trace.get() is not None:
+            spans.pop().end()
+
+    @event.listens_for(engine, "handle_error")
+    def _handle_error(exception_context):
+        spans = exception_context.connection.info.get("trace_spans") if exception_context.connection else None
+        if spans and _current_trace.get() is not None:
+            spans.pop().end(exception_context.original_exception)
+
+
+class BackgroundExporter:
+    """
+        Exports finished traces from a bounded queue on a daemon thread, so the
+        request that produced a trace never waits on file or network I/O. Traces
+        are dropped (and counted in `dropped`) when the queue is full.
+    """
+
+    def __init__(self, max_queue: int = 1000):
+        self._queue: queue.Queue = queue.Queue(max_queue)
+        self._thread: threading.Thread | None = None
+        self._lock = threading.Lock()
+        self.dropped = 0
+
+    def submit(self, spans: list[Span]):
+        if self._thread is None:
+            with self._lock:
+                if self._thread is None:
+                    self._thread = threading.Thread(target=self._run, name=type(self).__name__, daemon=True)
+                    self._thread.start()
+        try:
+            self._queue.put_nowait(spans)
+        except queue.Full:
+            self.dropped += 1
+
+    def _run(self):
+        while True:
+            spans = self._queue.get()
+            try:
+                if spans is None:
+                    return
+                self.export(spans)
+            except Exception as e:
+                settings.logger.warning(f"Trace export failed: {e}")
+            finally:
+                self._queue.task_done()
+
+    def flush(self):
+        if self._thread is not None:
+            self._queue.join()
+
+    def export(self, spans: list[Span]):
+        raise NotImplementedError
+
+
+class JsonlExporter(BackgroundExporter):
+    """
+        One JSON line per trace: the root span's name and duration plus every span
+        with its offset from the start of the request, i.e. a ready-made waterfall.
+    """
+
+    def __init__(self, path: str, max_queue: int = 1000):
+        super().__init__(max_queue)
+        self.path = path
+
+    @staticmethod
+    def waterfall(spans: list[Span]) -> dict:
+        root = spans[0]
+        return {
+            "trace_id": root.trace_id,
+            "name": root.name,
+            "duration_ms": round(root.duration_ms, 3),
+            "spans": [
+                {
+                    "span_id": span.span_id,
+                    "parent_id": span.parent_id,
+                    "name": span.name,
+                    "kind": span.kind,
+                    "offset_ms": round((span.start_ns - root.start_ns) / 1e6, 3),
+                    "duration_ms": round(span.duration_ms, 3),
+                    "status": span.status,
+                    "attributes": span.attributes,
+                }
+                for span in sorted(spans, key=lambda span: span.start_ns)
+            ],
+        }
+
+    def export(self, spans):
+        with open(self.path, "a") as output:
+            output.write(json.dumps(self.waterfall(spans), default=str) + "\n")
+
+
+def _otlp_value(value) -> dict:
+    if isinstance(value, bool):
+        return {"boolValue": value}
+    if isinstance(value, int):
+        return {"intValue": str(value)}
+    if isinstance(value, float):
+        return {"doubleValue": value}
+    return {"stringValue": str(value)}
+
+
+class OtlpHttpExporter(BackgroundExporter):
+    """
+        Sends traces to an OpenTelemetry collector using OTLP/HTTP with a JSON body.
+    """
+
+    def __init__(self, endpoint: str, service_name: str = "spotqueue", timeout: float = 2.0, max_queue: int = 1000):
+        super().__init__(max_queue)
+        self.endpoint = endpoint
+        self.service_name = service_name
+        self.timeout = timeout
+        self._client = None
+
+    def payload(self, spans: list[Span]) -> dict:
+        return {"resourceSpans": [{
+            "resource": {"attributes": [{"key": "service.name", "value": {"stringValue": self.service_name}}]},
+            "scopeSpans": [{
+                "scope": {"name": "app.utils.tracing"},
+                "spans": [
+                    {
+                        "traceId": span.trace_id,
+                        "spanId": span.span_id,
+                        **({"parentSpanId": span.parent_id} if span.parent_id else {}),
+                        "name": span.name,
+                        "kind": _OTLP_KINDS.get(span.kind, 1),
+                        "startTimeUnixNano": str(span.start_ns),
+                        "endTimeUnixNano": str(span.end_ns or span.start_ns),
+                        "attributes": [{"key": key, "value": _otlp_value(value)} for key, value in span.attributes.items()],
+                        "status": {"code": 2 if span.status == "error" else 1},
+                    }
+                    for span in spans
+                ],
+            }],
+        }]}
+
+    def export(self, spans):
+        import httpx
+
+        if self._client is None:
+            self._client = httpx.Client(timeout=self.timeout)
+        response = self._client.post(self.endpoint, json=self.payload(spans))
+        response.raise_for_status()
+
+
+def build_tracer() -> Tracer:
+    if not settings.TRACING_ENABLED:
+        return Tracer()
+    if settings.TRACE_EXPORTER == "otlp":
+        exporter = OtlpHttpExporter(settings.TRACE_OTLP_ENDPOINT, settings.TRACE_SERVICE_NAME)
+    elif settings.TRACE_EXPORTER == "jsonl":
+        exporter = JsonlExporter(settings.TRACE_FILE)
+    else:
+        raise ValueError(f"Unknown TRACE_EXPORTER {settings.TRACE_EXPORTER!r}")
+    return Tracer(exporter, settings.TRACE_SAMPLE_RATE, settings.TRACE_SLOW_MS)
+
+
+tracer = build_tracer()
+
+
+def parse_traceparent(header: str | None) -> tuple[str, str, bool] | None:
+    """
+        `(trace_id, parent_span_id, sampled)` from a W3C `traceparent` header, if valid.
+    """
+    if not header:
+        return None
+    parts = header.strip().split("-")
+    if len(parts) != 4 or len(parts[1]) != 32 or len(parts[2]) != 16 or len(parts[3]) != 2:
+        return None
+    try:
+        flags = int(parts[3], 16)
+        int(parts[1], 16), int(parts[2], 16)
+    except ValueError:
+        return None
+    return parts[1], parts[2], bool(flags & 1)
+
+
+class TracingMiddleware:
+    """
+        Pure ASGI middleware opening the root span of each request.
+
+        Continues the caller's trace when a `traceparent` header is present and
+        returns the trace id in `X-Trace-Id`, which is the key to find the
+        request's waterfall in the exported traces.
+    """
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or not tracer.enabled:
+            await self.app(scope, receive, send)
+            return
+
+        headers = dict(scope.get("headers") or [])
+        remote = parse_traceparent(headers.get(b"traceparent", b"").decode("latin-1"))
+        trace_id, parent_id, sampled = remote if remote else (None, None, None)
+        status_holder = [500]
+
+        with tracer.trace(f"{scope['method']} {scope['path']}", "server", trace_id, parent_id, sampled,
+                          **{"http.method": scope["method"], "http.target": scope["path"]}) as root:
+
+            async def send_wrapper(message):
+                if message["type"] == "http.response.start":
+                    status_holder[0] = message["status"]
+                    message = {**message, "headers": [*message.get("headers", []), (b"x-trace-id", root.trace_id.encode())]}
+                await send(message)
+
+            try:
+                await self.app(scope, receive, send_wrapper)
+            finally:
+                route = scope.get("route")
+                if route is not None:
+                    root.name = f"{scope['method']} {route.path}"
+                    root.attributes["http.route"] = route.path
+                root.attributes["http.status_code"] = status_holder[0]
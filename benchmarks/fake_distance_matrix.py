@@ -0,0 +1,157 @@
+"""
+Local stand-in for the distancematrix.ai Distance Matrix API.
+
+Answers `GET /maps/api/distancematrix/json?origins=..&destinations=..` in the
+same JSON shape as the real service, computing great-circle distances and a
+fixed-speed travel time. Latency and error rate are configurable so load tests
+can exercise slow or failing providers without spending API credits.
+
+Run standalone:
+
+    python -m benchmarks.fake_distance_matrix --port 8765 --latency-ms 80 --error-rate 0.02
+"""
+import argparse
+import asyncio
+import json
+import math
+import random
+from urllib.parse import parse_qs, urlsplit
+
+EARTH_RADIUS_KM = 6371.0088
+
+
+def haversine_km(origin: tuple[float, float], destination: tuple[float, float]) -> float:
+    lat1, lon1 = map(math.radians, origin)
+    lat2, lon2 = map(math.radians, destination)
+    a = math.sin((lat2 - lat1) / 2) ** 2 + math.cos(lat1) * math.cos(lat2) * math.sin((lon2 - lon1) / 2) ** 2
+    return 2 * EARTH_RADIUS_KM * math.asin(math.sqrt(a))
+
+
+def _parse_points(value: str) -> list[tuple[float, float]]:
+    points = []
+    for chunk in value.split("|"):
+        lat, lon = chunk.split(",")
+        points.append((float(lat), float(lon)))
+    return points
+
+
+def _duration_text(minutes: int) -> str:
+    hours, mins = divmod(minutes, 60)
+    if hours:
+        return f"{hours} hour{'s' if hours > 1 else ''} {mins} mins"
+    return f"{mins} mins"
+
+
+def build_matrix(origins: list[tuple[float, float]], destinations: list[tuple[float, float]], speed_kmh: float) -> dict:
+    rows = []
+    for origin in origins:
+        elements = []
+        for destination in destinations:
+            km = haversine_km(origin, destination)
+            minutes = max(1, round(km / speed_kmh * 60))
+            elements.append({
+                "status": "OK",
+                "distance": {"text": f"{km:.1f} km", "value": round(km * 1000)},
+                "duration": {"text": _duration_text(minutes), "value": minutes * 60},
+            })
+        rows.append({"elements": elements})
+    return {"status": "OK", "rows": rows}
+
+
+class FakeDistanceMatrix:
+    """
+        Asyncio HTTP server emulating the remote matrix API.
+
+        Attributes:
+            latency_ms (float): Mean artificial latency added to each response.
+            jitter_ms (float): Uniform +/- jitter around the mean latency.
+            error_rate (float): Fraction of requests answered with an HTTP 503.
+            speed_kmh (float): Travel speed used to derive durations from distances.
+    """
+
+    def __init__(self, host="127.0.0.1", port=0, latency_ms=50.0, jitter_ms=10.0, error_rate=0.0, speed_kmh=30.0, seed=1):
+        self.host = host
+        self.port = port
+        self.latency_ms = latency_ms
+        self.jitter_ms = jitter_ms
+        self.error_rate = error_rate
+        self.speed_kmh = speed_kmh
+        self.requests = 0
+        self.errors = 0
+        self._rng = random.Random(seed)
+        self._server = None
+
+    @property
+    def url(self) -> str:
+        return f"http://{self.host}:{self.port}/maps/api/distancematrix/json"
+
+    async def start(self):
+        self._server = await asyncio.start_server(self._handle, self.host, self.port)
+        self.port = self._server.sockets[0].getsockname()[1]
+        return self
+
+    async def stop(self):
+        if self._server is not None:
+            self._server.close()
+            await self._server.wait_closed()
+
+    async def _handle(self, reader, writer):
+        try:
+            request_line = await reader.readline()
+            while (await reader.readline()) not in (b"\r\n", b"\n", b""):
+                pass
+            _, target, _ = request_line.decode().split(" ", 2)
+            self.requests += 1
+
+            delay = max(0.0, self.latency_ms + self._rng.uniform(-self.jitter_ms, self.jitter_ms)) / 1000
+            await asyncio.sleep(delay)
+
+            if self._rng.random() < self.error_rate:
+                self.errors += 1
+                status, body = "503 Service Unavailable", {"status": "UNKNOWN_ERROR"}
+            else:
+                query = parse_qs(urlsplit(target).query)
+                try:
+                    body = build_matrix(_parse_points(query["origins"][0]), _parse_points(query["destinations"][0]), self.speed_kmh)
+                    status = "200 OK"
+                except (KeyError, ValueError):
+                    status, body = "400 Bad Request", {"status": "INVALID_REQUEST"}
+
+            payload = json.dumps(body).encode()
+            writer.write(
+                f"HTTP/1.1 {status}\r\nContent-Type: application/json\r\nContent-Length: {len(payload)}\r\n"
+                f"Connection: close\r\n\r\n".encode() + payload
+            )
+            await writer.drain()
+        except (ConnectionError, ValueError):
+            pass
+        finally:
+            writer.close()
+
+
+async def _serve_forever(args):
+    server = await FakeDistanceMatrix(
+        host=args.host, port=args.port, latency_ms=args.latency_ms, jitter_ms=args.jitter_ms,
+        error_rate=args.error_rate, speed_kmh=args.speed_kmh, seed=args.seed,
+    ).start()
+    print(f"Fake distance matrix listening on {server.url}")
+    await asyncio.Event().wait()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--latency-ms", type=float, default=50.0)
+    parser.add_argument("--jitter-ms", type=float, default=10.0)
+    parser.add_argument("--error-rate", type=float, default=0.0)
+    parser.add_argument("--speed-kmh", type=float, default=30.0)
+    parser.add_argument("--seed", type=int, default=1)
+    try:
+        asyncio.run(_serve_forever(parser.parse_args()))
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,331 @@
+"""
+End-to-end load test for the SpotQueue API.
+
+Starts the app under uvicorn against a throwaway SQLite file (or any
+`--database-url`), points it at a local fake Distance Matrix server and drives
+the registration, login, token issuance and location update flows with a
+fixed number of concurrent clients. Results are printed as JSON:
+
+    python -m benchmarks.load_test --users 200 --concurrency 20 --output run.json
+
+Runs are seeded and record the git commit, so two outputs can be compared.
+Pass `--baseline previous.json` to fail (exit code 1) when throughput drops or
+p95 latency grows by more than `--max-regression`.
+"""
+import argparse
+import asyncio
+import json
+import os
+import platform
+import random
+import socket
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+from datetime import datetime, time as dt_time, timezone
+from pathlib import Path
+
+import httpx
+
+from benchmarks.fake_distance_matrix import FakeDistanceMatrix
+
+REPO_ROOT = Path(__file__).resolve().parent.parent
+SERVICE_NAME = "Load_Test_Service"
+SERVICE_SITES = [("North", 24.93, 67.08), ("Centre", 24.8523464, 67.0078039), ("South", 24.80, 67.03)]
+
+
+def _free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+def _git_commit() -> str | None:
+    try:
+        return subprocess.check_output(["git", "rev-parse", "HEAD"], cwd=REPO_ROOT, text=True).strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def percentile(sorted_values: list[float], fraction: float) -> float:
+    if not sorted_values:
+        return 0.0
+    index = min(len(sorted_values) - 1, max(0, round(fraction * (len(sorted_values) - 1))))
+    return sorted_values[index]
+
+
+def summarize(samples: list[tuple[float, bool]], wall_seconds: float) -> dict:
+    latencies = sorted(latency * 1000 for latency, _ in samples)
+    errors = sum(1 for _, ok in samples if not ok)
+    return {
+        "requests": len(samples),
+        "errors": errors,
+        "error_rate": errors / len(samples) if samples else 0.0,
+        "throughput_rps": len(samples) / wall_seconds if wall_seconds else 0.0,
+        "latency_ms": {
+            "mean": statistics.fmean(latencies) if latencies else 0.0,
+            "p50": percentile(latencies, 0.50),
+            "p90": percentile(latencies, 0.90),
+            "p95": percentile(latencies, 0.95),
+            "p99": percentile(latencies, 0.99),
+            "max": latencies[-1] if latencies else 0.0,
+        },
+    }
+
+
+def seed_catalog(database_url: str, counters: int):
+    """
+        Create the schema and a single service with several sites and counters.
+
+        Runs in this process with the same models the app uses, so the catalog
+        exists before the first request regardless of API-level validation.
+    """
+    os.environ["DATABASE_URL"] = database_url
+    from app.db.database import Base, SessionLocal, engine
+    from app.models.counter_models import Counter
+    from app.models.service_models import Service
+    from app.models.site_models import ServiceSite
+    from app.models.token_models import Token  # noqa: F401  (registers the table)
+    from app.models.user_models import User  # noqa: F401
+
+    engine.echo = False  # keep stdout clean for the JSON report
+    Base.metadata.create_all(bind=engine)
+    db = SessionLocal()
+    try:
+        service = Service(service_name=SERVICE_NAME, service_entry_time=dt_time(0, 0), service_end_time=dt_time(23, 59))
+        db.add(service)
+        db.flush()
+        for number in range(1, counters + 1):
+            db.add(Counter(counter_number=number, service_id=service.id))
+        for site_name, latitude, longitude in SERVICE_SITES:
+            db.add(ServiceSite(service_id=service.id, site_name=site_name, latitude=latitude, longitude=longitude, is_open=True))
+        db.commit()
+    finally:
+        db.close()
+        engine.dispose()
+
+
+class AppServer:
+    """
+        Runs `app.main:app` under uvicorn in a child process.
+    """
+
+    def __init__(self, env: dict, workers: int):
+        self.port = _free_port()
+        self.env = env
+        self.workers = workers
+        self.process = None
+
+    @property
+    def base_url(self) -> str:
+        return f"http://127.0.0.1:{self.port}"
+
+    def start(self, timeout: float = 30.0):
+        self.process = subprocess.Popen(
+            [sys.executable, "-m", "uvicorn", "app.main:app", "--port", str(self.port),
+             "--workers", str(self.workers), "--log-level", "warning"],
+            cwd=REPO_ROOT, env=self.env, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL,
+        )
+        deadline = time.monotonic() + timeout
+        while time.monotonic() < deadline:
+            if self.process.poll() is not None:
+                raise RuntimeError(f"uvicorn exited with code {self.process.returncode}")
+            try:
+                if httpx.get(f"{self.base_url}/metrics", timeout=1.0).status_code == 200:
+                    return self
+            except httpx.HTTPError:
+                pass
+            time.sleep(0.1)
+        self.stop()
+        raise RuntimeError("uvicorn did not become ready in time")
+
+    def stop(self):
+        if self.process is not None and self.process.poll() is None:
+            self.process.terminate()
+            try:
+                self.process.wait(timeout=10)
+            except subprocess.TimeoutExpired:
+                self.process.kill()
+
+
+async def run_scenario(client: httpx.AsyncClient, requests: list, concurrency: int) -> dict:
+    """
+        Execute `requests` (callables returning an httpx coroutine) with at most
+        `concurrency` in flight, and summarize latency, throughput and errors.
+    """
+    queue: asyncio.Queue = asyncio.Queue()
+    for request in requests:
+        queue.put_nowait(request)
+    samples: list[tuple[float, bool]] = []
+
+    async def worker():
+        while True:
+            try:
+                request = queue.get_nowait()
+            except asyncio.QueueEmpty:
+                return
+            started = time.perf_counter()
+            try:
+                response = await request(client)
+                ok = response.status_code < 400
+            except httpx.HTTPError:
+                ok = False
+            samples.append((time.perf_counter() - started, ok))
+
+    started = time.perf_counter()
+    await asyncio.gather(*(worker() for _ in range(concurrency)))
+    return summarize(samples, time.perf_counter() - started)
+
+
+async def drive(base_url: str, args) -> dict:
+    rng = random.Random(args.seed)
+    users = [
+        {
+            "name": f"load_user_{i:06d}",
+            "email": f"load_user_{i:06d}@example.com",
+            "password": "load-test-password",
+            "latitude": rng.uniform(24.75, 25.0),
+            "longitude": rng.uniform(66.95, 67.2),
+        }
+        for i in range(args.users)
+    ]
+    user_ids: dict[str, int] = {}
+    results = {}
+    limits = httpx.Limits(max_connections=args.concurrency, max_keepalive_connections=args.concurrency)
+
+    async with httpx.AsyncClient(base_url=base_url, timeout=args.timeout, limits=limits) as client:
+
+        def register(user):
+            async def call(client):
+                response = await client.post("/users/register", json={k: user[k] for k in ("name", "email", "password")})
+                if response.status_code == 200:
+                    user_ids[user["email"]] = response.json()["id"]
+                return response
+            return call
+
+        def login(user):
+            return lambda client: client.post("/users/login", data={"username": user["email"], "password": user["password"]})
+
+        def issue_token(user):
+            return lambda client: client.post("/users/token", json={
+                "email": user["email"], "service_name": SERVICE_NAME,
+                "latitude": user["latitude"], "longitude": user["longitude"],
+            })
+
+        def update_location(user, step):
+            return lambda client: client.put("/users/new-location", json={
+                "user_id": user_ids.get(user["email"], 0),
+                "latitude": user["latitude"] - 0.002 * step,
+                "longitude": user["longitude"] - 0.002 * step,
+            })
+
+        results["register"] = await run_scenario(client, [register(user) for user in users], args.concurrency)
+        results["login"] = await run_scenario(client, [login(user) for user in users], args.concurrency)
+        results["token"] = await run_scenario(client, [issue_token(user) for user in users], args.concurrency)
+        results["location_update"] = await run_scenario(
+            client,
+            [update_location(user, step) for step in range(1, args.location_updates + 1) for user in users],
+            args.concurrency,
+        )
+    return results
+
+
+def compare(current: dict, baseline: dict, max_regression: float) -> list[str]:
+    regressions = []
+    for name, stats in current["scenarios"].items():
+        previous = baseline.get("scenarios", {}).get(name)
+        if not previous:
+            continue
+        if previous["throughput_rps"] and stats["throughput_rps"] < previous["throughput_rps"] * (1 - max_regression):
+            regressions.append(f"{name}: throughput {previous['throughput_rps']:.1f} -> {stats['throughput_rps']:.1f} rps")
+        if previous["latency_ms"]["p95"] and stats["latency_ms"]["p95"] > previous["latency_ms"]["p95"] * (1 + max_regression):
+            regressions.append(f"{name}: p95 {previous['latency_ms']['p95']:.1f} -> {stats['latency_ms']['p95']:.1f} ms")
+    return regressions
+
+
+async def main_async(args) -> dict:
+    fake = await FakeDistanceMatrix(
+        latency_ms=args.latency_ms, jitter_ms=args.jitter_ms, error_rate=args.error_rate, seed=args.seed,
+    ).start()
+
+    tmpdir = tempfile.TemporaryDirectory()
+    database_url = args.database_url or f"sqlite:///{Path(tmpdir.name) / 'load_test.db'}"
+    seed_catalog(database_url, args.counters)
+
+    env = {
+        **os.environ,
+        "DATABASE_URL": database_url,
+        "DISTANCE_MATRIX_URL": fake.url,
+        "DISTANCE_MATRIX_API_KEY": "load-test",
+        "SECRET_KEY": os.environ.get("SECRET_KEY", "load-test-secret"),
+        "ALGORITHM": os.environ.get("ALGORITHM", "HS256"),
+    }
+    server = AppServer(env, args.workers)
+    await asyncio.to_thread(server.start)
+    try:
+        started = time.perf_counter()
+        scenarios = await drive(server.base_url, args)
+        elapsed = time.perf_counter() - started
+    finally:
+        server.stop()
+        await fake.stop()
+        tmpdir.cleanup()
+
+    return {
+        "meta": {
+            "commit": _git_commit(),
+            "timestamp": datetime.now(timezone.utc).isoformat(),
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "database": "sqlite" if database_url.startswith("sqlite") else database_url.split(":", 1)[0],
+            "params": {
+                "users": args.users, "concurrency": args.concurrency, "workers": args.workers,
+                "counters": args.counters, "location_updates": args.location_updates, "seed": args.seed,
+                "fake_latency_ms": args.latency_ms, "fake_jitter_ms": args.jitter_ms, "fake_error_rate": args.error_rate,
+            },
+            "total_seconds": elapsed,
+            "fake_distance_requests": fake.requests,
+            "fake_distance_errors": fake.errors,
+        },
+        "scenarios": scenarios,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--database-url", help="Database to run against (default: fresh SQLite file)")
+    parser.add_argument("--users", type=int, default=100)
+    parser.add_argument("--concurrency", type=int, default=10)
+    parser.add_argument("--workers", type=int, default=1, help="uvicorn worker processes")
+    parser.add_argument("--counters", type=int, default=3)
+    parser.add_argument("--location-updates", type=int, default=3, help="location pings per user")
+    parser.add_argument("--latency-ms", type=float, default=50.0, help="fake distance API mean latency")
+    parser.add_argument("--jitter-ms", type=float, default=10.0)
+    parser.add_argument("--error-rate", type=float, default=0.0, help="fake distance API error fraction")
+    parser.add_argument("--timeout", type=float, default=30.0, help="client request timeout in seconds")
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--output", help="write JSON results to this file instead of stdout")
+    parser.add_argument("--baseline", help="previous JSON result to compare against")
+    parser.add_argument("--max-regression", type=float, default=0.2)
+    args = parser.parse_args()
+
+    result = asyncio.run(main_async(args))
+
+    exit_code = 0
+    if args.baseline:
+        regressions = compare(result, json.loads(Path(args.baseline).read_text()), args.max_regression)
+        result["regressions"] = regressions
+        exit_code = 1 if regressions else 0
+
+    output = json.dumps(result, indent=2)
+    if args.output:
+        Path(args.output).write_text(output + "\n")
+    else:
+        print(output)
+    sys.exit(exit_code)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,225 @@
+"""
+Micro-benchmarks for the crud and utils hot paths.
+
+Each database-bound function is timed against freshly seeded databases of
+increasing size, so the output shows how it scales with the number of tokens:
+
+    python -m benchmarks.micro_bench --sizes 1000,100000,1000000 --output micro.json
+
+Pure functions (reach-out check, distance response parsing, password hashing,
+JWT creation) do not depend on data size and are timed once. Results are JSON
+with per-call mean/median/p95 in microseconds plus the git commit.
+"""
+import argparse
+import asyncio
+import contextlib
+import json
+import os
+import platform
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+from datetime import datetime, time as dt_time, timezone
+from pathlib import Path
+
+os.environ.setdefault("DATABASE_URL", "sqlite://")
+os.environ.setdefault("SECRET_KEY", "micro-bench-secret")
+os.environ.setdefault("ALGORITHM", "HS256")
+
+from sqlalchemy import create_engine, insert  # noqa: E402
+from sqlalchemy.orm import sessionmaker  # noqa: E402
+
+REPO_ROOT = Path(__file__).resolve().parent.parent
+SEED_BATCH = 50_000
+DISTANCE_PAYLOAD = {
+    "status": "OK",
+    "rows": [{"elements": [{"status": "OK", "distance": {"text": "12.4 km"}, "duration": {"text": "1 hour 7 mins"}}]}],
+}
+
+
+def _git_commit() -> str | None:
+    try:
+        return subprocess.check_output(["git", "rev-parse", "HEAD"], cwd=REPO_ROOT, text=True).strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def measure(func, iterations: int) -> dict:
+    """
+        Call `func(i)` `iterations` times and report per-call timings in microseconds.
+    """
+    timings = []
+    for i in range(iterations):
+        started = time.perf_counter()
+        func(i)
+        timings.append((time.perf_counter() - started) * 1_000_000)
+    timings.sort()
+    return {
+        "iterations": iterations,
+        "mean_us": statistics.fmean(timings),
+        "median_us": statistics.median(timings),
+        "p95_us": timings[min(len(timings) - 1, int(0.95 * len(timings)))],
+    }
+
+
+def seed(session_factory, tokens: int, users: int, services: int, counters_per_service: int):
+    """
+        Bulk-load users, services, counters and `tokens` token rows with executemany batches.
+    """
+    from app.models.counter_models import Counter
+    from app.models.service_models import Service
+    from app.models.token_models import Token
+    from app.models.user_models import User
+
+    db = session_factory()
+    try:
+        db.execute(insert(Service), [
+            {"service_name": f"Service_{s}", "service_entry_time": dt_time(9), "service_end_time": dt_time(18)}
+            for s in range(1, services + 1)
+        ])
+        db.execute(insert(Counter), [
+            {"counter_number": c, "service_id": s}
+            for s in range(1, services + 1) for c in range(1, counters_per_service + 1)
+        ])
+        for start in range(0, users, SEED_BATCH):
+            db.execute(insert(User), [
+                {"name": f"user_{u}", "email": f"user_{u}@example.com", "hashed_password": "x", "role": "User"}
+                for u in range(start + 1, min(users, start + SEED_BATCH) + 1)
+            ])
+        issued = datetime.now(timezone.utc)
+        for start in range(0, tokens, SEED_BATCH):
+            rows = []
+            for t in range(start + 1, min(tokens, start + SEED_BATCH) + 1):
+                service_id = (t % services) + 1
+                counter_id = (service_id - 1) * counters_per_service + (t % counters_per_service) + 1
+                rows.append({
+                    "token_number": t, "queue_position": t, "issue_time": issued,
+                    "latitude": 24.85, "longitude": 67.0, "distance": 3.5, "duration": 9, "reach_out": False,
+                    "user_id": (t % users) + 1, "service_id": service_id, "counter_id": counter_id,
+                })
+            db.execute(insert(Token), rows)
+            db.commit()
+        db.commit()
+    finally:
+        db.close()
+
+
+def bench_database(database_url: str, size: int, args) -> dict:
+    from app.crud.counter_management import create_counter
+    from app.crud.services_management import get_service_by_name
+    from app.crud.token_management import create_token_record, generate_token
+    from app.crud.user_management import get_user_by_email
+    from app.db.database import Base
+    import app.crud.token_management as token_management
+    from app.schemas.counter_schemas import CounterCreate
+    from app.schemas.token_schemas import TokenCreate, TokenRequest
+
+    engine = create_engine(database_url)
+    Base.metadata.drop_all(bind=engine)
+    Base.metadata.create_all(bind=engine)
+    session_factory = sessionmaker(autocommit=False, autoflush=False, bind=engine)
+
+    users = max(1, min(size // 10, args.max_users))
+    started = time.perf_counter()
+    seed(session_factory, size, users, args.services, args.counters)
+    seed_seconds = time.perf_counter() - started
+
+    async def fake_distance(latitude, longitude, service_coordinates=None):
+        return 9, 3.5
+
+    original_get_distance = token_management.get_distance
+    token_management.get_distance = fake_distance
+    loop = asyncio.new_event_loop()
+    db = session_factory()
+    try:
+        n = args.iterations
+        results = {
+            "get_user_by_email": measure(lambda i: get_user_by_email(db, f"user_{(i % users) + 1}@example.com"), n),
+            "get_service_by_name": measure(lambda i: get_service_by_name(db, f"Service_{(i % args.services) + 1}"), n),
+            "create_token_record": measure(lambda i: create_token_record(
+                db, TokenCreate(user_id=1, service_id=1, counter_id=1, latitude=24.9, longitude=67.1), "9", "3.5"), n),
+            "generate_token": measure(lambda i: loop.run_until_complete(generate_token(
+                TokenRequest(email=f"user_{(i % users) + 1}@example.com", service_name="Service_1", latitude=24.9, longitude=67.1),
+                db)), n),
+            "create_counter": measure(lambda i: create_counter(
+                db, CounterCreate(counter_number=args.counters + i + 1, service_name="Service_1")), n),
+        }
+    finally:
+        token_management.get_distance = original_get_distance
+        db.close()
+        loop.close()
+        engine.dispose()
+    return {"tokens": size, "users": users, "seed_seconds": seed_seconds, "functions": results}
+
+
+def bench_pure(args) -> dict:
+    from types import SimpleNamespace
+    from app.crud.token_management import check_reach_out
+    from app.schemas.token_schemas import TokenResponse
+    from app.schemas.user_schemas import UserIn
+    from app.utils.auth import create_access_token, get_password_hash
+    from app.utils.get_distance import parse_distance_response
+    from app.utils.serialization import list_response, model_response
+
+    users = [SimpleNamespace(id=u, name=f"user_{u}", email=f"user_{u}@example.com", role="User") for u in range(100)]
+    token = SimpleNamespace(token_number=1, user_id=1, service_id=1, counter_id=1, distance=3.5, duration=9)
+
+    n = args.iterations
+    return {
+        "serialize_user_list_100": measure(lambda i: list_response(UserIn, users), n),
+        "serialize_token": measure(lambda i: model_response(TokenResponse, token), n * 10),
+        "check_reach_out": measure(lambda i: check_reach_out(24.8523464, 67.0078039, 1, 1), n * 10),
+        "parse_distance_response": measure(lambda i: parse_distance_response(DISTANCE_PAYLOAD), n * 10),
+        "create_access_token": measure(lambda i: create_access_token({"sub": f"user_{i}@example.com"}), n),
+        "get_password_hash": measure(lambda i: get_password_hash(f"password-{i}"), max(3, n // 20)),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--sizes", default="1000,10000,100000", help="comma-separated token counts to seed")
+    parser.add_argument("--database-url", help="database to (re)create for each size (default: fresh SQLite files)")
+    parser.add_argument("--iterations", type=int, default=200, help="calls per database-bound function")
+    parser.add_argument("--services", type=int, default=5)
+    parser.add_argument("--counters", type=int, default=4, help="counters per service")
+    parser.add_argument("--max-users", type=int, default=100_000)
+    parser.add_argument("--output", help="write JSON results to this file instead of stdout")
+    args = parser.parse_args()
+
+    import logging
+    logging.disable(logging.INFO)
+
+    from app.db.database import engine as app_engine
+    app_engine.echo = False
+
+    sizes = [int(size) for size in args.sizes.split(",") if size]
+    report = {
+        "meta": {
+            "commit": _git_commit(),
+            "timestamp": datetime.now(timezone.utc).isoformat(),
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "params": {"sizes": sizes, "iterations": args.iterations, "services": args.services, "counters": args.counters},
+        },
+        "pure": bench_pure(args),
+        "by_size": [],
+    }
+    with tempfile.TemporaryDirectory() as tmpdir:
+        for size in sizes:
+            database_url = args.database_url or f"sqlite:///{Path(tmpdir) / f'micro_{size}.db'}"
+            print(f"benchmarking {size} tokens ...", file=sys.stderr)
+            # Keep stray prints from the code under test out of the JSON report.
+            with contextlib.redirect_stdout(sys.stderr):
+                report["by_size"].append(bench_database(database_url, size, args))
+
+    output = json.dumps(report, indent=2)
+    if args.output:
+        Path(args.output).write_text(output + "\n")
+    else:
+        print(output)
+
+
+if __name__ == "__main__":
+    main()